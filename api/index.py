@@ -1,35 +1,158 @@
 """OpenFlow Backend — Vercel Serverless FastAPI"""
 
 import os
+import re
+import hmac
 import json
+import logging
+import copy
+import math
+import zlib
+import struct
+import base64
+import heapq
+import io
+import random
+import shutil
+import sqlite3
+import tempfile
+import itertools
+import asyncio
+import threading
+import time
 import uuid
+import hashlib
+import bisect
+from urllib.parse import quote, urlsplit
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-import bcrypt
-import jwt
-import httpx
-from fastapi import FastAPI, Depends, HTTPException, Header
+# bcrypt, jwt and httpx are imported where they're first used: module import is the serverless cold start
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from sqlalchemy import create_engine, Column, String, Text, ForeignKey, DateTime
+from sqlalchemy import create_engine, event, func, inspect, literal_column, table, column, text, and_, or_, Column, Index, Integer, LargeBinary, String, Text, ForeignKey, DateTime
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, declarative_base, Session, relationship
 
+if TYPE_CHECKING:
+    import httpx
+
 # ---------------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------------
 SECRET_KEY = os.environ.get("JWT_SECRET", "openflow-dev-secret-change-in-prod")
 FAL_API_KEY = os.environ.get("FAL_API_KEY", "148ec4ac-aafc-416b-9213-74cacdeefe5e:0dc2faa972e5762ba57fc758b2fd99e8")
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:////tmp/openflow.db")
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "1") == "1"  # 0: run `python api/index.py migrate` on deploy instead
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))  # connections kept open per process
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "30"))  # extra under bursts: sync routes run up to 40 at once in the threadpool
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", "15"))  # SQLite: seconds a writer waits for the lock before "database is locked"
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")  # SQLite: NORMAL survives app crashes in WAL mode, FULL also power loss
+DB_ASYNC = os.environ.get("DB_ASYNC", "0") == "1"  # async engine for async routes (needs aiosqlite or asyncpg)
+WRITE_BATCH_MAX = int(os.environ.get("WRITE_BATCH_MAX", "200"))  # queued writes grouped into one commit
+WRITE_BATCH_WINDOW = float(os.environ.get("WRITE_BATCH_WINDOW", "0"))  # seconds to wait for more writes; 0 commits as soon as the writer is free
 ALGORITHM = "HS256"
+log = logging.getLogger("openflow.api")
 TOKEN_EXPIRE_HOURS = 72
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "60"))  # 0 disables the token/user cache
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "4096"))
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))  # existing hashes are upgraded on login
+KDF_EXECUTOR = os.environ.get("KDF_EXECUTOR", "process")  # "process" or "thread"
+KDF_WORKERS = int(os.environ.get("KDF_WORKERS", str(os.cpu_count() or 2)))
+KDF_MAX_PENDING = int(os.environ.get("KDF_MAX_PENDING", str(KDF_WORKERS * 4)))
+
+# Provider client: one pooled keep-alive connection set per provider
+FAL_BASE_URL = os.environ.get("FAL_BASE_URL", "https://fal.run")  # point at benchmarks/mock_fal.py for offline runs
+PROVIDER_HTTP2 = os.environ.get("PROVIDER_HTTP2", "0") == "1"  # needs httpx[http2]
+PROVIDER_MAX_CONNECTIONS = int(os.environ.get("PROVIDER_MAX_CONNECTIONS", "100"))
+PROVIDER_CONCURRENCY = int(os.environ.get("PROVIDER_CONCURRENCY", "32"))  # in-flight calls per provider
+MODEL_CONCURRENCY = int(os.environ.get("MODEL_CONCURRENCY", "8"))  # in-flight calls per model
+PROVIDER_MAX_RETRIES = int(os.environ.get("PROVIDER_MAX_RETRIES", "3"))
+BREAKER_THRESHOLD = int(os.environ.get("BREAKER_THRESHOLD", "5"))  # consecutive failures before a model's circuit opens
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", "30"))
+
+# Generation jobs: submitted to fal's queue API, completed by webhook, poller or status polls
+FAL_QUEUE_URL = os.environ.get("FAL_QUEUE_URL", "https://queue.fal.run")
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "").rstrip("/")  # enables fal webhooks when set
+JOB_POLLER = os.environ.get("JOB_POLLER", "0" if os.environ.get("VERCEL") else "1") == "1"  # no background tasks on serverless
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2"))
+JOB_MAX_AGE = float(os.environ.get("JOB_MAX_AGE", "3600"))  # jobs still pending after this are failed
+JOB_SSE_TIMEOUT = float(os.environ.get("JOB_SSE_TIMEOUT", "25"))  # stay under platform limits; EventSource reconnects
+
+# Deterministic generation cache: seeded requests with an identical fal model + body reuse the earlier result
+GEN_CACHE_TTL = float(os.environ.get("GEN_CACHE_TTL", str(7 * 86400)))  # seconds; 0 disables the cache
+GEN_CACHE_MAX_ENTRIES = int(os.environ.get("GEN_CACHE_MAX_ENTRIES", "50000"))  # least recently hit are evicted first
+GEN_CACHE_PRUNE_INTERVAL = float(os.environ.get("GEN_CACHE_PRUNE_INTERVAL", "60"))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "100"))
+# Model estimates: rolling per-endpoint latency/cost samples from live generations, seeded from collector JSONL files
+COLLECTOR_DIR = os.environ.get("COLLECTOR_DIR", "")  # root of YYYY/MM/DD/generations.jsonl (server/app DATA_DIR); unset = live samples only
+ESTIMATE_WINDOW = int(os.environ.get("ESTIMATE_WINDOW", "200"))  # most recent samples kept per model
+ESTIMATE_MAX_AGE = float(os.environ.get("ESTIMATE_MAX_AGE", "86400"))  # seconds; older samples are ignored
+ESTIMATE_MIN_SAMPLES = int(os.environ.get("ESTIMATE_MIN_SAMPLES", "5"))  # fewer than this and a model has no estimate
+AUTO_EXPLORE = float(os.environ.get("AUTO_EXPLORE", "0.05"))  # share of "auto" requests sent to another model to keep its estimate fresh
+MODEL_COSTS = {k.strip(): float(v) for k, _, v in (i.partition("=") for i in os.environ.get("MODEL_COSTS", "").split(",")) if k.strip() and v}  # "fal-ai/flux/schnell=0.003,..." until cost data is seen
+MODEL_CLASSES = {k.strip(): [m.strip() for m in v.split("|") if m.strip()] for k, _, v in (i.partition("=") for i in os.environ.get("MODEL_CLASSES", "").split(";")) if k.strip() and v} or {
+    "image": ["flux-pro-1.1", "imagen-4", "sd-3.5", "dall-e-3"],  # interchangeable models for "auto:<class>"; "image=a|b;video=c|d"
+    "image-fast": ["flux-fast", "sd-3.5"],
+    "video": ["wan-2.1", "kling-3.0-pro", "minimax-hailuo", "hunyuan", "luma-ray-2"],
+}
+# Admission control: per-user token buckets plus weighted fair queueing for generation slots
+ADMISSION_DB = os.environ.get("ADMISSION_DB", "")  # SQLite file shared by workers on one host; unset = per process
+ADMISSION_RATE = float(os.environ.get("ADMISSION_RATE", "1"))  # generations per second refilled into each user's bucket
+ADMISSION_BURST = float(os.environ.get("ADMISSION_BURST", "40"))
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "64"))  # provider calls in flight across all users
+ADMISSION_PER_USER = int(os.environ.get("ADMISSION_PER_USER", "8"))
+ADMISSION_MAX_QUEUED = int(os.environ.get("ADMISSION_MAX_QUEUED", "100"))  # waiting per user
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", "30"))  # single requests; batch items wait as long as they need
+ADMISSION_WEIGHTS = {k.strip().lower(): float(v) for k, _, v in (i.partition("=") for i in os.environ.get("ADMISSION_WEIGHTS", "").split(",")) if k.strip() and v}  # "email=2,..."
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get("ADMIN_EMAILS", "").split(",") if e.strip()}
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")  # when set, /metrics needs "Authorization: Bearer <token>"
+# Media derivatives: thumbnails, video posters and previews rendered in a background pool, served from a local cache
+DERIVATIVES = os.environ.get("DERIVATIVES", "0" if os.environ.get("VERCEL") else "1") == "1"  # no background work on serverless
+DERIVATIVE_DIR = os.environ.get("DERIVATIVE_DIR", "/tmp/openflow-derivatives")  # content-addressed: <dir>/ab/<sha256>.<ext>
+DERIVATIVE_MAX_BYTES = int(os.environ.get("DERIVATIVE_MAX_BYTES", str(2 << 30)))  # least recently served files are evicted past this
+DERIVATIVE_WORKERS = int(os.environ.get("DERIVATIVE_WORKERS", "2"))
+DERIVATIVE_TIMEOUT = float(os.environ.get("DERIVATIVE_TIMEOUT", "120"))  # seconds, per download and per ffmpeg run
+DERIVATIVE_SOURCE_MAX_BYTES = int(os.environ.get("DERIVATIVE_SOURCE_MAX_BYTES", str(200 << 20)))  # larger originals get no derivatives
+DERIVATIVE_SOURCE_DIR = os.environ.get("DERIVATIVE_SOURCE_DIR", "")  # offline stand-in: read originals from here by the url's file name
+THUMB_SIZES = tuple(sorted({int(s) for s in os.environ.get("THUMB_SIZES", "256,768").split(",") if s.strip()}))  # longest edge, px
+PREVIEW_SIZE = int(os.environ.get("PREVIEW_SIZE", "480"))
+PREVIEW_SECONDS = float(os.environ.get("PREVIEW_SECONDS", "3"))  # 0: posters only
+FFMPEG = os.environ.get("FFMPEG", "ffmpeg")  # video posters and previews; image thumbnails too when Pillow isn't installed
 
 # ---------------------------------------------------------------------------
 # Database
 # ---------------------------------------------------------------------------
-connect_args = {"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def engine_options(url: str) -> dict:
+    """create_engine() arguments: a sized pool (except in-memory SQLite, which needs its single connection) and, for
+    SQLite, the busy timeout."""
+    if not url.startswith("sqlite"): return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT, "pool_pre_ping": True, "pool_recycle": 1800}
+    opts = {"connect_args": {"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT}}
+    name = make_url(url).database
+    if name and name != ":memory:" and "mode=memory" not in url: opts.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return opts
+
+def tune_sqlite(engine):
+    """Per-connection pragmas. WAL lets reads run alongside the one writer; synchronous=NORMAL drops the fsync per
+    commit (WAL syncs at checkpoints); busy_timeout makes a writer wait for the lock instead of failing. Writes still
+    take the lock at their first statement (pysqlite's implicit BEGIN), so they never need to upgrade a read."""
+    if engine.dialect.name != "sqlite": return
+    @event.listens_for(engine, "connect")
+    def pragmas(conn, _):
+        cur = conn.cursor()
+        for p in ("journal_mode=WAL", f"synchronous={DB_SYNCHRONOUS}", f"busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}", "cache_size=-16000", "temp_store=MEMORY"): cur.execute(f"PRAGMA {p}")
+        cur.close()
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+tune_sqlite(engine)
+_Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
@@ -54,6 +177,7 @@ class ProjectModel(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user = relationship("UserModel", back_populates="projects")
     workflows = relationship("WorkflowModel", back_populates="project")
+    __table_args__ = (Index("ix_projects_user_updated", "user_id", "updated_at", "id"),)
 
 
 class WorkflowModel(Base):
@@ -61,12 +185,26 @@ class WorkflowModel(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     project_id = Column(String, ForeignKey("projects.id"), nullable=False)
     name = Column(String, nullable=False)
-    data = Column(Text, default="{}")
+    data = Column(Text, default="{}")  # JSON snapshot, only for rows written before the compact encoding (migration 2)
+    body = Column(LargeBinary, nullable=True)  # encode_workflow() snapshot as of snapshot_revision; later edits are deltas in workflow_revisions
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+    snapshot_revision = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     project = relationship("ProjectModel", back_populates="workflows")
 
 
+class WorkflowRevisionModel(Base):
+    __tablename__ = "workflow_revisions"
+    id = Column(Integer, primary_key=True)
+    workflow_id = Column(String, ForeignKey("workflows.id"), nullable=False)
+    revision = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)  # snapshot | delta
+    payload = Column(LargeBinary, nullable=False)  # encode_workflow(), or zlib-compressed JSON if written by an older build
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_workflow_revisions_wf_rev", "workflow_id", "revision", unique=True),)
+
+
 class AssetModel(Base):
     __tablename__ = "assets"
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -79,14 +217,197 @@ class AssetModel(Base):
     metadata_json = Column(Text, default="{}")
     created_at = Column(DateTime, default=datetime.utcnow)
     user = relationship("UserModel", back_populates="assets")
+    __table_args__ = (Index("ix_assets_user_created", "user_id", "created_at", "id"),)
+
+
+class AssetDerivativeModel(Base):
+    __tablename__ = "asset_derivatives"
+    id = Column(Integer, primary_key=True)
+    asset_id = Column(String, ForeignKey("assets.id"), nullable=False)
+    source = Column(String, nullable=False, index=True)  # sha256 of the asset url: assets with the same url share files
+    kind = Column(String, nullable=False)  # thumb | poster | preview | error
+    size = Column(Integer, nullable=False, default=0)  # longest edge, px
+    digest = Column(String, nullable=True, index=True)  # sha256 of the file, its name in DERIVATIVE_DIR and /api/media
+    content_type = Column(String, nullable=True)
+    bytes = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_asset_derivatives_asset_kind", "asset_id", "kind", "size", unique=True),)
+
+
+class JobModel(Base):
+    __tablename__ = "generation_jobs"
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    project_id = Column(String, ForeignKey("projects.id"), nullable=True)
+    model = Column(String, nullable=False)
+    fal_model = Column(String, nullable=False)
+    type = Column(String, default="image")
+    inputs_json = Column(Text, default="{}")
+    status = Column(String, nullable=False, default="queued")  # queued | running | completed | failed
+    request_id = Column(String, nullable=True)  # fal queue request id
+    status_url = Column(Text, nullable=True)
+    response_url = Column(Text, nullable=True)
+    asset_id = Column(String, ForeignKey("assets.id"), nullable=True)
+    url = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    checked_at = Column(DateTime, default=datetime.utcnow)  # last provider status check
+    cache_key = Column(String, nullable=True)  # set for seeded requests; the result is cached on completion
+    __table_args__ = (Index("ix_jobs_user_created", "user_id", "created_at", "id"), Index("ix_jobs_status_checked", "status", "checked_at"))
+
+
+class GenerationCacheModel(Base):
+    __tablename__ = "generation_cache"
+    key = Column(String, primary_key=True)  # sha256 of fal model + normalized body
+    fal_model = Column(String, nullable=False, index=True)
+    type = Column(String, default="image")
+    url = Column(Text, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_hit_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class SceneDecompositionModel(Base):
+    __tablename__ = "scene_decompositions"
+    key = Column(String, primary_key=True)  # sha256 of story + style + scene count
+    scenes_json = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class GenerationCacheStatModel(Base):
+    __tablename__ = "generation_cache_stats"
+    fal_model = Column(String, primary_key=True)
+    hits = Column(Integer, nullable=False, default=0)
+    misses = Column(Integer, nullable=False, default=0)
+
+
+# Schema migrations: versioned, applied in order, recorded in schema_version. Nothing touches the database at import;
+# run `python api/index.py migrate` as a deploy step, or leave AUTO_MIGRATE on to apply them on the first session.
+# Append new migrations; never edit one that has shipped.
+def _baseline(conn):
+    """Tables for every model, plus columns and indexes that databases created by older builds are missing."""
+    Base.metadata.create_all(bind=conn)
+    for t in Base.metadata.sorted_tables:
+        have = {c["name"] for c in inspect(conn).get_columns(t.name)}
+        for c in t.columns:
+            if c.name not in have:
+                conn.execute(text(f"ALTER TABLE {t.name} ADD COLUMN {c.name} {c.type.compile(conn.dialect)}"
+                                  + (f" DEFAULT {c.server_default.arg}" if c.server_default is not None else "")))
+        for ix in t.indexes: ix.create(bind=conn, checkfirst=True)
+
+def _compact_workflows(conn):
+    """Re-encode JSON workflow snapshots (workflows.data) with encode_workflow into workflows.body, in batches."""
+    if "body" not in {c["name"] for c in inspect(conn).get_columns("workflows")}:
+        conn.execute(text(f"ALTER TABLE workflows ADD COLUMN body {LargeBinary().compile(dialect=conn.dialect)}"))
+    while rows := conn.execute(text("SELECT id, data FROM workflows WHERE body IS NULL LIMIT 500")).all():
+        conn.execute(text("UPDATE workflows SET body = :body, data = NULL WHERE id = :id"), [{"id": wid, "body": encode_workflow(json.loads(data or "{}"))} for wid, data in rows])
+
+# Asset search: an FTS5 table keyed by the assets rowid, kept in sync by triggers. `owner` is the user id as a single
+# token ("u" + hex), so a user's search only walks that user's postings; `params` holds the other prompt fields of
+# the generation inputs (negative_prompt, ...). VACUUM can renumber rowids of a table without an INTEGER PRIMARY KEY:
+# run `python api/index.py reindex` after one.
+ASSET_FTS_COLUMNS = "owner, prompt, model, type, params"
+
+def _asset_fts_values(row: str) -> str:
+    meta = f"CASE WHEN json_valid({row}.metadata_json) THEN {row}.metadata_json ELSE '{{}}' END"
+    return (f"'u' || replace({row}.user_id, '-', ''), {row}.prompt, {row}.model, {row}.type, "
+            f"(SELECT group_concat(value, ' ') FROM json_each({meta}) WHERE type = 'text' AND key LIKE '%prompt' AND key <> 'prompt')")
+
+def reindex_assets(conn):
+    """Rebuild the asset search index from the assets table."""
+    conn.exec_driver_sql("DELETE FROM assets_fts")
+    conn.exec_driver_sql(f"INSERT INTO assets_fts (rowid, {ASSET_FTS_COLUMNS}) SELECT a.rowid, {_asset_fts_values('a')} FROM assets a")
+
+def _asset_search(conn):
+    """FTS5 index over assets (SQLite only; search on other databases falls back to ILIKE)."""
+    if conn.dialect.name != "sqlite": return
+    conn.exec_driver_sql(f"CREATE VIRTUAL TABLE IF NOT EXISTS assets_fts USING fts5({ASSET_FTS_COLUMNS}, tokenize = 'unicode61 remove_diacritics 2')")
+    insert = f"INSERT INTO assets_fts (rowid, {ASSET_FTS_COLUMNS}) VALUES (new.rowid, {_asset_fts_values('new')});"
+    conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS assets_fts_insert AFTER INSERT ON assets BEGIN {insert} END")
+    conn.exec_driver_sql("CREATE TRIGGER IF NOT EXISTS assets_fts_delete AFTER DELETE ON assets BEGIN DELETE FROM assets_fts WHERE rowid = old.rowid; END")
+    conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS assets_fts_update AFTER UPDATE OF user_id, prompt, model, type, metadata_json ON assets BEGIN DELETE FROM assets_fts WHERE rowid = old.rowid; {insert} END")
+    reindex_assets(conn)
+
+def _asset_derivatives(conn):
+    """Table of rendered thumbnails, posters and previews; existing assets are queued as listings reach them."""
+    AssetDerivativeModel.__table__.create(bind=conn, checkfirst=True)
+
+MIGRATIONS = [(1, "baseline schema", _baseline), (2, "compact workflow snapshots", _compact_workflows), (3, "asset search index", _asset_search),
+              (4, "asset derivatives", _asset_derivatives)]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn) -> int:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
 
+def migrate(bind=None) -> int:
+    """Apply pending migrations in one transaction and return the schema version. Concurrent callers (several
+    workers starting on a fresh database) serialize on a write lock, so each migration runs exactly once."""
+    with (bind or engine).begin() as conn:
+        if conn.dialect.name == "sqlite": conn.exec_driver_sql("BEGIN IMMEDIATE")  # take the write lock before reading the version
+        elif conn.dialect.name == "postgresql": conn.execute(text("SELECT pg_advisory_xact_lock(72353)"))
+        version = schema_version(conn)
+        for v, _, step in MIGRATIONS:
+            if v > version: step(conn); conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": v}); version = v
+        return version
 
-Base.metadata.create_all(bind=engine)
+_schema_checked = [False]
+_schema_lock = threading.Lock()
+
+def ensure_schema():
+    """Once per process, before the first session: migrate (AUTO_MIGRATE) or refuse to run against an old schema."""
+    if _schema_checked[0]: return
+    with _schema_lock:
+        if _schema_checked[0]: return
+        if AUTO_MIGRATE: migrate()
+        else:
+            with engine.connect() as conn: version = schema_version(conn); conn.commit()
+            if version < SCHEMA_VERSION:
+                raise RuntimeError(f"Database schema is at version {version}, this build needs {SCHEMA_VERSION}: run `python api/index.py migrate`")
+        _schema_checked[0] = True
+
+def SessionLocal() -> Session:
+    ensure_schema()
+    return _Session()
+
+# Async routes run their queries through run_db(): on the async engine with DB_ASYNC, else on a worker thread, so a
+# slow query or a wait for the SQLite write lock never blocks the event loop. The async engine is built on first use.
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+_async_db: dict = {}
+
+def async_session():
+    if "sessions" not in _async_db:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        url = make_url(DATABASE_URL); url = url.set(drivername=f"{url.get_backend_name()}+{ASYNC_DRIVERS[url.get_backend_name()]}")
+        e = create_async_engine(url, **engine_options(DATABASE_URL)); tune_sqlite(e.sync_engine)
+        _async_db["engine"], _async_db["sessions"] = e, async_sessionmaker(e, autoflush=False, expire_on_commit=False)
+    return _async_db["sessions"]()
+
+async def run_db(fn, *args):
+    """fn(session, *args) off the event loop. fn commits its own writes; the session is closed afterwards, so return
+    plain values rather than ORM objects."""
+    if not DB_ASYNC:
+        def call():
+            with SessionLocal() as db: return fn(db, *args)
+        return await asyncio.to_thread(call)
+    if not _schema_checked[0]: await asyncio.to_thread(ensure_schema)
+    async with async_session() as db: return await db.run_sync(fn, *args)
 
 # ---------------------------------------------------------------------------
 # FastAPI
 # ---------------------------------------------------------------------------
-app = FastAPI(title="OpenFlow API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    poller = asyncio.create_task(job_poller()) if JOB_POLLER else None
+    yield
+    if poller: poller.cancel()
+    derivatives.shutdown(); writes.shutdown()
+    if "engine" in _async_db: await _async_db["engine"].dispose()
+    await fal.aclose(); await fal_queue.aclose()
+
+app = FastAPI(title="OpenFlow API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -94,8 +415,77 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Batch-Id"],
 )
 
+# ---------------------------------------------------------------------------
+# Metrics: Prometheus text format at /metrics, per process. Children are created once per label set and then
+# updated with plain attribute writes: no lock on the hot path (under the GIL a racing update can, rarely, lose one count).
+# ---------------------------------------------------------------------------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRICS: list = []
+
+class Count:
+    __slots__ = ("value",)
+    def __init__(self): self.value = 0.0
+    def inc(self, n: float = 1): self.value += n
+    def dec(self, n: float = 1): self.value -= n
+
+class Hist:
+    __slots__ = ("bounds", "counts", "sum")
+    def __init__(self, bounds: tuple): self.bounds, self.counts, self.sum = bounds, [0] * (len(bounds) + 1), 0.0
+    def observe(self, v: float):
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1; self.sum += v  # buckets are "<= bound"
+
+class Metric:
+    def __init__(self, name: str, help: str, kind: str, labelnames: tuple = (), fn=None, buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.kind, self.labelnames, self.fn, self.buckets = name, help, kind, labelnames, fn, buckets
+        self.children: dict = {}; METRICS.append(self)
+
+    def labels(self, *values):
+        key = tuple(map(str, values)); child = self.children.get(key)
+        if child is None: child = self.children.setdefault(key, Hist(self.buckets) if self.kind == "histogram" else Count())
+        return child
+
+    def render(self) -> list:
+        esc = lambda v: v.replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+        fmt = lambda v: "+Inf" if v == float("inf") else str(int(v)) if float(v).is_integer() else repr(float(v))
+        lbl = lambda pairs: "{" + ",".join(f'{n}="{esc(v)}"' for n, v in pairs) + "}" if pairs else ""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.fn: return lines + [f"{self.name} {fmt(self.fn())}"]
+        for key, child in list(self.children.items()):
+            pairs = list(zip(self.labelnames, key))
+            if self.kind != "histogram": lines.append(f"{self.name}{lbl(pairs)} {fmt(child.value)}"); continue
+            total = 0
+            for bound, n in zip(self.buckets + (float("inf"),), list(child.counts)):
+                total += n; lines.append(f"{self.name}_bucket{lbl(pairs + [('le', fmt(bound))])} {total}")
+            lines += [f"{self.name}_sum{lbl(pairs)} {fmt(child.sum)}", f"{self.name}_count{lbl(pairs)} {total}"]
+        return lines
+
+HTTP_SECONDS = Metric("openflow_http_request_duration_seconds", "HTTP request latency by route template, method and status code.", "histogram", ("method", "route", "status"))
+PROVIDER_SECONDS = Metric("openflow_provider_request_duration_seconds", "Latency of each provider HTTP attempt by provider and model.", "histogram", ("provider", "model"))
+PROVIDER_ERRORS = Metric("openflow_provider_errors_total", "Failed provider attempts by provider, model and reason (status code, transport, circuit_open).", "counter", ("provider", "model", "reason"))
+
+class MetricsMiddleware:
+    """Times every HTTP request, labelled by the matched route's template so path ids don't each get a child."""
+    def __init__(self, app): self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        status, start = [500], time.perf_counter()
+        async def send_status(msg):
+            if msg["type"] == "http.response.start": status[0] = msg["status"]
+            await send(msg)
+        try: await self.app(scope, receive, send_status)
+        finally: HTTP_SECONDS.labels(scope["method"], getattr(scope.get("route"), "path", "<unmatched>"), status[0]).observe(time.perf_counter() - start)
+
+app.add_middleware(MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"): raise HTTPException(401, "Invalid metrics token")
+    return Response("\n".join(line for m in METRICS for line in m.render()) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
 
 def get_db():
     db = SessionLocal()
@@ -104,29 +494,215 @@ def get_db():
     finally:
         db.close()
 
+# ---------------------------------------------------------------------------
+# Write batching: group commit for inserts. Handlers queue rows with writes.add() (async) or writes.submit() (sync);
+# one writer thread commits everything queued since its last commit in a single transaction, so under load N inserts
+# cost one commit (one fsync, one trip through the SQLite write lock) instead of N, and an idle writer commits at once.
+# `then(session)` adds related work to the same transaction (cache rows and counters) and is best-effort: if the batch
+# fails it is retried without them. A batch that still fails is split, so a bad row only fails its own caller.
+# ---------------------------------------------------------------------------
+class WriteBatcher:
+    """Single writer thread, started on first use like KdfPool. Committed rows come back detached, columns loaded."""
+    def __init__(self, max_items: int, window: float):
+        self.max_items, self.window = max_items, window
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, *rows, then=None) -> Future:
+        ensure_schema(); fut = Future()
+        with self._cond:
+            if self._thread is None: self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True); self._thread.start()
+            self._queue.append((rows, then, fut)); self._cond.notify()
+        return fut
+
+    async def add(self, *rows, then=None):
+        await asyncio.wrap_future(self.submit(*rows, then=then))
+
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def _loop(self):
+        me = threading.current_thread()
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._thread is not me)
+                if not self._queue: return  # shut down and drained
+            if self.window: time.sleep(self.window)
+            with self._cond: batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_items))]
+            if batch: WRITE_BATCH_SIZE.labels().observe(len(batch)); self._commit(batch)
+
+    def _write(self, items: list, then: bool):
+        with _Session(expire_on_commit=False) as db:
+            try:
+                for rows, fn, _ in items:
+                    db.add_all(rows)
+                    if then and fn: fn(db)
+                    db.flush()  # later items' updates see these rows
+                db.commit()
+            except Exception as e:
+                db.rollback(); return e
+
+    def _commit(self, items: list):
+        err = self._write(items, then=True)
+        if err and any(fn for _, fn, _ in items): err = self._write(items, then=False)
+        if err and len(items) > 1:
+            mid = len(items) // 2; self._commit(items[:mid]); self._commit(items[mid:]); return
+        for _, _, fut in items:
+            if err: fut.set_exception(err)
+            else: fut.set_result(None)
+
+    def shutdown(self):
+        """Commit what's queued, then stop the writer (the next write starts a new one)."""
+        with self._cond: thread, self._thread = self._thread, None; self._cond.notify_all()
+        if thread: thread.join(10)
+
+writes = WriteBatcher(WRITE_BATCH_MAX, WRITE_BATCH_WINDOW)
+WRITE_BATCH_SIZE = Metric("openflow_db_write_batch_size", "Queued writes committed per transaction by the write batcher.", "histogram", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+Metric("openflow_db_write_queue_depth", "Writes queued for the write batcher.", "gauge", fn=lambda: writes.depth())
 
-def hash_password(pw: str) -> str:
-    return bcrypt.hashpw(pw.encode(), bcrypt.gensalt()).decode()
 
-def verify_password(pw: str, hashed: str) -> bool:
-    return bcrypt.checkpw(pw.encode(), hashed.encode())
+class KdfPool:
+    """Bounded bcrypt executor so login bursts can't starve the request threadpool.
+
+    Returns 429 once `max_pending` hashes are queued or running.
+    """
+    def __init__(self, kind: str, workers: int, max_pending: int):
+        self.kind, self.workers, self.max_pending = kind, workers, max_pending
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None and self.kind == "process":
+                from concurrent.futures import ProcessPoolExecutor
+                try: self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                except (OSError, NotImplementedError): self.kind = "thread"  # no /dev/shm on serverless
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="kdf")
+            return self._executor
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(429, "Too many concurrent logins, retry shortly", headers={"Retry-After": "1"})
+            self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock: self._pending -= 1
+
+_kdf_pool = KdfPool(KDF_EXECUTOR, KDF_WORKERS, KDF_MAX_PENDING)
+
+# bcrypt.hashpw/checkpw are builtins, so they pickle to worker processes without importing this module
+async def hash_password(pw: str) -> str:
+    import bcrypt
+    return (await _kdf_pool.run(bcrypt.hashpw, pw.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))).decode()
+
+async def verify_password(pw: str, hashed: str) -> bool:
+    import bcrypt
+    return await _kdf_pool.run(bcrypt.checkpw, pw.encode(), hashed.encode())
+
+def needs_rehash(hashed: str) -> bool:
+    return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
 
 def create_token(user_id: str, email: str) -> str:
+    import jwt
     return jwt.encode({"sub": user_id, "email": email, "exp": datetime.utcnow() + timedelta(hours=TOKEN_EXPIRE_HOURS)}, SECRET_KEY, algorithm=ALGORITHM)
 
+class TTLCache:
+    """Thread-safe LRU cache; entries expire after at most `ttl` seconds."""
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None: return None
+            if item[1] < time.monotonic():
+                del self._data[key]; return None
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0: return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock: self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock: self._data.clear()
+
+_token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+_user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+# ORM updates and deletes only: bulk query(...).update() skips these events, so its callers pop the row themselves
+@event.listens_for(UserModel, "after_update")
+@event.listens_for(UserModel, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    _user_cache.pop(target.id)
+
 def get_current_user(authorization: Optional[str] = Header(None), db: Session = Depends(get_db)) -> UserModel:
+    import jwt
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(401, "Missing token")
+    token = authorization.split(" ", 1)[1]
     try:
-        payload = jwt.decode(authorization.split(" ", 1)[1], SECRET_KEY, algorithms=[ALGORITHM])
-        user = db.query(UserModel).filter(UserModel.id == payload["sub"]).first()
-        if not user: raise HTTPException(401, "Not found")
+        payload = _token_cache.get(token)
+        if payload is None:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            _token_cache.set(token, payload, payload["exp"] - time.time())
+        elif payload["exp"] < time.time():
+            _token_cache.pop(token)
+            raise jwt.ExpiredSignatureError()
+        user = _user_cache.get(payload["sub"])
+        if user is None:
+            user = db.query(UserModel).filter(UserModel.id == payload["sub"]).first()
+            if not user: raise HTTPException(401, "Not found")
+            db.expunge(user)  # detached copy is shared across requests
+            _user_cache.set(user.id, user)
         return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(401, "Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(401, "Invalid token")
 
+# Keyset pagination: newest first on (ts, id); the next page's cursor is returned in X-Next-Cursor
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(ts: datetime, row_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([ts.isoformat(), row_id]).encode()).rstrip(b"=").decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        ts, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(ts), str(row_id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+def keyset_page(query, ts_col, id_col, cursor: Optional[str], limit: int, response: Response) -> list:
+    if cursor:
+        ts, row_id = decode_cursor(cursor)
+        query = query.filter(or_(ts_col < ts, and_(ts_col == ts, id_col < row_id)))
+    rows = query.order_by(ts_col.desc(), id_col.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(getattr(rows[-1], ts_col.key), rows[-1].id)
+    return rows
+
+def parse_include(include: Optional[str], allowed: set) -> set:
+    fields = {f.strip() for f in (include or "").split(",") if f.strip()}
+    if fields - allowed: raise HTTPException(400, f"Unknown include field(s): {', '.join(sorted(fields - allowed))}")
+    return fields
+
 # Schemas
 class SignupReq(BaseModel):
     email: str; username: str; password: str
@@ -141,32 +717,62 @@ class WorkflowCreate(BaseModel):
     name: str; data: dict = {}
 
 class WorkflowUpdate(BaseModel):
-    name: Optional[str] = None; data: Optional[dict] = None
+    name: Optional[str] = None; data: Optional[dict] = None; base_revision: Optional[int] = None
+
+class WorkflowPatch(BaseModel):
+    base_revision: int; patch: list  # RFC 6902 ops against the workflow at base_revision
+
+class WorkflowEncode(BaseModel):
+    data: dict
+
+class WorkflowDecode(BaseModel):
+    encoded: str  # base64url encode_workflow() output, as in share links
 
 class GenerateReq(BaseModel):
     model: str; inputs: dict; project_id: Optional[str] = None
 
+class BatchReq(BaseModel):
+    items: list[GenerateReq]
+
 class SceneReq(BaseModel):
     story: str; num_scenes: int = 4; style: str = "cinematic"
 
-# Auth
+class StoryboardReq(SceneReq):
+    model: str = "flux-fast"; inputs: dict = {}; seed: Optional[int] = None; project_id: Optional[str] = None
+    scenes: Optional[list[dict]] = None  # edited scenes from an earlier run; skips decomposition
+
+# Auth: the async routes query through run_db, and signup writes the user and their first project in one commit
+def signup_conflict(db: Session, email: str, username: str) -> Optional[str]:
+    if db.query(UserModel.id).filter(UserModel.email == email).first(): return "Email taken"
+    if db.query(UserModel.id).filter(UserModel.username == username).first(): return "Username taken"
+
+def create_account(db: Session, user_id: str, email: str, username: str, password_hash: str) -> bool:
+    db.add_all([UserModel(id=user_id, email=email, username=username, password_hash=password_hash), ProjectModel(user_id=user_id, name="My First Project")])
+    try: db.commit(); return True
+    except IntegrityError: db.rollback(); return False  # lost a race for the email or username
+
+def find_login(db: Session, email: str):
+    return db.query(UserModel.id, UserModel.email, UserModel.username, UserModel.password_hash).filter(UserModel.email == email).first()
+
+def set_password_hash(db: Session, user_id: str, password_hash: str):
+    db.query(UserModel).filter(UserModel.id == user_id).update({"password_hash": password_hash}, synchronize_session=False); db.commit()
+    _user_cache.pop(user_id)  # bulk update: no after_update event
+
 @app.post("/api/auth/signup")
-def signup(req: SignupReq, db: Session = Depends(get_db)):
-    if db.query(UserModel).filter(UserModel.email == req.email).first():
-        raise HTTPException(400, "Email taken")
-    if db.query(UserModel).filter(UserModel.username == req.username).first():
-        raise HTTPException(400, "Username taken")
-    user = UserModel(email=req.email, username=req.username, password_hash=hash_password(req.password))
-    db.add(user); db.commit(); db.refresh(user)
-    proj = ProjectModel(user_id=user.id, name="My First Project")
-    db.add(proj); db.commit()
-    return {"token": create_token(user.id, user.email), "user": {"id": user.id, "email": user.email, "username": user.username}}
+async def signup(req: SignupReq):
+    if taken := await run_db(signup_conflict, req.email, req.username): raise HTTPException(400, taken)
+    user_id = str(uuid.uuid4())
+    if not await run_db(create_account, user_id, req.email, req.username, await hash_password(req.password)):
+        raise HTTPException(400, "Email or username taken")
+    return {"token": create_token(user_id, req.email), "user": {"id": user_id, "email": req.email, "username": req.username}}
 
 @app.post("/api/auth/login")
-def login(req: LoginReq, db: Session = Depends(get_db)):
-    user = db.query(UserModel).filter(UserModel.email == req.email).first()
-    if not user or not verify_password(req.password, user.password_hash):
+async def login(req: LoginReq):
+    user = await run_db(find_login, req.email)
+    if not user or not await verify_password(req.password, user.password_hash):
         raise HTTPException(401, "Invalid credentials")
+    if needs_rehash(user.password_hash):
+        await run_db(set_password_hash, user.id, await hash_password(req.password))
     return {"token": create_token(user.id, user.email), "user": {"id": user.id, "email": user.email, "username": user.username}}
 
 @app.get("/api/auth/me")
@@ -175,8 +781,9 @@ def me(user: UserModel = Depends(get_current_user)):
 
 # Projects
 @app.get("/api/projects")
-def list_projects(user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    return [{"id": p.id, "name": p.name, "description": p.description, "created_at": str(p.created_at)} for p in db.query(ProjectModel).filter(ProjectModel.user_id == user.id).all()]
+def list_projects(response: Response, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+    q = db.query(ProjectModel.id, ProjectModel.name, ProjectModel.description, ProjectModel.created_at, ProjectModel.updated_at).filter(ProjectModel.user_id == user.id)
+    return [{"id": p.id, "name": p.name, "description": p.description, "created_at": str(p.created_at), "updated_at": str(p.updated_at)} for p in keyset_page(q, ProjectModel.updated_at, ProjectModel.id, cursor, limit, response)]
 
 @app.post("/api/projects")
 def create_project(req: ProjectCreate, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -184,29 +791,415 @@ def create_project(req: ProjectCreate, user: UserModel = Depends(get_current_use
     db.add(p); db.commit(); db.refresh(p)
     return {"id": p.id, "name": p.name}
 
+# Workflow history: full snapshot every SNAPSHOT_EVERY revisions, JSON Patch deltas between
+SNAPSHOT_EVERY = int(os.environ.get("WORKFLOW_SNAPSHOT_EVERY", "50"))
+
+# Compact workflow encoding, for stored snapshots, revision history and share links. A msgpack-style tagged binary
+# with two workflow-specific tricks, then deflate:
+#   - strings of up to WF_INTERN_CHARS are interned: the first use carries the text and later uses an index, so node
+#     types, handle names, keys and node ids (repeated by every edge) cost one or two bytes
+#   - {"x", "y"} positions are deltas from the previous position, in hundredths, whenever that is exact; nodes laid
+#     out on a grid then cost a few bytes each
+# Layout: 0xCF, version, compression (0 none, 1 deflate), body. Lossless: key order and int vs float survive.
+# Tags: 0x00-0x7f int 0..127 | 0x80-0x8f map of 0-15 | 0x90-0x9f array of 0-15 | 0xa0-0xbf interned string 0-31 |
+# 0xc0 null | 0xc2 false | 0xc3 true | 0xc4 int | 0xc5 float64 | 0xc6 float32 | 0xc7 string | 0xc8 array | 0xc9 map |
+# 0xca new interned string | 0xcb interned string | 0xd0-0xd3 position (bit 0: x is float, bit 1: y is float) |
+# 0xe0-0xff int -32..-1. Lengths and indexes are varints; ints and position deltas zigzag varints.
+# Bump WF_VERSION for incompatible changes and keep decoding the old ones.
+WF_MAGIC, WF_VERSION = b"\xcf", 1
+WF_INTERN_CHARS = 64
+WF_MAX_BYTES = int(os.environ.get("WORKFLOW_MAX_BYTES", str(16 << 20)))  # decoded size cap; share links are untrusted
+
+def _wf_uint(out: bytearray, n: int):
+    while n > 0x7f: out.append(n & 0x7f | 0x80); n >>= 7
+    out.append(n)
+
+def _wf_centi(v) -> Optional[int]:
+    """v in hundredths, if decoding that gives back exactly v."""
+    if type(v) is int: return v * 100
+    if type(v) is float and math.isfinite(v):
+        k = round(v * 100)
+        if k / 100 == v and (k or math.copysign(1, v) > 0): return k  # -0.0 would come back as 0.0
+    return None
+
+class _WfEncoder:
+    def __init__(self): self.out, self.strings, self.x, self.y = bytearray(), {}, 0, 0
+
+    def value(self, v):
+        out = self.out
+        if isinstance(v, str): self.string(v)
+        elif isinstance(v, dict):
+            if len(v) == 2 and self.position(v): return
+            if len(v) < 16: out.append(0x80 | len(v))
+            else: out.append(0xc9); _wf_uint(out, len(v))
+            for k, item in v.items(): self.string(k); self.value(item)
+        elif isinstance(v, (list, tuple)):
+            if len(v) < 16: out.append(0x90 | len(v))
+            else: out.append(0xc8); _wf_uint(out, len(v))
+            for item in v: self.value(item)
+        elif v is None: out.append(0xc0)
+        elif isinstance(v, bool): out.append(0xc3 if v else 0xc2)
+        elif isinstance(v, int):
+            if -32 <= v < 128: out.append(v & 0xff)
+            else: out.append(0xc4); _wf_uint(out, v * 2 if v >= 0 else -v * 2 - 1)
+        elif isinstance(v, float):
+            try: f32 = struct.pack(">f", v)
+            except OverflowError: f32 = None
+            if f32 and struct.unpack(">f", f32)[0] == v: out.append(0xc6); out += f32
+            else: out.append(0xc5); out += struct.pack(">d", v)
+        else: raise TypeError(f"Cannot encode {type(v).__name__} in a workflow")
+
+    def position(self, v) -> bool:
+        keys = iter(v)
+        if next(keys) != "x" or next(keys) != "y": return False
+        x, y = _wf_centi(v["x"]), _wf_centi(v["y"])
+        if x is None or y is None: return False
+        out, dx, dy = self.out, x - self.x, y - self.y
+        out.append(0xd0 | (type(v["x"]) is float) | (type(v["y"]) is float) << 1)
+        _wf_uint(out, dx * 2 if dx >= 0 else -dx * 2 - 1); _wf_uint(out, dy * 2 if dy >= 0 else -dy * 2 - 1)
+        self.x, self.y = x, y
+        return True
+
+    def string(self, s: str):
+        out, i = self.out, self.strings.get(s)
+        if i is not None:
+            if i < 32: out.append(0xa0 | i)
+            else: out.append(0xcb); _wf_uint(out, i)
+            return
+        if len(s) <= WF_INTERN_CHARS: self.strings[s] = len(self.strings); out.append(0xca)
+        else: out.append(0xc7)
+        raw = s.encode("utf-8", "surrogatepass")  # JSON allows lone surrogates
+        _wf_uint(out, len(raw)); out += raw
+
+class _WfDecoder:
+    def __init__(self, buf: bytes): self.buf, self.i, self.strings, self.x, self.y = buf, 0, [], 0, 0
+
+    def uint(self) -> int:
+        n = shift = 0
+        while True:
+            b = self.buf[self.i]; self.i += 1
+            n |= (b & 0x7f) << shift
+            if b < 0x80: return n
+            shift += 7
+
+    def sint(self) -> int:
+        n = self.uint(); return (n >> 1) ^ -(n & 1)
+
+    def take(self, n: int) -> bytes:
+        if self.i + n > len(self.buf): raise ValueError("Truncated workflow encoding")
+        self.i += n; return self.buf[self.i - n:self.i]
+
+    def map(self, n: int) -> dict:
+        out = {}
+        for _ in range(n):
+            k = self.value()
+            if not isinstance(k, str): raise ValueError("Non-string key in workflow encoding")
+            out[k] = self.value()
+        return out
+
+    def value(self):
+        t = self.buf[self.i]; self.i += 1
+        if t < 0x80: return t
+        if t < 0x90: return self.map(t & 0x0f)
+        if t < 0xa0: return [self.value() for _ in range(t & 0x0f)]
+        if t < 0xc0: return self.strings[t & 0x1f]
+        if t >= 0xe0: return t - 0x100
+        if t == 0xc0: return None
+        if t in (0xc2, 0xc3): return t == 0xc3
+        if t == 0xc4: return self.sint()
+        if t == 0xc5: return struct.unpack(">d", self.take(8))[0]
+        if t == 0xc6: return struct.unpack(">f", self.take(4))[0]
+        if t in (0xc7, 0xca):
+            s = self.take(self.uint()).decode("utf-8", "surrogatepass")
+            if t == 0xca: self.strings.append(s)
+            return s
+        if t == 0xc8: return [self.value() for _ in range(self.uint())]
+        if t == 0xc9: return self.map(self.uint())
+        if t == 0xcb: return self.strings[self.uint()]
+        if 0xd0 <= t <= 0xd3:
+            self.x += self.sint(); self.y += self.sint()
+            return {"x": self.x / 100 if t & 1 else self.x // 100, "y": self.y / 100 if t & 2 else self.y // 100}
+        raise ValueError(f"Unknown tag 0x{t:02x} in workflow encoding")
+
+def encode_workflow(doc) -> bytes:
+    """Compact, versioned binary form of a JSON workflow document (see the layout above)."""
+    enc = _WfEncoder(); enc.value(doc)
+    body = bytes(enc.out); packed = zlib.compress(body, 9)
+    return WF_MAGIC + (bytes((WF_VERSION, 1)) + packed if len(packed) < len(body) else bytes((WF_VERSION, 0)) + body)
+
+def decode_workflow(blob: bytes):
+    """Inverse of encode_workflow; raises ValueError if blob is malformed, truncated or decodes past WF_MAX_BYTES."""
+    if len(blob) < 3 or blob[:1] != WF_MAGIC: raise ValueError("Not an encoded workflow")
+    if blob[1] != WF_VERSION: raise ValueError(f"Unsupported workflow encoding version {blob[1]}")
+    try:
+        if blob[2] == 1:
+            d = zlib.decompressobj(); body = d.decompress(blob[3:], WF_MAX_BYTES)
+            if d.unconsumed_tail or not d.eof: raise ValueError("Encoded workflow is truncated or too large")
+        elif blob[2] == 0: body = blob[3:]
+        else: raise ValueError(f"Unsupported workflow compression {blob[2]}")
+        dec = _WfDecoder(body); doc = dec.value()
+        if dec.i != len(body): raise ValueError("Trailing bytes after encoded workflow")
+        return doc
+    except (IndexError, struct.error, zlib.error, UnicodeDecodeError, RecursionError) as e:
+        raise ValueError(f"Malformed workflow encoding: {e!r}") from None
+
+def snapshot_of(w):
+    return decode_workflow(w.body) if w.body is not None else json.loads(w.data or "{}")
+
+def pack(value) -> bytes:
+    return encode_workflow(value)
+
+def unpack(payload: bytes):
+    if payload[:1] == WF_MAGIC: return decode_workflow(payload)
+    return json.loads(zlib.decompress(payload))  # written before the compact encoding
+
+def _pointer(path: str) -> list:
+    if path == "": return []
+    if not path.startswith("/"): raise ValueError(f"Invalid JSON pointer: {path!r}")
+    return [t.replace("~1", "/").replace("~0", "~") for t in path[1:].split("/")]
+
+ARRAY_INDEX = re.compile(r"0|[1-9][0-9]*")
+
+def _index(array: list, token: str, append: bool = False) -> int:
+    """Array index for a pointer token: no sign or leading zeros, an existing element ("add" may also use len or "-")."""
+    if append and token == "-": return len(array)
+    if not ARRAY_INDEX.fullmatch(token) or int(token) > len(array) - (not append): raise IndexError(f"bad array index {token!r}")
+    return int(token)
+
+def json_equal(a, b) -> bool:
+    """Equality for "test": true is not 1, numbers compare by value, containers element by element."""
+    if isinstance(a, bool) or isinstance(b, bool): return type(a) is type(b) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)): return a == b
+    if isinstance(a, list) and isinstance(b, list): return len(a) == len(b) and all(map(json_equal, a, b))
+    if isinstance(a, dict) and isinstance(b, dict): return a.keys() == b.keys() and all(json_equal(a[k], b[k]) for k in a)
+    return type(a) is type(b) and a == b
+
+def _walk(doc, tokens):
+    for t in tokens: doc = doc[_index(doc, t)] if isinstance(doc, list) else doc[t]
+    return doc
+
+def apply_json_patch(doc, ops: list):
+    """Apply RFC 6902 ops to doc (in place where possible); raises ValueError if they don't apply."""
+    def add(doc, tokens, value):
+        if not tokens: return value
+        parent, key = _walk(doc, tokens[:-1]), tokens[-1]
+        if isinstance(parent, list):
+            parent.insert(_index(parent, key, append=True), value)
+        else: parent[key] = value
+        return doc
+    def remove(doc, tokens):
+        if not tokens: raise ValueError("Cannot remove the document root")
+        parent, key = _walk(doc, tokens[:-1]), tokens[-1]
+        del parent[_index(parent, key) if isinstance(parent, list) else key]
+        return doc
+    try:
+        for op in ops:
+            kind, tokens = op["op"], _pointer(op["path"])
+            if kind == "add": doc = add(doc, tokens, copy.deepcopy(op["value"]))
+            elif kind == "remove": doc = remove(doc, tokens)
+            elif kind == "replace":
+                _walk(doc, tokens)  # must exist
+                doc = add(remove(doc, tokens), tokens, copy.deepcopy(op["value"])) if tokens else copy.deepcopy(op["value"])
+            elif kind in ("move", "copy"):
+                src = _pointer(op["from"]); value = copy.deepcopy(_walk(doc, src))
+                if kind == "move": doc = remove(doc, src)
+                doc = add(doc, tokens, value)
+            elif kind == "test":
+                if not json_equal(_walk(doc, tokens), op["value"]): raise ValueError(f"Test failed at {op['path']!r}")
+            else: raise ValueError(f"Unsupported op {kind!r}")
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"Patch does not apply: {e!r}")
+    return doc
+
+def workflow_at(db: Session, w, revision: int):
+    """Rebuild workflow data at `revision` from the nearest snapshot plus deltas (None if before history)."""
+    if revision >= w.snapshot_revision:
+        doc, base = snapshot_of(w), w.snapshot_revision
+    else:
+        snap = db.query(WorkflowRevisionModel).filter(WorkflowRevisionModel.workflow_id == w.id, WorkflowRevisionModel.kind == "snapshot", WorkflowRevisionModel.revision <= revision).order_by(WorkflowRevisionModel.revision.desc()).first()
+        if not snap: return None
+        doc, base = unpack(snap.payload), snap.revision
+    for (payload,) in db.query(WorkflowRevisionModel.payload).filter(WorkflowRevisionModel.workflow_id == w.id, WorkflowRevisionModel.revision > base, WorkflowRevisionModel.revision <= revision).order_by(WorkflowRevisionModel.revision):
+        doc = apply_json_patch(doc, unpack(payload))
+    return doc
+
+def get_owned_workflow(wid: str, user: UserModel, db: Session) -> WorkflowModel:
+    w = db.query(WorkflowModel).join(ProjectModel).filter(WorkflowModel.id == wid, ProjectModel.user_id == user.id).first()
+    if not w: raise HTTPException(404)
+    return w
+
 # Workflows
 @app.get("/api/projects/{pid}/workflows")
 def list_workflows(pid: str, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
     p = db.query(ProjectModel).filter(ProjectModel.id == pid, ProjectModel.user_id == user.id).first()
     if not p: raise HTTPException(404)
-    return [{"id": w.id, "name": w.name, "data": json.loads(w.data), "updated_at": str(w.updated_at)} for w in db.query(WorkflowModel).filter(WorkflowModel.project_id == pid).all()]
+    return [{"id": w.id, "name": w.name, "data": workflow_at(db, w, w.revision), "revision": w.revision, "updated_at": str(w.updated_at)} for w in db.query(WorkflowModel).filter(WorkflowModel.project_id == pid).all()]
 
 @app.post("/api/projects/{pid}/workflows")
 def create_workflow(pid: str, req: WorkflowCreate, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
     p = db.query(ProjectModel).filter(ProjectModel.id == pid, ProjectModel.user_id == user.id).first()
     if not p: raise HTTPException(404)
-    w = WorkflowModel(project_id=pid, name=req.name, data=json.dumps(req.data))
-    db.add(w); db.commit(); db.refresh(w)
-    return {"id": w.id, "name": w.name, "data": json.loads(w.data)}
+    w = WorkflowModel(project_id=pid, name=req.name, data=None, body=pack(req.data))
+    db.add(w); db.flush()
+    db.add(WorkflowRevisionModel(workflow_id=w.id, revision=0, kind="snapshot", payload=w.body))
+    db.commit(); db.refresh(w)
+    return {"id": w.id, "name": w.name, "data": req.data, "revision": w.revision}
 
 @app.put("/api/workflows/{wid}")
 def update_workflow(wid: str, req: WorkflowUpdate, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    w = db.query(WorkflowModel).join(ProjectModel).filter(WorkflowModel.id == wid, ProjectModel.user_id == user.id).first()
-    if not w: raise HTTPException(404)
+    w = get_owned_workflow(wid, user, db)
+    if req.base_revision is not None and req.base_revision != w.revision:
+        raise HTTPException(409, {"message": "Revision conflict", "revision": w.revision})
     if req.name: w.name = req.name
-    if req.data is not None: w.data = json.dumps(req.data)
-    db.commit()
-    return {"id": w.id, "name": w.name, "data": json.loads(w.data)}
+    if req.data is not None:  # a full write is a snapshot
+        w.revision += 1; w.snapshot_revision = w.revision; w.data, w.body = None, pack(req.data)
+        db.add(WorkflowRevisionModel(workflow_id=w.id, revision=w.revision, kind="snapshot", payload=w.body))
+    try: db.commit()
+    except IntegrityError:
+        db.rollback(); raise HTTPException(409, {"message": "Revision conflict"})
+    return {"id": w.id, "name": w.name, "data": req.data if req.data is not None else workflow_at(db, w, w.revision), "revision": w.revision}
+
+@app.patch("/api/workflows/{wid}")
+def patch_workflow(wid: str, req: WorkflowPatch, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Autosave path: store only a JSON Patch delta, guarded by base_revision."""
+    w = get_owned_workflow(wid, user, db)
+    if req.base_revision != w.revision:
+        raise HTTPException(409, {"message": "Revision conflict", "revision": w.revision})
+    try: doc = apply_json_patch(workflow_at(db, w, w.revision), req.patch)
+    except ValueError as e: raise HTTPException(422, str(e))
+    rev = w.revision + 1
+    values = {"revision": rev, "updated_at": datetime.utcnow()}
+    if rev - w.snapshot_revision >= SNAPSHOT_EVERY:
+        values.update(data=None, body=pack(doc), snapshot_revision=rev)
+        db.add(WorkflowRevisionModel(workflow_id=w.id, revision=rev, kind="snapshot", payload=values["body"]))
+    else:
+        db.add(WorkflowRevisionModel(workflow_id=w.id, revision=rev, kind="delta", payload=pack(req.patch)))
+    # Conditional update: a concurrent writer from the same base gets a 409 instead of a lost update
+    if not db.query(WorkflowModel).filter(WorkflowModel.id == w.id, WorkflowModel.revision == req.base_revision).update(values, synchronize_session=False):
+        db.rollback(); raise HTTPException(409, {"message": "Revision conflict"})
+    try: db.commit()
+    except IntegrityError:
+        db.rollback(); raise HTTPException(409, {"message": "Revision conflict"})
+    return {"id": w.id, "revision": rev}
+
+@app.get("/api/workflows/{wid}/revisions")
+def list_workflow_revisions(wid: str, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+    w = get_owned_workflow(wid, user, db)
+    rows = db.query(WorkflowRevisionModel.revision, WorkflowRevisionModel.kind, WorkflowRevisionModel.created_at).filter(WorkflowRevisionModel.workflow_id == w.id).order_by(WorkflowRevisionModel.revision.desc()).all()
+    return [{"revision": r.revision, "kind": r.kind, "created_at": str(r.created_at)} for r in rows]
+
+@app.get("/api/workflows/{wid}/revisions/{revision}")
+def get_workflow_revision(wid: str, revision: int, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+    w = get_owned_workflow(wid, user, db)
+    doc = workflow_at(db, w, revision) if 0 <= revision <= w.revision else None
+    if doc is None: raise HTTPException(404, "Revision not in history")
+    return {"id": w.id, "revision": revision, "data": doc}
+
+# Share links carry the compact encoding; both endpoints are pure functions, so no account is needed
+@app.post("/api/workflows/encode")
+def encode_workflow_link(req: WorkflowEncode):
+    blob = encode_workflow(req.data)
+    return {"encoded": base64.urlsafe_b64encode(blob).rstrip(b"=").decode(), "bytes": len(blob)}
+
+@app.post("/api/workflows/decode")
+def decode_workflow_link(req: WorkflowDecode):
+    try: return {"data": decode_workflow(base64.urlsafe_b64decode(req.encoded + "=" * (-len(req.encoded) % 4)))}
+    except ValueError as e: raise HTTPException(422, str(e))  # binascii.Error is a ValueError too
+
+# Provider client
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `cooldown` s lets one trial call through."""
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold, self.cooldown = threshold, cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+
+    def allow(self) -> bool:
+        if self.opened_at is None: return True
+        if self.trial or time.monotonic() - self.opened_at < self.cooldown: return False
+        self.trial = True  # half-open
+        return True
+
+    def retry_after(self) -> int:
+        return max(1, int(self.cooldown - (time.monotonic() - (self.opened_at or 0))))
+
+    def record(self, ok: bool):
+        if ok:
+            self.failures, self.opened_at, self.trial = 0, None, False
+            return
+        self.failures += 1
+        if self.trial or self.failures >= self.threshold:
+            self.opened_at, self.trial = time.monotonic(), False
+
+
+class ProviderClient:
+    """Shared HTTP client for one provider: pooled keep-alive connections, per-provider and
+    per-model concurrency limits, jittered retries on 429/5xx/transport errors and a per-model
+    circuit breaker. Pass `transport` (e.g. httpx.ASGITransport) to run against a local mock."""
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, name: str, base_url: str, headers: dict, transport=None):
+        self.name, self.base_url, self.headers, self.transport = name, base_url.rstrip("/"), headers, transport
+        self.breakers: dict = defaultdict(lambda: CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN))
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
+
+    def _bind(self):
+        # Pools and semaphores belong to one event loop; rebuild if we've been moved to another
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            import httpx
+            limits = httpx.Limits(max_connections=PROVIDER_MAX_CONNECTIONS, max_keepalive_connections=PROVIDER_MAX_CONNECTIONS)
+            try: self._client = httpx.AsyncClient(base_url=self.base_url, headers=self.headers, limits=limits, http2=PROVIDER_HTTP2, transport=self.transport)
+            except ImportError: self._client = httpx.AsyncClient(base_url=self.base_url, headers=self.headers, limits=limits, transport=self.transport)
+            self._provider_sem = asyncio.Semaphore(PROVIDER_CONCURRENCY)
+            self._model_sems: dict = defaultdict(lambda: asyncio.Semaphore(MODEL_CONCURRENCY))
+            self._loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None: await self._client.aclose()
+        self._client = None
+
+    async def request(self, method: str, model: str, path: str, json_body=None, timeout: float = 300) -> "httpx.Response":
+        """Call `path` on behalf of `model`. Returns the final response (which may be an error status)."""
+        import httpx
+        breaker = self.breakers[model]
+        if not breaker.allow():
+            PROVIDER_ERRORS.labels(self.name, model, "circuit_open").inc()
+            raise HTTPException(503, f"{self.name} model {model} is unavailable, retry later", headers={"Retry-After": str(breaker.retry_after())})
+        client = self._bind()
+        latency = PROVIDER_SECONDS.labels(self.name, model)
+        async with self._provider_sem, self._model_sems[model]:
+            for attempt in range(PROVIDER_MAX_RETRIES + 1):
+                resp, err, start = None, None, time.perf_counter()
+                try:
+                    resp = await client.request(method, path, json=json_body, timeout=timeout)
+                    latency.observe(time.perf_counter() - start)
+                    if resp.status_code >= 400: PROVIDER_ERRORS.labels(self.name, model, resp.status_code).inc()
+                    if resp.status_code not in self.RETRY_STATUSES:
+                        breaker.record(True)
+                        return resp
+                except httpx.TransportError as e:
+                    err = e; latency.observe(time.perf_counter() - start)
+                    PROVIDER_ERRORS.labels(self.name, model, "transport").inc()
+                if attempt == PROVIDER_MAX_RETRIES: break
+                delay = random.uniform(0, min(8.0, 0.25 * 2 ** attempt))  # full jitter
+                if resp is not None and resp.headers.get("Retry-After", "").isdigit():
+                    delay = max(delay, float(resp.headers["Retry-After"]))
+                await asyncio.sleep(delay)
+        # Rate limiting means the provider is healthy but busy, so it doesn't count against the breaker
+        breaker.record(resp is not None and resp.status_code == 429)
+        if resp is None: raise HTTPException(502, f"{self.name} unreachable: {err!r}")
+        return resp
+
+    async def post(self, model: str, json_body: dict, timeout: float = 300) -> "httpx.Response":
+        return await self.request("POST", model, f"/{model}", json_body, timeout)
+
+
+fal = ProviderClient("fal", FAL_BASE_URL, {"Authorization": f"Key {FAL_API_KEY}"})
+fal_queue = ProviderClient("fal-queue", FAL_QUEUE_URL, {"Authorization": f"Key {FAL_API_KEY}"})
 
 # Generate
 FAL_MODELS = {
@@ -218,8 +1211,8 @@ FAL_MODELS = {
     "hunyuan": "fal-ai/hunyuan-video", "luma-ray-2": "fal-ai/luma-dream-machine",
 }
 
-@app.post("/api/generate")
-async def generate(req: GenerateReq, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+def build_fal_request(req: GenerateReq) -> tuple:
+    """Map a GenerateReq onto (fal model path, request body, is_video)."""
     fal_model = FAL_MODELS.get(req.model, "fal-ai/flux/dev")
     inp = req.inputs
     is_video = any(k in fal_model for k in ["video", "wan", "kling", "minimax", "hunyuan", "luma", "ltx", "mochi"])
@@ -232,39 +1225,1066 @@ async def generate(req: GenerateReq, user: UserModel = Depends(get_current_user)
         if inp.get("width"): body["image_size"] = {"width": int(inp["width"]), "height": int(inp.get("height", inp["width"]))}
     if inp.get("guidance_scale"): body["guidance_scale"] = float(inp["guidance_scale"])
     if inp.get("seed") and int(inp["seed"]) >= 0: body["seed"] = int(inp["seed"])
+    return fal_model, body, is_video
 
-    async with httpx.AsyncClient(timeout=300) as client:
-        resp = await client.post(f"https://fal.run/{fal_model}", json=body, headers={"Content-Type": "application/json", "Authorization": f"Key {FAL_API_KEY}"})
-        data = resp.json()
-    url = (data.get("images") or [{}])[0].get("url") or data.get("image", {}).get("url") or data.get("video", {}).get("url")
+def result_url(data: dict) -> Optional[str]:
+    return (data.get("images") or [{}])[0].get("url") or data.get("image", {}).get("url") or data.get("video", {}).get("url")
+
+# Model estimates and "auto" routing. `model: "auto:<class>"` (or "auto:<class>:cheapest") picks the model of an
+# equivalence class with the lowest expected latency (p90 inflated by the error rate) or the lowest mean cost;
+# models whose circuit is open are passed over, and AUTO_EXPLORE of requests go to another model so estimates stay fresh.
+OBJECTIVES = ("fastest", "cheapest")
+
+class ModelEstimator:
+    """Rolling (time, latency_s, cost_usd, ok) samples per fal endpoint."""
+    def __init__(self, window: int, max_age: float):
+        self.window, self.max_age = window, max_age
+        self.samples: dict = defaultdict(lambda: deque(maxlen=self.window))
+        self._seeded = not COLLECTOR_DIR
+        self._lock = threading.Lock()
+
+    def observe(self, fal_model: str, latency: float, ok: bool = True, cost: Optional[float] = None, at: Optional[float] = None):
+        self.samples[fal_model].append((at or time.time(), latency, cost, ok))
+
+    def _seed(self):
+        """Load recent collector records once, on first use (not at import: it's file I/O on the cold start path)."""
+        if self._seeded: return
+        with self._lock:
+            if self._seeded: return
+            now, days = datetime.utcnow(), int(self.max_age // 86400) + 1
+            for d in range(days, -1, -1):
+                path = os.path.join(COLLECTOR_DIR, (now - timedelta(days=d)).strftime("%Y/%m/%d"), "generations.jsonl")
+                if not os.path.exists(path): continue
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            r = json.loads(line); m = r.get("metrics") or {}
+                            if r.get("provider", "fal") != "fal" or m.get("latency_ms") is None: continue
+                            at = datetime.fromisoformat(r["timestamp"]).timestamp()
+                            self.observe(FAL_MODELS.get(r["model"], r["model"]), m["latency_ms"] / 1000, bool(r.get("output")), m.get("cost_usd"), at)
+                        except (ValueError, KeyError, TypeError): continue  # partial or foreign records
+            self._seeded = True
+
+    def estimate(self, fal_model: str) -> dict:
+        """Latency percentiles (successful calls), error rate and mean cost over the live window."""
+        self._seed()
+        cutoff = time.time() - self.max_age
+        rows = [r for r in list(self.samples.get(fal_model, ())) if r[0] >= cutoff]
+        ok = sorted(r[1] for r in rows if r[3]); costs = [r[2] for r in rows if r[2] is not None]
+        out = {"fal_model": fal_model, "samples": len(rows), "cost_usd": round(sum(costs) / len(costs), 6) if costs else MODEL_COSTS.get(fal_model)}
+        if len(rows) < ESTIMATE_MIN_SAMPLES or not ok: return {**out, "p50_s": None, "p90_s": None, "p99_s": None, "error_rate": None}
+        pct = lambda p: round(ok[min(len(ok) - 1, int(len(ok) * p))], 3)
+        return {**out, "p50_s": pct(0.5), "p90_s": pct(0.9), "p99_s": pct(0.99), "error_rate": round(1 - len(ok) / len(rows), 4)}
+
+    def rank(self, names: list, objective: str = "fastest") -> list:
+        """Candidates best first: estimated ones by score, then the rest in class order; open circuits are dropped."""
+        def score(e):
+            fast = e["p90_s"] / max(0.05, 1 - e["error_rate"]) if e["p90_s"] is not None else None
+            if objective == "cheapest": return None if e["cost_usd"] is None else (e["cost_usd"], fast if fast is not None else float("inf"))
+            return None if fast is None else (fast,)
+        scored = [(score(self.estimate(FAL_MODELS[n])), i, n) for i, n in enumerate(names) if fal.breakers[FAL_MODELS[n]].opened_at is None]
+        return [n for sc, _, n in sorted(scored, key=lambda t: (t[0] is None, t[0] or (), t[1]))]
+
+    def pick(self, names: list, objective: str = "fastest", explore: bool = True) -> str:
+        ranked = self.rank(names, objective) or names  # every circuit open: let the breaker answer
+        if explore and len(ranked) > 1 and random.random() < AUTO_EXPLORE: return random.choice(ranked[1:])
+        return ranked[0]
+
+estimator = ModelEstimator(ESTIMATE_WINDOW, ESTIMATE_MAX_AGE)
+
+def resolve_model(req: GenerateReq, explore: bool = True) -> GenerateReq:
+    """Replace an "auto:<class>[:fastest|cheapest]" model with the chosen model; other names pass through."""
+    if req.model != "auto" and not req.model.startswith("auto:"): return req
+    _, cls, objective = (req.model.split(":") + ["", ""])[:3]
+    candidates = [n for n in MODEL_CLASSES.get(cls, []) if n in FAL_MODELS]
+    if not candidates or (objective or "fastest") not in OBJECTIVES:
+        raise HTTPException(400, f"Auto model must be auto:<class>[:{'|'.join(OBJECTIVES)}]; classes: {', '.join(sorted(MODEL_CLASSES))}")
+    return req.model_copy(update={"model": estimator.pick(candidates, objective or "fastest", explore)})
+
+def record_generation(fal_model: str, started: float, ok: bool):
+    estimator.observe(fal_model, time.monotonic() - started, ok)
+
+def new_asset(user_id: str, project_id: Optional[str], model: str, inputs: dict, is_video: bool, url: str, cache_hit: bool = False) -> AssetModel:
+    meta = {**inputs, "cache_hit": True} if cache_hit else inputs
+    return AssetModel(user_id=user_id, project_id=project_id, type="video" if is_video else "image", url=url, prompt=inputs.get("prompt", ""), model=model, metadata_json=json.dumps(meta))
+
+# Generation cache
+# Only seeded requests are deterministic enough to reuse. Entries expire after GEN_CACHE_TTL (provider
+# media URLs don't live forever) and the table is trimmed to GEN_CACHE_MAX_ENTRIES by last hit.
+_cache_pruned_at = [0.0]
+
+def _normalize(value):
+    if isinstance(value, str): return " ".join(value.split())
+    if isinstance(value, dict): return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list): return [_normalize(v) for v in value]
+    return value
+
+def generation_cache_key(fal_model: str, body: dict) -> Optional[str]:
+    if GEN_CACHE_TTL <= 0 or "seed" not in body: return None
+    return hashlib.sha256(json.dumps([fal_model, _normalize(body)], sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+def cache_lookup(db: Session, key: str) -> Optional[GenerationCacheModel]:
+    row = db.get(GenerationCacheModel, key)
+    if row and row.created_at < datetime.utcnow() - timedelta(seconds=GEN_CACHE_TTL):
+        db.delete(row); db.commit(); return None
+    return row
+
+def count_hit(db: Session, key: str, fal_model: str):
+    """Record a served hit; committed by the caller, usually along with the asset it produced."""
+    db.query(GenerationCacheModel).filter(GenerationCacheModel.key == key).update({"hits": GenerationCacheModel.hits + 1, "last_hit_at": datetime.utcnow()}, synchronize_session=False)
+    count_cache(db, fal_model, True)
+
+def count_cache(db: Session, fal_model: str, hit: bool):
+    col = GenerationCacheStatModel.hits if hit else GenerationCacheStatModel.misses
+    if not db.query(GenerationCacheStatModel).filter(GenerationCacheStatModel.fal_model == fal_model).update({col.key: col + 1}, synchronize_session=False):
+        db.add(GenerationCacheStatModel(fal_model=fal_model, hits=int(hit), misses=int(not hit))); db.flush()  # so a second count in this transaction updates it
+
+def cache_row(db: Session, key: str, fal_model: str, is_video: bool, url: str):
+    """Record a fresh result and its miss, pruning when due; committed by the caller. Passed as a write batch's
+    `then`, so a lost race drops only the cache row, never the asset."""
+    db.merge(GenerationCacheModel(key=key, fal_model=fal_model, type="video" if is_video else "image", url=url, hits=0, created_at=datetime.utcnow(), last_hit_at=datetime.utcnow()))
+    db.flush()  # a repeat of the key in this transaction merges into this row
+    count_cache(db, fal_model, False)
+    if time.monotonic() - _cache_pruned_at[0] > GEN_CACHE_PRUNE_INTERVAL:
+        _cache_pruned_at[0] = time.monotonic()
+        prune_generation_cache(db, commit=False)
+
+def cache_store(db: Session, key: str, fal_model: str, is_video: bool, url: str):
+    """cache_row() in its own commit, for results whose asset is already committed."""
+    try: cache_row(db, key, fal_model, is_video, url); db.commit()
+    except IntegrityError: db.rollback()
+
+def prune_generation_cache(db: Session, commit: bool = True) -> int:
+    n = db.query(GenerationCacheModel).filter(GenerationCacheModel.created_at < datetime.utcnow() - timedelta(seconds=GEN_CACHE_TTL)).delete(synchronize_session=False)
+    keep = db.query(GenerationCacheModel.key).order_by(GenerationCacheModel.last_hit_at.desc()).limit(GEN_CACHE_MAX_ENTRIES)
+    n += db.query(GenerationCacheModel).filter(GenerationCacheModel.key.not_in(keep.scalar_subquery())).delete(synchronize_session=False)
+    if commit: db.commit()
+    return n
+
+@app.post("/api/generate")
+async def generate(req: GenerateReq, user: UserModel = Depends(get_current_user)):
+    req = resolve_model(req)
+    fal_model, body, is_video = build_fal_request(req)
+    key = generation_cache_key(fal_model, body)
+    hit = await run_db(cache_lookup, key) if key else None
+    if hit:
+        a = new_asset(user.id, req.project_id, req.model, req.inputs, is_video, hit.url, cache_hit=True)
+        await writes.add(a, then=lambda s: count_hit(s, key, fal_model))
+        return {"url": hit.url, "asset_id": a.id, "model": req.model, "cached": True}
+    await admission.charge(user.id)
+    async with admission.slot(user.id, user_weight(user)):
+        started = time.monotonic()
+        data = (await fal.post(fal_model, body, timeout=300)).json()
+    url = result_url(data)
+    record_generation(fal_model, started, bool(url))
     if url:
-        a = AssetModel(user_id=user.id, project_id=req.project_id, type="video" if is_video else "image", url=url, prompt=inp.get("prompt", ""), model=req.model, metadata_json=json.dumps(inp))
-        db.add(a); db.commit()
-        return {"url": url, "asset_id": a.id}
+        a = new_asset(user.id, req.project_id, req.model, req.inputs, is_video, url)
+        await writes.add(a, then=(lambda s: cache_row(s, key, fal_model, is_video, url)) if key else None)
+        return {"url": url, "asset_id": a.id, "model": req.model}
     raise HTTPException(500, f"Generation failed: {str(data)[:300]}")
 
+@app.post("/api/generate/estimate")
+def estimate_generation(req: GenerateReq, user: UserModel = Depends(get_current_user)):
+    """ETA and cost for a request before sending it; "auto" resolves to the model it would most likely get."""
+    req = resolve_model(req, explore=False)
+    fal_model, _, is_video = build_fal_request(req)
+    return {"model": req.model, "type": "video" if is_video else "image", **estimator.estimate(fal_model), "queue_depth": sum(admission.queued.values())}
+
+@app.get("/api/models")
+def list_models(user: UserModel = Depends(get_current_user)):
+    """Every model with its current estimate, and each auto class ranked fastest and cheapest first."""
+    return {"models": {name: estimator.estimate(fal_model) for name, fal_model in FAL_MODELS.items()},
+            "classes": {cls: {o: estimator.rank([n for n in names if n in FAL_MODELS], o) for o in OBJECTIVES} for cls, names in MODEL_CLASSES.items()}}
+
+def require_admin(user: UserModel = Depends(get_current_user)) -> UserModel:
+    if user.email.lower() not in ADMIN_EMAILS: raise HTTPException(403, "Admin only")
+    return user
+
+@app.get("/api/admin/generation-cache")
+def generation_cache_stats(top: int = Query(20, ge=0, le=200), admin: UserModel = Depends(require_admin), db: Session = Depends(get_db)):
+    entries = dict(db.query(GenerationCacheModel.fal_model, func.count()).group_by(GenerationCacheModel.fal_model).all())
+    by_model = []
+    for st in db.query(GenerationCacheStatModel).order_by(GenerationCacheStatModel.hits.desc()):
+        total = st.hits + st.misses
+        by_model.append({"fal_model": st.fal_model, "hits": st.hits, "misses": st.misses, "hit_rate": round(st.hits / total, 4) if total else 0.0, "entries": entries.get(st.fal_model, 0)})
+    hits, misses = sum(m["hits"] for m in by_model), sum(m["misses"] for m in by_model)
+    hot = db.query(GenerationCacheModel).order_by(GenerationCacheModel.hits.desc()).limit(top).all()
+    return {
+        "ttl_seconds": GEN_CACHE_TTL, "max_entries": GEN_CACHE_MAX_ENTRIES, "entries": sum(entries.values()),
+        "hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "by_model": by_model,
+        "top": [{"key": e.key, "fal_model": e.fal_model, "url": e.url, "hits": e.hits, "created_at": str(e.created_at), "last_hit_at": str(e.last_hit_at)} for e in hot],
+    }
+
+@app.post("/api/admin/generation-cache/prune")
+def prune_cache(admin: UserModel = Depends(require_admin), db: Session = Depends(get_db)):
+    return {"evicted": prune_generation_cache(db)}
+
+@app.delete("/api/admin/generation-cache")
+def clear_cache(fal_model: Optional[str] = None, admin: UserModel = Depends(require_admin), db: Session = Depends(get_db)):
+    q = db.query(GenerationCacheModel)
+    if fal_model: q = q.filter(GenerationCacheModel.fal_model == fal_model)
+    n = q.delete(synchronize_session=False); db.commit()
+    return {"deleted": n}
+
+# Admission control
+# Every provider generation holds a slot. Users are charged tokens up front (429 + Retry-After when
+# their bucket is empty); when all slots are busy, waiters are served in weighted fair order using
+# start-time fair queueing tags, so one user's backlog can't starve anyone else's first request.
+# Bucket and slot state sit in a store: in-process by default, or a SQLite file (ADMISSION_DB) that
+# several workers share. Slots are leases, so a crashed worker's slots expire.
+# The stores and the fair queue mirror server/app/engine/admission.py, which this file can't import: the
+# Vercel function is this one file. Keep the two in step. Admission here differs only where generations
+# need it: the weight comes per call from the signed-in user, charging is separate from taking a slot
+# (a batch is charged once, then each item queues), batch items may wait without limit, and rejections
+# are 429 HTTPExceptions.
+def take_tokens(tokens: float, updated: float, now: float, cost: float, capacity: float, rate: float) -> tuple:
+    """Refill a bucket and take cost from it; returns (tokens left, seconds to wait or 0)."""
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+    return (tokens if wait else tokens - cost), wait
+
+class MemoryAdmissionStore:
+    blocking = False
+
+    def __init__(self):
+        self.buckets, self.leases, self.lock = {}, {}, threading.Lock()
+
+    def take(self, user_id: str, cost: float, capacity: float, rate: float) -> float:
+        with self.lock:
+            now = time.time()
+            tokens, wait = take_tokens(*self.buckets.get(user_id, (capacity, now)), now, cost, capacity, rate)
+            self.buckets[user_id] = (tokens, now)
+            return wait
+
+    def acquire(self, user_id: str, per_user: int, total: int, ttl: float) -> tuple:
+        with self.lock:
+            now = time.time()
+            self.leases = {k: v for k, v in self.leases.items() if v[1] > now}
+            if len(self.leases) >= total: return None, "global"
+            if sum(1 for u, _ in self.leases.values() if u == user_id) >= per_user: return None, "user"
+            lease = uuid.uuid4().hex; self.leases[lease] = (user_id, now + ttl)
+            return lease, None
+
+    def release(self, lease: str):
+        with self.lock: self.leases.pop(lease, None)
+
+    def in_flight(self) -> dict:
+        with self.lock:
+            out: dict = {}
+            for u, exp in self.leases.values():
+                if exp > time.time(): out[u] = out.get(u, 0) + 1
+            return out
+
+
+class SQLiteAdmissionStore:
+    """Same operations, each in one BEGIN IMMEDIATE transaction so workers can't interleave them. They can wait on
+    the file lock, so Admission runs them on a worker thread (blocking=True); the memory store is called inline."""
+    blocking = True
+    def __init__(self, path: str):
+        self.path, self.local = path, threading.local()
+        c = self._conn(); c.execute("PRAGMA journal_mode=WAL")
+        c.executescript("CREATE TABLE IF NOT EXISTS buckets (user_id TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);"
+                        "CREATE TABLE IF NOT EXISTS leases (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, expires REAL NOT NULL);"
+                        "CREATE INDEX IF NOT EXISTS ix_leases_user ON leases (user_id, expires);")
+
+    def _conn(self) -> sqlite3.Connection:
+        if getattr(self.local, "conn", None) is None: self.local.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        return self.local.conn
+
+    def _tx(self, fn):
+        c = self._conn(); c.execute("BEGIN IMMEDIATE")
+        try: out = fn(c, time.time())
+        except BaseException: c.execute("ROLLBACK"); raise
+        c.execute("COMMIT"); return out
+
+    def take(self, user_id: str, cost: float, capacity: float, rate: float) -> float:
+        def op(c, now):
+            row = c.execute("SELECT tokens, updated FROM buckets WHERE user_id = ?", (user_id,)).fetchone()
+            tokens, wait = take_tokens(*(row or (capacity, now)), now, cost, capacity, rate)
+            c.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (user_id, tokens, now))
+            return wait
+        return self._tx(op)
+
+    def acquire(self, user_id: str, per_user: int, total: int, ttl: float) -> tuple:
+        def op(c, now):
+            c.execute("DELETE FROM leases WHERE expires <= ?", (now,))
+            if c.execute("SELECT COUNT(*) FROM leases").fetchone()[0] >= total: return None, "global"
+            if c.execute("SELECT COUNT(*) FROM leases WHERE user_id = ?", (user_id,)).fetchone()[0] >= per_user: return None, "user"
+            lease = uuid.uuid4().hex; c.execute("INSERT INTO leases VALUES (?, ?, ?)", (lease, user_id, now + ttl))
+            return lease, None
+        return self._tx(op)
+
+    def release(self, lease: str):
+        self._tx(lambda c, now: c.execute("DELETE FROM leases WHERE id = ?", (lease,)))
+
+    def in_flight(self) -> dict:
+        return dict(self._conn().execute("SELECT user_id, COUNT(*) FROM leases WHERE expires > ? GROUP BY user_id", (time.time(),)).fetchall())
+
+
+class Admission:
+    def __init__(self, store, rate: float, burst: float, total: int, per_user: int, max_queued: int, max_wait: float, lease_ttl: float = 900):
+        self.store, self.rate, self.burst, self.total, self.per_user = store, rate, burst, total, per_user
+        self.max_queued, self.max_wait, self.lease_ttl = max_queued, max_wait, lease_ttl
+        self.heap: list = []; self.seq = itertools.count(); self.vtime = 0.0
+        self.last_finish: dict = {}; self.queued: dict = defaultdict(int)
+        self.loop = self.wake = self.dispatcher = None
+        self.admitted = 0; self.rejected = {"rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+        self.waits: deque = deque(maxlen=1024); self.wait_sum = 0.0
+
+    def _reject(self, reason: str, retry_after: float):
+        self.rejected[reason] += 1
+        raise HTTPException(429, f"Too many requests ({reason})", headers={"Retry-After": str(max(1, int(retry_after + 0.999)))})
+
+    async def _call(self, fn, *args):
+        return await asyncio.to_thread(fn, *args) if self.store.blocking else fn(*args)
+
+    def _release(self, lease: str):
+        """Return a slot without waiting for the store (a cancelled request must still give it back), then wake the dispatcher."""
+        wake = lambda *_: self.wake and self.wake.set()
+        if not self.store.blocking: self.store.release(lease); wake()
+        else: asyncio.get_running_loop().run_in_executor(None, self.store.release, lease).add_done_callback(wake)
+
+    async def charge(self, user_id: str, cost: float = 1):
+        wait = await self._call(self.store.take, user_id, cost, max(self.burst, cost), self.rate)
+        if wait: self._reject("rate_limited", wait)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, weight: float = 1.0, cost: float = 1, max_wait: Optional[float] = -1):
+        """Hold a generation slot; max_wait=None waits indefinitely, -1 uses ADMISSION_MAX_WAIT."""
+        lease = await self._acquire(user_id, weight, cost, self.max_wait if max_wait == -1 else max_wait)
+        try: yield
+        finally: self._release(lease)
+
+    async def _acquire(self, user_id: str, weight: float, cost: float, max_wait: Optional[float]) -> str:
+        if not self.heap:  # nobody waiting, so a free slot can't jump the queue
+            lease, _ = await self._call(self.store.acquire, user_id, self.per_user, self.total, self.lease_ttl)
+            if lease:
+                self.admitted += 1; self.waits.append(0.0); return lease
+        if self.queued[user_id] >= self.max_queued: self._reject("queue_full", (max_wait or self.max_wait) / 2)
+        start = max(self.vtime, self.last_finish.get(user_id, 0.0))
+        self.last_finish[user_id] = finish = start + cost / weight
+        fut, t0 = asyncio.get_running_loop().create_future(), time.monotonic()
+        heapq.heappush(self.heap, (finish, next(self.seq), user_id, fut)); self.queued[user_id] += 1
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop: self.loop, self.wake, self.dispatcher = loop, asyncio.Event(), None
+        if self.dispatcher is None or self.dispatcher.done(): self.dispatcher = loop.create_task(self._dispatch())
+        self.wake.set()
+        try:
+            lease = await asyncio.wait_for(asyncio.shield(fut), max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled(): self._release(fut.result())
+            else: fut.cancel()
+            if isinstance(e, asyncio.CancelledError): raise
+            self._reject("queue_timeout", max_wait / 2)
+        waited = time.monotonic() - t0
+        self.admitted += 1; self.waits.append(waited); self.wait_sum += waited
+        return lease
+
+    async def _dispatch(self):
+        while self.heap:
+            blocked, skipped = set(), []
+            while self.heap:
+                entry = heapq.heappop(self.heap); finish, _, user_id, fut = entry
+                if fut.done(): self.queued[user_id] -= 1; continue  # timed out or cancelled
+                if user_id in blocked: skipped.append(entry); continue
+                lease, why = await self._call(self.store.acquire, user_id, self.per_user, self.total, self.lease_ttl)
+                if lease and fut.done(): self.queued[user_id] -= 1; self._release(lease); continue  # gave up while the store was busy
+                if why == "global": skipped.append(entry); break
+                if why == "user": blocked.add(user_id); skipped.append(entry); continue
+                self.queued[user_id] -= 1; self.vtime = max(self.vtime, finish); fut.set_result(lease)
+            for entry in skipped: heapq.heappush(self.heap, entry)
+            if not self.heap: break
+            self.wake.clear()  # woken by a local release; poll for slots freed by other workers
+            try: await asyncio.wait_for(self.wake.wait(), 0.1)
+            except asyncio.TimeoutError: pass
+
+    def metrics(self) -> dict:
+        """Sync: the admin route and /metrics run in the threadpool, so the store read stays off the loop."""
+        w = sorted(self.waits); pct = lambda p: round(w[min(len(w) - 1, int(len(w) * p))], 4) if w else 0.0
+        in_flight = self.store.in_flight()
+        return {"queue_depth": sum(self.queued.values()), "queued_by_user": {u: n for u, n in self.queued.items() if n},
+                "in_flight": sum(in_flight.values()), "in_flight_by_user": in_flight, "admitted": self.admitted, "rejected": dict(self.rejected),
+                "wait_seconds": {"sum": round(self.wait_sum, 4), "p50": pct(0.5), "p95": pct(0.95), "max": round(w[-1], 4) if w else 0.0}}
+
+admission = Admission(SQLiteAdmissionStore(ADMISSION_DB) if ADMISSION_DB else MemoryAdmissionStore(), ADMISSION_RATE, ADMISSION_BURST, ADMISSION_MAX_IN_FLIGHT, ADMISSION_PER_USER, ADMISSION_MAX_QUEUED, ADMISSION_MAX_WAIT)
+Metric("openflow_generations_in_flight", "Provider generations holding an admission slot.", "gauge", fn=lambda: sum(admission.store.in_flight().values()))
+Metric("openflow_admission_queue_depth", "Generations waiting for an admission slot.", "gauge", fn=lambda: sum(admission.queued.values()))
+
+def user_weight(user: UserModel) -> float:
+    return ADMISSION_WEIGHTS.get(user.email.lower(), ADMISSION_WEIGHTS.get(user.id, 1.0))
+
+@app.get("/api/admin/admission")
+def admission_metrics(admin: UserModel = Depends(require_admin)):
+    return admission.metrics()
+
+# Batch generation
+# Items run concurrently through admission control (the batch is charged up front, then each item
+# takes a fair-queued slot), and each result is streamed as soon as it lands. Asset ids are assigned up front so results can reference them;
+# the rows themselves go in with one bulk insert when the batch ends (or is cancelled).
+_batches: dict = {}  # batch id -> {"user_id", "tasks": {index: task}, "cancelled"}
+
+async def _run_batch_item(i: int, req: GenerateReq, fal_model: str, body: dict, user_id: str, weight: float, out: asyncio.Queue):
+    try:
+        async with admission.slot(user_id, weight, max_wait=None):  # already charged for the whole batch
+            started = time.monotonic()
+            resp = await fal.post(fal_model, body, timeout=300)
+        data = resp.json()
+        url = result_url(data)
+        record_generation(fal_model, started, bool(url))
+        out.put_nowait({"index": i, "status": "ok", "url": url} if url else {"index": i, "status": "error", "error": f"Generation failed: {str(data)[:300]}"})
+    except HTTPException as e:
+        out.put_nowait({"index": i, "status": "error", "error": str(e.detail)})
+    except Exception as e:
+        out.put_nowait({"index": i, "status": "error", "error": repr(e)[:300]})
+
+def plan_generations(db: Session, items: list) -> tuple:
+    """Resolve each GenerateReq to its fal call and serve what we can from the generation cache. Sync: call it
+    through run_db."""
+    plans, cached = [], {}
+    for i, item in enumerate(items):
+        item = resolve_model(item)
+        fal_model, body, is_video = build_fal_request(item)
+        key = generation_cache_key(fal_model, body)
+        hit = cache_lookup(db, key) if key else None
+        if hit:
+            cached[i] = hit.url; count_hit(db, key, fal_model)
+        plans.append((item, fal_model, body, is_video, key))
+    db.commit()
+    return plans, cached
+
+async def run_generations(batch_id: str, user_id: str, weight: float, plans: list, cached: dict, request: Request, ordered: bool = False):
+    """Run planned generations concurrently, yielding one result dict per plan (in plan order if `ordered`).
+
+    Stops early, cancelling what's left, if the client disconnects or the batch is cancelled.
+    """
+    out: asyncio.Queue = asyncio.Queue()
+    entry = _batches.setdefault(batch_id, {"user_id": user_id, "tasks": {}, "cancelled": False})
+    tasks = entry["tasks"]
+    for i, p in enumerate(plans):
+        if i in cached: out.put_nowait({"index": i, "status": "ok", "url": cached[i], "cached": True})
+        elif entry["cancelled"]: out.put_nowait({"index": i, "status": "cancelled"})
+        else:
+            tasks[i] = asyncio.create_task(_run_batch_item(i, p[0], p[1], p[2], user_id, weight, out))
+            # Reported from the task's end, not an except in it: a task cancelled before its first step never runs
+            tasks[i].add_done_callback(lambda t, i=i: t.cancelled() and out.put_nowait({"index": i, "status": "cancelled"}))
+    assets, fresh, held, nxt = [], [], {}, 0
+    try:
+        for _ in range(len(plans)):
+            while True:
+                try:
+                    res = await asyncio.wait_for(out.get(), 1.0); break
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected(): return  # don't keep generating for nobody
+            if res["status"] == "ok":
+                item, fal_model, body, is_video, key = plans[res["index"]]
+                a = new_asset(user_id, item.project_id, item.model, item.inputs, is_video, res["url"], cache_hit=res.get("cached", False))
+                a.id = res["asset_id"] = str(uuid.uuid4())
+                assets.append(a)
+                if key and not res.get("cached"): fresh.append((key, fal_model, is_video, res["url"]))
+            if not ordered:
+                yield res; continue
+            held[res["index"]] = res
+            while nxt in held:
+                yield held.pop(nxt); nxt += 1
+    finally:
+        _batches.pop(batch_id, None)
+        for t in tasks.values(): t.cancel()  # client went away or the batch was cancelled
+        if assets:  # one transaction for the batch's assets and new cache rows; not awaited, the stream may be cancelled
+            writes.submit(*assets, then=lambda s: [cache_row(s, *f) for f in fresh]).add_done_callback(log_batch_write)
+
+def log_batch_write(fut):
+    if fut.exception(): log.error("Saving batch assets failed", exc_info=fut.exception())
+
+def stream_frame(msg: dict, sse: bool) -> str:
+    return f"event: {msg['event']}\ndata: {json.dumps(msg)}\n\n" if sse else json.dumps(msg) + "\n"
+
+def wants_sse(request: Request, format: Optional[str]) -> bool:
+    return format == "sse" or "text/event-stream" in request.headers.get("accept", "")
+
+def stream_response(gen, sse: bool, batch_id: str) -> StreamingResponse:
+    return StreamingResponse(gen, media_type="text/event-stream" if sse else "application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Batch-Id": batch_id})
+
+@app.post("/api/generate/batch")
+async def generate_batch(req: BatchReq, request: Request, format: Optional[str] = None, user: UserModel = Depends(get_current_user)):
+    """Stream one result per item as NDJSON (default) or SSE (`?format=sse` or `Accept: text/event-stream`).
+
+    The first message carries the batch id; DELETE /api/generate/batch/{id} cancels whatever hasn't finished.
+    """
+    if not req.items: raise HTTPException(400, "No items")
+    if len(req.items) > BATCH_MAX_ITEMS: raise HTTPException(400, f"At most {BATCH_MAX_ITEMS} items per batch")
+    sse, batch_id, user_id, weight = wants_sse(request, format), str(uuid.uuid4()), user.id, user_weight(user)
+    plans, cached = await run_db(plan_generations, req.items)
+    await admission.charge(user_id, len(plans) - len(cached))
+    _batches[batch_id] = {"user_id": user_id, "tasks": {}, "cancelled": False}  # cancellable as soon as the id is out
+
+    async def stream():
+        counts = {"ok": 0, "error": 0, "cancelled": 0}
+        yield stream_frame({"event": "batch", "batch_id": batch_id, "total": len(plans)}, sse)
+        async for res in run_generations(batch_id, user_id, weight, plans, cached, request):
+            counts[res["status"]] += 1
+            yield stream_frame({"event": "result", **res}, sse)
+        yield stream_frame({"event": "done", "batch_id": batch_id, **counts}, sse)
+
+    return stream_response(stream(), sse, batch_id)
+
+@app.delete("/api/generate/batch/{batch_id}")
+async def cancel_batch(batch_id: str, user: UserModel = Depends(get_current_user)):  # async: tasks must be cancelled on the loop thread
+    entry = _batches.get(batch_id)
+    if not entry or entry["user_id"] != user.id: raise HTTPException(404, "Not found")
+    entry["cancelled"] = True
+    pending = [t for t in entry["tasks"].values() if not t.done()]
+    for t in pending: t.cancel()
+    return {"cancelled": len(pending)}
+
+# Generation jobs
+# POST /api/jobs returns immediately with a job id. The job finishes via whichever arrives first:
+# fal's webhook (PUBLIC_BASE_URL set), the in-process poller (JOB_POLLER), or a status read that
+# finds the job due for a provider check. Completion is a conditional UPDATE, so racing paths
+# create the asset exactly once.
+PENDING = ("queued", "running")
+
+def job_out(j: JobModel) -> dict:
+    return {"id": j.id, "status": j.status, "model": j.model, "type": j.type, "project_id": j.project_id, "url": j.url, "asset_id": j.asset_id, "error": j.error, "created_at": str(j.created_at), "updated_at": str(j.updated_at)}
+
+def webhook_token(job_id: str) -> str:
+    return hmac.new(SECRET_KEY.encode(), f"job:{job_id}".encode(), hashlib.sha256).hexdigest()
+
+def job_snapshot(db: Session, job: JobModel) -> JobModel:
+    """The job's current row, detached: safe to read after run_db closes the session."""
+    db.refresh(job); db.expunge(job); return job
+
+def load_job(db: Session, job_id: str) -> Optional[JobModel]:
+    job = db.get(JobModel, job_id)
+    return job_snapshot(db, job) if job else None
+
+def finish_job(db: Session, job_id: str, data: Optional[dict] = None, error: Optional[str] = None) -> JobModel:
+    """Move a pending job to completed (creating its asset) or failed; a no-op if it had already finished. Sync, for
+    run_db; returns the job as it now stands."""
+    job = db.get(JobModel, job_id)
+    url = result_url(data) if data and not error else None
+    values = {"status": "completed" if url else "failed", "updated_at": datetime.utcnow(), "checked_at": datetime.utcnow()}
+    if url:
+        asset = new_asset(job.user_id, job.project_id, job.model, json.loads(job.inputs_json), job.type == "video", url)
+        db.add(asset); db.flush()
+        values.update(url=url, asset_id=asset.id)
+    else: values["error"] = (error or f"Generation failed: {str(data)[:300]}")[:2000]
+    won = db.query(JobModel).filter(JobModel.id == job.id, JobModel.status.in_(PENDING)).update(values, synchronize_session=False) == 1
+    if won:
+        db.commit()
+        estimator.observe(job.fal_model, (datetime.utcnow() - job.created_at).total_seconds(), bool(url))  # submit to result, queue included
+        if url and job.cache_key: cache_store(db, job.cache_key, job.fal_model, job.type == "video", url)
+    else: db.rollback()
+    return job_snapshot(db, job)
+
+def mark_checked(db: Session, job_id: str, running: bool) -> Optional[JobModel]:
+    """Record a provider check that didn't finish the job (and that it started running, if so)."""
+    values = {"checked_at": datetime.utcnow()}
+    if running: values.update(status="running", updated_at=datetime.utcnow())
+    db.query(JobModel).filter(JobModel.id == job_id, JobModel.status.in_(PENDING)).update(values, synchronize_session=False)
+    db.commit()
+    return load_job(db, job_id)
+
+def mark_submitted(db: Session, job_id: str, request_id: str, status_url: str, response_url: str) -> Optional[JobModel]:
+    db.query(JobModel).filter(JobModel.id == job_id).update({"request_id": request_id, "status_url": status_url, "response_url": response_url, "checked_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return load_job(db, job_id)
+
+async def refresh_job(job: JobModel) -> JobModel:
+    """Check a pending job's provider status and finish it if the result is ready. Takes and returns detached jobs;
+    the database work runs through run_db, never on the event loop."""
+    if job.status not in PENDING: return job
+    if not job.status_url:  # submission never reached the provider
+        return await run_db(finish_job, job.id, None, "Job was never submitted")
+    if datetime.utcnow() - job.created_at > timedelta(seconds=JOB_MAX_AGE):
+        return await run_db(finish_job, job.id, None, "Timed out waiting for the provider")
+    try:
+        resp = await fal_queue.request("GET", job.fal_model, job.status_url, timeout=30)
+        state = resp.json().get("status") if resp.status_code < 400 else None
+        if state == "COMPLETED":
+            resp = await fal_queue.request("GET", job.fal_model, job.response_url, timeout=60)
+            if resp.status_code < 400: return await run_db(finish_job, job.id, resp.json())
+            return await run_db(finish_job, job.id, None, f"Generation failed ({resp.status_code}): {resp.text[:300]}")
+        if resp.status_code in (400, 404, 410, 422):
+            return await run_db(finish_job, job.id, None, f"Provider lost the request ({resp.status_code})")
+    except HTTPException:
+        state = None  # provider unavailable; try again next round
+    return await run_db(mark_checked, job.id, state == "IN_PROGRESS" and job.status == "queued") or job
+
+def due_job_ids(db: Session) -> list:
+    return [j.id for j in db.query(JobModel.id).filter(JobModel.status.in_(PENDING), JobModel.checked_at <= datetime.utcnow() - timedelta(seconds=JOB_POLL_INTERVAL)).order_by(JobModel.checked_at).limit(50)]
+
+async def job_poller():
+    while True:
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+        try:
+            await asyncio.gather(*(_poll_one(jid) for jid in await run_db(due_job_ids)))
+        except asyncio.CancelledError: raise
+        except Exception: log.exception("Job poller round failed; retrying next round")
+
+async def _poll_one(job_id: str):
+    if job := await run_db(load_job, job_id): await refresh_job(job)
+
+def get_owned_job(db: Session, job_id: str, user: UserModel) -> JobModel:
+    job = db.query(JobModel).filter(JobModel.id == job_id, JobModel.user_id == user.id).first()
+    if not job: raise HTTPException(404, "Not found")
+    return job_snapshot(db, job)
+
+def job_due(job: JobModel) -> bool:
+    return job.status in PENDING and datetime.utcnow() - job.checked_at >= timedelta(seconds=JOB_POLL_INTERVAL)
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(req: GenerateReq, response: Response, user: UserModel = Depends(get_current_user)):
+    req = resolve_model(req)
+    fal_model, body, is_video = build_fal_request(req)
+    key = generation_cache_key(fal_model, body)
+    job = JobModel(id=str(uuid.uuid4()), user_id=user.id, project_id=req.project_id, model=req.model, fal_model=fal_model, type="video" if is_video else "image", inputs_json=json.dumps(req.inputs), cache_key=key)
+    hit = await run_db(cache_lookup, key) if key else None
+    if hit:  # already done: return the finished job, no provider call
+        a = new_asset(user.id, req.project_id, req.model, req.inputs, is_video, hit.url, cache_hit=True); a.id = str(uuid.uuid4())
+        job.status, job.url, job.asset_id = "completed", hit.url, a.id
+        await writes.add(a, job, then=lambda s: count_hit(s, key, fal_model))
+        response.status_code = 200
+        return job_out(job)
+    await admission.charge(user.id)  # the provider's queue holds the work, so jobs are rate limited but take no slot
+    await writes.add(job)
+    path = f"/{fal_model}"
+    if PUBLIC_BASE_URL: path += "?fal_webhook=" + quote(f"{PUBLIC_BASE_URL}/api/jobs/{job.id}/webhook?token={webhook_token(job.id)}", safe="")
+    try:
+        resp = await fal_queue.request("POST", fal_model, path, body, timeout=30)
+    except HTTPException as e:
+        await run_db(finish_job, job.id, None, str(e.detail)); raise
+    data = resp.json() if resp.status_code < 400 else {}
+    if not data.get("request_id"):
+        job = await run_db(finish_job, job.id, None, f"Queue submit failed ({resp.status_code}): {resp.text[:300]}")
+        raise HTTPException(502, job.error)
+    base = f"{FAL_QUEUE_URL}/{fal_model}/requests/{data['request_id']}"
+    job = await run_db(mark_submitted, job.id, data["request_id"], data.get("status_url") or f"{base}/status", data.get("response_url") or base)
+    response.headers["Location"] = f"/api/jobs/{job.id}"
+    e = estimator.estimate(fal_model)
+    return {**job_out(job), "eta": {"p50_s": e["p50_s"], "p90_s": e["p90_s"]}}
+
+@app.get("/api/jobs")
+def list_jobs(response: Response, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), status: Optional[str] = None, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+    q = db.query(JobModel).filter(JobModel.user_id == user.id)
+    if status: q = q.filter(JobModel.status == status)
+    return [job_out(j) for j in keyset_page(q, JobModel.created_at, JobModel.id, cursor, limit, response)]
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, user: UserModel = Depends(get_current_user)):
+    job = await run_db(get_owned_job, job_id, user)
+    if job_due(job): job = await refresh_job(job)
+    return job_out(job)
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, user: UserModel = Depends(get_current_user)):
+    """Server-sent events: a `status` event on every change, ending with the terminal state."""
+    await run_db(get_owned_job, job_id, user)
+    async def stream():
+        last, deadline = None, time.monotonic() + JOB_SSE_TIMEOUT
+        while True:
+            job = await run_db(load_job, job_id)
+            if job_due(job): job = await refresh_job(job)
+            if job.status != last:
+                last = job.status
+                yield f"event: status\ndata: {json.dumps(job_out(job))}\n\n"
+            if job.status not in PENDING: return
+            if time.monotonic() > deadline:
+                yield "retry: 1000\n\n"; return
+            await asyncio.sleep(min(1.0, JOB_POLL_INTERVAL))
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/api/jobs/{job_id}/webhook")
+async def job_webhook(job_id: str, request: Request, token: str = ""):
+    """fal queue webhook: {"request_id", "status": "OK" | "ERROR", "payload", "error"}."""
+    if not hmac.compare_digest(token, webhook_token(job_id)): raise HTTPException(403, "Bad token")
+    job = await run_db(load_job, job_id)
+    if not job: raise HTTPException(404, "Not found")
+    msg = await request.json()
+    if msg.get("status") == "OK" and msg.get("payload"): await run_db(finish_job, job_id, msg["payload"])
+    elif msg.get("status") == "OK": await refresh_job(job)  # payload too large to inline; fetch it
+    else: await run_db(finish_job, job_id, None, str(msg.get("error") or msg.get("payload") or "Generation failed")[:2000])
+    return {"ok": True}
+
+# Media derivatives
+# New assets are queued on commit; a small thread pool fetches each original once and renders thumbnails (images)
+# or posters plus a short muted preview (videos) into DERIVATIVE_DIR, named by content hash so identical output is
+# stored once. Pillow renders images when installed, ffmpeg everything else; with neither, listings just carry the
+# original url. Files are evicted least recently served first; a request for an evicted file redirects to the
+# original and queues the asset again.
+MEDIA_TYPES = {"webp": "image/webp", "jpg": "image/jpeg", "mp4": "video/mp4"}
+MEDIA_EXT = {v: k for k, v in MEDIA_TYPES.items()}
+MEDIA_NAME = re.compile(r"([0-9a-f]{64})\.(webp|jpg|mp4)")
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"  # names are content hashes: a name never changes content
+_media_tools: dict = {}
+
+def media_tools() -> dict:
+    """{"pillow": bool, "ffmpeg": path or None}, checked once per process."""
+    if not _media_tools:
+        try: import PIL.Image; pillow = True  # noqa: F401
+        except ImportError: pillow = False
+        _media_tools.update(pillow=pillow, ffmpeg=shutil.which(FFMPEG))
+    return _media_tools
+
+def can_derive(asset_type: str) -> bool:
+    tools = DERIVATIVES and media_tools()
+    return bool(tools) and bool(tools["ffmpeg"] or (asset_type != "video" and tools["pillow"]))
+
+def media_path(digest: str, content_type: str) -> str:
+    return os.path.join(DERIVATIVE_DIR, digest[:2], f"{digest}.{MEDIA_EXT[content_type]}")
+
+def media_url(digest: str, content_type: str) -> str:
+    return f"{PUBLIC_BASE_URL}/api/media/{digest}.{MEDIA_EXT[content_type]}"
+
+_media_bytes: list = [None]  # running size of DERIVATIVE_DIR in this process, from a scan on the first write
+_media_lock = threading.Lock()
+
+def _media_files():
+    for root, _, names in os.walk(DERIVATIVE_DIR):
+        for n in names:
+            if MEDIA_NAME.fullmatch(n):
+                try: yield os.path.join(root, n), os.stat(os.path.join(root, n))
+                except FileNotFoundError: pass
+
+def evict_media(added: int = 0) -> int:
+    """Once the cache passes DERIVATIVE_MAX_BYTES, delete least recently served files down to 90% of it. Processes
+    sharing the directory each keep their own running total and rescan before evicting."""
+    with _media_lock:
+        if _media_bytes[0] is None: _media_bytes[0] = sum(st.st_size for _, st in _media_files())
+        else: _media_bytes[0] += added
+        if _media_bytes[0] <= DERIVATIVE_MAX_BYTES: return 0
+        files = sorted(_media_files(), key=lambda f: f[1].st_mtime)
+        total, removed = sum(st.st_size for _, st in files), 0
+        for path, st in files:
+            if total <= DERIVATIVE_MAX_BYTES * 0.9: break
+            try: os.remove(path); total -= st.st_size; removed += 1
+            except FileNotFoundError: pass
+        _media_bytes[0] = total
+        return removed
+
+def store_media(data: bytes, content_type: str) -> str:
+    digest = hashlib.sha256(data).hexdigest(); path = media_path(digest, content_type)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f: f.write(data)
+        os.replace(tmp, path); evict_media(len(data))
+    return digest
+
+def fetch_original(url: str, dst: str):
+    """Copy an asset's original to dst: from DERIVATIVE_SOURCE_DIR by file name when set, else over HTTP(S)."""
+    if DERIVATIVE_SOURCE_DIR: return shutil.copyfile(os.path.join(DERIVATIVE_SOURCE_DIR, os.path.basename(urlsplit(url).path)), dst)
+    if urlsplit(url).scheme not in ("http", "https"): raise ValueError("Asset url is not http(s)")
+    import httpx
+    with httpx.stream("GET", url, timeout=DERIVATIVE_TIMEOUT, follow_redirects=True) as r, open(dst, "wb") as f:
+        r.raise_for_status(); n = 0
+        for chunk in r.iter_bytes(1 << 16):
+            n += len(chunk)
+            if n > DERIVATIVE_SOURCE_MAX_BYTES: raise ValueError(f"Original is larger than {DERIVATIVE_SOURCE_MAX_BYTES} bytes")
+            f.write(chunk)
+
+def _ffmpeg(*args):
+    import subprocess
+    proc = subprocess.run([media_tools()["ffmpeg"], "-nostdin", "-v", "error", "-y", *args], capture_output=True, timeout=DERIVATIVE_TIMEOUT)
+    if proc.returncode: raise RuntimeError(f"ffmpeg: {proc.stderr.decode(errors='replace').strip()[-500:] or proc.returncode}")
+
+def _fit(size: int, even: bool = False) -> str:
+    """ffmpeg scale filter: within size x size, aspect kept, never upscaled (even dimensions for yuv420p video)."""
+    return f"scale='min(iw,{size})':'min(ih,{size})':force_original_aspect_ratio=decrease" + (":force_divisible_by=2" if even else "")
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f: return f.read()
+
+def _stills(src: str, kind: str, work: str) -> list:
+    """One still per THUMB_SIZES entry: WebP from Pillow (largest first, each from the last), else JPEG from ffmpeg."""
+    if not media_tools()["pillow"]:
+        out = []
+        for size in THUMB_SIZES:
+            _ffmpeg("-i", src, "-frames:v", "1", "-vf", _fit(size), "-q:v", "4", "-update", "1", dst := os.path.join(work, f"{kind}{size}.jpg"))
+            out.append((kind, size, _read(dst), "image/jpeg"))
+        return out
+    from PIL import Image, ImageOps, features
+    fmt, ctype = ("WEBP", "image/webp") if features.check("webp") else ("JPEG", "image/jpeg")
+    out = []
+    with Image.open(src) as im:
+        im.draft("RGB", (THUMB_SIZES[-1], THUMB_SIZES[-1]))  # JPEGs decode at a reduced scale
+        im = ImageOps.exif_transpose(im)  # first frame of animations
+        im = im.convert("RGBA" if fmt == "WEBP" and (im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info) else "RGB")
+        for size in reversed(THUMB_SIZES):
+            im.thumbnail((size, size), Image.Resampling.LANCZOS)
+            buf = io.BytesIO(); im.save(buf, fmt, quality=80)
+            out.append((kind, size, buf.getvalue(), ctype))
+    return out
+
+def render_derivatives(src: str, asset_type: str, work: str) -> list:
+    """[(kind, size, data, content_type)] for an original on disk. A failed preview becomes an ("error", size, message,
+    None) entry so the posters still ship."""
+    if asset_type != "video": return _stills(src, "thumb", work)
+    _ffmpeg("-i", src, "-frames:v", "1", "-vf", f"thumbnail,{_fit(THUMB_SIZES[-1])}", "-update", "1", frame := os.path.join(work, "frame.png"))
+    out = _stills(frame, "poster", work)
+    if PREVIEW_SECONDS > 0:
+        try: _ffmpeg("-t", str(PREVIEW_SECONDS), "-i", src, "-an", "-vf", _fit(PREVIEW_SIZE, even=True), "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+                     "-pix_fmt", "yuv420p", "-movflags", "+faststart", clip := os.path.join(work, "preview.mp4"))
+        except Exception as e: return out + [("error", PREVIEW_SIZE, f"preview: {e}"[:2000], None)]
+        out.append(("preview", PREVIEW_SIZE, _read(clip), "video/mp4"))
+    return out
+
+def build_derivatives(asset_id: str) -> str:
+    """Render, or reuse from an asset with the same url, an asset's derivatives and record them. Returns the outcome."""
+    db = SessionLocal()
+    try:
+        a = db.get(AssetModel, asset_id)
+        if a is None or db.query(AssetDerivativeModel.id).filter(AssetDerivativeModel.asset_id == asset_id).first(): return "skipped"
+        source = hashlib.sha256(a.url.encode()).hexdigest()
+        prior = {(d.kind, d.size): d for d in db.query(AssetDerivativeModel).filter(AssetDerivativeModel.source == source, AssetDerivativeModel.kind != "error")}
+        if prior and all(os.path.exists(media_path(d.digest, d.content_type)) for d in prior.values()):
+            outcome, made = "reused", [(d.kind, d.size, d.digest, d.content_type, d.bytes, None) for d in prior.values()]
+        else:
+            outcome, made = "rendered", []
+            with tempfile.TemporaryDirectory(prefix="openflow-derive-") as work:
+                try:
+                    fetch_original(a.url, src := os.path.join(work, "original"))
+                    for kind, size, data, ctype in render_derivatives(src, a.type, work):
+                        made.append((kind, size, None, None, 0, data) if ctype is None else (kind, size, store_media(data, ctype), ctype, len(data), None))
+                except Exception as e:
+                    outcome, made = "failed", [("error", 0, None, None, 0, f"{type(e).__name__}: {e}"[:2000])]
+        db.add_all([AssetDerivativeModel(asset_id=asset_id, source=source, kind=kind, size=size, digest=digest, content_type=ctype, bytes=n, error=err)
+                    for kind, size, digest, ctype, n, err in made])
+        try: db.commit()
+        except IntegrityError: db.rollback(); return "skipped"  # another process got there first
+        return outcome
+    finally:
+        db.close()
+
+
+class DerivativePool:
+    """Background renderer, created on first use like KdfPool. An asset already queued or rendering in this process
+    isn't queued again."""
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: set = set()
+        self._lock = threading.Lock()
+
+    def submit(self, asset_ids):
+        with self._lock:
+            if self._executor is None: self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="derive")
+            for aid in asset_ids:
+                if aid not in self._pending: self._pending.add(aid); self._executor.submit(self._run, aid)
+
+    def _run(self, asset_id: str):
+        outcome = "failed"
+        try: outcome = build_derivatives(asset_id)
+        finally:
+            DERIVATIVE_JOBS.labels(outcome).inc()
+            with self._lock: self._pending.discard(asset_id)
+
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def shutdown(self):
+        if self._executor: self._executor.shutdown(wait=False, cancel_futures=True)
+
+derivatives = DerivativePool(DERIVATIVE_WORKERS)
+DERIVATIVE_JOBS = Metric("openflow_derivative_jobs_total", "Assets processed by the derivative pool by outcome (rendered, reused, failed, skipped).", "counter", ("outcome",))
+Metric("openflow_derivative_queue_depth", "Assets queued or rendering in the derivative pool.", "gauge", fn=lambda: derivatives.depth())
+
+@event.listens_for(_Session, "after_flush")
+def _collect_new_assets(session, flush_context):
+    if new := [o.id for o in session.new if isinstance(o, AssetModel) and can_derive(o.type)]: session.info.setdefault("new_assets", []).extend(new)
+
+@event.listens_for(_Session, "after_commit")
+def _derive_new_assets(session):
+    if new := session.info.pop("new_assets", None): derivatives.submit(new)
+
+@event.listens_for(_Session, "after_soft_rollback")
+def _forget_new_assets(session, previous_transaction):
+    session.info.pop("new_assets", None)
+
+def with_derivatives(db: Session, items: list) -> list:
+    """Add "thumbnail" (the smallest thumb or poster; null until rendered) and "derivatives" ({"thumb_256": url, ...})
+    to asset list items, and queue items that have never been rendered. "url" stays the original."""
+    refs, seen = defaultdict(dict), set()
+    for d in db.query(AssetDerivativeModel.asset_id, AssetDerivativeModel.kind, AssetDerivativeModel.size, AssetDerivativeModel.digest, AssetDerivativeModel.content_type
+                      ).filter(AssetDerivativeModel.asset_id.in_([i["id"] for i in items])):
+        seen.add(d.asset_id)
+        if d.digest: refs[d.asset_id][f"{d.kind}_{d.size}"] = media_url(d.digest, d.content_type)
+    for item in items:
+        found = refs.get(item["id"], {})
+        stills = sorted((int(k.rpartition("_")[2]), v) for k, v in found.items() if not k.startswith("preview_"))
+        item["thumbnail"], item["derivatives"] = stills[0][1] if stills else None, found
+    if missing := [i["id"] for i in items if i["id"] not in seen and can_derive(i["type"])]: derivatives.submit(missing)
+    return items
+
+@app.get("/api/media/{name}")
+def get_media(name: str, request: Request, db: Session = Depends(get_db)):
+    """A derivative by content hash. Unauthenticated, like the provider urls it stands in for (<img> can't send a
+    bearer token); names are unguessable sha256s."""
+    m = MEDIA_NAME.fullmatch(name)
+    if not m: raise HTTPException(404, "Not found")
+    etag = f'"{m[1]}"'
+    if request.headers.get("if-none-match") in (etag, f"W/{etag}"): return Response(status_code=304, headers={"ETag": etag, "Cache-Control": MEDIA_CACHE_CONTROL})
+    path = os.path.join(DERIVATIVE_DIR, m[1][:2], name)
+    try: st = os.stat(path)
+    except FileNotFoundError: st = None
+    if st:
+        if time.time() - st.st_mtime > 3600: os.utime(path)  # mtime is the eviction clock; touch at most hourly
+        return FileResponse(path, media_type=MEDIA_TYPES[m[2]], headers={"ETag": etag, "Cache-Control": MEDIA_CACHE_CONTROL}, stat_result=st)
+    rows = db.query(AssetModel.id, AssetModel.type, AssetModel.url).join(AssetDerivativeModel, AssetDerivativeModel.asset_id == AssetModel.id).filter(AssetDerivativeModel.digest == m[1]).limit(20).all()
+    if not rows: raise HTTPException(404, "Not found")
+    if ids := [r.id for r in rows if can_derive(r.type)]:  # evicted: render again
+        db.query(AssetDerivativeModel).filter(AssetDerivativeModel.asset_id.in_(ids)).delete(synchronize_session=False); db.commit()
+        derivatives.submit(ids)
+    return RedirectResponse(rows[0].url, 307, headers={"Cache-Control": "no-store"})
+
 # Assets
 @app.get("/api/assets")
-def list_assets(user: UserModel = Depends(get_current_user), db: Session = Depends(get_db), limit: int = 50):
-    return [{"id": a.id, "type": a.type, "url": a.url, "prompt": a.prompt, "model": a.model, "created_at": str(a.created_at)} for a in db.query(AssetModel).filter(AssetModel.user_id == user.id).order_by(AssetModel.created_at.desc()).limit(limit).all()]
+def list_assets(response: Response, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), include: Optional[str] = None, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+    extra = parse_include(include, {"metadata_json"})
+    cols = [AssetModel.id, AssetModel.type, AssetModel.url, AssetModel.prompt, AssetModel.model, AssetModel.created_at]
+    if extra: cols.append(AssetModel.metadata_json)
+    out = []
+    for a in keyset_page(db.query(*cols).filter(AssetModel.user_id == user.id), AssetModel.created_at, AssetModel.id, cursor, limit, response):
+        item = {"id": a.id, "type": a.type, "url": a.url, "prompt": a.prompt, "model": a.model, "created_at": str(a.created_at)}
+        if extra: item["metadata_json"] = a.metadata_json
+        out.append(item)
+    return with_derivatives(db, out)
+
+# Asset search: FTS5 on SQLite (migration 3), ranked by bm25 with these column weights; elsewhere every word must
+# appear in the prompt or model (ILIKE) and results come newest first
+SEARCH_WEIGHTS = (0.0, 3.0, 2.0, 1.0, 1.0)  # owner, prompt, model, type, params
+SEARCH_MAX_WORDS = 16
+assets_fts = table("assets_fts", column("rowid"))  # virtual table from migration 3, not part of Base.metadata
+
+def encode_rank_cursor(score: float, rowid: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, rowid]).encode()).rstrip(b"=").decode()
+
+def decode_rank_cursor(cursor: str) -> tuple:
+    try:
+        score, rowid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(score), int(rowid)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+def fts_match(q: str, user_id: str) -> str:
+    """User text as an FTS5 query over the user's assets: every word must match, the last one as a prefix."""
+    words = re.findall(r"\w+", q)[:SEARCH_MAX_WORDS]
+    if not words: raise HTTPException(400, "Search query has no words")
+    terms = " ".join(f'"{w}"' for w in words) + "*"
+    return f"owner:u{user_id.replace('-', '')} AND ({terms})"
+
+@app.get("/api/assets/search")
+def search_assets(response: Response, q: str = Query(..., min_length=1, max_length=500), type: Optional[str] = None, model: Optional[str] = None, project_id: Optional[str] = None,
+                  sort: str = Query("relevance", pattern="^(relevance|newest)$"), cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), include: Optional[str] = None,
+                  user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Search prompts, model and type of the user's assets. sort=relevance pages by (bm25 score, rowid) with the cursor
+    in X-Next-Cursor; scores shift as assets are added, so a long-lived cursor can skip or repeat a few results."""
+    extra = parse_include(include, {"metadata_json"})
+    cols = [AssetModel.id, AssetModel.type, AssetModel.url, AssetModel.prompt, AssetModel.model, AssetModel.created_at]
+    if extra: cols.append(AssetModel.metadata_json)
+    filters = [AssetModel.user_id == user.id] + [c == v for c, v in ((AssetModel.type, type), (AssetModel.model, model), (AssetModel.project_id, project_id)) if v is not None]
+    score = None
+    if db.bind.dialect.name == "sqlite":
+        rowid, score = literal_column("assets.rowid"), func.bm25(literal_column("assets_fts"), *SEARCH_WEIGHTS)
+        query = db.query(*cols, score.label("score"), rowid.label("rowid")).select_from(AssetModel).join(assets_fts, assets_fts.c.rowid == rowid)
+        query = query.filter(text("assets_fts MATCH :match").bindparams(match=fts_match(q, user.id)), *filters)
+    else:
+        words = re.findall(r"\w+", q)[:SEARCH_MAX_WORDS]
+        if not words: raise HTTPException(400, "Search query has no words")
+        pats = ["%" + re.sub(r"([\\%_])", r"\\\1", w) + "%" for w in words]  # \w+ words can contain _, a LIKE wildcard
+        query = db.query(*cols).filter(*filters, *[or_(AssetModel.prompt.ilike(p, escape="\\"), AssetModel.model.ilike(p, escape="\\")) for p in pats])
+    if score is None or sort == "newest": rows = keyset_page(query, AssetModel.created_at, AssetModel.id, cursor, limit, response)
+    else:
+        if cursor:
+            s, r = decode_rank_cursor(cursor)
+            query = query.filter(or_(score > s, and_(score == s, rowid > r)))
+        rows = query.order_by(score, rowid).limit(limit + 1).all()
+        if len(rows) > limit:
+            rows = rows[:limit]; response.headers["X-Next-Cursor"] = encode_rank_cursor(rows[-1].score, rows[-1].rowid)
+    out = []
+    for a in rows:
+        item = {"id": a.id, "type": a.type, "url": a.url, "prompt": a.prompt, "model": a.model, "created_at": str(a.created_at)}
+        if score is not None and sort == "relevance": item["score"] = round(-a.score, 4)  # bm25 is lower-is-better; report higher-is-better
+        if extra: item["metadata_json"] = a.metadata_json
+        out.append(item)
+    return with_derivatives(db, out)
 
 # Scene Builder
+# Decompositions are cached by (story, style, scene count) with the generation cache TTL; only real LLM
+# output is cached, never the placeholder fallback.
+def fallback_scenes(story: str, num_scenes: int, style: str) -> list:
+    return [{"title": f"Scene {i+1}", "prompt": f"{style}, {story}, scene {i+1}", "type": "image"} for i in range(num_scenes)]
+
+def valid_scenes(scenes, num_scenes: int) -> list:
+    """The usable scenes of a decomposition: dicts with a non-empty string prompt, at most num_scenes of them."""
+    if not isinstance(scenes, list): return []
+    return [sc for sc in scenes if isinstance(sc, dict) and isinstance(sc.get("prompt"), str) and sc["prompt"].strip()][:num_scenes]
+
+def load_decomposition(db: Session, key: str) -> Optional[list]:
+    row = db.get(SceneDecompositionModel, key)
+    return json.loads(row.scenes_json) if row and row.created_at >= datetime.utcnow() - timedelta(seconds=GEN_CACHE_TTL) else None
+
+def save_decomposition(db: Session, key: str, scenes: list):
+    db.merge(SceneDecompositionModel(key=key, scenes_json=json.dumps(scenes), created_at=datetime.utcnow())); db.commit()
+
+async def decompose_story(story: str, num_scenes: int, style: str) -> tuple:
+    """Return (scenes, from_cache): at most num_scenes scenes, each a dict with a string "prompt"."""
+    key = hashlib.sha256(json.dumps([" ".join(story.split()), style, num_scenes]).encode()).hexdigest()
+    if scenes := valid_scenes(await run_db(load_decomposition, key), num_scenes): return scenes, True
+    try:
+        resp = await fal.post("fal-ai/any-llm", {
+            "model": "google/gemini-flash-2.0",
+            "prompt": f"Break this story into {num_scenes} visual scenes. For each, give a title and a detailed {style} image prompt. Return ONLY a JSON array: [{{\"title\": \"...\", \"prompt\": \"...\", \"type\": \"image\"}}]\n\nStory: {story}",
+        }, timeout=60)
+        data = resp.json()
+        text = data.get("output", "") or str(data)
+        m = re.search(r'\[.*\]', text, re.DOTALL)
+        if scenes := valid_scenes(json.loads(m.group()) if m else None, num_scenes):
+            if GEN_CACHE_TTL > 0: await run_db(save_decomposition, key, scenes)
+            return scenes, False
+        log.warning("Story decomposition returned no usable scenes; using placeholders")
+    except Exception:
+        log.warning("Story decomposition failed; using placeholders", exc_info=True)
+    return fallback_scenes(story, num_scenes, style), False
+
 @app.post("/api/scene-builder")
 async def scene_builder(req: SceneReq, user: UserModel = Depends(get_current_user)):
-    import re
-    try:
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.post("https://fal.run/fal-ai/any-llm", json={
-                "model": "google/gemini-flash-2.0",
-                "prompt": f"Break this story into {req.num_scenes} visual scenes. For each, give a title and a detailed {req.style} image prompt. Return ONLY a JSON array: [{{\"title\": \"...\", \"prompt\": \"...\", \"type\": \"image\"}}]\n\nStory: {req.story}",
-            }, headers={"Authorization": f"Key {FAL_API_KEY}"})
-            data = resp.json()
-            text = data.get("output", "") or str(data)
-            m = re.search(r'\[.*\]', text, re.DOTALL)
-            if m: return {"scenes": json.loads(m.group())}
-    except: pass
-    return {"scenes": [{"title": f"Scene {i+1}", "prompt": f"{req.style}, {req.story}, scene {i+1}", "type": "image"} for i in range(req.num_scenes)]}
+    return {"scenes": (await decompose_story(req.story, req.num_scenes, req.style))[0]}
+
+# Storyboard: decompose, then generate every scene at once and stream them back in scene order.
+# All scenes share one seed (the request's, or one derived from the story), so with the generation
+# cache on, resubmitting edited `scenes` only regenerates the scenes whose prompt actually changed.
+@app.post("/api/storyboard")
+async def storyboard(req: StoryboardReq, request: Request, format: Optional[str] = None, user: UserModel = Depends(get_current_user)):
+    if not 0 < (len(req.scenes) if req.scenes is not None else req.num_scenes) <= BATCH_MAX_ITEMS:
+        raise HTTPException(400, f"A storyboard needs 1-{BATCH_MAX_ITEMS} scenes")
+    scenes, decomposition_cached = (req.scenes, False) if req.scenes is not None else await decompose_story(req.story, req.num_scenes, req.style)
+    seed = req.seed if req.seed is not None and req.seed > 0 else int(hashlib.sha256(f"{req.story}|{req.style}".encode()).hexdigest()[:8], 16) % (2**31 - 1) + 1
+    items = [GenerateReq(model=req.model, inputs={**req.inputs, "prompt": sc.get("prompt", ""), "seed": seed}, project_id=req.project_id) for sc in scenes]
+    sse, batch_id, user_id, weight = wants_sse(request, format), str(uuid.uuid4()), user.id, user_weight(user)
+    plans, cached = await run_db(plan_generations, items)
+    await admission.charge(user_id, len(plans) - len(cached))
+    _batches[batch_id] = {"user_id": user_id, "tasks": {}, "cancelled": False}
+
+    async def stream():
+        counts = {"ok": 0, "error": 0, "cancelled": 0}
+        yield stream_frame({"event": "storyboard", "batch_id": batch_id, "seed": seed, "scenes": scenes, "decomposition_cached": decomposition_cached, "cached_scenes": sorted(cached)}, sse)
+        async for res in run_generations(batch_id, user_id, weight, plans, cached, request, ordered=True):
+            counts[res["status"]] += 1
+            sc = scenes[res["index"]]
+            yield stream_frame({"event": "scene", "title": sc.get("title", ""), "prompt": sc.get("prompt", ""), **res}, sse)
+        yield stream_frame({"event": "done", "batch_id": batch_id, **counts}, sse)
+
+    return stream_response(stream(), sse, batch_id)
 
 @app.get("/api/health")
 def health():
     return {"status": "ok"}
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] not in (["migrate"], ["reindex"]): sys.exit("usage: python api/index.py migrate|reindex")
+    print(f"schema version {migrate()}")
+    if sys.argv[1] == "reindex" and engine.dialect.name == "sqlite":
+        with engine.begin() as conn: reindex_assets(conn)
+        print("asset search index rebuilt")
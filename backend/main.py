@@ -1,25 +1,95 @@
 """OpenFlow Backend — FastAPI with SQLite, JWT auth, projects & assets."""
 
 import os
+import re
 import json
+import copy
+import math
+import struct
+import asyncio
 import hashlib
 import hmac
+import threading
 import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Optional
 
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import (create_engine, event, inspect, text, and_, or_, Column, Index, Integer, LargeBinary,
+                        String, Text, DateTime, ForeignKey)
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 
 # ---------------------------------------------------------------------------
 # Database setup
 # ---------------------------------------------------------------------------
 
-DATABASE_URL = "sqlite:///./openflow.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./openflow.db")
+
+# Connection pool, sized for the request threadpool (AnyIO runs up to 40 sync endpoints at once)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "30"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+
+# SQLite: seconds a writer waits for the lock before "database is locked", and the fsync policy.
+# NORMAL is durable across application crashes in WAL mode; FULL also survives power loss.
+DB_BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", "15"))
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+
+# Run the async endpoints' queries on an async engine (needs aiosqlite or asyncpg installed)
+DB_ASYNC = os.environ.get("DB_ASYNC", "0") == "1"
+
+# Group commit: queued inserts per transaction, and how long to wait for more (0: commit as soon as the writer is free)
+WRITE_BATCH_MAX = int(os.environ.get("WRITE_BATCH_MAX", "200"))
+WRITE_BATCH_WINDOW = float(os.environ.get("WRITE_BATCH_WINDOW", "0"))
+
+
+def _engine_options(url: str) -> dict:
+    """create_engine() arguments for `url`.
+
+    Every engine gets a sized pool except in-memory SQLite, which must keep
+    its single connection. SQLite also gets the busy timeout.
+    """
+    if not url.startswith("sqlite"):
+        return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT,
+                "pool_pre_ping": True, "pool_recycle": 1800}
+    options: dict = {"connect_args": {"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT}}
+    database = make_url(url).database
+    if database and database != ":memory:" and "mode=memory" not in url:
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+
+def _tune_sqlite(engine) -> None:
+    """Set the SQLite pragmas on every new connection.
+
+    WAL lets readers run alongside the single writer instead of blocking
+    it, synchronous=NORMAL drops the fsync on every commit (WAL syncs at
+    checkpoints), and busy_timeout makes a writer wait for the lock rather
+    than fail. pysqlite begins a transaction at the first write statement,
+    so writers take the lock up front and never have to upgrade a read.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        for pragma in ("journal_mode=WAL", f"synchronous={DB_SYNCHRONOUS}",
+                       f"busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}", "cache_size=-16000", "temp_store=MEMORY"):
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+_tune_sqlite(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -27,6 +97,16 @@ JWT_SECRET = os.environ.get("JWT_SECRET", "openflow-dev-secret-change-me")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRY_HOURS = 72
 
+# Verified tokens and user rows are cached per process; set AUTH_CACHE_TTL=0 to disable
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "4096"))
+
+# Password hashing runs in a dedicated pool; logins beyond KDF_MAX_PENDING get a 429
+PBKDF2_ITERATIONS = int(os.environ.get("PBKDF2_ITERATIONS", "100000"))
+KDF_EXECUTOR = os.environ.get("KDF_EXECUTOR", "process")  # "process" or "thread"
+KDF_WORKERS = int(os.environ.get("KDF_WORKERS", str(os.cpu_count() or 2)))
+KDF_MAX_PENDING = int(os.environ.get("KDF_MAX_PENDING", str(KDF_WORKERS * 4)))
+
 
 # ---------------------------------------------------------------------------
 # Models
@@ -45,10 +125,18 @@ class Project(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     name = Column(String, nullable=False)
+    # Full canvas as of `snapshot_revision`, compactly encoded (see _encode_workflow); later edits live as deltas
+    # in project_revisions. workflow_json holds the text instead only when it isn't valid JSON.
     workflow_json = Column(Text, default="{}")
+    workflow_blob = Column(LargeBinary, nullable=True)
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+    snapshot_revision = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Matches the keyset order used by list_projects
+    __table_args__ = (Index("ix_projects_user_updated", "user_id", "updated_at", "id"),)
+
 
 class Asset(Base):
     __tablename__ = "assets"
@@ -60,14 +148,58 @@ class Asset(Base):
     metadata_json = Column(Text, default="{}")
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index("ix_assets_user_created", "user_id", "created_at", "id"),)
+
+
+class ProjectRevision(Base):
+    """One entry of a project's workflow history: a full snapshot or a JSON Patch delta."""
+    __tablename__ = "project_revisions"
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    revision = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)  # snapshot, delta
+    payload = Column(LargeBinary, nullable=False)  # _pack(): compact encoding, or zlib-compressed text
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Unique so two writers racing from the same base revision can't both land
+    __table_args__ = (Index("ix_project_revisions_project_rev", "project_id", "revision", unique=True),)
+
+
+def _add_missing_columns() -> None:
+    """Add columns introduced after a table was first created."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(engine.dialect)}"
+                if col.server_default is not None:
+                    ddl += f" DEFAULT {col.server_default.arg}"
+                conn.execute(text(ddl))
+
 
 Base.metadata.create_all(bind=engine)
+_add_missing_columns()
+# create_all skips indexes on tables that already exist
+for _table in Base.metadata.sorted_tables:
+    for _index in _table.indexes:
+        _index.create(bind=engine, checkfirst=True)
 
 # ---------------------------------------------------------------------------
 # App
 # ---------------------------------------------------------------------------
 
-app = FastAPI(title="OpenFlow API", version="0.1.0")
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    yield
+    _writes.shutdown()
+    if "engine" in _async_db:
+        await _async_db["engine"].dispose()
+
+
+app = FastAPI(title="OpenFlow API", version="0.1.0", lifespan=_lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -75,6 +207,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -86,22 +219,199 @@ def get_db():
         db.close()
 
 
+# Async endpoints query through run_db() so a slow query, or a wait for the SQLite write lock,
+# never blocks the event loop. The async engine is only built (and its driver imported) on first use.
+_ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+_async_db: dict = {}
+
+
+def _async_session():
+    if "sessions" not in _async_db:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        url = make_url(DATABASE_URL)
+        url = url.set(drivername=f"{url.get_backend_name()}+{_ASYNC_DRIVERS[url.get_backend_name()]}")
+        async_engine = create_async_engine(url, **_engine_options(DATABASE_URL))
+        _tune_sqlite(async_engine.sync_engine)
+        _async_db["engine"] = async_engine
+        _async_db["sessions"] = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return _async_db["sessions"]()
+
+
+async def run_db(fn, *args):
+    """Call fn(session, *args) off the event loop and return its result.
+
+    With DB_ASYNC the call runs on the async engine (AsyncSession.run_sync),
+    otherwise in a worker thread with a regular session. `fn` commits its own
+    writes; the session is closed afterwards, so return plain values rather
+    than ORM objects.
+    """
+    if not DB_ASYNC:
+        def call():
+            with SessionLocal() as db:
+                return fn(db, *args)
+        return await asyncio.to_thread(call)
+    async with _async_session() as db:
+        return await db.run_sync(fn, *args)
+
+
+# ---------------------------------------------------------------------------
+# Write batching
+# ---------------------------------------------------------------------------
+
+class _WriteBatcher:
+    """Group commit for inserts from concurrent requests.
+
+    Endpoints queue rows with `submit()` and wait on the returned future; a
+    single writer thread commits everything queued since its last commit in
+    one transaction. Under load N inserts then cost one commit (one fsync,
+    one trip through the SQLite write lock) instead of N, while an idle
+    writer commits straight away. If a batch fails it is split in half and
+    retried, so a bad row only fails its own caller. Committed rows come back
+    detached with their columns (including generated ids) loaded.
+    """
+
+    def __init__(self, max_items: int, window: float):
+        self.max_items = max_items
+        self.window = window
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._sessions = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+
+    def submit(self, *rows) -> Future:
+        future: Future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+                self._thread.start()
+            self._queue.append((rows, future))
+            self._cond.notify()
+        return future
+
+    def _loop(self) -> None:
+        me = threading.current_thread()
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._thread is not me)
+                if not self._queue:
+                    return  # shut down and drained
+            if self.window:
+                time.sleep(self.window)
+            with self._cond:
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_items))]
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch: list) -> None:
+        error = None
+        with self._sessions() as db:
+            try:
+                for rows, _ in batch:
+                    db.add_all(rows)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                error = e
+        if error is not None and len(batch) > 1:
+            middle = len(batch) // 2
+            self._commit(batch[:middle])
+            self._commit(batch[middle:])
+            return
+        for _, future in batch:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+
+    def shutdown(self) -> None:
+        """Commit whatever is queued, then stop the writer (the next submit starts a new one)."""
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(10)
+
+
+_writes = _WriteBatcher(WRITE_BATCH_MAX, WRITE_BATCH_WINDOW)
+
+
 # ---------------------------------------------------------------------------
 # Auth helpers
 # ---------------------------------------------------------------------------
 
 import base64
 
-def _hash_password(password: str) -> str:
+
+class _KdfPool:
+    """Bounded executor that keeps password hashing off the request threadpool.
+
+    PBKDF2 is CPU-bound, so by default it runs in a process pool. Once
+    `max_pending` hashes are queued or running, further callers get a 429
+    instead of queueing behind a login storm.
+    """
+
+    def __init__(self, kind: str, workers: int, max_pending: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    try:
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    except (OSError, NotImplementedError):
+                        # No semaphore support (some containers); hashlib releases the GIL anyway
+                        self.kind = "thread"
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="kdf")
+            return self._executor
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(status_code=429, detail="Too many concurrent logins, retry shortly",
+                                    headers={"Retry-After": "1"})
+            self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+_kdf_pool = _KdfPool(KDF_EXECUTOR, KDF_WORKERS, KDF_MAX_PENDING)
+
+
+def _parse_password_hash(stored: str) -> tuple[int, bytes, bytes]:
+    # Hashes written before the work factor was configurable are bare base64 at 100k iterations
+    iterations, encoded = 100_000, stored
+    if stored.startswith("pbkdf2_sha256$"):
+        _, iters, encoded = stored.split("$", 2)
+        iterations = int(iters)
+    raw = base64.b64decode(encoded.encode())
+    return iterations, raw[:16], raw[16:]
+
+
+async def _hash_password(password: str) -> str:
     salt = os.urandom(16)
-    dk = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, 100_000)
-    return base64.b64encode(salt + dk).decode()
+    # hashlib.pbkdf2_hmac is a builtin, so it pickles to worker processes without importing this app
+    dk = await _kdf_pool.run(hashlib.pbkdf2_hmac, "sha256", password.encode(), salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${base64.b64encode(salt + dk).decode()}"
+
 
+async def _verify_password(password: str, stored: str) -> bool:
+    iterations, salt, dk = _parse_password_hash(stored)
+    candidate = await _kdf_pool.run(hashlib.pbkdf2_hmac, "sha256", password.encode(), salt, iterations)
+    return hmac.compare_digest(dk, candidate)
 
-def _verify_password(password: str, stored: str) -> bool:
-    raw = base64.b64decode(stored.encode())
-    salt, dk = raw[:16], raw[16:]
-    return hmac.compare_digest(dk, hashlib.pbkdf2_hmac("sha256", password.encode(), salt, 100_000))
+
+def _needs_rehash(stored: str) -> bool:
+    return _parse_password_hash(stored)[0] != PBKDF2_ITERATIONS
 
 
 def _create_token(user_id: int, email: str) -> str:
@@ -118,7 +428,65 @@ def _create_token(user_id: int, email: str) -> str:
     return f"{header}.{pay}.{sig}"
 
 
+class _TTLCache:
+    """Thread-safe LRU cache whose entries expire after at most `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_token_cache = _TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+_user_cache = _TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+# Fired by ORM flushes only; bulk query(...).update() callers must pop the cached row themselves
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target) -> None:
+    _user_cache.pop(target.id)
+
+
 def _decode_token(token: str) -> dict:
+    payload = _token_cache.get(token)
+    if payload is not None:
+        # Cached entries never outlive the token, but check anyway so expiry stays exact
+        if payload.get("exp", 0) < time.time():
+            _token_cache.pop(token)
+            raise HTTPException(status_code=401, detail="expired")
+        return payload
     try:
         parts = token.split(".")
         if len(parts) != 3:
@@ -133,21 +501,544 @@ def _decode_token(token: str) -> dict:
         payload = json.loads(base64.urlsafe_b64decode(padded))
         if payload.get("exp", 0) < time.time():
             raise ValueError("expired")
-        return payload
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
+    _token_cache.set(token, payload, ttl=payload["exp"] - time.time())
+    return payload
 
 
 def get_current_user(authorization: Optional[str] = Header(None), db: Session = Depends(get_db)) -> User:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing token")
     payload = _decode_token(authorization[7:])
-    user = db.query(User).filter(User.id == payload["sub"]).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+    user = _user_cache.get(payload["sub"])
+    if user is None:
+        user = db.query(User).filter(User.id == payload["sub"]).first()
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        # Detach so the cached row is never expired or refreshed by another request's session
+        db.expunge(user)
+        _user_cache.set(user.id, user)
     return user
 
 
+# ---------------------------------------------------------------------------
+# Pagination helpers
+# ---------------------------------------------------------------------------
+
+MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = json.dumps([ts.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _keyset_page(query, ts_col, id_col, cursor: Optional[str], limit: int, response: Response) -> list:
+    """Return one newest-first page, setting X-Next-Cursor when more rows remain."""
+    if cursor:
+        ts, row_id = _decode_cursor(cursor)
+        query = query.filter(or_(ts_col < ts, and_(ts_col == ts, id_col < row_id)))
+    rows = query.order_by(ts_col.desc(), id_col.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = _encode_cursor(getattr(last, ts_col.key), last.id)
+    return rows
+
+
+def _parse_include(include: Optional[str], allowed: set[str]) -> set[str]:
+    fields = {f.strip() for f in (include or "").split(",") if f.strip()}
+    unknown = fields - allowed
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include field(s): {', '.join(sorted(unknown))}")
+    return fields
+
+
+# ---------------------------------------------------------------------------
+# Compact workflow encoding
+# ---------------------------------------------------------------------------
+#
+# Canvases are stored, versioned and shared in a msgpack-style tagged binary
+# with two workflow-specific tricks, then deflated:
+#
+# - strings of up to WF_INTERN_CHARS are interned: the first use carries the
+#   text, later uses an index, so node types, handle names, keys and node ids
+#   (repeated by every edge) cost one or two bytes
+# - {"x", "y"} positions are stored as deltas from the previous position, in
+#   hundredths, whenever that is exact, so nodes laid out on a grid cost a
+#   few bytes each
+#
+# Layout: 0xCF, version, compression (0 none, 1 deflate), body. Decoding gives
+# back the same document, key order and int vs float included. Tags:
+#
+#   0x00-0x7f  int 0..127             0xc5       float64
+#   0x80-0x8f  map of 0-15 entries    0xc6       float32
+#   0x90-0x9f  array of 0-15 items    0xc7       string
+#   0xa0-0xbf  interned string 0-31   0xc8/0xc9  array/map
+#   0xc0       null                   0xca       new interned string
+#   0xc2/0xc3  false/true             0xcb       interned string
+#   0xc4       int                    0xd0-0xd3  position (bit 0: x is float, bit 1: y)
+#   0xe0-0xff  int -32..-1
+#
+# Lengths and indexes are varints; ints and position deltas zigzag varints.
+# api/index.py uses the same format. Bump WF_VERSION for incompatible changes
+# and keep decoding the old ones.
+
+WF_MAGIC = b"\xcf"
+WF_VERSION = 1
+WF_INTERN_CHARS = 64
+# Cap on the decoded size; share links are untrusted input
+WF_MAX_BYTES = int(os.environ.get("WORKFLOW_MAX_BYTES", str(16 << 20)))
+
+
+def _write_uint(out: bytearray, n: int) -> None:
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _write_sint(out: bytearray, n: int) -> None:
+    _write_uint(out, n * 2 if n >= 0 else -n * 2 - 1)
+
+
+def _centi(v: Any) -> Optional[int]:
+    """`v` in hundredths, if decoding that gives back exactly `v`."""
+    if type(v) is int:
+        return v * 100
+    if type(v) is float and math.isfinite(v):
+        k = round(v * 100)
+        if k / 100 == v and (k or math.copysign(1, v) > 0):  # -0.0 would come back as 0.0
+            return k
+    return None
+
+
+class _WorkflowEncoder:
+    def __init__(self) -> None:
+        self.out = bytearray()
+        self.strings: dict[str, int] = {}
+        self.x = self.y = 0
+
+    def value(self, v: Any) -> None:
+        out = self.out
+        if isinstance(v, str):
+            self.string(v)
+        elif isinstance(v, dict):
+            if len(v) == 2 and self.position(v):
+                return
+            if len(v) < 16:
+                out.append(0x80 | len(v))
+            else:
+                out.append(0xc9)
+                _write_uint(out, len(v))
+            for key, item in v.items():
+                self.string(key)
+                self.value(item)
+        elif isinstance(v, (list, tuple)):
+            if len(v) < 16:
+                out.append(0x90 | len(v))
+            else:
+                out.append(0xc8)
+                _write_uint(out, len(v))
+            for item in v:
+                self.value(item)
+        elif v is None:
+            out.append(0xc0)
+        elif isinstance(v, bool):
+            out.append(0xc3 if v else 0xc2)
+        elif isinstance(v, int):
+            if -32 <= v < 128:
+                out.append(v & 0xff)
+            else:
+                out.append(0xc4)
+                _write_sint(out, v)
+        elif isinstance(v, float):
+            try:
+                f32 = struct.pack(">f", v)
+            except OverflowError:
+                f32 = None
+            if f32 and struct.unpack(">f", f32)[0] == v:
+                out.append(0xc6)
+                out += f32
+            else:
+                out.append(0xc5)
+                out += struct.pack(">d", v)
+        else:
+            raise TypeError(f"Cannot encode {type(v).__name__} in a workflow")
+
+    def position(self, v: dict) -> bool:
+        keys = iter(v)
+        if next(keys) != "x" or next(keys) != "y":
+            return False
+        x, y = _centi(v["x"]), _centi(v["y"])
+        if x is None or y is None:
+            return False
+        self.out.append(0xd0 | (type(v["x"]) is float) | (type(v["y"]) is float) << 1)
+        _write_sint(self.out, x - self.x)
+        _write_sint(self.out, y - self.y)
+        self.x, self.y = x, y
+        return True
+
+    def string(self, s: str) -> None:
+        out = self.out
+        index = self.strings.get(s)
+        if index is not None:
+            if index < 32:
+                out.append(0xa0 | index)
+            else:
+                out.append(0xcb)
+                _write_uint(out, index)
+            return
+        if len(s) <= WF_INTERN_CHARS:
+            self.strings[s] = len(self.strings)
+            out.append(0xca)
+        else:
+            out.append(0xc7)
+        raw = s.encode("utf-8", "surrogatepass")  # JSON allows lone surrogates
+        _write_uint(out, len(raw))
+        out += raw
+
+
+class _WorkflowDecoder:
+    def __init__(self, buf: bytes) -> None:
+        self.buf = buf
+        self.i = 0
+        self.strings: list[str] = []
+        self.x = self.y = 0
+
+    def uint(self) -> int:
+        n = shift = 0
+        while True:
+            b = self.buf[self.i]
+            self.i += 1
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    def sint(self) -> int:
+        n = self.uint()
+        return (n >> 1) ^ -(n & 1)
+
+    def take(self, n: int) -> bytes:
+        if self.i + n > len(self.buf):
+            raise ValueError("Truncated workflow encoding")
+        self.i += n
+        return self.buf[self.i - n:self.i]
+
+    def map(self, n: int) -> dict:
+        out = {}
+        for _ in range(n):
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError("Non-string key in workflow encoding")
+            out[key] = self.value()
+        return out
+
+    def value(self) -> Any:
+        t = self.buf[self.i]
+        self.i += 1
+        if t < 0x80:
+            return t
+        if t < 0x90:
+            return self.map(t & 0x0f)
+        if t < 0xa0:
+            return [self.value() for _ in range(t & 0x0f)]
+        if t < 0xc0:
+            return self.strings[t & 0x1f]
+        if t >= 0xe0:
+            return t - 0x100
+        if t == 0xc0:
+            return None
+        if t in (0xc2, 0xc3):
+            return t == 0xc3
+        if t == 0xc4:
+            return self.sint()
+        if t == 0xc5:
+            return struct.unpack(">d", self.take(8))[0]
+        if t == 0xc6:
+            return struct.unpack(">f", self.take(4))[0]
+        if t in (0xc7, 0xca):
+            s = self.take(self.uint()).decode("utf-8", "surrogatepass")
+            if t == 0xca:
+                self.strings.append(s)
+            return s
+        if t == 0xc8:
+            return [self.value() for _ in range(self.uint())]
+        if t == 0xc9:
+            return self.map(self.uint())
+        if t == 0xcb:
+            return self.strings[self.uint()]
+        if 0xd0 <= t <= 0xd3:
+            self.x += self.sint()
+            self.y += self.sint()
+            return {"x": self.x / 100 if t & 1 else self.x // 100, "y": self.y / 100 if t & 2 else self.y // 100}
+        raise ValueError(f"Unknown tag 0x{t:02x} in workflow encoding")
+
+
+def _encode_workflow(doc: Any) -> bytes:
+    """Compact, versioned binary form of a JSON workflow document."""
+    encoder = _WorkflowEncoder()
+    encoder.value(doc)
+    body = bytes(encoder.out)
+    packed = zlib.compress(body, 9)
+    if len(packed) < len(body):
+        return WF_MAGIC + bytes((WF_VERSION, 1)) + packed
+    return WF_MAGIC + bytes((WF_VERSION, 0)) + body
+
+
+def _decode_workflow(blob: bytes) -> Any:
+    """Inverse of `_encode_workflow`.
+
+    Raises:
+        ValueError: If `blob` is malformed, truncated, from an unknown version
+            or decodes to more than WF_MAX_BYTES.
+    """
+    if len(blob) < 3 or blob[:1] != WF_MAGIC:
+        raise ValueError("Not an encoded workflow")
+    if blob[1] != WF_VERSION:
+        raise ValueError(f"Unsupported workflow encoding version {blob[1]}")
+    try:
+        if blob[2] == 1:
+            inflater = zlib.decompressobj()
+            body = inflater.decompress(blob[3:], WF_MAX_BYTES)
+            if inflater.unconsumed_tail or not inflater.eof:
+                raise ValueError("Encoded workflow is truncated or too large")
+        elif blob[2] == 0:
+            body = blob[3:]
+        else:
+            raise ValueError(f"Unsupported workflow compression {blob[2]}")
+        decoder = _WorkflowDecoder(body)
+        doc = decoder.value()
+        if decoder.i != len(body):
+            raise ValueError("Trailing bytes after encoded workflow")
+        return doc
+    except (IndexError, struct.error, zlib.error, UnicodeDecodeError, RecursionError) as e:
+        raise ValueError(f"Malformed workflow encoding: {e!r}") from None
+
+
+def _dump(doc: Any) -> str:
+    return json.dumps(doc, separators=(",", ":"), ensure_ascii=False)
+
+
+def _pack(value: Any) -> bytes:
+    """Encode a revision payload: a document, or workflow JSON text."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return zlib.compress(value.encode())  # not JSON: keep the text verbatim
+    return _encode_workflow(value)
+
+
+def _unpack(payload: bytes) -> str:
+    if payload[:1] == WF_MAGIC:
+        return _dump(_decode_workflow(payload))
+    return zlib.decompress(payload).decode()  # non-JSON text, or written by an older build
+
+
+def _snapshot_columns(workflow: Any) -> dict[str, Any]:
+    """Project column values that store `workflow` (a document or JSON text) as the latest snapshot."""
+    if isinstance(workflow, str):
+        try:
+            workflow = json.loads(workflow)
+        except ValueError:
+            return {"workflow_json": workflow, "workflow_blob": None}
+    return {"workflow_json": None, "workflow_blob": _encode_workflow(workflow)}
+
+
+def _snapshot_json(p) -> str:
+    """The project row's latest snapshot as JSON text."""
+    if p.workflow_blob is not None:
+        return _dump(_decode_workflow(p.workflow_blob))
+    return p.workflow_json or "{}"
+
+
+def _compact_workflows() -> None:
+    """Re-encode canvases stored as JSON text by older builds."""
+    last_id = 0
+    with engine.begin() as conn:
+        while True:
+            rows = conn.execute(text("SELECT id, workflow_json FROM projects WHERE workflow_blob IS NULL AND id > :last "
+                                     "ORDER BY id LIMIT 500"), {"last": last_id}).all()
+            if not rows:
+                break
+            for project_id, raw in rows:
+                columns = _snapshot_columns(raw or "{}")
+                if columns["workflow_blob"] is not None:
+                    conn.execute(text("UPDATE projects SET workflow_blob = :blob, workflow_json = NULL WHERE id = :id"),
+                                 {"blob": columns["workflow_blob"], "id": project_id})
+            last_id = rows[-1][0]
+
+
+_compact_workflows()
+
+
+# ---------------------------------------------------------------------------
+# Workflow history helpers
+# ---------------------------------------------------------------------------
+
+# Every Nth revision is stored as a full snapshot; the ones between are JSON Patch deltas
+SNAPSHOT_EVERY = int(os.environ.get("WORKFLOW_SNAPSHOT_EVERY", "50"))
+
+
+def _json_pointer(path: str) -> list[str]:
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer: {path!r}")
+    return [t.replace("~1", "/").replace("~0", "~") for t in path[1:].split("/")]
+
+
+_ARRAY_INDEX = re.compile(r"0|[1-9][0-9]*")
+
+
+def _array_index(array: list, token: str, append: bool = False) -> int:
+    """Resolve a JSON Pointer token against an array (RFC 6901 section 4).
+
+    Only plain decimal indices of existing elements are accepted; with
+    `append` (the target of an "add"), also the length itself or "-".
+    Negative, zero-padded and out-of-range indices raise IndexError.
+    """
+    if append and token == "-":
+        return len(array)
+    if not _ARRAY_INDEX.fullmatch(token):
+        raise IndexError(f"invalid array index {token!r}")
+    index = int(token)
+    if index > len(array) or (index == len(array) and not append):
+        raise IndexError(f"array index {token} out of range")
+    return index
+
+
+def _json_equal(a: Any, b: Any) -> bool:
+    """JSON value equality for "test" (RFC 6902 section 4.6).
+
+    Unlike ==, booleans never equal numbers; numbers compare by value.
+    """
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_json_equal(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_json_equal(a[k], b[k]) for k in a)
+    return type(a) is type(b) and a == b
+
+
+def _pointer_get(doc: Any, tokens: list[str]) -> Any:
+    for t in tokens:
+        doc = doc[_array_index(doc, t)] if isinstance(doc, list) else doc[t]
+    return doc
+
+
+def _pointer_add(doc: Any, tokens: list[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent, key = _pointer_get(doc, tokens[:-1]), tokens[-1]
+    if isinstance(parent, list):
+        parent.insert(_array_index(parent, key, append=True), value)
+    else:
+        parent[key] = value
+    return doc
+
+
+def _pointer_remove(doc: Any, tokens: list[str]) -> Any:
+    if not tokens:
+        raise ValueError("Cannot remove the document root")
+    parent, key = _pointer_get(doc, tokens[:-1]), tokens[-1]
+    if isinstance(parent, list):
+        del parent[_array_index(parent, key)]
+    else:
+        del parent[key]
+    return doc
+
+
+def _apply_json_patch(doc: Any, ops: list[dict]) -> Any:
+    """Apply RFC 6902 JSON Patch operations to `doc` (mutated in place where possible).
+
+    Raises:
+        ValueError: If an operation is malformed or does not apply.
+    """
+    try:
+        for op in ops:
+            kind, tokens = op["op"], _json_pointer(op["path"])
+            if kind == "add":
+                doc = _pointer_add(doc, tokens, copy.deepcopy(op["value"]))
+            elif kind == "remove":
+                doc = _pointer_remove(doc, tokens)
+            elif kind == "replace":
+                value = copy.deepcopy(op["value"])
+                if not tokens:
+                    doc = value
+                    continue
+                parent, key = _pointer_get(doc, tokens[:-1]), tokens[-1]
+                if isinstance(parent, list):
+                    parent[_array_index(parent, key)] = value
+                else:
+                    parent[key]  # target must exist
+                    parent[key] = value
+            elif kind in ("move", "copy"):
+                source = _json_pointer(op["from"])
+                value = copy.deepcopy(_pointer_get(doc, source))
+                if kind == "move":
+                    doc = _pointer_remove(doc, source)
+                doc = _pointer_add(doc, tokens, value)
+            elif kind == "test":
+                if not _json_equal(_pointer_get(doc, tokens), op["value"]):
+                    raise ValueError(f"Test failed at {op['path']!r}")
+            else:
+                raise ValueError(f"Unsupported op {kind!r}")
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"Patch does not apply: {e!r}")
+    return doc
+
+
+def _workflow_at(db: Session, p, revision: int) -> Optional[str]:
+    """Rebuild the workflow JSON at `revision` from the nearest snapshot plus deltas.
+
+    `p` is the project row, or a query row with its id, snapshot columns
+    and snapshot_revision. Returns None if the revision predates recorded
+    history.
+    """
+    project_id = p.id
+    if revision >= p.snapshot_revision:
+        base_json, base_rev = _snapshot_json(p), p.snapshot_revision
+    else:
+        snap = (db.query(ProjectRevision)
+                .filter(ProjectRevision.project_id == project_id, ProjectRevision.kind == "snapshot",
+                        ProjectRevision.revision <= revision)
+                .order_by(ProjectRevision.revision.desc()).first())
+        if not snap:
+            return None
+        base_json, base_rev = _unpack(snap.payload), snap.revision
+    if revision == base_rev:
+        return base_json
+
+    deltas = (db.query(ProjectRevision.payload)
+              .filter(ProjectRevision.project_id == project_id, ProjectRevision.revision > base_rev,
+                      ProjectRevision.revision <= revision)
+              .order_by(ProjectRevision.revision).all())
+    doc = json.loads(base_json)
+    for (payload,) in deltas:
+        doc = _apply_json_patch(doc, json.loads(_unpack(payload)))
+    return _dump(doc)
+
+
+def _current_workflow(db: Session, p) -> str:
+    return _workflow_at(db, p, p.revision)
+
+
 # ---------------------------------------------------------------------------
 # Auth endpoints
 # ---------------------------------------------------------------------------
@@ -157,22 +1048,51 @@ class AuthRequest(BaseModel):
     password: str
 
 
-@app.post("/auth/signup")
-def signup(req: AuthRequest, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == req.email).first():
-        raise HTTPException(status_code=400, detail="Email already registered")
-    user = User(email=req.email, password_hash=_hash_password(req.password))
+def _email_taken(db: Session, email: str) -> bool:
+    return db.query(User.id).filter(User.email == email).first() is not None
+
+
+def _create_user(db: Session, email: str, password_hash: str) -> Optional[int]:
+    """Insert the user and return its id, or None if the email was taken meanwhile."""
+    user = User(email=email, password_hash=password_hash)
     db.add(user)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return user.id
+
+
+def _find_login(db: Session, email: str):
+    return db.query(User.id, User.email, User.password_hash).filter(User.email == email).first()
+
+
+def _set_password_hash(db: Session, user_id: int, password_hash: str) -> None:
+    db.query(User).filter(User.id == user_id).update({"password_hash": password_hash}, synchronize_session=False)
     db.commit()
-    db.refresh(user)
-    return {"token": _create_token(user.id, user.email), "user_id": user.id}
+    # A bulk update doesn't fire after_update, so drop the cached row here
+    _user_cache.pop(user_id)
+
+
+@app.post("/auth/signup")
+async def signup(req: AuthRequest):
+    if await run_db(_email_taken, req.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    user_id = await run_db(_create_user, req.email, await _hash_password(req.password))
+    if user_id is None:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    return {"token": _create_token(user_id, req.email), "user_id": user_id}
 
 
 @app.post("/auth/login")
-def login(req: AuthRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == req.email).first()
-    if not user or not _verify_password(req.password, user.password_hash):
+async def login(req: AuthRequest):
+    user = await run_db(_find_login, req.email)
+    if not user or not await _verify_password(req.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if _needs_rehash(user.password_hash):
+        # Upgrade to the deployment's current work factor while we have the plaintext
+        await run_db(_set_password_hash, user.id, await _hash_password(req.password))
     return {"token": _create_token(user.id, user.email), "user_id": user.id}
 
 
@@ -188,22 +1108,46 @@ class ProjectCreate(BaseModel):
 class ProjectUpdate(BaseModel):
     name: Optional[str] = None
     workflow_json: Optional[str] = None
+    base_revision: Optional[int] = None  # reject with 409 if the project has moved on
+
+
+class WorkflowPatch(BaseModel):
+    base_revision: int
+    patch: list[dict]  # RFC 6902 operations against the workflow at base_revision
 
 
 @app.get("/projects")
-def list_projects(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    projects = db.query(Project).filter(Project.user_id == user.id).order_by(Project.updated_at.desc()).all()
-    return [{"id": p.id, "name": p.name, "workflow_json": p.workflow_json,
-             "created_at": str(p.created_at), "updated_at": str(p.updated_at)} for p in projects]
+def list_projects(response: Response, cursor: Optional[str] = None,
+                  limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), include: Optional[str] = None,
+                  user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Newest-first page of projects. Pass `include=workflow_json` to get the canvas blobs too."""
+    extra = _parse_include(include, {"workflow_json"})
+    columns = [Project.id, Project.name, Project.revision, Project.created_at, Project.updated_at]
+    if "workflow_json" in extra:
+        columns += [Project.workflow_json, Project.workflow_blob, Project.snapshot_revision]
+    query = db.query(*columns).filter(Project.user_id == user.id)
+    projects = _keyset_page(query, Project.updated_at, Project.id, cursor, limit, response)
+    out = []
+    for p in projects:
+        item = {"id": p.id, "name": p.name, "revision": p.revision,
+                "created_at": str(p.created_at), "updated_at": str(p.updated_at)}
+        if "workflow_json" in extra:
+            item["workflow_json"] = _current_workflow(db, p)
+        out.append(item)
+    return out
 
 
 @app.post("/projects")
 def create_project(req: ProjectCreate, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    p = Project(user_id=user.id, name=req.name, workflow_json=req.workflow_json)
+    snapshot = _snapshot_columns(req.workflow_json)
+    p = Project(user_id=user.id, name=req.name, **snapshot)
     db.add(p)
+    db.flush()
+    db.add(ProjectRevision(project_id=p.id, revision=0, kind="snapshot",
+                           payload=snapshot["workflow_blob"] or _pack(req.workflow_json)))
     db.commit()
     db.refresh(p)
-    return {"id": p.id, "name": p.name, "created_at": str(p.created_at)}
+    return {"id": p.id, "name": p.name, "revision": p.revision, "created_at": str(p.created_at)}
 
 
 @app.get("/projects/{project_id}")
@@ -211,7 +1155,7 @@ def get_project(project_id: int, user: User = Depends(get_current_user), db: Ses
     p = db.query(Project).filter(Project.id == project_id, Project.user_id == user.id).first()
     if not p:
         raise HTTPException(status_code=404, detail="Not found")
-    return {"id": p.id, "name": p.name, "workflow_json": p.workflow_json,
+    return {"id": p.id, "name": p.name, "workflow_json": _current_workflow(db, p), "revision": p.revision,
             "created_at": str(p.created_at), "updated_at": str(p.updated_at)}
 
 
@@ -220,13 +1164,83 @@ def update_project(project_id: int, req: ProjectUpdate, user: User = Depends(get
     p = db.query(Project).filter(Project.id == project_id, Project.user_id == user.id).first()
     if not p:
         raise HTTPException(status_code=404, detail="Not found")
+    if req.base_revision is not None and req.base_revision != p.revision:
+        raise HTTPException(status_code=409, detail={"message": "Revision conflict", "revision": p.revision})
     if req.name is not None:
         p.name = req.name
     if req.workflow_json is not None:
-        p.workflow_json = req.workflow_json
+        # A full write is a snapshot: the row holds it and no deltas need replaying
+        p.revision += 1
+        p.snapshot_revision = p.revision
+        snapshot = _snapshot_columns(req.workflow_json)
+        p.workflow_json, p.workflow_blob = snapshot["workflow_json"], snapshot["workflow_blob"]
+        db.add(ProjectRevision(project_id=p.id, revision=p.revision, kind="snapshot",
+                               payload=snapshot["workflow_blob"] or _pack(req.workflow_json)))
     p.updated_at = datetime.utcnow()
-    db.commit()
-    return {"ok": True}
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"message": "Revision conflict"})
+    return {"ok": True, "revision": p.revision}
+
+
+@app.patch("/projects/{project_id}/workflow")
+def patch_project_workflow(project_id: int, req: WorkflowPatch, user: User = Depends(get_current_user),
+                           db: Session = Depends(get_db)):
+    """Apply a JSON Patch to the project's workflow, storing only the delta."""
+    p = db.query(Project).filter(Project.id == project_id, Project.user_id == user.id).first()
+    if not p:
+        raise HTTPException(status_code=404, detail="Not found")
+    if req.base_revision != p.revision:
+        raise HTTPException(status_code=409, detail={"message": "Revision conflict", "revision": p.revision})
+    try:
+        doc = _apply_json_patch(json.loads(_current_workflow(db, p)), req.patch)
+    except ValueError as e:  # includes JSONDecodeError for non-JSON workflow strings
+        raise HTTPException(status_code=422, detail=str(e))
+
+    new_rev = p.revision + 1
+    values: dict[str, Any] = {"revision": new_rev, "updated_at": datetime.utcnow()}
+    if new_rev - p.snapshot_revision >= SNAPSHOT_EVERY:
+        values.update(_snapshot_columns(doc), snapshot_revision=new_rev)
+        db.add(ProjectRevision(project_id=p.id, revision=new_rev, kind="snapshot", payload=values["workflow_blob"]))
+    else:
+        db.add(ProjectRevision(project_id=p.id, revision=new_rev, kind="delta", payload=_pack(req.patch)))
+    # Conditional on the base revision so a concurrent writer turns into a 409, not a lost update
+    updated = (db.query(Project).filter(Project.id == p.id, Project.revision == req.base_revision)
+               .update(values, synchronize_session=False))
+    if not updated:
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"message": "Revision conflict"})
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"message": "Revision conflict"})
+    return {"ok": True, "revision": new_rev}
+
+
+@app.get("/projects/{project_id}/revisions")
+def list_project_revisions(project_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Server-side undo history: every recorded revision, newest first."""
+    p = db.query(Project).filter(Project.id == project_id, Project.user_id == user.id).first()
+    if not p:
+        raise HTTPException(status_code=404, detail="Not found")
+    rows = (db.query(ProjectRevision.revision, ProjectRevision.kind, ProjectRevision.created_at)
+            .filter(ProjectRevision.project_id == p.id).order_by(ProjectRevision.revision.desc()).all())
+    return [{"revision": r.revision, "kind": r.kind, "created_at": str(r.created_at)} for r in rows]
+
+
+@app.get("/projects/{project_id}/revisions/{revision}")
+def get_project_revision(project_id: int, revision: int, user: User = Depends(get_current_user),
+                         db: Session = Depends(get_db)):
+    p = db.query(Project).filter(Project.id == project_id, Project.user_id == user.id).first()
+    if not p or not 0 <= revision <= p.revision:
+        raise HTTPException(status_code=404, detail="Not found")
+    workflow_json = _workflow_at(db, p, revision)
+    if workflow_json is None:
+        raise HTTPException(status_code=404, detail="Revision predates recorded history")
+    return {"id": p.id, "revision": revision, "workflow_json": workflow_json}
 
 
 @app.delete("/projects/{project_id}")
@@ -234,11 +1248,43 @@ def delete_project(project_id: int, user: User = Depends(get_current_user), db:
     p = db.query(Project).filter(Project.id == project_id, Project.user_id == user.id).first()
     if not p:
         raise HTTPException(status_code=404, detail="Not found")
+    db.query(ProjectRevision).filter(ProjectRevision.project_id == p.id).delete()
     db.delete(p)
     db.commit()
     return {"ok": True}
 
 
+# ---------------------------------------------------------------------------
+# Share links
+# ---------------------------------------------------------------------------
+
+class WorkflowEncode(BaseModel):
+    data: dict
+
+
+class WorkflowDecode(BaseModel):
+    encoded: str  # base64url `_encode_workflow` output, as carried by share links
+
+
+@app.post("/workflows/encode")
+def encode_workflow_link(req: WorkflowEncode):
+    """Compact, URL-safe form of a workflow for share links.
+
+    Pure functions of their input, so neither endpoint needs an account.
+    """
+    blob = _encode_workflow(req.data)
+    return {"encoded": base64.urlsafe_b64encode(blob).rstrip(b"=").decode(), "bytes": len(blob)}
+
+
+@app.post("/workflows/decode")
+def decode_workflow_link(req: WorkflowDecode):
+    try:
+        blob = base64.urlsafe_b64decode(req.encoded + "=" * (-len(req.encoded) % 4))
+        return {"data": _decode_workflow(blob)}
+    except ValueError as e:  # binascii.Error is a ValueError too
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 # ---------------------------------------------------------------------------
 # Asset endpoints
 # ---------------------------------------------------------------------------
@@ -251,18 +1297,30 @@ class AssetCreate(BaseModel):
 
 
 @app.get("/assets")
-def list_assets(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    assets = db.query(Asset).filter(Asset.user_id == user.id).order_by(Asset.created_at.desc()).all()
-    return [{"id": a.id, "type": a.type, "url": a.url, "project_id": a.project_id,
-             "metadata_json": a.metadata_json, "created_at": str(a.created_at)} for a in assets]
+def list_assets(response: Response, cursor: Optional[str] = None,
+                limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), include: Optional[str] = None,
+                user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Newest-first page of assets. Pass `include=metadata_json` to get generation params too."""
+    extra = _parse_include(include, {"metadata_json"})
+    columns = [Asset.id, Asset.type, Asset.url, Asset.project_id, Asset.created_at]
+    if "metadata_json" in extra:
+        columns.append(Asset.metadata_json)
+    query = db.query(*columns).filter(Asset.user_id == user.id)
+    assets = _keyset_page(query, Asset.created_at, Asset.id, cursor, limit, response)
+    out = []
+    for a in assets:
+        item = {"id": a.id, "type": a.type, "url": a.url, "project_id": a.project_id, "created_at": str(a.created_at)}
+        if "metadata_json" in extra:
+            item["metadata_json"] = a.metadata_json
+        out.append(item)
+    return out
 
 
 @app.post("/assets")
-def create_asset(req: AssetCreate, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_asset(req: AssetCreate, user: User = Depends(get_current_user)):
     a = Asset(user_id=user.id, project_id=req.project_id, type=req.type, url=req.url, metadata_json=req.metadata_json)
-    db.add(a)
-    db.commit()
-    db.refresh(a)
+    # Committed by the write batcher, together with whatever other inserts are queued
+    _writes.submit(a).result()
     return {"id": a.id, "url": a.url, "created_at": str(a.created_at)}
 
 
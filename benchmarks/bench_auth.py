@@ -0,0 +1,106 @@
+"""Authenticated request throughput benchmark.
+
+Measures the cost of `get_current_user` in both backends with the
+verified-token/user cache disabled and enabled:
+
+- `dependency`: calls `get_current_user` directly, isolating auth cost.
+- `request`: full in-process round trips to the cheap assets listing
+  (`GET /assets` in backend/main.py, `GET /api/assets` in api/index.py).
+
+Everything runs in-process against throwaway SQLite databases.
+
+Usage:
+    python benchmarks/bench_auth.py [--requests 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import ModuleType
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_app(name: str, path: Path, workdir: Path, env: dict[str, str]) -> ModuleType:
+    """Import a single-file FastAPI app from `path` inside `workdir`."""
+    os.environ.update(env)
+    cwd = os.getcwd()
+    os.chdir(workdir)  # backend/main.py opens ./openflow.db
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+def set_cache(module: ModuleType, ttl: float) -> None:
+    for cache in (module._token_cache, module._user_cache):
+        cache.ttl = ttl
+        cache.clear()
+
+
+def bench_dependency(module: ModuleType, header: str, n: int) -> float:
+    """Return get_current_user calls per second."""
+    db = module.SessionLocal()
+    try:
+        start = time.perf_counter()
+        for _ in range(n):
+            module.get_current_user(header, db)
+        return n / (time.perf_counter() - start)
+    finally:
+        db.close()
+
+
+def bench_requests(client, path: str, header: str, n: int) -> float:
+    """Return authenticated requests per second."""
+    headers = {"Authorization": header}
+    start = time.perf_counter()
+    for _ in range(n):
+        resp = client.get(path, headers=headers)
+        assert resp.status_code == 200, resp.text
+    return n / (time.perf_counter() - start)
+
+
+def run(label: str, module: ModuleType, signup: str, signup_body: dict, assets_path: str, n: int) -> None:
+    from fastapi.testclient import TestClient
+
+    with TestClient(module.app) as client:
+        token = client.post(signup, json=signup_body).json()["token"]
+        header = f"Bearer {token}"
+        for ttl, mode in ((0, "no cache"), (module.AUTH_CACHE_TTL or 60, "cached")):
+            set_cache(module, ttl)
+            dep = bench_dependency(module, header, n)
+            req = bench_requests(client, assets_path, header, n)
+            print(f"{label:<16} {mode:<10} {dep:>12,.0f} {req:>12,.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000, help="iterations per measurement")
+    args = parser.parse_args()
+
+    print(f"{'app':<16} {'mode':<10} {'dep/s':>12} {'req/s':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        backend = load_app("openflow_backend", ROOT / "backend" / "main.py", tmp_path, {})
+        run("backend/main.py", backend, "/auth/signup",
+            {"email": "bench@example.com", "password": "bench-pass"}, "/assets", args.requests)
+
+        api = load_app("openflow_api", ROOT / "api" / "index.py", tmp_path,
+                       {"DATABASE_URL": f"sqlite:///{tmp_path / 'api.db'}"})
+        run("api/index.py", api, "/api/auth/signup",
+            {"email": "bench@example.com", "username": "bench", "password": "bench-pass"},
+            "/api/assets", args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Provider client benchmark.
+
+Compares the old one-`httpx.AsyncClient`-per-request pattern against the
+pooled `ProviderClient` in api/index.py, both talking to the local mock
+fal server (benchmarks/mock_fal.py) over a real TCP socket so connection
+setup costs are included.
+
+Usage:
+    python benchmarks/bench_provider.py [--requests 500] [--concurrency 50] [--latency-ms 20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_auth import ROOT, load_app  # noqa: E402
+from mock_fal import create_app  # noqa: E402
+
+MODEL = "fal-ai/flux/dev"
+
+
+def serve_mock(latency_ms: float) -> tuple[str, uvicorn.Server]:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    server = uvicorn.Server(uvicorn.Config(create_app(latency_ms, jitter_ms=0), host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}", server
+
+
+async def run(call, n: int, concurrency: int) -> dict[str, float]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def one():
+        async with sem:
+            t = time.perf_counter()
+            resp = await call()
+            resp.raise_for_status()
+            latencies.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "req_s": n / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def bench(base_url: str, module, n: int, concurrency: int) -> None:
+    async def per_request():
+        async with httpx.AsyncClient(timeout=300) as client:
+            return await client.post(f"{base_url}/{MODEL}", json={"prompt": "bench"})
+
+    async def pooled():
+        return await module.fal.post(MODEL, {"prompt": "bench"})
+
+    for label, call in (("per-request client", per_request), ("pooled client", pooled)):
+        r = await run(call, n, concurrency)
+        print(f"{label:<20} {r['req_s']:>9.1f} req/s   p50 {r['p50_ms']:>7.1f} ms   p99 {r['p99_ms']:>7.1f} ms")
+    await module.fal.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    base_url, server = serve_mock(args.latency_ms)
+    with tempfile.TemporaryDirectory() as tmp:
+        module = load_app("api_index", ROOT / "api" / "index.py", Path(tmp), {
+            "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+            "FAL_BASE_URL": base_url,
+            # Let the benchmark concurrency, not the client limits, bound throughput
+            "PROVIDER_CONCURRENCY": str(args.concurrency),
+            "MODEL_CONCURRENCY": str(args.concurrency),
+        })
+        asyncio.run(bench(base_url, module, args.requests, args.concurrency))
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
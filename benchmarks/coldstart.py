@@ -0,0 +1,125 @@
+"""Cold-start benchmark and gate for the serverless api/index.py entry point.
+
+Every Vercel cold start pays for importing api/index.py before the first
+request is served. This script imports it in fresh interpreters and
+reports:
+
+- `import_ms`: best and median wall time of `import api.index`
+- `top`: the slowest top-level imports, from `python -X importtime`
+- `lazy`: modules that must not load at import time (bcrypt, jwt, httpx,
+  the KDF process pool) but did
+- `touched_db`: whether importing opened the database (schema migrations
+  belong to `python api/index.py migrate` or the first session)
+
+With --check it exits 1 when a lazy module was imported, the database
+was touched, or the median import time exceeds --budget-ms. Timings are
+machine-specific; the lazy-module and database checks are not.
+
+Usage:
+    python benchmarks/coldstart.py                      # report
+    python benchmarks/coldstart.py --check --budget-ms 1500
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Loaded on first use, never by `import api.index`
+LAZY_MODULES = ("bcrypt", "jwt", "httpx", "concurrent.futures.process", "PIL")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import api.index
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000, "lazy": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def _env(db: Path) -> dict[str, str]:
+    return {**os.environ, "DATABASE_URL": f"sqlite:///{db}", "JOB_POLLER": "0", "PYTHONDONTWRITEBYTECODE": "1"}
+
+
+def probe(db: Path) -> dict[str, Any]:
+    """Import api.index once in a fresh interpreter."""
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, env=_env(db), check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def importtime(db: Path, top: int) -> list[dict[str, Any]]:
+    """Slowest direct imports of api.index, by cumulative microseconds."""
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api.index"],
+        cwd=ROOT, env=_env(db), check=True, capture_output=True, text=True,
+    ).stderr
+    rows = []
+    for line in err.splitlines():
+        # "import time: <self us> | <cumulative us> | <two spaces per nesting level><module>"
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header or unrelated output
+        name = parts[2].strip()
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        if depth <= 1:
+            rows.append({"module": name, "self_ms": int(parts[0]) / 1000, "cumulative_ms": int(parts[1]) / 1000})
+    rows.sort(key=lambda r: -r["cumulative_ms"])
+    return rows[:top]
+
+
+def measure(runs: int = 7, top: int = 10) -> dict[str, Any]:
+    """Run the probes against a throwaway database path and summarise them."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "coldstart.db"
+        samples = [probe(db) for _ in range(runs)]
+        touched = db.exists()
+        slowest = importtime(db, top)
+    times = sorted(s["ms"] for s in samples)
+    return {
+        "import_ms": {"best": round(times[0], 1), "median": round(statistics.median(times), 1), "runs": runs},
+        "top": slowest,
+        "lazy": sorted({m for s in samples for m in s["lazy"]}),
+        "touched_db": touched,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7, help="fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--budget-ms", type=float, help="fail --check when the median import exceeds this")
+    parser.add_argument("--check", action="store_true", help="exit 1 on a lazy import, DB access or blown budget")
+    args = parser.parse_args()
+
+    report = measure(args.runs, args.top)
+    failures = [f"imported at startup: {m}" for m in report["lazy"]]
+    if report["touched_db"]:
+        failures.append("import opened the database")
+    if args.budget_ms and report["import_ms"]["median"] > args.budget_ms:
+        failures.append(f"median import {report['import_ms']['median']}ms > budget {args.budget_ms}ms")
+    report["failures"] = failures
+
+    for row in report["top"]:
+        print(f"{row['module']:<32} {row['cumulative_ms']:>9.1f} ms  (self {row['self_ms']:.1f})", file=sys.stderr)
+    print(f"import api.index: best {report['import_ms']['best']} ms, median {report['import_ms']['median']} ms",
+          file=sys.stderr)
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Synthetic workflow graphs and stub nodes for executor benchmarks.
+
+Every generator returns a workflow dict in the executor's format whose
+nodes are all `Stub` nodes. A stub's cost is set through its node data:
+
+    sleep_ms      — time.sleep() per execution (simulates provider I/O)
+    cpu_iters     — iterations of a small arithmetic loop (simulates CPU work)
+    output_bytes  — size of the bytes value it returns on port "out"
+
+Shapes:
+    wide(n)     — one root fanning out to n-2 siblings that join in one sink
+    deep(n)     — a single chain of n nodes
+    diamond(n)  — a chain of diamonds (a → b, a → c, b → d, c → d, ...)
+    layered(n)  — random layers of `width` nodes, each wired to up to
+                  `fan_in` nodes of the previous layer (seeded)
+
+Importing this module registers `Stub` with the executor, so
+`server/` must be importable (the benchmark scripts add it to sys.path).
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from typing import Any
+
+from app.nodes.base import BaseNode
+
+
+class Stub(BaseNode):
+    """Benchmark node with configurable sleep, CPU work and output size."""
+
+    name = "Stub"
+    category = "benchmark"
+    description = "Synthetic node for executor benchmarks."
+
+    def execute(self, sleep_ms: float = 0, cpu_iters: int = 0, output_bytes: int = 0, **kwargs: Any) -> dict:
+        if sleep_ms:
+            time.sleep(sleep_ms / 1000)
+        acc = 0
+        for i in range(cpu_iters):
+            acc = (acc * 31 + i) & 0xFFFFFFFF
+        return {"out": b"x" * output_bytes, "acc": acc}
+
+
+def _node(i: int, data: dict[str, Any]) -> dict[str, Any]:
+    return {"id": f"n{i}", "type": "Stub", "data": data}
+
+
+def _edge(src: int, tgt: int) -> dict[str, str]:
+    return {"source": f"n{src}", "sourceHandle": "out", "target": f"n{tgt}", "targetHandle": "upstream"}
+
+
+def wide(n: int, **data: Any) -> dict:
+    """One root, n-2 parallel children, one sink joining them."""
+    n = max(n, 3)
+    nodes = [_node(i, data) for i in range(n)]
+    edges = [_edge(0, i) for i in range(1, n - 1)] + [_edge(i, n - 1) for i in range(1, n - 1)]
+    return {"nodes": nodes, "edges": edges}
+
+
+def deep(n: int, **data: Any) -> dict:
+    """A linear chain."""
+    return {"nodes": [_node(i, data) for i in range(n)], "edges": [_edge(i, i + 1) for i in range(n - 1)]}
+
+
+def diamond(n: int, **data: Any) -> dict:
+    """Diamonds chained head to tail; every third node is a join."""
+    nodes = [_node(0, data)]
+    edges = []
+    head = 0
+    while len(nodes) + 3 <= n:
+        b, c, d = len(nodes), len(nodes) + 1, len(nodes) + 2
+        nodes += [_node(b, data), _node(c, data), _node(d, data)]
+        edges += [_edge(head, b), _edge(head, c), _edge(b, d), _edge(c, d)]
+        head = d
+    return {"nodes": nodes, "edges": edges}
+
+
+def layered(n: int, width: int = 50, fan_in: int = 3, seed: int = 0, **data: Any) -> dict:
+    """Random layered DAG: each node depends on up to `fan_in` nodes of the previous layer."""
+    rng = random.Random(seed)
+    nodes = [_node(i, data) for i in range(n)]
+    edges = []
+    for start in range(width, n, width):
+        prev = range(start - width, start)
+        for tgt in range(start, min(start + width, n)):
+            for src in rng.sample(prev, min(fan_in, len(prev))):
+                edges.append(_edge(src, tgt))
+    return {"nodes": nodes, "edges": edges}
+
+
+SHAPES = {"wide": wide, "deep": deep, "diamond": diamond, "layered": layered}
@@ -0,0 +1,157 @@
+"""Concurrent asset insert throughput on SQLite, before and after the tuned database layer.
+
+Writer threads each insert assets the way request handlers do, while
+reader threads keep listing recent assets, against throwaway SQLite files:
+
+- `default`: the engine as configured before the tuning (rollback
+  journal, synchronous=FULL, pysqlite's 5 s lock timeout, default pool),
+  one commit per asset.
+- `tuned`: api/index.py's engine (WAL, synchronous=NORMAL, busy timeout,
+  sized pool), one commit per asset.
+- `batched`: the tuned engine behind `writes`, api/index.py's group-commit
+  write batcher; each writer waits for its asset's commit.
+
+Failed writes ("database is locked", pool timeouts) are counted, not retried.
+
+Usage:
+    python benchmarks/db_writes.py [--writers 32] [--writes 100] [--readers 4]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+from bench_auth import ROOT, load_app  # noqa: E402
+
+
+def load(tmp: Path) -> ModuleType:
+    return load_app("openflow_api_db_writes", ROOT / "api" / "index.py", tmp, {
+        "DATABASE_URL": f"sqlite:///{tmp / 'tuned.db'}",
+        "JOB_POLLER": "0",
+        "DERIVATIVES": "0",
+    })
+
+
+def hammer(write: Callable[[int], None], read: Callable[[], None], writers: int, writes: int, readers: int) -> dict[str, Any]:
+    """Run `writers` threads calling write(i) `writes` times each while `readers` threads loop on read()."""
+    errors: list[str] = []
+    latencies: list[float] = []
+    done = threading.Event()
+    reads = [0]
+
+    def writer(w: int) -> None:
+        for i in range(writes):
+            start = time.perf_counter()
+            try:
+                write(w * writes + i)
+            except Exception as e:  # noqa: BLE001 - counted, the point of the benchmark
+                errors.append(type(e).__name__)
+            latencies.append(time.perf_counter() - start)
+
+    def reader() -> None:
+        while not done.is_set():
+            try:
+                read()
+                reads[0] += 1
+            except Exception as e:  # noqa: BLE001
+                errors.append(f"read:{type(e).__name__}")
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    pool = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    total = writers * writes
+    failed = sum(1 for e in errors if not e.startswith("read:"))
+    return {
+        "writes_per_s": round((total - failed) / elapsed, 1),
+        "failed": failed,
+        "read_errors": len(errors) - failed,
+        "reads": reads[0],
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000, 2),
+    }
+
+
+def run(writers: int, writes: int, readers: int) -> dict[str, dict[str, Any]]:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        module = load(tmp_path)
+        with module.SessionLocal() as db:
+            user = module.UserModel(email="bench@example.com", username="bench", password_hash="x")
+            db.add(user)
+            db.commit()
+            user_id = user.id
+
+        def asset(i: int):
+            return module.new_asset(user_id, None, "flux-fast", {"prompt": f"bench {i}", "seed": i}, False, f"http://mock/{i}.png")
+
+        def per_commit(sessions: sessionmaker) -> tuple[Callable[[int], None], Callable[[], None]]:
+            def write(i: int) -> None:
+                with sessions() as db:
+                    db.add(asset(i))
+                    db.commit()
+
+            def read() -> None:
+                with sessions() as db:
+                    db.query(module.AssetModel.id).filter(module.AssetModel.user_id == user_id).order_by(
+                        module.AssetModel.created_at.desc()).limit(50).all()
+            return write, read
+
+        default = create_engine(f"sqlite:///{tmp_path / 'default.db'}", connect_args={"check_same_thread": False})
+        module.migrate(default)
+        with default.begin() as conn:
+            conn.exec_driver_sql("INSERT INTO users (id, email, username, password_hash) VALUES (?, ?, ?, ?)",
+                                 (user_id, "bench@example.com", "bench", "x"))
+
+        results = {}
+        results["default"] = hammer(*per_commit(sessionmaker(bind=default)), writers, writes, readers)
+        tuned_write, tuned_read = per_commit(module._Session)
+        results["tuned"] = hammer(tuned_write, tuned_read, writers, writes, readers)
+        results["batched"] = hammer(lambda i: module.writes.submit(asset(i)).result(), tuned_read, writers, writes, readers)
+        batches = module.WRITE_BATCH_SIZE.labels()
+        results["batched"]["mean_batch"] = round(batches.sum / max(1, sum(batches.counts)), 1)
+        module.writes.shutdown()
+        default.dispose()
+        module.engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=32, help="concurrent writer threads")
+    parser.add_argument("--writes", type=int, default=100, help="inserts per writer")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent reader threads")
+    args = parser.parse_args()
+
+    results = run(args.writers, args.writes, args.readers)
+    base = results["default"]["writes_per_s"] or 1
+    print(f"{'mode':<10} {'writes/s':>10} {'vs default':>11} {'failed':>7} {'p50 ms':>8} {'p99 ms':>8} {'reads':>8}")
+    for mode, r in results.items():
+        print(f"{mode:<10} {r['writes_per_s']:>10,.0f} {r['writes_per_s'] / base:>10.1f}x {r['failed']:>7} "
+              f"{r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['reads']:>8}")
+
+
+if __name__ == "__main__":
+    main()
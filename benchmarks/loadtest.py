@@ -0,0 +1,416 @@
+"""Offline load-testing harness.
+
+Starts the mock fal server (benchmarks/mock_fal.py) and the app under test
+as real uvicorn processes — with as many workers as you ask for — then
+drives them with concurrent virtual users running a weighted mix of
+scenarios. Nothing talks to fal.run. Point --url at an already running
+deployment to skip starting the app.
+
+Targets and scenarios:
+    index   (api/index.py)
+        signup    POST /api/auth/signup (a fresh user; bcrypt-bound)
+        auth      POST /api/auth/login, GET /api/auth/me
+        projects  create project, list projects, create + update + list workflows
+        generate  POST /api/generate
+        batch     POST /api/generate/batch (4 items, streamed to the end)
+        jobs      POST /api/jobs, then poll GET /api/jobs/{id} until done
+    server  (server/app/main.py)
+        workflow  create, get (If-None-Match), patch (If-Match) a workflow
+        execute   POST /api/workflows/execute on a 10-node graph — the server
+                  has no provider nodes yet, so this measures engine overhead
+                  (admission, checkpoints, scheduling)
+
+Each virtual user signs up once (index) and then loops over scenarios
+until --duration elapses. The report gives, per step and overall:
+requests, throughput, p50/p95/p99/max latency and an error breakdown
+by HTTP status or transport failure, plus what the mock provider saw.
+
+Usage:
+    python benchmarks/loadtest.py --target index --users 50 --duration 30 --workers 4
+    python benchmarks/loadtest.py --target index --mix generate=5,batch=1,jobs=1 \\
+        --mock-latency-ms 800 --mock-distribution lognormal --mock-error-rate 0.02 --mock-queue-workers 16
+    python benchmarks/loadtest.py --target server --users 20 --env ADMISSION_RATE=100 --output load.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext, suppress
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterator
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+HERE = Path(__file__).resolve().parent
+
+DEFAULT_MIX = {
+    "index": {"auth": 2, "projects": 3, "generate": 6, "batch": 1, "jobs": 1, "signup": 1},
+    "server": {"workflow": 3, "execute": 2},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))]
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    """Collects latency samples and outcomes per step name."""
+
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, Counter] = defaultdict(Counter)
+        self.started = time.perf_counter()
+
+    async def call(self, step: str, send: Awaitable[httpx.Response], ok: tuple[int, ...] = ()) -> httpx.Response | None:
+        """Await a request, recording its latency and outcome under `step`.
+
+        Returns the response for 2xx/3xx (or any status in `ok`), else None.
+        """
+        start = time.perf_counter()
+        try:
+            resp = await send
+        except httpx.TimeoutException:
+            outcome, resp = "timeout", None
+        except httpx.TransportError as exc:
+            outcome, resp = type(exc).__name__, None
+        else:
+            outcome = "ok" if resp.status_code < 400 or resp.status_code in ok else str(resp.status_code)
+        self.samples[step].append(time.perf_counter() - start)
+        if outcome != "ok":
+            self.errors[step][outcome] += 1
+            return None
+        return resp
+
+    def record(self, step: str, seconds: float, outcome: str = "ok") -> None:
+        """Record an end-to-end measurement that spans several requests."""
+        self.samples[step].append(seconds)
+        if outcome != "ok":
+            self.errors[step][outcome] += 1
+
+    def report(self) -> dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+
+        def summarize(samples: list[float], errors: Counter) -> dict[str, Any]:
+            ordered = sorted(samples)
+            failed = sum(errors.values())
+            return {
+                "requests": len(ordered),
+                "errors": failed,
+                "error_rate": round(failed / len(ordered), 4) if ordered else 0.0,
+                "throughput": round(len(ordered) / elapsed, 2),
+                "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1) if ordered else 0.0,
+                "error_breakdown": dict(errors),
+            }
+
+        # End-to-end measurements (prefixed "e2e:") aren't extra requests
+        steps = {name: summarize(s, self.errors[name]) for name, s in sorted(self.samples.items())}
+        requests = [v for name, s in self.samples.items() if not name.startswith("e2e:") for v in s]
+        errors = sum((c for name, c in self.errors.items() if not name.startswith("e2e:")), Counter())
+        return {"elapsed_s": round(elapsed, 2), "overall": summarize(requests, errors), "steps": steps}
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+class IndexUser:
+    """A virtual user of api/index.py."""
+
+    GRAPH = {"nodes": [{"id": "n1", "type": "textInput", "position": {"x": 0, "y": 0}, "data": {"text": "a fox"}}],
+             "edges": []}
+
+    def __init__(self, client: httpx.AsyncClient, rec: Recorder, rng: random.Random) -> None:
+        self.client, self.rec, self.rng = client, rec, rng
+        self.email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        self.password = "load-test-pass"
+        self.headers: dict[str, str] = {}
+
+    async def setup(self) -> bool:
+        resp = await self.rec.call("POST /api/auth/signup", self.client.post("/api/auth/signup", json={
+            "email": self.email, "username": self.email.split("@")[0], "password": self.password}))
+        if resp is None:
+            return False
+        self.headers = {"Authorization": f"Bearer {resp.json()['token']}"}
+        return True
+
+    async def signup(self) -> None:
+        email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        await self.rec.call("POST /api/auth/signup", self.client.post("/api/auth/signup", json={
+            "email": email, "username": email.split("@")[0], "password": self.password}))
+
+    async def auth(self) -> None:
+        await self.rec.call("POST /api/auth/login", self.client.post(
+            "/api/auth/login", json={"email": self.email, "password": self.password}))
+        await self.rec.call("GET /api/auth/me", self.client.get("/api/auth/me", headers=self.headers))
+
+    async def projects(self) -> None:
+        c, h = self.client, self.headers
+        resp = await self.rec.call("POST /api/projects", c.post("/api/projects", json={"name": "load"}, headers=h))
+        await self.rec.call("GET /api/projects", c.get("/api/projects", headers=h))
+        if resp is None:
+            return
+        pid = resp.json()["id"]
+        resp = await self.rec.call("POST /api/projects/{pid}/workflows", c.post(
+            f"/api/projects/{pid}/workflows", json={"name": "wf", "data": self.GRAPH}, headers=h))
+        if resp is not None:
+            wf = resp.json()
+            await self.rec.call("PUT /api/workflows/{wid}", c.put(f"/api/workflows/{wf['id']}", json={
+                "data": self.GRAPH, "base_revision": wf["revision"]}, headers=h))
+        await self.rec.call("GET /api/projects/{pid}/workflows", c.get(f"/api/projects/{pid}/workflows", headers=h))
+
+    def _body(self) -> dict:
+        return {"model": self.rng.choice(["flux-fast", "flux-pro-1.1", "sd-3.5"]),
+                "inputs": {"prompt": f"load test {self.rng.random()}"}}
+
+    async def generate(self) -> None:
+        await self.rec.call("POST /api/generate", self.client.post("/api/generate", json=self._body(), headers=self.headers))
+
+    async def batch(self) -> None:
+        start = time.perf_counter()
+        items = [self._body() for _ in range(4)]
+        try:
+            async with self.client.stream("POST", "/api/generate/batch", json={"items": items}, headers=self.headers) as resp:
+                if resp.status_code >= 400:
+                    await resp.aread()
+                    self.rec.record("POST /api/generate/batch", time.perf_counter() - start, str(resp.status_code))
+                    return
+                async for line in resp.aiter_lines():
+                    event = json.loads(line) if line.strip() else {}
+                    if event.get("event") == "result" and event.get("status") != "ok":
+                        self.rec.record("e2e:batch item", 0.0, event.get("status", "error"))
+            self.rec.record("POST /api/generate/batch", time.perf_counter() - start)
+        except httpx.TimeoutException:
+            self.rec.record("POST /api/generate/batch", time.perf_counter() - start, "timeout")
+        except httpx.TransportError as exc:
+            self.rec.record("POST /api/generate/batch", time.perf_counter() - start, type(exc).__name__)
+
+    async def jobs(self) -> None:
+        start = time.perf_counter()
+        resp = await self.rec.call("POST /api/jobs", self.client.post("/api/jobs", json=self._body(), headers=self.headers))
+        if resp is None:
+            return
+        job = resp.json()
+        while job.get("status") in ("queued", "running") and time.perf_counter() - start < 120:
+            await asyncio.sleep(0.25)
+            resp = await self.rec.call("GET /api/jobs/{id}", self.client.get(f"/api/jobs/{job['id']}", headers=self.headers))
+            if resp is not None:
+                job = resp.json()
+        outcome = "ok" if job.get("status") == "completed" else job.get("status") or "unknown"
+        self.rec.record("e2e:job completion", time.perf_counter() - start, "timeout" if outcome in ("queued", "running") else outcome)
+
+
+class ServerUser:
+    """A virtual user of server/app/main.py."""
+
+    def __init__(self, client: httpx.AsyncClient, rec: Recorder, rng: random.Random) -> None:
+        self.client, self.rec, self.rng = client, rec, rng
+        self.headers = {"X-User-Id": f"load-{uuid.uuid4().hex[:8]}"}
+        nodes = [{"id": f"n{i}", "type": "LoadTestNode", "data": {"i": i}} for i in range(10)]
+        edges = [{"source": f"n{i}", "target": f"n{i + 1}"} for i in range(9)]
+        self.graph = {"nodes": nodes, "edges": edges}
+
+    async def setup(self) -> bool:
+        return True
+
+    async def workflow(self) -> None:
+        c = self.client
+        resp = await self.rec.call("POST /api/workflows/", c.post("/api/workflows/", json={"name": "load", **self.graph}))
+        if resp is None:
+            return
+        wf_id, etag = resp.json()["id"], resp.headers.get("etag", "")
+        await self.rec.call("GET /api/workflows/{id}", c.get(f"/api/workflows/{wf_id}", headers={"If-None-Match": etag}))
+        await self.rec.call("PATCH /api/workflows/{id}", c.patch(
+            f"/api/workflows/{wf_id}", json={"name": "renamed"}, headers={"If-Match": etag}))
+
+    async def execute(self) -> None:
+        await self.rec.call("POST /api/workflows/execute", self.client.post(
+            "/api/workflows/execute", json=self.graph, headers=self.headers))
+
+
+USERS = {"index": IndexUser, "server": ServerUser}
+
+
+async def virtual_user(make: Callable, client: httpx.AsyncClient, rec: Recorder, mix: dict[str, float],
+                       deadline: float, delay: float, seed: int) -> None:
+    await asyncio.sleep(delay)
+    rng = random.Random(seed)
+    user = make(client, rec, rng)
+    if not await user.setup():
+        return
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        await getattr(user, rng.choices(names, weights)[0])()
+
+
+async def drive(target: str, base_url: str, users: int, duration: float, ramp: float,
+                mix: dict[str, float], timeout: float) -> dict[str, Any]:
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=users * 2, max_keepalive_connections=users * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            virtual_user(USERS[target], client, rec, mix, deadline, ramp * i / max(users, 1), seed=i)
+            for i in range(users)
+        ))
+    return rec.report()
+
+
+# ---------------------------------------------------------------------------
+# Processes
+# ---------------------------------------------------------------------------
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60) -> None:
+    start = time.time()
+    while time.time() - start < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+@contextmanager
+def spawn(cmd: list[str], cwd: Path, env: dict[str, str], ready_url: str) -> Iterator[None]:
+    # Own process group, so uvicorn's worker processes are signalled too and
+    # none are left behind if the supervisor has to be killed
+    proc = subprocess.Popen(cmd, cwd=cwd, env={**os.environ, **env}, stdout=subprocess.DEVNULL,
+                            start_new_session=True)
+    try:
+        wait_ready(ready_url, proc)
+        yield
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            pass
+        with suppress(ProcessLookupError):
+            os.killpg(proc.pid, signal.SIGKILL)
+
+
+def parse_pairs(text: str, cast: Callable = str) -> dict[str, Any]:
+    """Parse "a=1,b=2" (or a list of "a=1" strings) into a dict."""
+    items = text if isinstance(text, list) else text.split(",")
+    return {k.strip(): cast(v) for k, _, v in (item.partition("=") for item in items) if k.strip()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=list(USERS), default="index")
+    parser.add_argument("--url", help="test an already running app instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which users start")
+    parser.add_argument("--mix", default="", help="scenario weights, e.g. generate=5,batch=1")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request client timeout")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE for the app (repeatable)")
+    parser.add_argument("--mock-latency-ms", type=float, default=500)
+    parser.add_argument("--mock-jitter-ms", type=float, default=200)
+    parser.add_argument("--mock-distribution", default="lognormal")
+    parser.add_argument("--mock-video-latency-ms", type=float)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--mock-slow-rate", type=float, default=0.0)
+    parser.add_argument("--mock-max-concurrency", type=int, default=0)
+    parser.add_argument("--mock-queue-workers", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    mix = parse_pairs(args.mix, float) if args.mix else DEFAULT_MIX[args.target]
+    unknown = set(mix) - set(DEFAULT_MIX[args.target])
+    if unknown:
+        parser.error(f"unknown scenarios for {args.target}: {', '.join(sorted(unknown))}")
+
+    mock_port = free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    mock_cmd = [
+        sys.executable, str(HERE / "mock_fal.py"), "--port", str(mock_port),
+        "--latency-ms", str(args.mock_latency_ms), "--jitter-ms", str(args.mock_jitter_ms),
+        "--distribution", args.mock_distribution, "--error-rate", str(args.mock_error_rate),
+        "--throttle-rate", str(args.mock_throttle_rate), "--slow-rate", str(args.mock_slow_rate),
+        "--max-concurrency", str(args.mock_max_concurrency), "--queue-workers", str(args.mock_queue_workers),
+    ]
+    if args.mock_video_latency_ms is not None:
+        mock_cmd += ["--video-latency-ms", str(args.mock_video_latency_ms)]
+
+    with tempfile.TemporaryDirectory() as tmp, spawn(mock_cmd, HERE, {}, f"{mock_url}/_stats"):
+        app_url = args.url
+        app_env = {
+            # index
+            "DATABASE_URL": f"sqlite:///{tmp}/index.db",
+            "FAL_BASE_URL": mock_url,
+            "FAL_QUEUE_URL": f"{mock_url}/queue",
+            "JOB_POLL_INTERVAL": "0.5",
+            "ADMISSION_DB": f"{tmp}/admission.db",
+            # server
+            "RUN_DB": f"{tmp}/runs.sqlite3",
+            "WORKFLOW_DB": f"{tmp}/workflows.sqlite3",
+            **parse_pairs(args.env),
+        }
+        if args.target == "index":
+            module, cwd, health = "api.index:app", ROOT, "/api/health"
+        else:
+            module, cwd, health = "app.main:app", ROOT / "server", "/"
+        if app_url is None:
+            port = free_port()
+            app_url = f"http://127.0.0.1:{port}"
+            app_cmd = [sys.executable, "-m", "uvicorn", module, "--port", str(port),
+                       "--workers", str(args.workers), "--log-level", "warning"]
+            app_ctx = spawn(app_cmd, cwd, app_env, app_url + health)
+        else:
+            app_ctx = nullcontext()
+
+        with app_ctx:
+            httpx.post(f"{mock_url}/_stats/reset")
+            print(f"# {args.target} at {app_url}: {args.users} users for {args.duration:.0f}s, mix {mix}", file=sys.stderr)
+            report = asyncio.run(drive(args.target, app_url, args.users, args.duration, args.ramp, mix, args.timeout))
+            report["provider"] = httpx.get(f"{mock_url}/_stats").json()
+
+    report["config"] = {k: v for k, v in vars(args).items() if k != "output"} | {"mix": mix}
+    for name, s in [("overall", report["overall"]), *report["steps"].items()]:
+        errors = ", ".join(f"{k}: {v}" for k, v in s["error_breakdown"].items())
+        print(f"{name:<36} {s['requests']:>7} {s['throughput']:>8.1f}/s  p50 {s['p50_ms']:>8.1f}  "
+              f"p95 {s['p95_ms']:>8.1f}  p99 {s['p99_ms']:>8.1f} ms  {errors}", file=sys.stderr)
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
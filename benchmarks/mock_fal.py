@@ -0,0 +1,251 @@
+"""Local stand-in for the fal.ai synchronous REST API.
+
+Answers `POST /<model path>` the way fal.run does, with configurable
+latency, error rate and a concurrency ceiling past which it returns 429,
+so the provider client can be exercised without network access or an API
+key. The queue API (submit, status, result, webhook) lives under `/queue`. `fal-ai/any-llm` returns a JSON array of scenes; video models return
+`{"video": {...}}`; everything else returns `{"images": [...]}`.
+
+Latency is drawn from a distribution (`fixed`, `uniform`, `normal`,
+`lognormal` or `exponential`) around `latency_ms`, video models can be
+given their own mean, and a `slow_rate` fraction of requests take
+`slow_factor` times longer to model a heavy tail. Besides 500s
+(`error_rate`) it can answer random 429s (`throttle_rate`). With
+`queue_workers` set, queued jobs wait IN_QUEUE (reporting their
+`queue_position`) until one of that many workers picks them up.
+
+Counters are served at `GET /_stats` and reset with `POST /_stats/reset`.
+
+Usage:
+    python benchmarks/mock_fal.py [--port 8787] [--latency-ms 200] [--error-rate 0.0]
+    python benchmarks/mock_fal.py --distribution lognormal --jitter-ms 150 --slow-rate 0.02 --queue-workers 8
+    FAL_BASE_URL=http://127.0.0.1:8787 FAL_QUEUE_URL=http://127.0.0.1:8787/queue uvicorn api.index:app
+
+In-process:
+    app = create_app(latency_ms=50)
+    transport = httpx.ASGITransport(app=app)
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import uuid
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+# Same substrings api/index.py uses to decide a model is a video model
+VIDEO_MARKERS = ("video", "wan", "kling", "minimax", "hunyuan", "luma", "ltx", "mochi")
+
+
+DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+
+def latency_sampler(distribution: str, mean_ms: float, spread_ms: float,
+                    slow_rate: float = 0.0, slow_factor: float = 10.0):
+    """Return a function drawing one latency in seconds.
+
+    `spread_ms` is the +/- range for uniform, the standard deviation for
+    normal, and sets the shape (sigma = spread / mean) for lognormal,
+    where `mean_ms` is the median.
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution {distribution!r}; expected one of {DISTRIBUTIONS}")
+
+    def draw() -> float:
+        if distribution == "fixed" or mean_ms <= 0:
+            ms = mean_ms
+        elif distribution == "uniform":
+            ms = mean_ms + random.uniform(-spread_ms, spread_ms)
+        elif distribution == "normal":
+            ms = random.gauss(mean_ms, spread_ms)
+        elif distribution == "lognormal":
+            ms = random.lognormvariate(math.log(mean_ms), spread_ms / mean_ms)
+        else:
+            ms = random.expovariate(1 / mean_ms)
+        if slow_rate and random.random() < slow_rate:
+            ms *= slow_factor
+        return max(0.0, ms) / 1000
+
+    return draw
+
+
+def create_app(latency_ms: float = 200, jitter_ms: float = 50, error_rate: float = 0.0,
+               max_concurrency: int = 0, *, distribution: str = "uniform",
+               video_latency_ms: float | None = None, throttle_rate: float = 0.0,
+               slow_rate: float = 0.0, slow_factor: float = 10.0, queue_workers: int = 0) -> FastAPI:
+    """Build the mock server.
+
+    Args:
+        latency_ms: Mean (median for lognormal) simulated generation time.
+        jitter_ms: Spread around `latency_ms`; see `latency_sampler`.
+        error_rate: Fraction of requests answered with a 500.
+        max_concurrency: In-flight requests above this get a 429 (0 = unlimited).
+        distribution: Latency distribution, one of DISTRIBUTIONS.
+        video_latency_ms: Mean latency for video models (default: `latency_ms`).
+        throttle_rate: Fraction of requests answered with a random 429.
+        slow_rate: Fraction of requests that take `slow_factor` times longer.
+        slow_factor: Multiplier for slow requests.
+        queue_workers: Queue jobs processed at once (0 = unlimited).
+    """
+    app = FastAPI(title="mock fal")
+    image_latency = latency_sampler(distribution, latency_ms, jitter_ms, slow_rate, slow_factor)
+    video_latency = image_latency if video_latency_ms is None else latency_sampler(
+        distribution, video_latency_ms, jitter_ms * video_latency_ms / latency_ms if latency_ms else jitter_ms,
+        slow_rate, slow_factor)
+
+    def draw_latency(model_path: str) -> float:
+        return video_latency() if any(k in model_path for k in VIDEO_MARKERS) else image_latency()
+
+    def fresh_stats() -> dict:
+        return {"requests": 0, "errors": 0, "throttled": 0, "in_flight": 0, "peak_in_flight": 0,
+                "by_status": Counter(), "queue_submitted": 0, "queue_depth": 0, "peak_queue_depth": 0}
+
+    app.state.stats = fresh_stats()
+
+    @app.get("/_stats")
+    async def stats():
+        return app.state.stats
+
+    @app.post("/_stats/reset")
+    async def reset_stats():
+        # Keep live gauges; they describe requests still in progress
+        live = {k: app.state.stats[k] for k in ("in_flight", "queue_depth")}
+        app.state.stats = {**fresh_stats(), **live}
+        return app.state.stats
+
+    # Queue API (queue.fal.run): submit returns at once; poll status, then fetch the result.
+    # Set FAL_QUEUE_URL=http://127.0.0.1:8787/queue to use it.
+    app.state.queue = {}
+    app.state.waiting = []  # request ids in IN_QUEUE order
+    workers = asyncio.Semaphore(queue_workers) if queue_workers else None
+
+    @app.post("/queue/{model_path:path}")
+    async def submit(model_path: str, request: Request, fal_webhook: str | None = None):
+        s = app.state.stats
+        body = await request.json()
+        if throttle_rate and random.random() < throttle_rate:
+            s["throttled"] += 1
+            s["by_status"][429] += 1
+            return JSONResponse({"detail": "Too many requests"}, status_code=429, headers={"Retry-After": "1"})
+        request_id = uuid.uuid4().hex
+        base = f"{str(request.base_url).rstrip('/')}/queue/{model_path}/requests/{request_id}"
+        job = {"status": "IN_QUEUE", "result": None, "code": 200}
+        app.state.queue[request_id] = job
+        app.state.waiting.append(request_id)
+        s["queue_submitted"] += 1
+        s["queue_depth"] += 1
+        s["peak_queue_depth"] = max(s["peak_queue_depth"], s["queue_depth"])
+        s["by_status"][200] += 1
+        asyncio.get_running_loop().create_task(_complete(job, model_path, body, fal_webhook, request_id))
+        return {"request_id": request_id, "status_url": f"{base}/status", "response_url": base}
+
+    async def _complete(job: dict, model_path: str, body: dict, webhook: str | None, request_id: str) -> None:
+        if workers:
+            await workers.acquire()
+        try:
+            app.state.waiting.remove(request_id)
+            app.state.stats["queue_depth"] -= 1
+            job["status"] = "IN_PROGRESS"
+            await asyncio.sleep(draw_latency(model_path))
+        finally:
+            if workers:
+                workers.release()
+        failed = random.random() < error_rate
+        job["result"] = {"detail": "Internal error"} if failed else _result(model_path, body)
+        job["code"] = 500 if failed else 200
+        job["status"] = "COMPLETED"
+        if webhook:
+            import httpx
+            msg = {"request_id": request_id, "status": "ERROR" if failed else "OK", "payload": job["result"]}
+            async with httpx.AsyncClient() as client:
+                try:
+                    await client.post(webhook, json=msg)
+                except httpx.HTTPError:
+                    pass
+
+    @app.get("/queue/{model_path:path}/requests/{request_id}/status")
+    async def status(model_path: str, request_id: str):
+        job = app.state.queue.get(request_id)
+        if job is None:
+            return JSONResponse({"detail": "Not found"}, status_code=404)
+        out = {"status": job["status"], "request_id": request_id}
+        if job["status"] == "IN_QUEUE":
+            out["queue_position"] = app.state.waiting.index(request_id)
+        return JSONResponse(out, status_code=200 if job["status"] == "COMPLETED" else 202)
+
+    @app.get("/queue/{model_path:path}/requests/{request_id}")
+    async def result(model_path: str, request_id: str):
+        job = app.state.queue.get(request_id)
+        if job is None or job["status"] != "COMPLETED":
+            return JSONResponse({"detail": "Not ready"}, status_code=400 if job else 404)
+        return JSONResponse(job["result"], status_code=job["code"])
+
+    @app.post("/{model_path:path}")
+    async def run(model_path: str, request: Request):
+        s = app.state.stats
+        s["requests"] += 1
+        body = await request.json()
+        if (max_concurrency and s["in_flight"] >= max_concurrency) or (throttle_rate and random.random() < throttle_rate):
+            s["throttled"] += 1
+            s["by_status"][429] += 1
+            return JSONResponse({"detail": "Too many requests"}, status_code=429, headers={"Retry-After": "1"})
+        s["in_flight"] += 1
+        s["peak_in_flight"] = max(s["peak_in_flight"], s["in_flight"])
+        try:
+            await asyncio.sleep(draw_latency(model_path))
+            if random.random() < error_rate:
+                s["errors"] += 1
+                s["by_status"][500] += 1
+                return JSONResponse({"detail": "Internal error"}, status_code=500)
+            s["by_status"][200] += 1
+            return _result(model_path, body)
+        finally:
+            s["in_flight"] -= 1
+
+    return app
+
+
+def _result(model_path: str, body: dict) -> dict:
+    key = uuid.uuid4().hex[:12]
+    if model_path == "fal-ai/any-llm":
+        scenes = [{"title": f"Scene {i + 1}", "prompt": f"mock scene {i + 1}", "type": "image"} for i in range(4)]
+        return {"output": json.dumps(scenes)}
+    if any(k in model_path for k in VIDEO_MARKERS):
+        return {"video": {"url": f"https://mock.fal.media/{key}.mp4"}, "seed": body.get("seed", 0)}
+    return {"images": [{"url": f"https://mock.fal.media/{key}.png", "width": 1024, "height": 1024}],
+            "seed": body.get("seed", random.randint(0, 2**31))}
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=0)
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--video-latency-ms", type=float)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-factor", type=float, default=10.0)
+    parser.add_argument("--queue-workers", type=int, default=0)
+    args = parser.parse_args()
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.max_concurrency,
+                     distribution=args.distribution, video_latency_ms=args.video_latency_ms,
+                     throttle_rate=args.throttle_rate, slow_rate=args.slow_rate,
+                     slow_factor=args.slow_factor, queue_workers=args.queue_workers)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""Benchmark suite for the executor, collector and API hot paths.
+
+Runs offline and in-process, compares every result with the stored
+baseline (benchmarks/baseline.json) and emits machine-readable JSON.
+
+Groups:
+    topo       topological_sort / compile_workflow on 10k–100k node DAGs
+    executor   WorkflowExecutor.execute with stub nodes (overhead, sleep,
+               CPU, output size) and the Map node
+    collector  GenerationCollector.log throughput at several record sizes
+    api        server/app endpoints and api/index.py /api/generate against
+               the in-process mock fal provider
+    startup    cold import of api/index.py in fresh interpreters (see
+               coldstart.py, which also gates lazily imported modules)
+    codec      compact workflow encoding of a 500-node canvas (see
+               workflow_codec.py for sizes)
+    db         concurrent asset inserts on SQLite: the untuned engine,
+               the tuned one and the write batcher (see db_writes.py)
+
+Every result has one headline `value` (higher is better) plus extras.
+A result is flagged as a regression when it drops more than --tolerance
+below the baseline; --check turns that into a non-zero exit status.
+The stored baseline is machine-specific: refresh it with
+--update-baseline on the machine that runs --check, and widen
+--tolerance on shared or throttled runners.
+
+Usage:
+    python benchmarks/suite.py                        # full run, JSON on stdout
+    python benchmarks/suite.py --quick --check        # smaller sizes, CI gate
+    python benchmarks/suite.py --only topo,collector --output results.json
+    python benchmarks/suite.py --update-baseline      # accept current numbers
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+from bench_auth import ROOT, load_app  # noqa: E402
+
+sys.path.insert(0, str(ROOT / "server"))
+BASELINE = HERE / "baseline.json"
+
+Result = dict[str, Any]
+
+
+def timed(fn: Callable[[], Any], repeat: int = 5) -> float:
+    """Best wall time of `repeat` calls, in seconds (least affected by noise).
+
+    The garbage collector is paused while timing so a collection triggered
+    by an earlier case isn't billed to this one.
+    """
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return min(samples)
+
+
+def latencies(fn: Callable[[], Any], n: int) -> Result:
+    """Call `fn` n times; return throughput and latency percentiles."""
+    samples = []
+    start = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    samples.sort()
+    return {
+        "value": round(n / elapsed, 1),
+        "unit": "req/s",
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p99_ms": round(samples[max(0, int(len(samples) * 0.99) - 1)] * 1000, 3),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Groups
+# ---------------------------------------------------------------------------
+
+def bench_topo(quick: bool, tmp: Path) -> dict[str, Result]:
+    from app.engine.executor import compile_workflow, topological_sort
+    from dags import SHAPES
+
+    results = {}
+    for size in (10_000,) if quick else (10_000, 100_000):
+        for shape, make in SHAPES.items():
+            wf = make(size)
+            seconds = timed(lambda: topological_sort(wf["nodes"], wf["edges"]))
+            results[f"topo.sort.{shape}.{size}"] = {"value": round(size / seconds), "unit": "nodes/s"}
+        wf = SHAPES["layered"](size)
+        seconds = timed(lambda: compile_workflow(wf))
+        results[f"topo.compile.layered.{size}"] = {"value": round(size / seconds), "unit": "nodes/s"}
+    return results
+
+
+def bench_executor(quick: bool, tmp: Path) -> dict[str, Result]:
+    from app.engine.executor import WorkflowExecutor, compile_workflow
+    from app.engine.memory import MemoryLimits
+    from dags import SHAPES, deep, wide
+
+    executor = WorkflowExecutor()
+    results = {}
+    size = 200 if quick else 1_000
+    for shape, make in SHAPES.items():
+        compiled = compile_workflow(make(size))
+        seconds = timed(lambda: executor.execute(compiled))
+        results[f"executor.overhead.{shape}.{size}"] = {"value": round(size / seconds), "unit": "nodes/s"}
+
+    # Memory profiling: tracemalloc, /proc reads and a budget sampler thread
+    profiled = WorkflowExecutor(memory=MemoryLimits(node_budget=1 << 30))
+    compiled = compile_workflow(deep(size))
+    seconds = timed(lambda: profiled.execute(compiled))
+    results[f"executor.overhead.deep.{size}.memory"] = {"value": round(size / seconds), "unit": "nodes/s"}
+
+    cases = {
+        "executor.sleep_1ms.wide.50": wide(50, sleep_ms=1),
+        "executor.cpu_20k.deep.50": deep(50, cpu_iters=20_000),
+        "executor.output_1mb.deep.50": deep(50, output_bytes=1 << 20),
+    }
+    for name, wf in cases.items():
+        compiled = compile_workflow(wf)
+        seconds = timed(lambda: executor.execute(compiled))
+        results[name] = {"value": round(50 / seconds, 1), "unit": "nodes/s"}
+
+    items = 64 if quick else 256
+    sub = deep(3, sleep_ms=2)
+    map_wf = {
+        "nodes": [{"id": "map", "type": "Map", "data": {
+            "items": list(range(items)), "workflow": sub, "item_input": "n0.item", "concurrency": 16}}],
+        "edges": [],
+    }
+    seconds = timed(lambda: executor.execute(map_wf))
+    results[f"executor.map.{items}x3.c16"] = {"value": round(items / seconds, 1), "unit": "items/s"}
+    return results
+
+
+def bench_collector(quick: bool, tmp: Path) -> dict[str, Result]:
+    from app.data.collector import GenerationCollector, GenerationRecord
+
+    # Already fast, so --quick doesn't shrink it: fewer records would make it noisier
+    results = {}
+    for size, count in ((256, 2_000), (4_096, 2_000), (65_536, 200)):
+        records = [
+            GenerationRecord("fal", "flux-dev", "image", input_params={"prompt": "x" * size, "seed": i})
+            for i in range(count)
+        ]
+
+        def write_all() -> None:
+            collector = GenerationCollector(tempfile.mkdtemp(dir=tmp))
+            for record in records:
+                collector.log(record)
+
+        seconds = timed(write_all)
+        results[f"collector.log.{size}B"] = {
+            "value": round(count / seconds),
+            "unit": "records/s",
+            "mb_s": round(count * size / seconds / 1e6, 2),
+        }
+    return results
+
+
+def bench_api(quick: bool, tmp: Path) -> dict[str, Result]:
+    import httpx
+    from fastapi.testclient import TestClient
+    from mock_fal import create_app
+
+    n = 100 if quick else 500
+    results = {}
+
+    # server/app — stores pointed at the temp dir, admission out of the way
+    os.environ.update({
+        "RUN_DB": str(tmp / "runs.sqlite3"),
+        "WORKFLOW_DB": str(tmp / "workflows.sqlite3"),
+        "ADMISSION_RATE": "1000000",
+        "ADMISSION_BURST": "1000000",
+    })
+    from app.main import app
+    from dags import layered
+
+    with TestClient(app) as client:
+        wf = layered(20, width=5)
+        wf_id = client.post("/api/workflows/", json={"name": "bench", **wf}).json()["id"]
+        results["api.server.list_nodes"] = latencies(lambda: client.get("/api/nodes"), n)
+        results["api.server.get_workflow"] = latencies(lambda: client.get(f"/api/workflows/{wf_id}"), n)
+        results["api.server.execute.20_nodes"] = latencies(
+            lambda: client.post("/api/workflows/execute", json=wf).raise_for_status(), n // 2
+        )
+
+    # api/index.py — generation against the mock provider, no network
+    module = load_app("api_index_suite", ROOT / "api" / "index.py", tmp, {
+        "DATABASE_URL": f"sqlite:///{tmp / 'api.db'}",
+        "JOB_POLLER": "0",
+        "BCRYPT_ROUNDS": "4",
+        "ADMISSION_BURST": "1000000",
+        "ADMISSION_RATE": "1000000",
+    })
+    module.fal = module.ProviderClient(
+        "fal", "http://mock-fal", {}, transport=httpx.ASGITransport(app=create_app(latency_ms=0, jitter_ms=0))
+    )
+    with TestClient(module.app) as client:
+        token = client.post("/api/auth/signup", json={
+            "email": "bench@example.com", "username": "bench", "password": "bench-pass",
+        }).json()["token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        body = {"model": "flux-fast", "inputs": {"prompt": "a lighthouse at dusk"}}
+        results["api.index.generate"] = latencies(
+            lambda: client.post("/api/generate", json=body, headers=headers).raise_for_status(), n
+        )
+        results["api.index.list_assets"] = latencies(
+            lambda: client.get("/api/assets", headers=headers).raise_for_status(), n
+        )
+
+        # Search over 20k assets of this user, through the FTS index the triggers maintain
+        words = "lighthouse dusk neon market cabin snow marble portrait forest river castle dragon city rain".split()
+        rng = random.Random(0)
+        db = module.SessionLocal()
+        user_id = db.query(module.UserModel.id).filter(module.UserModel.username == "bench").scalar()
+        db.add_all(
+            module.new_asset(user_id, None, "flux-fast", {"prompt": " ".join(rng.choices(words, k=8))}, False, "http://mock")
+            for _ in range(20_000)
+        )
+        db.commit()
+        db.close()
+        results["api.index.search_assets.20k"] = latencies(
+            lambda: client.get("/api/assets/search", params={"q": "dragon castle"}, headers=headers).raise_for_status(),
+            n,
+        )
+    return results
+
+
+def bench_startup(quick: bool, tmp: Path) -> dict[str, Result]:
+    from coldstart import measure
+
+    report = measure(runs=3 if quick else 7, top=0)
+    ms = report["import_ms"]["median"]
+    return {"startup.import.api_index": {
+        "value": round(1000 / ms, 2), "unit": "imports/s", "median_ms": ms, "best_ms": report["import_ms"]["best"],
+    }}
+
+
+def bench_codec(quick: bool, tmp: Path) -> dict[str, Result]:
+    from workflow_codec import canvas, load_codec
+
+    module = load_codec(tmp)
+    doc = canvas(500)
+    blob = module.encode_workflow(doc)
+    ratio = round(len(json.dumps(doc, separators=(",", ":"))) / len(blob), 1)
+    return {
+        "codec.encode.canvas.500": {
+            "value": round(500 / timed(lambda: module.encode_workflow(doc))), "unit": "nodes/s", "ratio": ratio,
+        },
+        "codec.decode.canvas.500": {"value": round(500 / timed(lambda: module.decode_workflow(blob))), "unit": "nodes/s"},
+    }
+
+
+def bench_db(quick: bool, tmp: Path) -> dict[str, Result]:
+    from db_writes import run
+
+    results = run(writers=16 if quick else 32, writes=25 if quick else 100, readers=4)
+    return {f"db.writes.{mode}": {"value": r.pop("writes_per_s"), "unit": "writes/s", **r} for mode, r in results.items()}
+
+
+GROUPS: dict[str, Callable[[bool, Path], dict[str, Result]]] = {
+    "topo": bench_topo,
+    "executor": bench_executor,
+    "collector": bench_collector,
+    "api": bench_api,
+    "startup": bench_startup,
+    "codec": bench_codec,
+    "db": bench_db,
+}
+
+
+# ---------------------------------------------------------------------------
+# Baseline
+# ---------------------------------------------------------------------------
+
+def compare(results: dict[str, Result], baseline: dict[str, Result], tolerance: float) -> dict[str, Result]:
+    """Ratio of each result to its baseline and whether it regressed."""
+    comparison = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            comparison[name] = {"status": "new"}
+            continue
+        ratio = result["value"] / base["value"] if base["value"] else float("inf")
+        status = "regressed" if ratio < 1 - tolerance else "improved" if ratio > 1 + tolerance else "ok"
+        comparison[name] = {"baseline": base["value"], "ratio": round(ratio, 3), "status": status}
+    return comparison
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast smoke run")
+    parser.add_argument("--only", default="", help=f"comma-separated groups ({', '.join(GROUPS)})")
+    parser.add_argument("--output", type=Path, help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional slowdown")
+    parser.add_argument("--check", action="store_true", help="exit 1 if anything regressed")
+    parser.add_argument("--update-baseline", action="store_true", help="merge these results into the baseline")
+    args = parser.parse_args()
+
+    groups = [g for g in args.only.split(",") if g] or list(GROUPS)
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+
+    results: dict[str, Result] = {}
+    # Apps under test print on startup; keep stdout for the JSON report
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(sys.stderr):
+        for group in groups:
+            start = time.perf_counter()
+            results.update(GROUPS[group](args.quick, Path(tmp)))
+            print(f"# {group}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else {"results": {}}
+    comparison = compare(results, stored["results"], args.tolerance)
+    for name, result in results.items():
+        c = comparison[name]
+        ratio = f"{c['ratio']:.2f}x" if "ratio" in c else ""
+        print(f"{name:<40} {result['value']:>14,.1f} {result['unit']:<10} {ratio:>7} {c['status']}", file=sys.stderr)
+
+    meta = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+    }
+    report = json.dumps({"meta": meta, "results": results, "comparison": comparison}, indent=2)
+    if args.output:
+        args.output.write_text(report + "\n")
+    else:
+        print(report)
+
+    if args.update_baseline:
+        stored["results"].update(results)
+        stored["meta"] = meta
+        args.baseline.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+    if args.check and any(c["status"] == "regressed" for c in comparison.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
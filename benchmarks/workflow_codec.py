@@ -0,0 +1,127 @@
+"""Size and speed of the compact workflow encoding against plain JSON.
+
+Builds canvases shaped like the web app's saved workflows (React Flow
+nodes with a position, defId and values, smoothstep edges wired
+"out" → "in") and reports, per canvas size:
+
+- `json_bytes`: the JSON the client sends and the database used to store
+- `json_zlib_bytes`: that JSON deflated, for reference
+- `compact_bytes`: api/index.py's encode_workflow() output
+- `ratio`: json_bytes / compact_bytes
+- `encode_ms` / `decode_ms`: best of several runs
+
+and checks that every canvas round-trips exactly. With --check it exits 1
+when the 500-node canvas shrinks less than --min-ratio.
+
+Usage:
+    python benchmarks/workflow_codec.py
+    python benchmarks/workflow_codec.py --check --min-ratio 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+from bench_auth import ROOT, load_app  # noqa: E402
+
+STEPS = [
+    ("text.input", {"text": None}),
+    ("image.text_to_image", {"model": "flux-pro-1.1-ultra", "width": 1024, "height": 1024, "steps": 28}),
+    ("transform.upscale", {"scale": 2, "model": "real-esrgan"}),
+    ("video.image_to_video", {"model": "kling-2.1", "duration": 5, "motion": 0.6}),
+    ("output.preview", {}),
+]
+SUBJECTS = ["a luxury watch on marble", "a lighthouse at dusk", "a neon-lit street market", "a mountain cabin in snow"]
+STYLES = ["dramatic lighting, 8k", "soft film grain, 35mm", "vibrant, trendy social media aesthetic", "studio backdrop"]
+
+
+def canvas(n: int, seed: int = 0) -> dict[str, Any]:
+    """An n-node canvas of parallel five-step pipelines laid out on a grid.
+
+    About one node in ten has been dragged off the grid, to a fractional
+    position, as hand-edited canvases have.
+    """
+    rng = random.Random(seed)
+    nodes, edges = [], []
+    for i in range(n):
+        row, col = divmod(i, len(STEPS))
+        def_id, values = STEPS[col]
+        values = dict(values)
+        if "text" in values:
+            values["text"] = f"Product photography of {rng.choice(SUBJECTS)}, {rng.choice(STYLES)}"
+        x, y = 100 + 400 * col, 150 + 300 * row
+        if rng.random() < 0.1:
+            x, y = round(x + rng.uniform(-50, 50), 2), round(y + rng.uniform(-50, 50), 2)
+        nodes.append({"id": f"template_{i}", "type": "flowNode", "position": {"x": x, "y": y},
+                      "defId": def_id, "values": values})
+        if col:
+            edges.append({"id": f"tmpl_edge_{i}", "source": f"template_{i - 1}", "sourceHandle": "out",
+                          "target": f"template_{i}", "targetHandle": "in", "animated": False,
+                          "type": "smoothstep", "style": {"stroke": "#d1d5db", "strokeWidth": 1.5}})
+    return {"nodes": nodes, "edges": edges}
+
+
+def best_ms(fn: Callable[[], Any], repeat: int = 5) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return round(min(samples) * 1000, 3)
+
+
+def load_codec(tmp: Path) -> ModuleType:
+    return load_app("api_index_codec", ROOT / "api" / "index.py", tmp, {
+        "DATABASE_URL": f"sqlite:///{tmp / 'codec.db'}", "JOB_POLLER": "0",
+    })
+
+
+def measure(module: ModuleType, sizes: tuple[int, ...] = (50, 500, 5000)) -> dict[str, dict[str, Any]]:
+    results = {}
+    for n in sizes:
+        doc = canvas(n)
+        raw = json.dumps(doc, separators=(",", ":")).encode()
+        blob = module.encode_workflow(doc)
+        if module.decode_workflow(blob) != doc:
+            raise AssertionError(f"{n}-node canvas did not round-trip")
+        results[f"canvas.{n}"] = {
+            "json_bytes": len(raw),
+            "json_zlib_bytes": len(zlib.compress(raw, 9)),
+            "compact_bytes": len(blob),
+            "ratio": round(len(raw) / len(blob), 1),
+            "encode_ms": best_ms(lambda: module.encode_workflow(doc)),
+            "decode_ms": best_ms(lambda: module.decode_workflow(blob)),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min-ratio", type=float, default=10, help="required JSON/compact ratio at 500 nodes")
+    parser.add_argument("--check", action="store_true", help="exit 1 if the 500-node canvas misses --min-ratio")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = measure(load_codec(Path(tmp)))
+    for name, r in results.items():
+        print(f"{name:<14} json {r['json_bytes']:>9,} B  json+zlib {r['json_zlib_bytes']:>8,} B  "
+              f"compact {r['compact_bytes']:>7,} B  {r['ratio']:>5}x  "
+              f"encode {r['encode_ms']} ms  decode {r['decode_ms']} ms", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+    if args.check and results["canvas.500"]["ratio"] < args.min_ratio:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
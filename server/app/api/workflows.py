@@ -2,17 +2,52 @@
 Workflow CRUD API routes.
 
 Handles creating, reading, updating, and executing workflows.
+
+Workflows live in a persistent store (SQLite by default, see
+app.data.workflow_store) behind a read-through LRU cache, so several
+server workers can share them. Each workflow's `version` is exposed as
+its ETag: GET honours If-None-Match, and PATCH honours If-Match for
+optimistic concurrency.
+
+The store is synchronous and its writes can wait on other workers' locks,
+so the handlers are plain functions, which FastAPI runs in its threadpool.
 """
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+import base64
+import json
+import os
 from typing import Any, Optional
 
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from pydantic import BaseModel
+
+from app.data.workflow_store import (
+    CachedWorkflowStore,
+    SQLiteWorkflowStore,
+    WorkflowConflict,
+    WorkflowStore,
+)
+
 router = APIRouter()
 
+WORKFLOW_DB = os.getenv("WORKFLOW_DB", "data/workflows.sqlite3")
+WORKFLOW_CACHE_SIZE = int(os.getenv("WORKFLOW_CACHE_SIZE", "256"))
+MAX_PAGE_SIZE = 200
+
+_store: Optional[WorkflowStore] = None
+
 
-# In-memory store (replace with PostgreSQL in production)
-_workflows: dict[str, dict[str, Any]] = {}
+def get_store() -> WorkflowStore:
+    """Return the process-wide workflow store, opening it on first use.
+
+    Override this dependency to plug in a different backend.
+    """
+    global _store
+    if _store is None:
+        _store = CachedWorkflowStore(
+            SQLiteWorkflowStore(WORKFLOW_DB), maxsize=WORKFLOW_CACHE_SIZE
+        )
+    return _store
 
 
 class WorkflowCreate(BaseModel):
@@ -27,54 +62,136 @@ class WorkflowUpdate(BaseModel):
     edges: Optional[list[dict[str, Any]]] = None
 
 
+def _etag(workflow_id: str, version: int) -> str:
+    return f'"{workflow_id}.{version}"'
+
+
+def _parse_etag(value: str, workflow_id: str) -> Optional[int]:
+    """Extract the version from an If-Match/If-None-Match value for this workflow."""
+    tag = value.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    prefix = f'"{workflow_id}.'
+    if tag.startswith(prefix) and tag.endswith('"') and tag[len(prefix) : -1].isdigit():
+        return int(tag[len(prefix) : -1])
+    return None
+
+
+def _encode_cursor(summary: dict[str, Any]) -> str:
+    raw = json.dumps([summary["updated_at"], summary["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        updated_at, wf_id = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        return str(updated_at), str(wf_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/")
-async def list_workflows() -> list[dict[str, Any]]:
-    """List all workflows."""
-    return list(_workflows.values())
+def list_workflows(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    store: WorkflowStore = Depends(get_store),
+) -> list[dict[str, Any]]:
+    """List workflow summaries, most recently updated first.
+
+    Summaries carry node and edge counts rather than the graphs. When more
+    results exist, the cursor for the next page is returned in the
+    `X-Next-Cursor` header.
+    """
+    page = store.list(limit + 1, _decode_cursor(cursor) if cursor else None)
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(page[-1])
+    return page
 
 
 @router.post("/")
-async def create_workflow(body: WorkflowCreate) -> dict[str, Any]:
+def create_workflow(
+    body: WorkflowCreate, response: Response, store: WorkflowStore = Depends(get_store)
+) -> dict[str, Any]:
     """Create a new workflow."""
-    import uuid
-    wf_id = str(uuid.uuid4())
-    workflow = {
-        "id": wf_id,
-        "name": body.name,
-        "nodes": body.nodes,
-        "edges": body.edges,
-    }
-    _workflows[wf_id] = workflow
+    workflow = store.create(body.name, body.nodes, body.edges)
+    response.headers["ETag"] = _etag(workflow["id"], workflow["version"])
     return workflow
 
 
 @router.get("/{workflow_id}")
-async def get_workflow(workflow_id: str) -> dict[str, Any]:
-    """Get a workflow by id."""
-    if workflow_id not in _workflows:
+def get_workflow(
+    workflow_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    store: WorkflowStore = Depends(get_store),
+) -> Any:
+    """Get a workflow by id.
+
+    Returns 304 Not Modified without a body when If-None-Match names the
+    current version.
+    """
+    if if_none_match:
+        version = store.version(workflow_id)
+        if version is not None and any(
+            _parse_etag(tag, workflow_id) == version for tag in if_none_match.split(",")
+        ):
+            return Response(
+                status_code=304, headers={"ETag": _etag(workflow_id, version)}
+            )
+    workflow = store.get(workflow_id)
+    if workflow is None:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    return _workflows[workflow_id]
+    response.headers["ETag"] = _etag(workflow_id, workflow["version"])
+    return workflow
 
 
 @router.patch("/{workflow_id}")
-async def update_workflow(workflow_id: str, body: WorkflowUpdate) -> dict[str, Any]:
-    """Update a workflow."""
-    if workflow_id not in _workflows:
+def update_workflow(
+    workflow_id: str,
+    body: WorkflowUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    store: WorkflowStore = Depends(get_store),
+) -> dict[str, Any]:
+    """Update a workflow.
+
+    With an If-Match header, the update only applies if the workflow is
+    still at that version; otherwise it fails with 412 and the current
+    ETag, and the client should re-fetch and retry.
+    """
+    expected = None
+    if if_match and if_match.strip() != "*":
+        expected = _parse_etag(if_match, workflow_id)
+        if expected is None:
+            raise HTTPException(
+                status_code=412,
+                detail="If-Match does not name a version of this workflow",
+            )
+    try:
+        workflow = store.update(
+            workflow_id, body.model_dump(exclude_none=True), expected
+        )
+    except WorkflowConflict as exc:
+        raise HTTPException(
+            status_code=412,
+            detail="Workflow was modified by someone else",
+            headers={"ETag": _etag(workflow_id, exc.current_version)},
+        )
+    if workflow is None:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    wf = _workflows[workflow_id]
-    if body.name is not None:
-        wf["name"] = body.name
-    if body.nodes is not None:
-        wf["nodes"] = body.nodes
-    if body.edges is not None:
-        wf["edges"] = body.edges
-    return wf
+    response.headers["ETag"] = _etag(workflow_id, workflow["version"])
+    return workflow
 
 
 @router.delete("/{workflow_id}")
-async def delete_workflow(workflow_id: str) -> dict[str, str]:
+def delete_workflow(
+    workflow_id: str, store: WorkflowStore = Depends(get_store)
+) -> dict[str, str]:
     """Delete a workflow."""
-    if workflow_id not in _workflows:
+    if not store.delete(workflow_id):
         raise HTTPException(status_code=404, detail="Workflow not found")
-    del _workflows[workflow_id]
     return {"status": "deleted"}
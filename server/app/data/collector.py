@@ -1,4 +1,4 @@
-<![CDATA["""Generation Data Collector.
+"""Generation Data Collector.
 
 Captures every AI generation event on the platform and writes it to
 append-only JSONL files organized by date. This data powers the training
@@ -24,11 +24,13 @@ from __future__ import annotations
 
 import json
 import os
+import time
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
+from app.metrics import COLLECTOR_BACKLOG, COLLECTOR_WRITE_SECONDS
 
 # Default storage root — override via DATA_DIR environment variable
 DATA_DIR = Path(os.getenv("DATA_DIR", "data/generations"))
@@ -132,6 +134,14 @@ class GenerationCollector:
         """
         return self.data_dir / dt.strftime("%Y/%m/%d") / "generations.jsonl"
 
+    def partitions(self) -> list[Path]:
+        """List all date partitions, oldest first.
+
+        Returns:
+            Paths to every `YYYY/MM/DD/generations.jsonl` file under data_dir.
+        """
+        return sorted(self.data_dir.glob("*/*/*/generations.jsonl"))
+
     def log(self, record: GenerationRecord) -> Path:
         """Write a generation record to the appropriate JSONL file.
 
@@ -141,12 +151,18 @@ class GenerationCollector:
         Returns:
             Path to the file the record was written to.
         """
-        dt = datetime.fromisoformat(record.timestamp)
-        filepath = self._get_file_path(dt)
-        filepath.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(filepath, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+        COLLECTOR_BACKLOG.inc()
+        start = time.perf_counter()
+        try:
+            dt = datetime.fromisoformat(record.timestamp)
+            filepath = self._get_file_path(dt)
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+
+            with open(filepath, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+        finally:
+            COLLECTOR_WRITE_SECONDS.observe(time.perf_counter() - start)
+            COLLECTOR_BACKLOG.dec()
 
         return filepath
 
@@ -177,4 +193,3 @@ class GenerationCollector:
             metrics=data.get("metrics"),
         )
         return self.log(record)
-]]>
\ No newline at end of file
@@ -0,0 +1,390 @@
+"""Generation Deduplication Index.
+
+Many generations are near-repeats: the same model and parameters with a
+prompt that differs only by casing, punctuation or a word or two. This
+module keeps a persistent index of everything that has been exported so
+far and assigns each record to a duplicate cluster.
+
+Two levels of matching are used:
+- Exact: SHA-256 of the normalised (model, input params) pair.
+- Near: a MinHash signature of the prompt's word shingles, bucketed into
+  LSH bands. Records are only compared when their model and non-prompt
+  params match exactly and they share at least one band; candidates are
+  then confirmed by estimated Jaccard similarity.
+
+The index lives in a single SQLite file and records how far into each
+collector partition it has read, so new partitions (and new lines
+appended to today's partition) are picked up incrementally without ever
+rebuilding the index.
+
+Usage:
+    index = DedupIndex("data/generations/dedup_index.sqlite3")
+    result = index.add(record_dict)
+    if not result.duplicate:
+        ...
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import sqlite3
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+# Free-text inputs matched by similarity instead of exactly
+PROMPT_FIELDS = ("prompt", "negative_prompt")
+
+# Params ignored when deciding whether two generations asked for the same
+# thing. Seeds are randomised per run by the UI, so keeping them would make
+# every record unique.
+DEFAULT_IGNORED_PARAMS = frozenset({"seed"})
+
+# 16 bands x 4 rows: pairs at Jaccard 0.8 collide in some band >99.9% of
+# the time, pairs at 0.3 only ~12% of the time.
+NUM_PERM = 64
+BAND_ROWS = 4
+BAND_COUNT = NUM_PERM // BAND_ROWS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big")
+        % _MERSENNE_PRIME
+        | 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big")
+        % _MERSENNE_PRIME,
+    )
+    for i in range(NUM_PERM)
+]
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# ---------------------------------------------------------------------------
+# Normalisation & Hashing
+# ---------------------------------------------------------------------------
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase a prompt and collapse punctuation and whitespace."""
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def _normalize_value(value: Any) -> Any:
+    """Recursively normalise a param value so equivalent inputs compare equal."""
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: _normalize_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_value(v) for v in value]
+    return value
+
+
+def _canonical_json(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def shingles(text: str) -> set[str]:
+    """Word unigrams plus bigrams of an already-normalised prompt."""
+    words = text.split()
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def minhash(text: str) -> list[int]:
+    """Compute a MinHash signature of a prompt's shingles.
+
+    Args:
+        text: Already-normalised prompt text.
+
+    Returns:
+        NUM_PERM 32-bit minimum hashes. The fraction of positions where two
+        signatures agree estimates the Jaccard similarity of the prompts.
+    """
+    features = shingles(text)
+    if not features:
+        return [_MAX_HASH] * NUM_PERM
+    hashes = [
+        int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), "big")
+        for f in features
+    ]
+    return [
+        min((a * h + b) % _MERSENNE_PRIME & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def jaccard_estimate(sig_a: list[int], sig_b: list[int]) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / NUM_PERM
+
+
+def _bands(signature: list[int]) -> list[int]:
+    """Collapse each band of rows into a single signed 64-bit bucket key."""
+    keys = []
+    for i in range(BAND_COUNT):
+        rows = signature[i * BAND_ROWS : (i + 1) * BAND_ROWS]
+        digest = hashlib.blake2b(array("I", rows).tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class DedupResult:
+    """Outcome of adding one record to the index.
+
+    Attributes:
+        cluster_id: Duplicate cluster the record was assigned to.
+        duplicate: True if the cluster already existed.
+        exact: True if the record matched an existing record exactly.
+    """
+
+    cluster_id: int
+    duplicate: bool
+    exact: bool
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS clusters (
+    id INTEGER PRIMARY KEY,
+    canonical_id TEXT,
+    model TEXT NOT NULL,
+    param_sig TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    size INTEGER NOT NULL DEFAULT 1,
+    exact_dups INTEGER NOT NULL DEFAULT 0,
+    near_dups INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS exact_keys (
+    key TEXT PRIMARY KEY,
+    cluster_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bands (
+    param_sig TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    cluster_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_bands_lookup ON bands (param_sig, band, value);
+CREATE TABLE IF NOT EXISTS partitions (
+    path TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+"""
+
+
+class DedupIndex:
+    """Persistent exact + near-duplicate index backed by SQLite.
+
+    Writes are batched into the caller's transaction: call `commit()`
+    once a partition has been fully processed so a crash mid-partition
+    simply re-reads it on the next run.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        *,
+        threshold: float = 0.7,
+        ignored_params: frozenset[str] = DEFAULT_IGNORED_PARAMS,
+    ) -> None:
+        """Open (or create) the index.
+
+        Args:
+            path: SQLite file holding the index.
+            threshold: Minimum estimated Jaccard similarity of prompt
+                shingles for two records to count as near-duplicates.
+                Values above 1.0 disable near-duplicate matching.
+            ignored_params: Input params excluded from the comparison.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.ignored_params = ignored_params
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the underlying connection."""
+        self._conn.close()
+
+    def commit(self) -> None:
+        """Persist everything added since the last commit."""
+        self._conn.commit()
+
+    # -- Keys ---------------------------------------------------------------
+
+    def keys_for(self, record: dict[str, Any]) -> tuple[str, str, str]:
+        """Compute (exact_key, param_sig, normalised prompt) for a record."""
+        model = str(record.get("model", "unknown"))
+        params = {
+            k: _normalize_value(v)
+            for k, v in (record.get("input") or {}).items()
+            if k not in self.ignored_params
+        }
+        prompt = normalize_text(str(params.pop("prompt", "") or ""))
+        texts = {
+            f: normalize_text(str(params.pop(f) or ""))
+            for f in PROMPT_FIELDS
+            if f in params
+        }
+
+        param_sig = hashlib.sha256(
+            _canonical_json([model, params, texts]).encode()
+        ).hexdigest()
+        exact_key = hashlib.sha256(f"{param_sig}\x1f{prompt}".encode()).hexdigest()
+        return exact_key, param_sig, prompt
+
+    # -- Mutation -----------------------------------------------------------
+
+    def add(self, record: dict[str, Any]) -> DedupResult:
+        """Assign a record to a duplicate cluster, creating one if needed.
+
+        Args:
+            record: Generation record as written by the collector.
+
+        Returns:
+            Which cluster the record landed in and whether it was a duplicate.
+        """
+        exact_key, param_sig, prompt = self.keys_for(record)
+        cur = self._conn.cursor()
+
+        row = cur.execute(
+            "SELECT cluster_id FROM exact_keys WHERE key = ?", (exact_key,)
+        ).fetchone()
+        if row:
+            cur.execute(
+                "UPDATE clusters SET size = size + 1, exact_dups = exact_dups + 1 WHERE id = ?",
+                (row[0],),
+            )
+            return DedupResult(cluster_id=row[0], duplicate=True, exact=True)
+
+        signature = minhash(prompt)
+        bands = _bands(signature)
+        cluster_id = self._find_near(cur, param_sig, signature, bands)
+        if cluster_id is not None:
+            cur.execute(
+                "UPDATE clusters SET size = size + 1, near_dups = near_dups + 1 WHERE id = ?",
+                (cluster_id,),
+            )
+            cur.execute(
+                "INSERT INTO exact_keys (key, cluster_id) VALUES (?, ?)",
+                (exact_key, cluster_id),
+            )
+            return DedupResult(cluster_id=cluster_id, duplicate=True, exact=False)
+
+        cur.execute(
+            "INSERT INTO clusters (canonical_id, model, param_sig, signature) VALUES (?, ?, ?, ?)",
+            (
+                record.get("id"),
+                str(record.get("model", "unknown")),
+                param_sig,
+                array("I", signature).tobytes(),
+            ),
+        )
+        cluster_id = cur.lastrowid
+        assert cluster_id is not None  # set by the INSERT above
+        cur.execute(
+            "INSERT INTO exact_keys (key, cluster_id) VALUES (?, ?)",
+            (exact_key, cluster_id),
+        )
+        cur.executemany(
+            "INSERT INTO bands (param_sig, band, value, cluster_id) VALUES (?, ?, ?, ?)",
+            [(param_sig, i, value, cluster_id) for i, value in enumerate(bands)],
+        )
+        return DedupResult(cluster_id=cluster_id, duplicate=False, exact=False)
+
+    def _find_near(
+        self,
+        cur: sqlite3.Cursor,
+        param_sig: str,
+        signature: list[int],
+        bands: list[int],
+    ) -> int | None:
+        """Return the most similar cluster at or above `threshold`, if any."""
+        if self.threshold > 1.0:
+            return None
+        clauses = " OR ".join("(b.band = ? AND b.value = ?)" for _ in bands)
+        args: list[Any] = [param_sig]
+        for i, value in enumerate(bands):
+            args.extend((i, value))
+        rows = cur.execute(
+            f"SELECT DISTINCT c.id, c.signature FROM bands b JOIN clusters c ON c.id = b.cluster_id "
+            f"WHERE b.param_sig = ? AND ({clauses})",
+            args,
+        ).fetchall()
+
+        best: tuple[float, int] | None = None
+        for cid, blob in rows:
+            similarity = jaccard_estimate(signature, array("I", blob).tolist())
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                best = (similarity, cid)
+        return best[1] if best else None
+
+    # -- Partition bookkeeping ----------------------------------------------
+
+    def partition_offset(self, path: Path | str) -> int:
+        """Byte offset up to which a partition file has been indexed."""
+        row = self._conn.execute(
+            "SELECT offset FROM partitions WHERE path = ?", (str(path),)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def set_partition_offset(self, path: Path | str, offset: int) -> None:
+        """Record that a partition has been indexed up to `offset` bytes."""
+        self._conn.execute(
+            "INSERT INTO partitions (path, offset) VALUES (?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET offset = excluded.offset",
+            (str(path), offset),
+        )
+
+    # -- Reporting ----------------------------------------------------------
+
+    def stats(self, top: int = 10) -> dict[str, Any]:
+        """Summarise duplicate clusters across everything indexed so far.
+
+        Args:
+            top: Number of largest clusters to include.
+
+        Returns:
+            Totals, per-model breakdown and the largest clusters.
+        """
+        total, clusters, exact, near = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*), COALESCE(SUM(exact_dups), 0), "
+            "COALESCE(SUM(near_dups), 0) FROM clusters"
+        ).fetchone()
+        by_model = {
+            model: {"records": size, "clusters": count}
+            for model, size, count in self._conn.execute(
+                "SELECT model, SUM(size), COUNT(*) FROM clusters GROUP BY model ORDER BY SUM(size) DESC"
+            )
+        }
+        largest = [
+            {"cluster_id": cid, "canonical_id": canonical, "model": model, "size": size}
+            for cid, canonical, model, size in self._conn.execute(
+                "SELECT id, canonical_id, model, size FROM clusters WHERE size > 1 "
+                "ORDER BY size DESC LIMIT ?",
+                (top,),
+            )
+        ]
+        return {
+            "records": total,
+            "clusters": clusters,
+            "exact_duplicates": exact,
+            "near_duplicates": near,
+            "duplicate_ratio": round((exact + near) / total, 4) if total else 0.0,
+            "by_model": by_model,
+            "largest_clusters": largest,
+        }
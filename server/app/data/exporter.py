@@ -0,0 +1,107 @@
+"""Generation Dataset Exporter.
+
+Turns the collector's date-partitioned JSONL files into training-ready
+exports. Every record passes through the deduplication index first, so
+exports contain one canonical record per duplicate cluster and a
+statistics file describing what was dropped.
+
+Exports are incremental: the index remembers how far into each partition
+it has read, so each run emits only records that landed since the last
+one.
+
+Output layout:
+    <out>.jsonl        — deduplicated records
+    <out>.stats.json   — duplicate-cluster statistics
+
+Usage:
+    exporter = GenerationExporter()
+    summary = exporter.export_jsonl("exports/2026-02-15.jsonl")
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any
+
+from app.data.collector import GenerationCollector
+from app.data.dedup import DedupIndex
+
+INDEX_FILENAME = "dedup_index.sqlite3"
+
+
+class GenerationExporter:
+    """Export collector partitions as deduplicated JSONL."""
+
+    def __init__(
+        self,
+        collector: GenerationCollector | None = None,
+        index: DedupIndex | None = None,
+    ) -> None:
+        """Initialize the exporter.
+
+        Args:
+            collector: Collector whose partitions are exported.
+            index: Dedup index to use. Defaults to one stored next to the
+                collector's partitions.
+        """
+        self.collector = collector or GenerationCollector()
+        self.index = index or DedupIndex(self.collector.data_dir / INDEX_FILENAME)
+
+    def export_jsonl(self, out_path: Path | str) -> dict[str, Any]:
+        """Export all not-yet-exported records, dropping duplicates.
+
+        The index is committed after each partition, and only once that
+        partition's records are flushed to the output file.
+
+        Args:
+            out_path: Destination JSONL file. A `.stats.json` file is
+                written alongside it.
+
+        Returns:
+            Summary with counts for this run and cumulative cluster stats.
+        """
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        read = written = exact = near = 0
+
+        with open(out_path, "w", encoding="utf-8") as out:
+            for partition in self.collector.partitions():
+                offset = self.index.partition_offset(partition)
+                if partition.stat().st_size <= offset:
+                    continue
+
+                with open(partition, "rb") as f:
+                    f.seek(offset)
+                    for line in f:
+                        # A line without its newline is still being written
+                        if not line.endswith(b"\n"):
+                            break
+                        offset += len(line)
+                        if not line.strip():
+                            continue
+                        record = json.loads(line)
+                        read += 1
+                        result = self.index.add(record)
+                        if not result.duplicate:
+                            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                            written += 1
+                        elif result.exact:
+                            exact += 1
+                        else:
+                            near += 1
+
+                out.flush()
+                self.index.set_partition_offset(partition, offset)
+                self.index.commit()
+
+        summary = {
+            "read": read,
+            "written": written,
+            "exact_duplicates": exact,
+            "near_duplicates": near,
+            "clusters": self.index.stats(),
+        }
+        stats_path = out_path.with_suffix(".stats.json")
+        stats_path.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        return summary
@@ -0,0 +1,371 @@
+"""Workflow Storage.
+
+Persistent storage for workflow definitions behind a small interface so
+the backend can be swapped (SQLite by default, anything else later)
+without touching the API layer.
+
+Every workflow carries a monotonically increasing `version`. It doubles
+as the HTTP ETag and as the optimistic-concurrency token: updates can
+name the version they were based on and are rejected if someone else
+got there first.
+
+`CachedWorkflowStore` wraps any store with a read-through LRU cache of
+decoded workflows. Cache entries are revalidated against the backing
+store's version column on every read — a single indexed lookup — so
+several workers sharing one database never serve each other's stale
+copies, while unchanged workflows are never re-read or re-decoded.
+
+Usage:
+    store = CachedWorkflowStore(SQLiteWorkflowStore("data/workflows.sqlite3"))
+    wf = store.create("My flow", nodes, edges)
+    store.update(wf["id"], {"name": "Renamed"}, expected_version=wf["version"])
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+
+class WorkflowConflict(Exception):
+    """Raised when an update's expected version is no longer current.
+
+    Attributes:
+        current_version: The version now stored.
+    """
+
+    def __init__(self, current_version: int) -> None:
+        super().__init__(f"Workflow changed (now at version {current_version})")
+        self.current_version = current_version
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# ---------------------------------------------------------------------------
+# Interface
+# ---------------------------------------------------------------------------
+
+
+class WorkflowStore:
+    """Storage backend interface.
+
+    Full workflows are dicts with id, name, nodes, edges, version,
+    created_at and updated_at. Summaries omit nodes and edges and carry
+    node_count and edge_count instead.
+    """
+
+    def create(
+        self, name: str, nodes: list[dict[str, Any]], edges: list[dict[str, Any]]
+    ) -> dict[str, Any]:
+        """Store a new workflow at version 1 and return it."""
+        raise NotImplementedError
+
+    def get(self, workflow_id: str) -> dict[str, Any] | None:
+        """Return the full workflow, or None if it does not exist."""
+        raise NotImplementedError
+
+    def version(self, workflow_id: str) -> int | None:
+        """Return the current version without loading the workflow."""
+        raise NotImplementedError
+
+    def update(
+        self,
+        workflow_id: str,
+        changes: dict[str, Any],
+        expected_version: int | None = None,
+    ) -> dict[str, Any] | None:
+        """Apply name/nodes/edges changes and bump the version.
+
+        Args:
+            workflow_id: Workflow to update.
+            changes: Subset of {"name", "nodes", "edges"}.
+            expected_version: If given, only update while still at this version.
+
+        Returns:
+            The updated workflow, or None if it does not exist.
+
+        Raises:
+            WorkflowConflict: The workflow is no longer at expected_version.
+        """
+        raise NotImplementedError
+
+    def delete(self, workflow_id: str) -> bool:
+        """Delete a workflow. Returns False if it did not exist."""
+        raise NotImplementedError
+
+    def list(
+        self, limit: int = 50, cursor: tuple[str, str] | None = None
+    ) -> list[dict[str, Any]]:
+        """Return summaries, most recently updated first.
+
+        Args:
+            limit: Maximum number of summaries.
+            cursor: (updated_at, id) of the last summary of the previous page.
+        """
+        raise NotImplementedError
+
+
+# ---------------------------------------------------------------------------
+# SQLite Backend
+# ---------------------------------------------------------------------------
+
+
+class SQLiteWorkflowStore(WorkflowStore):
+    """Workflows in one SQLite file, safe to share between worker processes."""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS workflows (
+            id         TEXT PRIMARY KEY,
+            name       TEXT NOT NULL,
+            data       TEXT NOT NULL,
+            node_count INTEGER NOT NULL,
+            edge_count INTEGER NOT NULL,
+            version    INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_workflows_updated ON workflows (updated_at, id);
+    """
+    _SUMMARY_COLUMNS = (
+        "id, name, node_count, edge_count, version, created_at, updated_at"
+    )
+
+    def __init__(self, path: Path | str) -> None:
+        """Open (or create) the database.
+
+        Args:
+            path: SQLite file holding the workflows table.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _full(row: sqlite3.Row) -> dict[str, Any]:
+        data = json.loads(row["data"])
+        return {
+            "id": row["id"],
+            "name": row["name"],
+            "nodes": data["nodes"],
+            "edges": data["edges"],
+            "version": row["version"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def create(
+        self, name: str, nodes: list[dict[str, Any]], edges: list[dict[str, Any]]
+    ) -> dict[str, Any]:
+        now = _now()
+        workflow = {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "nodes": nodes,
+            "edges": edges,
+            "version": 1,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO workflows (id, name, data, node_count, edge_count, version, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, 1, ?, ?)",
+                (
+                    workflow["id"],
+                    name,
+                    json.dumps({"nodes": nodes, "edges": edges}),
+                    len(nodes),
+                    len(edges),
+                    now,
+                    now,
+                ),
+            )
+        return workflow
+
+    def get(self, workflow_id: str) -> dict[str, Any] | None:
+        row = (
+            self._conn()
+            .execute("SELECT * FROM workflows WHERE id = ?", (workflow_id,))
+            .fetchone()
+        )
+        return self._full(row) if row else None
+
+    def version(self, workflow_id: str) -> int | None:
+        row = (
+            self._conn()
+            .execute("SELECT version FROM workflows WHERE id = ?", (workflow_id,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def update(
+        self,
+        workflow_id: str,
+        changes: dict[str, Any],
+        expected_version: int | None = None,
+    ) -> dict[str, Any] | None:
+        conn = self._conn()
+        with conn:
+            # Take the write lock before reading so the read-modify-write can't interleave
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM workflows WHERE id = ?", (workflow_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if expected_version is not None and row["version"] != expected_version:
+                raise WorkflowConflict(row["version"])
+            workflow = self._full(row)
+            for key in ("name", "nodes", "edges"):
+                if changes.get(key) is not None:
+                    workflow[key] = changes[key]
+            workflow["version"] += 1
+            workflow["updated_at"] = _now()
+            conn.execute(
+                "UPDATE workflows SET name = ?, data = ?, node_count = ?, edge_count = ?, version = ?, updated_at = ?"
+                " WHERE id = ?",
+                (
+                    workflow["name"],
+                    json.dumps(
+                        {"nodes": workflow["nodes"], "edges": workflow["edges"]}
+                    ),
+                    len(workflow["nodes"]),
+                    len(workflow["edges"]),
+                    workflow["version"],
+                    workflow["updated_at"],
+                    workflow_id,
+                ),
+            )
+        return workflow
+
+    def delete(self, workflow_id: str) -> bool:
+        with self._conn() as conn:
+            return (
+                conn.execute(
+                    "DELETE FROM workflows WHERE id = ?", (workflow_id,)
+                ).rowcount
+                > 0
+            )
+
+    def list(
+        self, limit: int = 50, cursor: tuple[str, str] | None = None
+    ) -> list[dict[str, Any]]:
+        sql = f"SELECT {self._SUMMARY_COLUMNS} FROM workflows"
+        params: tuple = ()
+        if cursor:
+            sql += " WHERE updated_at < ? OR (updated_at = ? AND id < ?)"
+            params = (cursor[0], cursor[0], cursor[1])
+        sql += " ORDER BY updated_at DESC, id DESC LIMIT ?"
+        return [dict(row) for row in self._conn().execute(sql, (*params, limit))]
+
+
+# ---------------------------------------------------------------------------
+# Read-through Cache
+# ---------------------------------------------------------------------------
+
+
+class CachedWorkflowStore(WorkflowStore):
+    """LRU cache of decoded workflows in front of another store.
+
+    Returned workflows are the cached objects themselves; treat them as
+    read-only.
+    """
+
+    def __init__(self, backend: WorkflowStore, maxsize: int = 256) -> None:
+        """Wrap a store.
+
+        Args:
+            backend: Store that owns the data.
+            maxsize: Number of workflows kept decoded in memory.
+        """
+        self.backend = backend
+        self.maxsize = maxsize
+        self._cache: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _put(self, workflow: dict[str, Any]) -> None:
+        with self._lock:
+            self._cache[workflow["id"]] = workflow
+            self._cache.move_to_end(workflow["id"])
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def _drop(self, workflow_id: str) -> None:
+        with self._lock:
+            self._cache.pop(workflow_id, None)
+
+    def create(
+        self, name: str, nodes: list[dict[str, Any]], edges: list[dict[str, Any]]
+    ) -> dict[str, Any]:
+        workflow = self.backend.create(name, nodes, edges)
+        self._put(workflow)
+        return workflow
+
+    def get(self, workflow_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            cached = self._cache.get(workflow_id)
+        # Another worker may have written since we cached it; the version lookup is cheap
+        if (
+            cached is not None
+            and self.backend.version(workflow_id) == cached["version"]
+        ):
+            with self._lock:
+                self._cache.move_to_end(workflow_id)
+            self.hits += 1
+            return cached
+        self.misses += 1
+        workflow = self.backend.get(workflow_id)
+        if workflow is None:
+            self._drop(workflow_id)
+        else:
+            self._put(workflow)
+        return workflow
+
+    def version(self, workflow_id: str) -> int | None:
+        return self.backend.version(workflow_id)
+
+    def update(
+        self,
+        workflow_id: str,
+        changes: dict[str, Any],
+        expected_version: int | None = None,
+    ) -> dict[str, Any] | None:
+        try:
+            workflow = self.backend.update(workflow_id, changes, expected_version)
+        except WorkflowConflict:
+            self._drop(workflow_id)
+            raise
+        if workflow is None:
+            self._drop(workflow_id)
+        else:
+            self._put(workflow)
+        return workflow
+
+    def delete(self, workflow_id: str) -> bool:
+        self._drop(workflow_id)
+        return self.backend.delete(workflow_id)
+
+    def list(
+        self, limit: int = 50, cursor: tuple[str, str] | None = None
+    ) -> list[dict[str, Any]]:
+        return self.backend.list(limit, cursor)
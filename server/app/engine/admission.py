@@ -0,0 +1,539 @@
+"""Admission Control.
+
+Guards expensive work (workflow runs, provider generations) so a single
+heavy user cannot monopolise provider capacity or worker slots.
+
+Two mechanisms are layered:
+- Rate: a per-user token bucket. Each admission costs tokens; a user
+  whose bucket is empty is rejected immediately with a retry hint.
+- Concurrency: a global pool of run slots (plus a per-user cap). When
+  the pool is full, requests wait in a weighted fair queue — each user's
+  requests are tagged with virtual finish times (start-time fair
+  queueing), so users are served in proportion to their weight no matter
+  how many requests any one of them has queued.
+
+Bucket and slot state live behind an `AdmissionStore`. The in-memory
+store serves a single process; `SQLiteAdmissionStore` keeps the state in
+one SQLite file so several workers on the same host share buckets and
+slot counts without any outside service. Slots are leases with an
+expiry, so a crashed worker cannot leak capacity forever. Its operations
+can wait on the file lock, so the controller runs them on a worker thread
+rather than on the event loop; the in-memory store is called inline.
+
+Usage:
+    admission = AdmissionController(SQLiteAdmissionStore("data/admission.sqlite3"))
+    async with admission.admit(user_id):
+        ...  # raises AdmissionRejected instead of entering when over limits
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is refused admission.
+
+    Attributes:
+        reason: "rate_limited", "queue_full" or "queue_timeout".
+        retry_after: Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(f"{reason}, retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# ---------------------------------------------------------------------------
+# Stores
+# ---------------------------------------------------------------------------
+
+
+class AdmissionStore:
+    """Shared bucket and slot state. Every method must be atomic.
+
+    Attributes:
+        blocking: Operations may block (disk I/O, lock waits), so async
+            callers must run them on a worker thread.
+    """
+
+    blocking = False
+
+    def take(self, user_id: str, cost: float, capacity: float, rate: float) -> float:
+        """Take `cost` tokens from a user's bucket.
+
+        Returns:
+            0.0 if the tokens were taken, otherwise the seconds until the
+            bucket will hold enough of them.
+        """
+        raise NotImplementedError
+
+    def acquire(
+        self, user_id: str, per_user: int, total: int, ttl: float
+    ) -> tuple[str | None, str | None]:
+        """Try to lease a run slot.
+
+        Returns:
+            (lease_id, None) on success, or (None, "user") / (None, "global")
+            naming the limit that blocked it.
+        """
+        raise NotImplementedError
+
+    def release(self, lease_id: str) -> None:
+        """Return a leased slot."""
+        raise NotImplementedError
+
+    def in_flight(self) -> dict[str, int]:
+        """Live lease counts per user."""
+        raise NotImplementedError
+
+
+def _refill(
+    tokens: float, updated: float, now: float, capacity: float, rate: float
+) -> float:
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryAdmissionStore(AdmissionStore):
+    """Process-local store."""
+
+    def __init__(self) -> None:
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._leases: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, user_id: str, cost: float, capacity: float, rate: float) -> float:
+        with self._lock:
+            now = time.time()
+            tokens, updated = self._buckets.get(user_id, (capacity, now))
+            tokens = _refill(tokens, updated, now, capacity, rate)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            self._buckets[user_id] = (tokens - cost if not wait else tokens, now)
+            return wait
+
+    def acquire(
+        self, user_id: str, per_user: int, total: int, ttl: float
+    ) -> tuple[str | None, str | None]:
+        with self._lock:
+            now = time.time()
+            self._leases = {k: v for k, v in self._leases.items() if v[1] > now}
+            if len(self._leases) >= total:
+                return None, "global"
+            if sum(1 for u, _ in self._leases.values() if u == user_id) >= per_user:
+                return None, "user"
+            lease_id = uuid.uuid4().hex
+            self._leases[lease_id] = (user_id, now + ttl)
+            return lease_id, None
+
+    def release(self, lease_id: str) -> None:
+        with self._lock:
+            self._leases.pop(lease_id, None)
+
+    def in_flight(self) -> dict[str, int]:
+        with self._lock:
+            now = time.time()
+            counts: dict[str, int] = {}
+            for user_id, expires in self._leases.values():
+                if expires > now:
+                    counts[user_id] = counts.get(user_id, 0) + 1
+            return counts
+
+
+class SQLiteAdmissionStore(AdmissionStore):
+    """Store shared by every worker process that opens the same file.
+
+    Each operation runs in its own `BEGIN IMMEDIATE` transaction, which
+    takes SQLite's write lock up front, so read-modify-write cycles from
+    different processes cannot interleave.
+    """
+
+    blocking = True
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS buckets (
+            user_id TEXT PRIMARY KEY,
+            tokens  REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS leases (
+            id      TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            expires REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_leases_user ON leases (user_id, expires);
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        """Open (or create) the store.
+
+        Args:
+            path: SQLite file shared by all workers.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None
+            )
+        return conn
+
+    def _write(self, fn: Callable[[sqlite3.Connection, float], T]) -> T:
+        """Run `fn(conn, now)` in one BEGIN IMMEDIATE transaction."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn, time.time())
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def take(self, user_id: str, cost: float, capacity: float, rate: float) -> float:
+        def op(conn: sqlite3.Connection, now: float) -> float:
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            tokens = _refill(row[0], row[1], now, capacity, rate) if row else capacity
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (user_id, tokens, updated) VALUES (?, ?, ?)",
+                (user_id, tokens - cost if not wait else tokens, now),
+            )
+            return wait
+
+        return self._write(op)
+
+    def acquire(
+        self, user_id: str, per_user: int, total: int, ttl: float
+    ) -> tuple[str | None, str | None]:
+        def op(conn: sqlite3.Connection, now: float) -> tuple[str | None, str | None]:
+            conn.execute("DELETE FROM leases WHERE expires <= ?", (now,))
+            if conn.execute("SELECT COUNT(*) FROM leases").fetchone()[0] >= total:
+                return None, "global"
+            if (
+                conn.execute(
+                    "SELECT COUNT(*) FROM leases WHERE user_id = ?", (user_id,)
+                ).fetchone()[0]
+                >= per_user
+            ):
+                return None, "user"
+            lease_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO leases (id, user_id, expires) VALUES (?, ?, ?)",
+                (lease_id, user_id, now + ttl),
+            )
+            return lease_id, None
+
+        return self._write(op)
+
+    def release(self, lease_id: str) -> None:
+        self._write(
+            lambda conn, now: conn.execute(
+                "DELETE FROM leases WHERE id = ?", (lease_id,)
+            )
+        )
+
+    def in_flight(self) -> dict[str, int]:
+        rows = (
+            self._conn()
+            .execute(
+                "SELECT user_id, COUNT(*) FROM leases WHERE expires > ? GROUP BY user_id",
+                (time.time(),),
+            )
+            .fetchall()
+        )
+        return dict(rows)
+
+
+# ---------------------------------------------------------------------------
+# Controller
+# ---------------------------------------------------------------------------
+
+
+class _Waiter:
+    __slots__ = ("user_id", "future", "enqueued")
+
+    def __init__(self, user_id: str, future: asyncio.Future[str]) -> None:
+        self.user_id = user_id
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class AdmissionController:
+    """Token-bucket rate limiting plus weighted fair queueing for run slots."""
+
+    def __init__(
+        self,
+        store: AdmissionStore | None = None,
+        *,
+        rate: float = 0.5,
+        burst: float = 10,
+        max_in_flight: int = 16,
+        per_user_in_flight: int = 4,
+        max_queued_per_user: int = 20,
+        max_wait: float = 60.0,
+        lease_ttl: float = 3600.0,
+        weights: dict[str, float] | None = None,
+        poll_interval: float = 0.1,
+    ) -> None:
+        """Initialize the controller.
+
+        Args:
+            store: Shared state. Defaults to a process-local store.
+            rate: Tokens added to each user's bucket per second.
+            burst: Bucket capacity — how many admissions a user can make at once.
+            max_in_flight: Run slots across all users.
+            per_user_in_flight: Run slots any one user may hold.
+            max_queued_per_user: Requests a user may have waiting for a slot.
+            max_wait: Seconds a request may wait for a slot before it is rejected.
+            lease_ttl: Seconds after which an unreleased slot is reclaimed.
+            weights: Per-user fair-share weights (default 1.0).
+            poll_interval: How often waiters re-check the store for slots
+                freed by other workers.
+        """
+        self.store = store or MemoryAdmissionStore()
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.per_user_in_flight = per_user_in_flight
+        self.max_queued_per_user = max_queued_per_user
+        self.max_wait = max_wait
+        self.lease_ttl = lease_ttl
+        self.weights = weights or {}
+        self.poll_interval = poll_interval
+
+        self._heap: list[tuple[float, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._last_finish: dict[str, float] = {}
+        self._queued: dict[str, int] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+
+        self._admitted = 0
+        self._rejected: dict[str, int] = {
+            "rate_limited": 0,
+            "queue_full": 0,
+            "queue_timeout": 0,
+        }
+        self._waits: deque[float] = deque(maxlen=1024)
+        self._wait_total = 0.0
+        self._wait_count = 0
+
+    # -- public API --------------------------------------------------------
+
+    async def check_rate(self, user_id: str, cost: float = 1.0) -> None:
+        """Charge a user's token bucket, raising AdmissionRejected if it is empty."""
+        wait = await self._store(
+            self.store.take, user_id, cost, max(self.burst, cost), self.rate
+        )
+        if wait:
+            self._reject("rate_limited")
+            raise AdmissionRejected("rate_limited", wait)
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, cost: float = 1.0) -> AsyncIterator[None]:
+        """Hold a run slot for the duration of the block.
+
+        Args:
+            user_id: Whose bucket and fair share to charge.
+            cost: Tokens to charge; also scales the request's fair-queue
+                virtual time, so a costly request delays that user's next one.
+
+        Raises:
+            AdmissionRejected: Over rate, too many queued, or waited too long.
+        """
+        await self.check_rate(user_id, cost)
+        lease_id = await self._acquire(user_id, cost)
+        try:
+            yield
+        finally:
+            self._release(lease_id)
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests waiting for a slot in this process."""
+        return sum(self._queued.values())
+
+    async def metrics(self) -> dict[str, Any]:
+        """Queue depth, in-flight counts and wait-time statistics."""
+        waits = sorted(self._waits)
+        pct = lambda p: (
+            round(waits[min(len(waits) - 1, int(len(waits) * p))], 4) if waits else 0.0
+        )
+        in_flight = await self._store(self.store.in_flight)
+        return {
+            "queue_depth": self.queue_depth,
+            "queued_by_user": {u: n for u, n in self._queued.items() if n},
+            "in_flight": sum(in_flight.values()),
+            "in_flight_by_user": in_flight,
+            "admitted": self._admitted,
+            "rejected": dict(self._rejected),
+            "wait_seconds": {
+                "count": self._wait_count,
+                "sum": round(self._wait_total, 4),
+                "p50": pct(0.5),
+                "p95": pct(0.95),
+                "max": round(waits[-1], 4) if waits else 0.0,
+            },
+        }
+
+    # -- internals ---------------------------------------------------------
+
+    async def _store(self, fn: Callable[..., T], *args: Any) -> T:
+        """Call a store operation, on a worker thread if the store may block."""
+        if self.store.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    def _release(self, lease_id: str) -> None:
+        """Return a slot without waiting, then wake the dispatcher.
+
+        Not awaited, so a cancelled request still gives its slot back.
+        """
+        if not self.store.blocking:
+            self.store.release(lease_id)
+            if self._wake is not None:
+                self._wake.set()
+            return
+        done = asyncio.get_running_loop().run_in_executor(
+            None, self.store.release, lease_id
+        )
+        done.add_done_callback(
+            lambda _: self._wake.set() if self._wake is not None else None
+        )
+
+    def _reject(self, reason: str) -> None:
+        self._rejected[reason] += 1
+
+    def _record_wait(self, seconds: float) -> None:
+        self._admitted += 1
+        self._waits.append(seconds)
+        self._wait_total += seconds
+        self._wait_count += 1
+
+    async def _acquire(self, user_id: str, cost: float) -> str:
+        # Fast path: nobody is waiting, so taking a free slot can't jump the queue
+        if not self._heap:
+            lease_id, _ = await self._store(
+                self.store.acquire,
+                user_id,
+                self.per_user_in_flight,
+                self.max_in_flight,
+                self.lease_ttl,
+            )
+            if lease_id:
+                self._record_wait(0.0)
+                return lease_id
+
+        if self._queued.get(user_id, 0) >= self.max_queued_per_user:
+            self._reject("queue_full")
+            raise AdmissionRejected("queue_full", self.max_wait / 2)
+
+        # Start-time fair queueing: a user's tags advance by cost/weight per
+        # request, so a backlog from one user doesn't delay another's first request
+        start = max(self._vtime, self._last_finish.get(user_id, 0.0))
+        finish = start + cost / self.weights.get(user_id, 1.0)
+        self._last_finish[user_id] = finish
+        waiter = _Waiter(user_id, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, (finish, next(self._seq), waiter))
+        self._queued[user_id] = self._queued.get(user_id, 0) + 1
+        self._ensure_dispatcher()
+
+        try:
+            granted = await asyncio.wait_for(
+                asyncio.shield(waiter.future), self.max_wait
+            )
+        except asyncio.TimeoutError:
+            self._drop(waiter)
+            self._reject("queue_timeout")
+            raise AdmissionRejected("queue_timeout", self.max_wait / 2) from None
+        except asyncio.CancelledError:
+            self._drop(waiter)
+            raise
+        self._record_wait(time.monotonic() - waiter.enqueued)
+        return granted
+
+    def _drop(self, waiter: _Waiter) -> None:
+        """Give up on a waiter; returns its slot if one was granted meanwhile."""
+        if waiter.future.done() and not waiter.future.cancelled():
+            self._release(waiter.future.result())
+        else:
+            waiter.future.cancel()
+
+    def _ensure_dispatcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        wake = self._wake
+        if self._loop is not loop or wake is None:
+            wake = asyncio.Event()
+            self._loop, self._wake, self._dispatcher = loop, wake, None
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch(wake))
+        wake.set()
+
+    async def _dispatch(self, wake: asyncio.Event) -> None:
+        """Grant slots to waiters in virtual-finish order until the queue drains."""
+        while self._heap:
+            blocked_users: set[str] = set()
+            skipped: list[tuple[float, int, _Waiter]] = []
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                finish, _, waiter = entry
+                if waiter.future.done():  # timed out or cancelled
+                    self._queued[waiter.user_id] -= 1
+                    continue
+                if waiter.user_id in blocked_users:
+                    skipped.append(entry)
+                    continue
+                lease_id, blocked = await self._store(
+                    self.store.acquire,
+                    waiter.user_id,
+                    self.per_user_in_flight,
+                    self.max_in_flight,
+                    self.lease_ttl,
+                )
+                if lease_id is None:
+                    skipped.append(entry)
+                    if blocked == "global":
+                        break
+                    blocked_users.add(waiter.user_id)
+                    continue
+                if waiter.future.done():  # gave up while the store was busy
+                    self._queued[waiter.user_id] -= 1
+                    self._release(lease_id)
+                    continue
+                self._queued[waiter.user_id] -= 1
+                self._vtime = max(self._vtime, finish)
+                waiter.future.set_result(lease_id)
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+            if not self._heap:
+                break
+            # Woken by a local release, or poll for slots released by other workers
+            wake.clear()
+            try:
+                await asyncio.wait_for(wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
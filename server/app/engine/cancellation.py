@@ -0,0 +1,182 @@
+"""Run Cancellation.
+
+A `CancelToken` is handed to every node of a run. It is cancelled when a
+user cancels the run (WebSocket or REST), when the client that started it
+goes away, or when the run's deadline passes. A node with its own
+`timeout` gets a child token that also expires after that timeout.
+
+Python can't interrupt a thread, so cancellation is cooperative inside a
+node: long-running nodes should call `raise_if_cancelled()` between steps
+and bound provider calls with `remaining()`. The executor checks the token
+between nodes. A node that declares a `timeout` runs on a worker thread,
+and the executor stops waiting on it straight away once it is cancelled or
+times out, skips everything downstream, and returns — releasing the run's
+worker slot even if the node's thread is still unwinding.
+
+Usage:
+    token = CancelToken(deadline=time.monotonic() + 300)
+    node_token = token.child(timeout=60)
+    httpx.post(url, json=body, timeout=node_token.remaining(30))
+    node_token.raise_if_cancelled()
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable
+
+
+class RunCancelled(Exception):
+    """Raised when work is abandoned because its token was cancelled.
+
+    Attributes:
+        reason: "cancelled", "deadline", "timeout", or a caller-supplied reason.
+    """
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"Run stopped: {reason}")
+        self.reason = reason
+
+
+class CancelToken:
+    """Thread-safe cancellation flag with an optional monotonic deadline.
+
+    Cancelling a token cancels all of its children; a child never outlives
+    its parent's deadline.
+    """
+
+    def __init__(
+        self, deadline: float | None = None, expire_reason: str = "deadline"
+    ) -> None:
+        """Create a token.
+
+        Args:
+            deadline: `time.monotonic()` value after which the token counts
+                as expired, or None for no deadline.
+            expire_reason: Reason recorded when the deadline is what stops it.
+        """
+        self.deadline = deadline
+        self.reason: str | None = None
+        self._expire_reason = expire_reason
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], None]] = []
+        self._parent: tuple[CancelToken, Callable[[], None]] | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        """True once cancelled, either explicitly or by an expired deadline."""
+        if (
+            not self._event.is_set()
+            and self.deadline is not None
+            and time.monotonic() >= self.deadline
+        ):
+            self.cancel(self._expire_reason)
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Cancel the token and its children.
+
+        Returns:
+            False if it was already cancelled (the first reason is kept).
+        """
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+        return True
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Call `callback` when the token is cancelled (now, if it already is)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]) -> None:
+        """Undo `on_cancel(callback)`; a no-op once the token is cancelled."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def remaining(self, cap: float | None = None) -> float | None:
+        """Seconds until the deadline, at most `cap`; None if unbounded."""
+        if self.deadline is None:
+            return cap
+        left = max(0.0, self.deadline - time.monotonic())
+        return left if cap is None else min(left, cap)
+
+    def raise_if_cancelled(self) -> None:
+        """Raise `RunCancelled` if the token is cancelled or expired."""
+        if self.cancelled:
+            raise RunCancelled(self.reason or "cancelled")
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until cancelled or `timeout` elapses; True if cancelled."""
+        return self._event.wait(timeout)
+
+    def child(self, timeout: float | None = None) -> CancelToken:
+        """A token cancelled with this one, expiring after `timeout` seconds.
+
+        The child's deadline is the earlier of the parent's deadline and
+        `timeout` from now; whichever applies names the expiry reason.
+        """
+        deadline, reason = self.deadline, self._expire_reason
+        if timeout is not None:
+            own = time.monotonic() + timeout
+            if deadline is None or own < deadline:
+                deadline, reason = own, "timeout"
+        token = CancelToken(deadline, reason)
+
+        def follow() -> None:
+            token.cancel(self.reason or "cancelled")
+
+        token._parent = (self, follow)
+        self.on_cancel(follow)
+        return token
+
+    def detach(self) -> None:
+        """Stop following the parent token.
+
+        Call it once the work a child token guards is over, so a long-lived
+        parent doesn't accumulate callbacks for every child it handed out.
+        """
+        if self._parent is not None:
+            parent, callback = self._parent
+            parent.remove_callback(callback)
+            self._parent = None
+
+
+class CancelRegistry:
+    """Tokens of the runs currently executing in this process."""
+
+    def __init__(self) -> None:
+        self._tokens: dict[str, CancelToken] = {}
+        self._lock = threading.Lock()
+
+    def register(self, run_id: str, token: CancelToken) -> None:
+        """Track a run's token so `cancel` can reach it."""
+        with self._lock:
+            self._tokens[run_id] = token
+
+    def unregister(self, run_id: str) -> None:
+        """Forget a run once it has finished here."""
+        with self._lock:
+            self._tokens.pop(run_id, None)
+
+    def cancel(self, run_id: str, reason: str = "cancelled") -> bool:
+        """Cancel a run executing here. Returns False if it isn't."""
+        with self._lock:
+            token = self._tokens.get(run_id)
+        return token is not None and token.cancel(reason)
+
+    def __contains__(self, run_id: str) -> bool:
+        """True while the run is executing in this process."""
+        with self._lock:
+            return run_id in self._tokens
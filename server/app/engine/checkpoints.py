@@ -0,0 +1,374 @@
+"""Run Checkpoints.
+
+Persists every node output as the executor produces it, so a run that
+fails part-way (provider timeout, worker restart) can be resumed without
+re-running — and re-paying for — the nodes that already succeeded.
+
+Outputs are stored as JSON. Binary values (image/video bytes) are moved
+into a content-addressed blob table and referenced from the JSON, so
+identical outputs are stored once. Outputs that cannot be serialised at
+all are recorded as succeeded but not restorable, which makes a resume
+run that node again rather than hand downstream nodes a lossy copy.
+
+Nothing is kept forever: `prune()` deletes finished runs that haven't
+changed for a while, their node results, and every blob no remaining
+node result references.
+
+Run status:
+    running   — in progress (or its worker died; see `is_stale`)
+    completed — every node succeeded
+    failed    — at least one node failed, or the run missed its deadline
+    cancelled — stopped by a user or by its client disconnecting
+
+Usage:
+    store = CheckpointStore("data/runs.sqlite3")
+    run_id = store.create_run(workflow)
+    store.save_node(run_id, "node_1", {"text": "A cat"}, ok=True)
+    store.finish_run(run_id)
+    store.prune(older_than=30 * 86400)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any
+
+_BLOB_KEY = "$blob"
+
+
+class CheckpointStore:
+    """SQLite-backed run and node-output checkpoints."""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id         TEXT PRIMARY KEY,
+            workflow   TEXT NOT NULL,
+            status     TEXT NOT NULL,
+            error      TEXT,
+            attempts   INTEGER NOT NULL DEFAULT 1,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS node_results (
+            run_id      TEXT NOT NULL,
+            node_id     TEXT NOT NULL,
+            ok          INTEGER NOT NULL,
+            restorable  INTEGER NOT NULL,
+            output      TEXT,
+            finished_at REAL NOT NULL,
+            PRIMARY KEY (run_id, node_id)
+        );
+        CREATE TABLE IF NOT EXISTS blobs (
+            digest TEXT PRIMARY KEY,
+            data   BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS blob_refs (
+            run_id  TEXT NOT NULL,
+            node_id TEXT NOT NULL,
+            digest  TEXT NOT NULL,
+            PRIMARY KEY (run_id, node_id, digest)
+        );
+        CREATE INDEX IF NOT EXISTS ix_runs_created ON runs (created_at);
+        CREATE INDEX IF NOT EXISTS ix_blob_refs_digest ON blob_refs (digest);
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        """Open (or create) the checkpoint database.
+
+        Args:
+            path: SQLite file for runs, node results and blobs.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        had_refs = (
+            conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'blob_refs'"
+            ).fetchone()
+            is not None
+        )
+        conn.executescript(self._SCHEMA)
+        if not had_refs:
+            # Stores from before blob_refs: index the blobs existing outputs point at
+            with conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO blob_refs (run_id, node_id, digest)"
+                    " SELECT n.run_id, n.node_id, t.value FROM node_results n, json_tree(n.output) t"
+                    " WHERE n.output IS NOT NULL AND t.key = ?",
+                    (_BLOB_KEY,),
+                )
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(runs)")}
+        if "cancel_requested" not in columns:
+            conn.execute(
+                "ALTER TABLE runs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    # -- encoding ----------------------------------------------------------
+
+    def _encode(self, value: Any, blobs: dict[str, bytes]) -> Any:
+        """Replace bytes with blob references, collecting the blobs by digest."""
+        if isinstance(value, (bytes, bytearray)):
+            digest = hashlib.sha256(value).hexdigest()
+            blobs[digest] = bytes(value)
+            return {_BLOB_KEY: digest}
+        if isinstance(value, dict):
+            return {k: self._encode(v, blobs) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._encode(v, blobs) for v in value]
+        return value
+
+    def _decode(self, value: Any, conn: sqlite3.Connection) -> Any:
+        """Inverse of `_encode`.
+
+        Raises:
+            LookupError: A referenced blob is missing.
+        """
+        if isinstance(value, dict):
+            if set(value) == {_BLOB_KEY}:
+                row = conn.execute(
+                    "SELECT data FROM blobs WHERE digest = ?", (value[_BLOB_KEY],)
+                ).fetchone()
+                if row is None:
+                    raise LookupError(f"blob {value[_BLOB_KEY]} is missing")
+                return bytes(row[0])
+            return {k: self._decode(v, conn) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._decode(v, conn) for v in value]
+        return value
+
+    # -- runs --------------------------------------------------------------
+
+    def create_run(self, workflow: dict[str, Any]) -> str:
+        """Record a new run of `workflow` and return its id."""
+        run_id = f"run_{uuid.uuid4().hex[:16]}"
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO runs (id, workflow, status, created_at, updated_at) VALUES (?, ?, 'running', ?, ?)",
+                (run_id, json.dumps(workflow), now, now),
+            )
+        return run_id
+
+    def restart_run(self, run_id: str, stale_after: float) -> bool:
+        """Claim a failed, cancelled (or stale running) run for a resume attempt.
+
+        The claim is a single conditional UPDATE, so of two concurrent
+        resumes only one wins.
+
+        Args:
+            run_id: Run to resume.
+            stale_after: Seconds without a checkpoint after which a
+                'running' run is considered abandoned.
+
+        Returns:
+            False if the run is completed, still live, or doesn't exist.
+        """
+        now = time.time()
+        with self._conn() as conn:
+            return (
+                conn.execute(
+                    "UPDATE runs SET status = 'running', error = NULL, cancel_requested = 0,"
+                    " attempts = attempts + 1, updated_at = ?"
+                    " WHERE id = ? AND (status IN ('failed', 'cancelled') OR (status = 'running' AND updated_at < ?))",
+                    (now, run_id, now - stale_after),
+                ).rowcount
+                > 0
+            )
+
+    def save_node(
+        self, run_id: str, node_id: str, output: dict[str, Any], ok: bool
+    ) -> None:
+        """Checkpoint one node's output.
+
+        Args:
+            run_id: Run the node belongs to.
+            node_id: Node that finished.
+            output: The node's output dict (errors included, for failed nodes).
+            ok: Whether the node succeeded.
+        """
+        # Serialise first: blobs are only stored once the output is known to encode
+        blobs: dict[str, bytes] = {}
+        try:
+            encoded, restorable = json.dumps(self._encode(output, blobs)), True
+        except (TypeError, ValueError):
+            encoded, restorable, blobs = None, False, {}
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO blobs (digest, data) VALUES (?, ?)",
+                blobs.items(),
+            )
+            conn.execute(
+                "DELETE FROM blob_refs WHERE run_id = ? AND node_id = ?",
+                (run_id, node_id),
+            )
+            conn.executemany(
+                "INSERT INTO blob_refs (run_id, node_id, digest) VALUES (?, ?, ?)",
+                [(run_id, node_id, digest) for digest in blobs],
+            )
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO node_results (run_id, node_id, ok, restorable, output, finished_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, node_id, int(ok), int(restorable), encoded, now),
+            )
+            conn.execute("UPDATE runs SET updated_at = ? WHERE id = ?", (now, run_id))
+
+    def request_cancel(self, run_id: str) -> bool:
+        """Flag a running run for cancellation by whichever worker runs it.
+
+        Returns:
+            False if the run doesn't exist or isn't running.
+        """
+        with self._conn() as conn:
+            return (
+                conn.execute(
+                    "UPDATE runs SET cancel_requested = 1 WHERE id = ? AND status = 'running'",
+                    (run_id,),
+                ).rowcount
+                > 0
+            )
+
+    def cancel_requested(self, run_id: str) -> bool:
+        """True if `request_cancel` was called for this run attempt."""
+        row = (
+            self._conn()
+            .execute("SELECT cancel_requested FROM runs WHERE id = ?", (run_id,))
+            .fetchone()
+        )
+        return bool(row and row[0])
+
+    def finish_run(
+        self, run_id: str, error: str | None = None, cancelled: bool = False
+    ) -> str:
+        """Close a run, deriving its status from its node results.
+
+        Args:
+            run_id: Run to close.
+            error: Run-level error (e.g. the executor itself raised).
+            cancelled: The run was stopped by a user or its client.
+
+        Returns:
+            The final status.
+        """
+        with self._conn() as conn:
+            failed = conn.execute(
+                "SELECT COUNT(*) FROM node_results WHERE run_id = ? AND ok = 0",
+                (run_id,),
+            ).fetchone()[0]
+            status = (
+                "cancelled"
+                if cancelled
+                else "failed" if error or failed else "completed"
+            )
+            conn.execute(
+                "UPDATE runs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), run_id),
+            )
+        return status
+
+    def get_run(self, run_id: str) -> dict[str, Any] | None:
+        """Return a run's metadata, workflow and per-node status, or None."""
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        nodes = {
+            r["node_id"]: {
+                "status": "ok" if r["ok"] else "failed",
+                "finished_at": r["finished_at"],
+            }
+            for r in conn.execute(
+                "SELECT node_id, ok, finished_at FROM node_results WHERE run_id = ?",
+                (run_id,),
+            )
+        }
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "cancel_requested": bool(row["cancel_requested"]),
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "workflow": json.loads(row["workflow"]),
+            "nodes": nodes,
+        }
+
+    def completed_outputs(self, run_id: str) -> dict[str, dict[str, Any]]:
+        """Restorable outputs of the nodes that succeeded in a run.
+
+        An output whose blobs have gone missing counts as not restorable:
+        it is left out, so a resume runs that node again.
+        """
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT node_id, output FROM node_results WHERE run_id = ? AND ok = 1 AND restorable = 1",
+            (run_id,),
+        ).fetchall()
+        outputs: dict[str, dict[str, Any]] = {}
+        for r in rows:
+            try:
+                outputs[r["node_id"]] = self._decode(json.loads(r["output"]), conn)
+            except LookupError:
+                continue
+        return outputs
+
+    def list_runs(self, limit: int = 50) -> list[dict[str, Any]]:
+        """Most recent runs, without workflows or node details."""
+        rows = self._conn().execute(
+            "SELECT id, status, error, attempts, created_at, updated_at FROM runs ORDER BY created_at DESC LIMIT ?",
+            (limit,),
+        )
+        return [dict(r) for r in rows]
+
+    def prune(self, older_than: float) -> dict[str, int]:
+        """Delete finished runs untouched for `older_than` seconds, and orphaned blobs.
+
+        Running runs are kept whatever their age (a stale one may still be
+        resumed). Blobs are deleted once no remaining node result refers to
+        them, whichever run stored them first.
+
+        Returns:
+            Counts of deleted "runs" and "blobs".
+        """
+        cutoff = time.time() - older_than
+        with self._conn() as conn:
+            runs = [
+                r[0]
+                for r in conn.execute(
+                    "SELECT id FROM runs WHERE status != 'running' AND updated_at < ?",
+                    (cutoff,),
+                )
+            ]
+            for table in ("blob_refs", "node_results", "runs"):
+                column = "id" if table == "runs" else "run_id"
+                conn.executemany(
+                    f"DELETE FROM {table} WHERE {column} = ?",
+                    [(run_id,) for run_id in runs],
+                )
+            blobs = conn.execute(
+                "DELETE FROM blobs WHERE NOT EXISTS (SELECT 1 FROM blob_refs r WHERE r.digest = blobs.digest)"
+            ).rowcount
+        return {"runs": len(runs), "blobs": blobs}
+
+    @staticmethod
+    def is_stale(run: dict[str, Any], after: float) -> bool:
+        """True if a 'running' run hasn't checkpointed for `after` seconds (its worker likely died)."""
+        return run["status"] == "running" and time.time() - run["updated_at"] > after
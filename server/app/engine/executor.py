@@ -1,4 +1,4 @@
-<![CDATA["""DAG Workflow Executor.
+"""DAG Workflow Executor.
 
 Executes a workflow graph by performing topological sort on the nodes,
 then running each node in dependency order. Outputs from upstream nodes
@@ -14,20 +14,52 @@ Workflow format expected:
         {"source": "node_1", "sourceHandle": "text", "target": "node_2", "targetHandle": "prompt"}
     ]
 }
+
+With a `CheckpointStore`, each node's output is persisted as soon as it
+finishes, and a failed run can be resumed: nodes that succeeded (and whose
+upstream nodes all succeeded) are restored from their checkpoints instead
+of being executed again.
+
+With a `CancelToken`, the run stops as soon as the token is cancelled or
+its deadline passes: every node not yet run is marked skipped. Nodes run
+inline on the calling thread and see the cancellation through their own
+token; a node that declares a `timeout` runs on a shared worker pool
+instead, so it can be abandoned mid-flight. One that exceeds its
+`timeout` is abandoned the same way, and only its downstream nodes are
+skipped.
+
+With `MemoryLimits`, every node's allocation peak, retained output size
+and RSS delta are recorded in `executor.memory`, and a node or run that
+goes over its memory budget stops the run like a cancellation does (see
+`app.engine.memory`).
+
+`compile_workflow()` does the per-graph work (sorting, indexing, edge
+wiring) once, so a graph run many times — e.g. by the `Map` node, once
+per list element — only pays for node execution.
 """
 
 from __future__ import annotations
 
+import contextlib
+import threading
+import time
 from collections import defaultdict, deque
-from typing import Any
-
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+from app.engine.cancellation import CancelToken, RunCancelled
+from app.engine.checkpoints import CheckpointStore
+from app.engine.memory import MemoryLimits, RunMemory
+from app.metrics import NODE_SECONDS
 from app.nodes.base import BaseNode
-
+from app.nodes.flow import Map  # noqa: F401  (built-in flow-control nodes)
 
 # ---------------------------------------------------------------------------
 # Node Registry
 # ---------------------------------------------------------------------------
 
+
 def _build_node_registry() -> dict[str, type[BaseNode]]:
     """Build a lookup table from node class name to class.
 
@@ -43,10 +75,41 @@ def _build_node_registry() -> dict[str, type[BaseNode]]:
     return registry
 
 
+# ---------------------------------------------------------------------------
+# Node Threads
+# ---------------------------------------------------------------------------
+
+# Nodes that declare a timeout run here so the executor can stop waiting on
+# them. A node abandoned mid-flight keeps its worker until it next checks its
+# token, and nodes queued behind busy workers spend their timeout waiting.
+NODE_POOL_SIZE = 32
+
+_node_pool: ThreadPoolExecutor | None = None
+_node_pool_lock = threading.Lock()
+_on_node_thread = threading.local()
+
+
+def _mark_node_thread() -> None:
+    """Pool initializer: flag the worker so nested node calls stay inline."""
+    _on_node_thread.active = True
+
+
+def _get_node_pool() -> ThreadPoolExecutor:
+    """The shared node pool, created on first use."""
+    global _node_pool
+    with _node_pool_lock:
+        if _node_pool is None:
+            _node_pool = ThreadPoolExecutor(
+                NODE_POOL_SIZE, thread_name_prefix="node", initializer=_mark_node_thread
+            )
+        return _node_pool
+
+
 # ---------------------------------------------------------------------------
 # Topological Sort
 # ---------------------------------------------------------------------------
 
+
 def topological_sort(nodes: list[dict], edges: list[dict]) -> list[str]:
     """Sort node IDs in execution order using Kahn's algorithm.
 
@@ -91,10 +154,74 @@ def topological_sort(nodes: list[dict], edges: list[dict]) -> list[str]:
     return order
 
 
+def is_failed(output: dict[str, Any]) -> bool:
+    """True if a node output records an error, validation failure or skip."""
+    return "_error" in output or "_errors" in output or "_skipped" in output
+
+
+# ---------------------------------------------------------------------------
+# Compilation
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class CompiledWorkflow:
+    """A workflow graph prepared for (repeated) execution.
+
+    Attributes:
+        order: Node IDs in execution order.
+        node_map: Node ID → node definition.
+        input_map: Target node ID → list of (source_id, source_handle, target_handle).
+        sinks: Node IDs with no outgoing edges, in execution order.
+    """
+
+    order: list[str]
+    node_map: dict[str, dict]
+    input_map: dict[str, list[tuple[str, str, str]]]
+    sinks: list[str]
+
+
+def compile_workflow(workflow: dict) -> CompiledWorkflow:
+    """Sort and index a workflow once so it can be executed many times.
+
+    Raises:
+        ValueError: If the graph contains a cycle.
+    """
+    nodes = workflow.get("nodes", [])
+    edges = workflow.get("edges", [])
+    order = topological_sort(nodes, edges)
+
+    # Build reverse edge map: target_node_id → list of (source_id, source_handle, target_handle)
+    input_map: dict[str, list[tuple[str, str, str]]] = defaultdict(list)
+    for edge in edges:
+        input_map[edge["target"]].append(
+            (
+                edge["source"],
+                edge.get("sourceHandle", "output"),
+                edge.get("targetHandle", "input"),
+            )
+        )
+
+    sources = {edge["source"] for edge in edges}
+    return CompiledWorkflow(
+        order=order,
+        node_map={n["id"]: n for n in nodes},
+        input_map=dict(input_map),
+        sinks=[nid for nid in order if nid not in sources],
+    )
+
+
+class WorkflowSource(Protocol):
+    """Anything that can look up a saved workflow by ID (e.g. a WorkflowStore)."""
+
+    def get(self, workflow_id: str) -> dict[str, Any] | None: ...
+
+
 # ---------------------------------------------------------------------------
 # Executor
 # ---------------------------------------------------------------------------
 
+
 class WorkflowExecutor:
     """Execute a workflow DAG from start to finish.
 
@@ -103,72 +230,251 @@ class WorkflowExecutor:
     2. Instantiates each node using the registry.
     3. Wires outputs from upstream nodes into downstream inputs via edges.
     4. Validates inputs before execution.
-    5. Collects and returns all results.
+    5. Collects and returns all results, checkpointing each one if a
+       checkpoint store and run ID are given.
     """
 
-    def __init__(self) -> None:
-        self.registry = _build_node_registry()
+    def __init__(
+        self,
+        checkpoints: CheckpointStore | None = None,
+        workflows: WorkflowSource | None = None,
+        registry: dict[str, type[BaseNode]] | None = None,
+        depth: int = 0,
+        memory: MemoryLimits | None = None,
+    ) -> None:
+        """Create an executor.
+
+        Args:
+            checkpoints: Store to checkpoint node outputs in.
+            workflows: Resolves saved workflows referenced by ID (sub-graphs).
+            registry: Node classes by type name; scanned from BaseNode if omitted.
+            depth: Sub-graph nesting level (0 for a top-level run).
+            memory: Profile each node's memory and enforce these budgets.
+        """
+        self.registry = registry if registry is not None else _build_node_registry()
+        self.checkpoints = checkpoints
+        self.workflows = workflows
+        self.depth = depth
+        self.memory_limits = memory
         self.results: dict[str, dict[str, Any]] = {}
+        self.restored: list[str] = []
+        self.memory: RunMemory | None = None
+
+    def spawn(self) -> WorkflowExecutor:
+        """A fresh executor for a sub-graph, sharing registry and workflow source.
 
-    def execute(self, workflow: dict) -> dict[str, dict[str, Any]]:
+        Sub-graphs aren't memory-profiled: they count towards the node running them.
+        """
+        return WorkflowExecutor(
+            workflows=self.workflows, registry=self.registry, depth=self.depth + 1
+        )
+
+    def execute(
+        self,
+        workflow: dict | CompiledWorkflow,
+        run_id: str | None = None,
+        completed: dict[str, dict[str, Any]] | None = None,
+        token: CancelToken | None = None,
+        inputs: dict[str, dict[str, Any]] | None = None,
+    ) -> dict[str, dict[str, Any]]:
         """Execute the full workflow.
 
         Args:
-            workflow: Dict with "nodes" and "edges" lists.
+            workflow: Dict with "nodes" and "edges" lists, or a compiled workflow.
+            run_id: Run to checkpoint node outputs under (needs `checkpoints`).
+            completed: Outputs of nodes that already succeeded in an earlier
+                attempt. A node is restored from here instead of executed
+                when all of its upstream nodes were restored too, so
+                anything downstream of a re-executed node runs again.
+            token: Cancels the run; see the module docstring.
+            inputs: Extra static inputs by node ID, overlaid on each node's data.
 
         Returns:
             Dict mapping node ID → output dict from that node's execute().
+            With memory limits, per-node usage is in `self.memory` afterwards.
         """
-        nodes = workflow.get("nodes", [])
-        edges = workflow.get("edges", [])
-        order = topological_sort(nodes, edges)
-
-        # Index nodes by ID for quick lookup
-        node_map = {n["id"]: n for n in nodes}
-
-        # Build reverse edge map: target_node_id → list of (source_id, source_handle, target_handle)
-        input_map: dict[str, list[tuple[str, str, str]]] = defaultdict(list)
-        for edge in edges:
-            input_map[edge["target"]].append((
-                edge["source"],
-                edge.get("sourceHandle", "output"),
-                edge.get("targetHandle", "input"),
-            ))
+        compiled = (
+            workflow
+            if isinstance(workflow, CompiledWorkflow)
+            else compile_workflow(workflow)
+        )
+        input_map = compiled.input_map
+        inputs = inputs or {}
 
         self.results = {}
+        self.restored = []
+        completed = completed or {}
+        restored: set[str] = set()
+        token = token or CancelToken()
+        # Nodes that were cancelled or timed out; their descendants are skipped
+        stopped: dict[str, dict[str, Any]] = {}
+        self.memory = (
+            RunMemory(self.memory_limits, token)
+            if self.memory_limits is not None
+            else None
+        )
 
-        for node_id in order:
-            node_def = node_map[node_id]
-            node_type = node_def.get("type", "")
+        with self.memory or contextlib.nullcontext():
+            for node_id in compiled.order:
+                if node_id in completed and all(
+                    src in restored for src, _, _ in input_map.get(node_id, [])
+                ):
+                    self.results[node_id] = completed[node_id]
+                    if self.memory is not None:
+                        self.memory.retain(node_id, completed[node_id])
+                    restored.add(node_id)
+                    self.restored.append(node_id)
+                    continue
+
+                blocked = next(
+                    (src for src, _, _ in input_map.get(node_id, []) if src in stopped),
+                    None,
+                )
+                if token.cancelled:
+                    stopped[node_id] = self.results[node_id] = {
+                        "_skipped": f"run {token.reason}"
+                    }
+                elif blocked is not None:
+                    stopped[node_id] = self.results[node_id] = {
+                        "_skipped": f"upstream node {blocked} was stopped"
+                    }
+                else:
+                    self._run_node(
+                        node_id,
+                        compiled.node_map[node_id],
+                        input_map,
+                        token,
+                        inputs.get(node_id),
+                    )
+                    if "_cancelled" in self.results[node_id]:
+                        stopped[node_id] = self.results[node_id]
+
+                if self.checkpoints is not None and run_id is not None:
+                    output = self.results[node_id]
+                    self.checkpoints.save_node(
+                        run_id, node_id, output, not is_failed(output)
+                    )
 
-            # Look up the node class; skip unknown types gracefully
-            node_cls = self.registry.get(node_type)
-            if node_cls is None:
-                self.results[node_id] = {"_error": f"Unknown node type: {node_type}"}
-                continue
+        return self.results
 
-            node_instance = node_cls()
+    def resume(
+        self, run_id: str, token: CancelToken | None = None
+    ) -> dict[str, dict[str, Any]]:
+        """Re-run a checkpointed run, skipping nodes that already succeeded.
 
-            # Gather inputs: start with static data, then overlay connected outputs
-            inputs: dict[str, Any] = dict(node_def.get("data", {}))
-            for src_id, src_handle, tgt_handle in input_map.get(node_id, []):
-                upstream = self.results.get(src_id, {})
-                if src_handle in upstream:
-                    inputs[tgt_handle] = upstream[src_handle]
+        Failed and never-run nodes (and everything downstream of them) are
+        executed in the original topological order; the rest are restored.
 
-            # Validate
-            errors = node_instance.validate(inputs)
-            if errors:
-                self.results[node_id] = {"_errors": errors}
-                continue
+        Args:
+            run_id: A run recorded in this executor's checkpoint store.
+            token: Cancels the resumed run.
 
-            # Execute
-            try:
-                output = node_instance.execute(**inputs)
-            except Exception as exc:
-                output = {"_error": str(exc)}
+        Returns:
+            Dict mapping node ID → output dict, restored and fresh alike.
 
-            self.results[node_id] = output
+        Raises:
+            KeyError: The run does not exist.
+        """
+        if self.checkpoints is None:
+            raise RuntimeError("resume() needs a checkpoint store")
+        run = self.checkpoints.get_run(run_id)
+        if run is None:
+            raise KeyError(run_id)
+        return self.execute(
+            run["workflow"], run_id, self.checkpoints.completed_outputs(run_id), token
+        )
 
-        return self.results
-]]>
\ No newline at end of file
+    def _run_node(
+        self,
+        node_id: str,
+        node_def: dict,
+        input_map: dict[str, list[tuple[str, str, str]]],
+        token: CancelToken,
+        overrides: dict[str, Any] | None = None,
+    ) -> None:
+        """Validate and execute one node, storing its output in `results`."""
+        node_type = node_def.get("type", "")
+
+        # Look up the node class; skip unknown types gracefully
+        node_cls = self.registry.get(node_type)
+        if node_cls is None:
+            self.results[node_id] = {"_error": f"Unknown node type: {node_type}"}
+            return
+
+        node_instance = node_cls()
+
+        # Gather inputs: start with static data, then overlay connected outputs
+        inputs: dict[str, Any] = dict(node_def.get("data", {}))
+        if overrides:
+            inputs.update(overrides)
+        for src_id, src_handle, tgt_handle in input_map.get(node_id, []):
+            upstream = self.results.get(src_id, {})
+            if src_handle in upstream:
+                inputs[tgt_handle] = upstream[src_handle]
+
+        # Validate
+        errors = node_instance.validate(inputs)
+        if errors:
+            self.results[node_id] = {"_errors": errors}
+            return
+
+        # Execute. Only a node with its own timeout needs its own token
+        timed = node_instance.timeout is not None
+        node_token = token.child(node_instance.timeout) if timed else token
+        node_instance.cancel_token = node_token
+        node_instance.executor = self
+        outcome = "ok"
+        start = time.perf_counter()
+        try:
+            with (
+                self.memory.watch(node_id, node_type)
+                if self.memory is not None
+                else contextlib.nullcontext()
+            ):
+                output = self._call(node_instance, inputs, node_token)
+        except RunCancelled as exc:
+            outcome = "cancelled"
+            output = {"_error": str(exc), "_cancelled": exc.reason}
+        except Exception as exc:
+            outcome = "error"
+            output = {"_error": str(exc)}
+        finally:
+            if timed:
+                node_token.detach()
+        if self.memory is not None:
+            output = self.memory.retain(node_id, output)
+        NODE_SECONDS.labels(
+            node_type, "cancelled" if "_cancelled" in output else outcome
+        ).observe(time.perf_counter() - start)
+
+        self.results[node_id] = output
+
+    @staticmethod
+    def _call(
+        node: BaseNode, inputs: dict[str, Any], token: CancelToken
+    ) -> dict[str, Any]:
+        """Run `node.execute()`, giving up when `token` (the node's cancel token) fires.
+
+        Nodes without a `timeout` run inline: they can only be stopped by
+        checking their token. Nodes with one run on the node pool and are
+        abandoned as soon as the token fires; the abandoned call keeps its
+        worker only until the node next checks its token. Calls made from a
+        pool worker (a timed node running a sub-graph) stay inline, so
+        nested graphs can't exhaust the pool waiting on themselves.
+        """
+        token.raise_if_cancelled()
+        if node.timeout is None or getattr(_on_node_thread, "active", False):
+            return node.execute(**inputs)
+
+        wake = threading.Event()
+        future = _get_node_pool().submit(lambda: node.execute(**inputs))
+        future.add_done_callback(lambda _: wake.set())
+        token.on_cancel(wake.set)
+        # `cancelled` also trips the token once its deadline has passed
+        while not future.done() and not token.cancelled:
+            wake.wait(token.remaining())
+
+        if future.done():
+            return future.result()
+        future.cancel()  # still queued: don't start it
+        raise RunCancelled(token.reason or "cancelled")
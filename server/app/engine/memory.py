@@ -0,0 +1,258 @@
+"""Per-Node Memory Accounting.
+
+Opt-in: a `WorkflowExecutor` given `MemoryLimits` measures every node it
+runs and reports, per node:
+
+- `peak_bytes`: the highest Python allocation total (tracemalloc) reached
+  while the node ran, above what was allocated when it started
+- `output_bytes`: deep size of the output the run keeps for the node
+- `rss_delta_bytes`: resident set size after the node minus before
+  (None where /proc/self/statm isn't available)
+
+A node's usage is the larger of its allocation peak and its RSS growth.
+When it passes `node_budget`, or the run's retained outputs plus the
+running node's usage pass `run_budget`, the run token is cancelled with
+reason "memory": the node is stopped like any cancelled node (see
+`app.engine.executor`), marked `_cancelled: "memory"` with the breach as
+its `_error`, and every node not yet run is skipped. Budgets are checked
+every `poll_interval` seconds while a node runs and once more when it
+returns, so a node can overshoot by what it allocates in one interval. A
+node keeps its memory until it next checks its token or returns.
+
+tracemalloc and RSS are process-wide. With several runs on one worker each
+run's numbers include the others' allocations, and profiled runs reset
+each other's tracemalloc peak. tracemalloc also slows allocation-heavy
+Python code (often 2x or more), which is why profiling is off unless asked
+for. Buffers allocated outside the Python allocator (Pillow images, most
+C extensions) only show in the RSS delta. Sub-graphs (Map items) aren't
+profiled separately: they count towards the node that runs them.
+
+Usage:
+    executor = WorkflowExecutor(memory=MemoryLimits(node_budget=512 << 20))
+    executor.execute(workflow)
+    executor.memory.report()  # {"nodes": {...}, "peak_bytes": ..., "exceeded": None}
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator
+
+from app.engine.cancellation import CancelToken
+from app.metrics import NODE_MEMORY_BYTES
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# tracemalloc is started by the first profiled run and stopped by the last,
+# unless something else (PYTHONTRACEMALLOC, a debugger) already started it
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False
+
+
+def rss_bytes() -> int | None:
+    """Current resident set size of this process, or None if unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def deep_sizeof(value: Any, limit: int = 100_000) -> int:
+    """Approximate bytes held by `value` and everything it contains.
+
+    Sums `sys.getsizeof` over dicts, lists, tuples and sets recursively,
+    counting each object once. Stops descending after `limit` objects.
+    """
+    seen: set[int] = set()
+    stack = [value]
+    total = 0
+    while stack and len(seen) < limit:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return total
+
+
+def _start_tracing() -> None:
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_owned = True
+        _tracing_users += 1
+
+
+def _stop_tracing() -> None:
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+
+
+def _mib(n: int) -> str:
+    return f"{n / (1 << 20):.1f} MiB"
+
+
+@dataclass(frozen=True)
+class MemoryLimits:
+    """Memory profiling settings for a run.
+
+    Attributes:
+        node_budget: Bytes one node may use, or None for no limit.
+        run_budget: Bytes a run may hold (retained outputs plus the running
+            node), or None for no limit.
+        poll_interval: Seconds between budget checks while a node runs.
+    """
+
+    node_budget: int | None = None
+    run_budget: int | None = None
+    poll_interval: float = 0.05
+
+
+class RunMemory:
+    """Memory accounting for one run; a context manager around its execution.
+
+    Attributes:
+        nodes: Node ID → {"peak_bytes", "output_bytes", "rss_delta_bytes"}.
+        retained: Total `output_bytes` of the nodes run or restored so far.
+        exceeded: Description of the budget breach that stopped the run.
+        exceeded_node: Node that was running (or had just finished) then.
+    """
+
+    def __init__(self, limits: MemoryLimits, token: CancelToken) -> None:
+        self.limits = limits
+        self.token = token
+        self.nodes: dict[str, dict[str, int | None]] = {}
+        self.retained = 0
+        self.exceeded: str | None = None
+        self.exceeded_node: str | None = None
+        self._rss_start: int | None = None
+        self._rss_end: int | None = None
+        self._running: tuple[str, Callable[[], int]] | None = (
+            None  # (node ID, its usage so far)
+        )
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    def __enter__(self) -> RunMemory:
+        _start_tracing()
+        self._rss_start = rss_bytes()
+        if self.limits.node_budget is not None or self.limits.run_budget is not None:
+            self._sampler = threading.Thread(
+                target=self._sample, name="memory-sampler", daemon=True
+            )
+            self._sampler.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self._rss_end = rss_bytes()
+        _stop_tracing()
+
+    def _sample(self) -> None:
+        """Check the running node's usage against the budgets every `poll_interval`."""
+        while not self._stop.wait(self.limits.poll_interval):
+            running = self._running
+            if running is not None and self._check(running[0], running[1]()):
+                return
+
+    @contextmanager
+    def watch(self, node_id: str, node_type: str) -> Iterator[None]:
+        """Measure the node executed inside the block, enforcing budgets as it runs."""
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        rss_start = rss_bytes()
+        rss_peak = [0]
+
+        def usage() -> int:
+            peak = tracemalloc.get_traced_memory()[1] - base
+            rss = rss_bytes()
+            if rss is not None and rss_start is not None:
+                rss_peak[0] = max(rss_peak[0], rss - rss_start)
+            return max(peak, rss_peak[0])
+
+        self._running = (node_id, usage)
+        try:
+            yield
+        finally:
+            self._running = None
+            self._check(node_id, usage())
+            peak = max(0, tracemalloc.get_traced_memory()[1] - base)
+            rss_end = rss_bytes()
+            self.nodes[node_id] = {
+                "peak_bytes": peak,
+                "output_bytes": 0,
+                "rss_delta_bytes": (
+                    rss_end - rss_start
+                    if rss_end is not None and rss_start is not None
+                    else None
+                ),
+            }
+            NODE_MEMORY_BYTES.labels(node_type).observe(peak)
+
+    def retain(self, node_id: str, output: dict[str, Any]) -> dict[str, Any]:
+        """Account for an output the run keeps; returns it, or the error that replaces it.
+
+        The node that breached a budget gets `{"_error", "_cancelled": "memory"}`
+        even if it returned before the breach was noticed.
+        """
+        size = deep_sizeof(output)
+        self.retained += size
+        self.nodes.setdefault(
+            node_id, {"peak_bytes": 0, "output_bytes": 0, "rss_delta_bytes": None}
+        )["output_bytes"] = size
+        self._check(node_id, 0)
+        if self.exceeded_node == node_id:
+            return {"_error": self.exceeded, "_cancelled": "memory"}
+        return output
+
+    def _check(self, node_id: str, used: int) -> bool:
+        """Stop the run if `used` (the running node's usage) breaks a budget."""
+        if self.exceeded is not None:
+            return True
+        node_budget, run_budget = self.limits.node_budget, self.limits.run_budget
+        if node_budget is not None and used > node_budget:
+            reason = f"Node {node_id} used {_mib(used)}, over the {_mib(node_budget)} node memory budget"
+        elif run_budget is not None and self.retained + used > run_budget:
+            reason = f"Run used {_mib(self.retained + used)} at node {node_id}, over the {_mib(run_budget)} run memory budget"
+        else:
+            return False
+        self.exceeded, self.exceeded_node = reason, node_id
+        self.token.cancel("memory")
+        return True
+
+    def report(self) -> dict[str, Any]:
+        """Per-node numbers plus run totals, for run results."""
+        peaks = [n["peak_bytes"] or 0 for n in self.nodes.values()]
+        rss_end = self._rss_end if self._rss_end is not None else rss_bytes()
+        return {
+            "nodes": self.nodes,
+            "peak_bytes": max(peaks, default=0),
+            "output_bytes": self.retained,
+            "rss_delta_bytes": (
+                rss_end - self._rss_start
+                if rss_end is not None and self._rss_start is not None
+                else None
+            ),
+            "node_budget": self.limits.node_budget,
+            "run_budget": self.limits.run_budget,
+            "exceeded": self.exceeded,
+        }
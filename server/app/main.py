@@ -1,4 +1,4 @@
-<![CDATA["""OpenFlow Backend — FastAPI Application Entry Point.
+"""OpenFlow Backend — FastAPI Application Entry Point.
 
 This module initializes the FastAPI app, configures CORS middleware,
 sets up WebSocket support for real-time generation streaming, and
@@ -7,12 +7,47 @@ defines the core API routes.
 
 from __future__ import annotations
 
+import asyncio
+import ipaddress
+import math
 import os
+import time
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
-
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from typing import TYPE_CHECKING, AsyncGenerator
+
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+
+from app.api import workflows
+from app.engine.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    MemoryAdmissionStore,
+    SQLiteAdmissionStore,
+)
+from app.engine.cancellation import CancelRegistry, CancelToken
+from app.engine.checkpoints import CheckpointStore
+from app.engine.memory import MemoryLimits
+
+if TYPE_CHECKING:
+    from app.engine.executor import WorkflowExecutor
+from app.metrics import (
+    CONTENT_TYPE,
+    REGISTRY,
+    RUNS_FINISHED,
+    RUNS_IN_FLIGHT,
+    WS_CONNECTIONS,
+    WS_SEND_PENDING,
+    MetricsMiddleware,
+)
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -20,25 +55,94 @@ from fastapi.middleware.cors import CORSMiddleware
 
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
 
+# Admission control for workflow runs. Set ADMISSION_DB to share limits
+# between worker processes. Weights are keyed on the caller identity from
+# `user_key`: the client address, or the `X-User-Id` a proxy listed in
+# TRUSTED_PROXIES sets, e.g. "203.0.113.7=0.5,batch-bot=2".
+ADMISSION_DB = os.getenv("ADMISSION_DB", "")
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "0.5"))
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "10"))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "16"))
+ADMISSION_PER_USER = int(os.getenv("ADMISSION_PER_USER", "4"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "20"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "60"))
+ADMISSION_WEIGHTS = {
+    user.strip(): float(weight)
+    for user, _, weight in (
+        item.partition("=") for item in os.getenv("ADMISSION_WEIGHTS", "").split(",")
+    )
+    if user.strip() and weight
+}
+
+# Runs are admitted per client address. Behind a reverse proxy, list its
+# addresses or networks in TRUSTED_PROXIES ("10.0.0.0/8,127.0.0.1"); only
+# requests arriving from those may name the caller, with an `X-User-Id`
+# header set by an authenticating proxy or else `X-Forwarded-For`.
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(net.strip(), strict=False)
+    for net in os.getenv("TRUSTED_PROXIES", "").split(",")
+    if net.strip()
+]
+
+# Run checkpoints. A run still marked "running" that hasn't checkpointed a
+# node for RUN_STALE_AFTER seconds is assumed dead and may be resumed.
+RUN_DB = os.getenv("RUN_DB", "data/runs.sqlite3")
+RUN_STALE_AFTER = float(os.getenv("RUN_STALE_AFTER", "900"))
+
+# Finished runs (and blobs only they used) are deleted once they've been
+# untouched for RUN_RETENTION_DAYS; checked at startup and then every
+# RUN_PRUNE_INTERVAL seconds. 0 keeps runs forever.
+RUN_RETENTION_DAYS = float(os.getenv("RUN_RETENTION_DAYS", "30"))
+RUN_PRUNE_INTERVAL = float(os.getenv("RUN_PRUNE_INTERVAL", "3600"))
+
+# Longest a run may take, queueing included (0 disables); callers can ask
+# for less with ?deadline=. Cancels issued to another worker and client
+# disconnects are noticed within RUN_CANCEL_POLL seconds.
+RUN_DEADLINE = float(os.getenv("RUN_DEADLINE", "1800"))
+RUN_CANCEL_POLL = float(os.getenv("RUN_CANCEL_POLL", "1"))
+
+# Per-node memory accounting (tracemalloc peak, retained output size, RSS
+# delta), returned under "memory" in run results. Setting a budget turns it
+# on too; a run that goes over one fails, naming the node. Sizes in MiB,
+# 0 for no limit. Profiling slows allocation-heavy nodes, so it's opt-in.
+RUN_MEMORY_PROFILE = os.getenv("RUN_MEMORY_PROFILE", "0") == "1"
+NODE_MEMORY_BUDGET_MB = float(os.getenv("NODE_MEMORY_BUDGET_MB", "0"))
+RUN_MEMORY_BUDGET_MB = float(os.getenv("RUN_MEMORY_BUDGET_MB", "0"))
+
 
 # ---------------------------------------------------------------------------
 # Application Lifespan
 # ---------------------------------------------------------------------------
 
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Manage startup and shutdown events.
 
-    On startup: initialize database connections, register nodes.
+    On startup: initialize database connections, register nodes, start
+    pruning old runs.
     On shutdown: close connections gracefully.
     """
     # Startup
     print("🌊 OpenFlow starting up...")
+    pruner = asyncio.create_task(_prune_runs()) if RUN_RETENTION_DAYS > 0 else None
     yield
     # Shutdown
+    if pruner is not None:
+        pruner.cancel()
     print("🌊 OpenFlow shutting down...")
 
 
+async def _prune_runs() -> None:
+    """Delete expired runs every RUN_PRUNE_INTERVAL seconds, off the event loop."""
+    while True:
+        try:
+            await asyncio.to_thread(checkpoints.prune, RUN_RETENTION_DAYS * 86400)
+        except Exception as exc:
+            print(f"Pruning old runs failed: {exc}")
+        await asyncio.sleep(RUN_PRUNE_INTERVAL)
+
+
 # ---------------------------------------------------------------------------
 # App Instance
 # ---------------------------------------------------------------------------
@@ -56,13 +160,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+app.add_middleware(MetricsMiddleware)
+
+app.include_router(workflows.router, prefix="/api/workflows", tags=["workflows"])
 
 
 # ---------------------------------------------------------------------------
 # Connection Manager (WebSocket)
 # ---------------------------------------------------------------------------
 
+
 class ConnectionManager:
     """Manage active WebSocket connections for real-time streaming.
 
@@ -77,24 +186,225 @@ class ConnectionManager:
         """Accept and register a new WebSocket connection."""
         await websocket.accept()
         self.active.append(websocket)
+        WS_CONNECTIONS.inc()
 
     def disconnect(self, websocket: WebSocket) -> None:
         """Remove a disconnected WebSocket."""
         self.active.remove(websocket)
+        WS_CONNECTIONS.dec()
+
+    async def send(self, websocket: WebSocket, message: dict) -> None:
+        """Send a JSON message to one client."""
+        WS_SEND_PENDING.inc()
+        try:
+            await websocket.send_json(message)
+        finally:
+            WS_SEND_PENDING.dec()
 
     async def broadcast(self, message: dict) -> None:
         """Send a JSON message to all connected clients."""
-        for ws in self.active:
-            await ws.send_json(message)
+        # Everything not yet sent counts as queued, so a slow client shows up
+        targets = list(self.active)
+        remaining = len(targets)
+        WS_SEND_PENDING.inc(remaining)
+        try:
+            for ws in targets:
+                await ws.send_json(message)
+                remaining -= 1
+                WS_SEND_PENDING.dec()
+        finally:
+            WS_SEND_PENDING.dec(remaining)
 
 
 manager = ConnectionManager()
 
 
+# ---------------------------------------------------------------------------
+# Admission Control
+# ---------------------------------------------------------------------------
+
+admission = AdmissionController(
+    SQLiteAdmissionStore(ADMISSION_DB) if ADMISSION_DB else MemoryAdmissionStore(),
+    rate=ADMISSION_RATE,
+    burst=ADMISSION_BURST,
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    per_user_in_flight=ADMISSION_PER_USER,
+    max_queued_per_user=ADMISSION_MAX_QUEUED,
+    max_wait=ADMISSION_MAX_WAIT,
+    weights=ADMISSION_WEIGHTS,
+)
+
+REGISTRY.gauge(
+    "openflow_admission_queue_depth", "Runs waiting for an admission slot."
+).labels().set_function(lambda: admission.queue_depth)
+
+
+def _trusted_proxy(host: str) -> bool:
+    try:
+        addr = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(addr in net for net in TRUSTED_PROXIES)
+
+
+def user_key(request: Request) -> str:
+    """Identify the caller for rate limiting.
+
+    There is no authentication in front of the engine, so callers are told
+    apart by address. Identity headers are client-controlled and only
+    honoured on requests relayed by a proxy listed in TRUSTED_PROXIES: its
+    `X-User-Id`, or else the nearest untrusted `X-Forwarded-For` hop.
+    """
+    host = request.client.host if request.client else "anonymous"
+    if not _trusted_proxy(host):
+        return host
+    user = request.headers.get("x-user-id", "").strip()
+    if user:
+        return user
+    hops = [
+        hop.strip()
+        for hop in request.headers.get("x-forwarded-for", "").split(",")
+        if hop.strip()
+    ]
+    for hop in reversed(hops):
+        if not _trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else host
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    """Turn an admission rejection into a 429 with a Retry-After hint."""
+    retry_after = max(1, math.ceil(exc.retry_after))
+    return JSONResponse(
+        {
+            "detail": f"Too many requests ({exc.reason})",
+            "reason": exc.reason,
+            "retry_after": retry_after,
+        },
+        status_code=429,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+# ---------------------------------------------------------------------------
+# Run Checkpoints
+# ---------------------------------------------------------------------------
+
+checkpoints = CheckpointStore(RUN_DB)
+cancels = CancelRegistry()
+
+
+def _new_token(deadline: float | None) -> CancelToken:
+    """Token for a run starting now, bounded by RUN_DEADLINE and the caller's deadline."""
+    limits = [d for d in (deadline, RUN_DEADLINE) if d]
+    return CancelToken(time.monotonic() + min(limits) if limits else None)
+
+
+def _memory_limits() -> MemoryLimits | None:
+    """Memory profiling settings for new runs, or None when profiling is off."""
+    node, run = (
+        int(mb * (1 << 20)) or None
+        for mb in (NODE_MEMORY_BUDGET_MB, RUN_MEMORY_BUDGET_MB)
+    )
+    if not (RUN_MEMORY_PROFILE or node or run):
+        return None
+    return MemoryLimits(node_budget=node, run_budget=run)
+
+
+def _run_checkpointed(
+    executor: WorkflowExecutor,
+    run_id: str,
+    token: CancelToken,
+    workflow: dict | None = None,
+) -> dict:
+    """Execute (or resume) a run and close it; called off the event loop."""
+    try:
+        if workflow is None:
+            results = executor.resume(run_id, token)
+        else:
+            results = executor.execute(workflow, run_id, token=token)
+    except Exception as exc:
+        checkpoints.finish_run(run_id, error=str(exc))
+        raise
+    stopped = any("_skipped" in out or "_cancelled" in out for out in results.values())
+    if stopped and token.cancelled and token.reason == "deadline":
+        status = checkpoints.finish_run(run_id, error="Run deadline exceeded")
+    elif (
+        stopped
+        and token.cancelled
+        and token.reason == "memory"
+        and executor.memory is not None
+    ):
+        status = checkpoints.finish_run(run_id, error=executor.memory.exceeded)
+    else:
+        status = checkpoints.finish_run(run_id, cancelled=stopped and token.cancelled)
+    result = {
+        "run_id": run_id,
+        "status": status,
+        "reason": token.reason if stopped and token.cancelled else None,
+        "restored": executor.restored,
+        "results": results,
+    }
+    if executor.memory is not None:
+        result["memory"] = executor.memory.report()
+    return result
+
+
+async def _execute_run(
+    request: Request,
+    executor: WorkflowExecutor,
+    run_id: str,
+    token: CancelToken,
+    workflow: dict | None = None,
+) -> dict:
+    """Run the executor on a worker thread while watching for cancellation.
+
+    The run is cancelled when its client disconnects or when a cancel for
+    it reaches another worker (flagged in the checkpoint store). The
+    executor then skips every node not yet started, but this returns, and
+    the caller's admission slot is released, only once the executor does:
+    straight away if the node in flight declares a timeout (it is
+    abandoned), otherwise when that node next checks its token or returns.
+    """
+    cancels.register(run_id, token)
+    RUNS_IN_FLIGHT.inc()
+    status = "failed"
+    try:
+        task = asyncio.ensure_future(
+            asyncio.to_thread(_run_checkpointed, executor, run_id, token, workflow)
+        )
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=RUN_CANCEL_POLL)
+            if done:
+                result = task.result()
+                status = result["status"]
+                return result
+            if await request.is_disconnected():
+                token.cancel("client disconnected")
+            elif await asyncio.to_thread(checkpoints.cancel_requested, run_id):
+                token.cancel("cancelled")
+    finally:
+        cancels.unregister(run_id)
+        RUNS_IN_FLIGHT.dec()
+        RUNS_FINISHED.labels(status).inc()
+
+
+def cancel_run(run_id: str) -> bool:
+    """Cancel a run, whichever worker is executing it.
+
+    Returns:
+        False if the run isn't running.
+    """
+    flagged = checkpoints.request_cancel(run_id)
+    return cancels.cancel(run_id) or flagged
+
+
 # ---------------------------------------------------------------------------
 # Routes
 # ---------------------------------------------------------------------------
 
+
 @app.get("/")
 async def root() -> dict[str, str]:
     """Health-check endpoint."""
@@ -109,38 +419,145 @@ async def list_nodes() -> dict[str, list[dict]]:
     and its typed input/output schema so the frontend can render
     the correct handles and form fields.
     """
+    import app.nodes.flow  # noqa: F401  (built-in flow-control nodes)
     from app.nodes.base import BaseNode
 
     registry = []
     for subclass in BaseNode.__subclasses__():
-        registry.append({
-            "name": subclass.__name__,
-            "category": getattr(subclass, "category", "general"),
-            "description": getattr(subclass, "description", ""),
-            "inputs": getattr(subclass, "inputs", {}),
-            "outputs": getattr(subclass, "outputs", {}),
-        })
+        registry.append(
+            {
+                "name": subclass.__name__,
+                "category": getattr(subclass, "category", "general"),
+                "description": getattr(subclass, "description", ""),
+                "inputs": getattr(subclass, "inputs", {}),
+                "outputs": getattr(subclass, "outputs", {}),
+            }
+        )
     return {"nodes": registry}
 
 
 @app.post("/api/workflows/execute")
-async def execute_workflow(workflow: dict) -> dict:
+async def execute_workflow(
+    workflow: dict, request: Request, deadline: float | None = Query(None, gt=0)
+) -> dict:
     """Execute a workflow DAG.
 
     Accepts a JSON workflow definition containing nodes and edges,
-    runs the DAG executor, and returns the results.
+    runs the DAG executor, and returns the results. Runs go through
+    admission control: over-rate callers get a 429, and when all run
+    slots are busy the request waits its fair turn.
+
+    Every node output is checkpointed under the returned `run_id`; if
+    the run fails, `POST /api/runs/{run_id}/resume` picks it up again.
+
+    The run can be cancelled over REST or WebSocket, and stops when the
+    client disconnects or the deadline passes. Nodes not yet run are then
+    returned as `{"_skipped": reason}`.
 
     Args:
         workflow: Serialized workflow with "nodes" and "edges" keys.
+        deadline: Seconds the run may take, queueing included (capped at RUN_DEADLINE).
 
     Returns:
-        Execution results keyed by node ID.
+        Run ID, status ("completed", "failed" or "cancelled") and results
+        keyed by node ID; with memory profiling on, per-node and run
+        memory under "memory".
+    """
+    from app.engine.executor import WorkflowExecutor, topological_sort
+
+    try:
+        topological_sort(workflow.get("nodes", []), workflow.get("edges", []))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    token = _new_token(deadline)
+    executor = WorkflowExecutor(
+        checkpoints, workflows.get_store(), memory=_memory_limits()
+    )
+    async with admission.admit(user_key(request)):
+        # The executor and the checkpoint store are synchronous; call them
+        # off the event loop so queued requests and WebSocket traffic keep
+        # flowing while they work
+        run_id = await asyncio.to_thread(checkpoints.create_run, workflow)
+        return await _execute_run(request, executor, run_id, token, workflow)
+
+
+@app.get("/api/runs")
+async def list_runs(limit: int = 50) -> dict:
+    """Most recent runs with their status."""
+    return {
+        "runs": await asyncio.to_thread(checkpoints.list_runs, min(max(limit, 1), 200))
+    }
+
+
+@app.get("/api/runs/{run_id}")
+async def get_run(run_id: str) -> dict:
+    """A run's status, workflow and per-node checkpoint status."""
+    run = await asyncio.to_thread(checkpoints.get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+
+@app.post("/api/runs/{run_id}/cancel")
+async def cancel_run_endpoint(run_id: str) -> dict:
+    """Cancel a running run.
+
+    The node in flight is told to stop (abandoned outright if it declares
+    a timeout) and all remaining nodes are skipped; the run can be resumed
+    later.
+    """
+    if await asyncio.to_thread(checkpoints.get_run, run_id) is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if not await asyncio.to_thread(cancel_run, run_id):
+        raise HTTPException(status_code=409, detail="Run is not running")
+    return {"run_id": run_id, "status": "cancelling"}
+
+
+@app.post("/api/runs/{run_id}/resume")
+async def resume_run(
+    run_id: str, request: Request, deadline: float | None = Query(None, gt=0)
+) -> dict:
+    """Resume a failed or cancelled run from its last successful nodes.
+
+    Failed and not-yet-run nodes are executed in the original topological
+    order; nodes that succeeded are restored from their checkpoints and
+    listed under `restored`. Completed runs can't be resumed, nor can runs
+    still in progress unless their worker has gone quiet for
+    RUN_STALE_AFTER seconds.
     """
     from app.engine.executor import WorkflowExecutor
 
-    executor = WorkflowExecutor()
-    results = executor.execute(workflow)
-    return {"status": "completed", "results": results}
+    run = await asyncio.to_thread(checkpoints.get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run["status"] == "completed":
+        raise HTTPException(status_code=409, detail="Run already completed")
+    if run["status"] == "running" and not checkpoints.is_stale(run, RUN_STALE_AFTER):
+        raise HTTPException(status_code=409, detail="Run is still in progress")
+
+    token = _new_token(deadline)
+    executor = WorkflowExecutor(
+        checkpoints, workflows.get_store(), memory=_memory_limits()
+    )
+    async with admission.admit(user_key(request)):
+        if not await asyncio.to_thread(
+            checkpoints.restart_run, run_id, RUN_STALE_AFTER
+        ):
+            raise HTTPException(status_code=409, detail="Run is already being resumed")
+        return await _execute_run(request, executor, run_id, token)
+
+
+@app.get("/api/admission/metrics")
+async def admission_metrics() -> dict:
+    """Admission queue depth, in-flight runs, rejections and wait times."""
+    return await admission.metrics()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Runtime metrics in the Prometheus text exposition format."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 
 @app.websocket("/ws")
@@ -157,7 +574,16 @@ async def websocket_endpoint(websocket: WebSocket) -> None:
             data = await websocket.receive_json()
             # Handle incoming commands (e.g., cancel execution)
             if data.get("type") == "ping":
-                await websocket.send_json({"type": "pong"})
+                await manager.send(websocket, {"type": "pong"})
+            elif data.get("type") == "cancel":
+                run_id = str(data.get("run_id", ""))
+                await manager.send(
+                    websocket,
+                    {
+                        "type": "cancel_ack",
+                        "run_id": run_id,
+                        "ok": await asyncio.to_thread(cancel_run, run_id),
+                    },
+                )
     except WebSocketDisconnect:
         manager.disconnect(websocket)
-]]>
\ No newline at end of file
@@ -0,0 +1,385 @@
+"""Runtime metrics in the Prometheus text exposition format.
+
+A small, dependency-free registry of counters, gauges and histograms,
+served by `GET /metrics`. Each metric family hands out one child per
+label combination; callers on hot paths bind their children once (at
+import, or on first use via `labels()`, which is a dict lookup after the
+first call) and then only touch plain attributes:
+
+    NODE_SECONDS = REGISTRY.histogram(
+        "openflow_node_duration_seconds", "Node execution time.", ("node_type", "outcome"))
+    ...
+    NODE_SECONDS.labels("Map", "ok").observe(elapsed)
+
+Updates take no lock. They rely on the GIL, so two threads updating the
+same child at the same instant can in rare cases lose one increment —
+an acceptable error for monitoring, and much cheaper than a lock per
+observation. Only creating a child takes the family's lock.
+
+Metrics are per process: with several uvicorn workers, scrape each one
+(or aggregate by instance) rather than expecting one global view.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Iterator
+
+# Seconds; spans sub-millisecond API calls up to multi-minute video nodes
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# ---------------------------------------------------------------------------
+# Children
+# ---------------------------------------------------------------------------
+
+
+class CounterChild:
+    """A monotonically increasing value."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class GaugeChild:
+    """A value that goes up and down, or is read from a callback at scrape time."""
+
+    __slots__ = ("value", "function")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function: Callable[[], float] | None = None
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Report `function()` instead of the stored value."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class HistogramChild:
+    """Observations counted into fixed buckets, plus their sum."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        # Buckets are "less than or equal", which is what bisect_left finds
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+# ---------------------------------------------------------------------------
+# Families
+# ---------------------------------------------------------------------------
+
+
+class MetricFamily:
+    """A named metric and its children, one per label-value combination."""
+
+    type = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: Any) -> Any:
+        """Return the child for these label values, creating it on first use."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} takes labels {self.labelnames}, got {values!r}"
+                )
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def _samples(self, key: tuple[str, ...], child: Any) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {_escape(self.documentation)}"
+        yield f"# TYPE {self.name} {self.type}"
+        for key, child in list(self._children.items()):
+            yield from self._samples(key, child)
+
+
+class Counter(MetricFamily):
+    type = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def _samples(self, key: tuple[str, ...], child: CounterChild) -> Iterator[str]:
+        yield f"{self.name}{_labels(self.labelnames, key)} {_number(child.value)}"
+
+
+class Gauge(MetricFamily):
+    type = "gauge"
+
+    def _new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def _samples(self, key: tuple[str, ...], child: GaugeChild) -> Iterator[str]:
+        yield f"{self.name}{_labels(self.labelnames, key)} {_number(child.get())}"
+
+
+class Histogram(MetricFamily):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def _samples(self, key: tuple[str, ...], child: HistogramChild) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), list(child.counts)):
+            cumulative += count
+            le = _labels(self.labelnames, key, f'le="{_number(bound)}"')
+            yield f"{self.name}_bucket{le} {cumulative}"
+        labels = _labels(self.labelnames, key)
+        yield f"{self.name}_sum{labels} {_number(child.sum)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+# ---------------------------------------------------------------------------
+# Registry
+# ---------------------------------------------------------------------------
+
+
+class Registry:
+    """A set of metric families rendered together."""
+
+    def __init__(self) -> None:
+        self._families: dict[str, MetricFamily] = {}
+
+    def _add(self, family: MetricFamily) -> Any:
+        existing = self._families.setdefault(family.name, family)
+        if (
+            type(existing) is not type(family)
+            or existing.labelnames != family.labelnames
+        ):
+            raise ValueError(
+                f"Metric {family.name} already registered with a different definition"
+            )
+        return existing
+
+    def counter(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All families in the text exposition format."""
+        lines = [
+            line for family in list(self._families.values()) for line in family.render()
+        ]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# ---------------------------------------------------------------------------
+# Application metrics
+# ---------------------------------------------------------------------------
+
+HTTP_SECONDS = REGISTRY.histogram(
+    "openflow_http_request_duration_seconds",
+    "HTTP request latency by route template, method and status code.",
+    ("method", "route", "status"),
+)
+NODE_SECONDS = REGISTRY.histogram(
+    "openflow_node_duration_seconds",
+    "Node execution time by node type and outcome (ok, error, cancelled).",
+    ("node_type", "outcome"),
+)
+NODE_MEMORY_BYTES = REGISTRY.histogram(
+    "openflow_node_memory_peak_bytes",
+    "Peak Python allocations per node execution, by node type (memory-profiled runs only).",
+    ("node_type",),
+    buckets=tuple(float(1 << n) for n in range(20, 34)),  # 1 MiB .. 8 GiB, doubling
+)
+RUNS_IN_FLIGHT = REGISTRY.gauge(
+    "openflow_runs_in_flight", "Workflow runs currently executing."
+).labels()
+RUNS_FINISHED = REGISTRY.counter(
+    "openflow_runs_finished_total",
+    "Finished workflow runs by final status.",
+    ("status",),
+)
+WS_CONNECTIONS = REGISTRY.gauge(
+    "openflow_websocket_connections", "Open WebSocket connections."
+).labels()
+WS_SEND_PENDING = REGISTRY.gauge(
+    "openflow_websocket_send_queue_depth", "WebSocket messages queued or being sent."
+).labels()
+COLLECTOR_WRITE_SECONDS = REGISTRY.histogram(
+    "openflow_collector_write_duration_seconds",
+    "Time to append one generation record.",
+    buckets=(
+        0.0001,
+        0.00025,
+        0.0005,
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        1,
+    ),
+).labels()
+COLLECTOR_BACKLOG = REGISTRY.gauge(
+    "openflow_collector_backlog",
+    "Generation records waiting to be written or being written.",
+).labels()
+
+
+class MetricsMiddleware:
+    """ASGI middleware that times every HTTP request.
+
+    Requests are labelled with the matched route's template (e.g.
+    `/api/runs/{run_id}`), so path parameters don't create a child per
+    ID; requests matching no route share the `<unmatched>` label.
+    """
+
+    def __init__(self, app: Any, histogram: Histogram = HTTP_SECONDS) -> None:
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.histogram.labels(
+                scope["method"], route_template(scope), status
+            ).observe(time.perf_counter() - start)
+
+
+def route_template(scope: dict) -> str:
+    """The full path template of the route a request matched, or `<unmatched>`.
+
+    A route from an included router or a mounted app knows only its own
+    template (`/{workflow_id}` rather than `/api/workflows/{workflow_id}`),
+    so the prefix the request consumed before reaching it is put back: the
+    route's part of the path is rebuilt from the path parameters and cut
+    off the end of the request path.
+    """
+    route: Any = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "<unmatched>"
+    try:
+        own = route.url_path_for(route.name, **scope.get("path_params", {}))
+    except Exception:  # not a Starlette route, or parameters it can't format
+        return template
+    path = scope["path"]
+    return path[: len(path) - len(own)] + template if path.endswith(own) else template
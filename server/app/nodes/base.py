@@ -1,4 +1,4 @@
-<![CDATA["""Base node class for the OpenFlow node system.
+"""Base node class for the OpenFlow node system.
 
 Every node in OpenFlow — whether it generates images, processes text,
 or calls an external API — inherits from `BaseNode`. This provides a
@@ -23,12 +23,27 @@ Example of creating a custom node:
         def execute(self, image: bytes, scale: int = 2, **kwargs) -> dict:
             upscaled = real_esrgan_upscale(image, scale)
             return {"image": upscaled}
+
+Nodes that call slow external APIs should set `timeout` and cooperate
+with cancellation through `self.cancel_token`:
+
+        timeout = 120
+
+        def execute(self, prompt: str, **kwargs) -> dict:
+            resp = client.post(url, json={"prompt": prompt},
+                               timeout=self.cancel_token.remaining(60))
+            self.cancel_token.raise_if_cancelled()
+            ...
 """
 
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Any
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from app.engine.cancellation import CancelToken
+    from app.engine.executor import WorkflowExecutor
 
 
 @dataclass
@@ -74,8 +89,17 @@ class BaseNode:
         - `outputs`: Dict of output port name → NodeOutput.
         - `execute(**kwargs) -> dict`: The actual computation.
 
+    Subclasses may define:
+        - `timeout`: Seconds `execute()` may take before the node is
+          abandoned and everything downstream of it skipped.
+
     The workflow engine calls `validate()` before `execute()` to ensure
-    all required inputs are present and type-compatible.
+    all required inputs are present and type-compatible. It sets
+    `cancel_token` before `execute()`; the token is cancelled when the run
+    is cancelled, hits its deadline, or this node exceeds `timeout`. A node
+    without a `timeout` shares the run's token, so it should only watch the
+    token, never cancel it. It also sets `executor`, for nodes that run
+    sub-graphs.
     """
 
     name: str = "Unnamed Node"
@@ -83,6 +107,9 @@ class BaseNode:
     description: str = ""
     inputs: dict[str, NodeInput] = {}
     outputs: dict[str, NodeOutput] = {}
+    timeout: float | None = None
+    cancel_token: CancelToken | None = None
+    executor: WorkflowExecutor | None = None
 
     def validate(self, input_values: dict[str, Any]) -> list[str]:
         """Check that all required inputs are present and have valid types.
@@ -131,8 +158,14 @@ class BaseNode:
             "name": self.name,
             "category": self.category,
             "description": self.description,
+            "timeout": self.timeout,
             "inputs": {
-                k: {"type": v.type, "description": v.description, "default": v.default, "required": v.required}
+                k: {
+                    "type": v.type,
+                    "description": v.description,
+                    "default": v.default,
+                    "required": v.required,
+                }
                 for k, v in self.inputs.items()
             },
             "outputs": {
@@ -140,4 +173,3 @@ class BaseNode:
                 for k, v in self.outputs.items()
             },
         }
-]]>
\ No newline at end of file
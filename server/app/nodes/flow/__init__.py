@@ -0,0 +1,3 @@
+from app.nodes.flow.map import Map
+
+__all__ = ["Map"]
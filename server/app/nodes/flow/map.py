@@ -0,0 +1,189 @@
+"""Map node — run a sub-workflow once per list item, in parallel.
+
+Replaces duplicating nodes on the canvas (or re-running a workflow from
+the client) for every prompt in a list. The sub-workflow is compiled once
+and executed per item on a bounded thread pool; each item's value is fed
+into one port of the sub-graph, and one port (or every sink node's
+output) is collected back into a list in item order.
+
+Example node definition:
+
+    {"id": "map_1", "type": "Map", "data": {
+        "workflow": "<saved workflow id>",
+        "item_input": "prompt.text",
+        "output": "gen.image",
+        "concurrency": 8,
+        "on_error": "collect"}}
+
+with `items` connected from an upstream list output.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any
+
+from app.nodes.base import BaseNode, NodeInput, NodeOutput
+
+
+def _port(ref: str, node_map: dict[str, dict], what: str) -> tuple[str, str]:
+    """Split a "node_id.port" reference and check the node exists."""
+    node_id, _, port = ref.rpartition(".")
+    if not node_id or not port:
+        raise ValueError(f"{what} must look like 'node_id.port', got {ref!r}")
+    if node_id not in node_map:
+        raise ValueError(f"{what} names unknown sub-workflow node {node_id!r}")
+    return node_id, port
+
+
+class Map(BaseNode):
+    """Fan a list out over a sub-workflow and gather the results."""
+
+    name = "Map"
+    category = "flow"
+    description = "Run a sub-workflow once per list item, in parallel, and collect the results into a list."
+
+    # Hard caps, whatever the node data asks for
+    MAX_CONCURRENCY = 16
+    MAX_DEPTH = 4
+
+    inputs = {
+        "items": NodeInput(type="list", description="Items to map over"),
+        "workflow": NodeInput(
+            type="workflow",
+            description="Sub-workflow: a saved workflow ID or an inline {nodes, edges} graph",
+        ),
+        "item_input": NodeInput(
+            type="string", description="Port each item is fed into, as 'node_id.port'"
+        ),
+        "output": NodeInput(
+            type="string",
+            description="Port to collect, as 'node_id.port' (default: every sink node's outputs)",
+            required=False,
+        ),
+        "concurrency": NodeInput(
+            type="int", description="Items run at once", default=4, required=False
+        ),
+        "on_error": NodeInput(
+            type="string",
+            description="collect: failed items become null; skip: drop them; fail: stop and fail the node",
+            default="collect",
+            required=False,
+            options=["collect", "skip", "fail"],
+        ),
+    }
+    outputs = {
+        "results": NodeOutput(
+            type="list", description="Collected outputs, in item order"
+        ),
+        "errors": NodeOutput(
+            type="list", description="[{index, error}] for failed items"
+        ),
+        "succeeded": NodeOutput(
+            type="int", description="Number of items that succeeded"
+        ),
+        "failed": NodeOutput(type="int", description="Number of items that failed"),
+    }
+
+    def execute(  # type: ignore[override]  # ports arrive as named keyword arguments
+        self,
+        items: list[Any],
+        workflow: str | dict[str, Any],
+        item_input: str,
+        output: str | None = None,
+        concurrency: int = 4,
+        on_error: str = "collect",
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        """Run the sub-workflow for every item and collect the results.
+
+        Args:
+            items: Values to map over; each is fed into `item_input`.
+            workflow: Saved workflow ID or inline {nodes, edges} graph.
+            item_input: Sub-workflow port each item goes into ("node_id.port").
+            output: Port to collect ("node_id.port"); every sink's outputs if omitted.
+            concurrency: Items run at once, capped at MAX_CONCURRENCY.
+            on_error: "collect", "skip" or "fail" (see the `on_error` input).
+
+        Returns:
+            Dict with "results" in item order, "errors", "succeeded" and "failed".
+
+        Raises:
+            ValueError: Bad node data, an unknown sub-workflow, or nesting too deep.
+            RuntimeError: An item failed with on_error="fail".
+            RunCancelled: The run was cancelled while items were running.
+        """
+        from app.engine.cancellation import CancelToken
+        from app.engine.executor import WorkflowExecutor, compile_workflow, is_failed
+
+        if not isinstance(items, (list, tuple)):
+            raise ValueError(f"'items' must be a list, got {type(items).__name__}")
+        if on_error not in ("collect", "skip", "fail"):
+            raise ValueError(f"Unknown on_error mode: {on_error!r}")
+
+        executor = self.executor or WorkflowExecutor()
+        if executor.depth >= self.MAX_DEPTH:
+            raise ValueError(f"Map nesting deeper than {self.MAX_DEPTH} levels")
+        if isinstance(workflow, str):
+            graph = executor.workflows.get(workflow) if executor.workflows else None
+            if graph is None:
+                raise ValueError(f"Unknown sub-workflow: {workflow}")
+        else:
+            graph = workflow
+        compiled = compile_workflow(graph)
+        target, target_port = _port(item_input, compiled.node_map, "item_input")
+        collect = _port(output, compiled.node_map, "output") if output else None
+
+        # Child token: cancelled with the run, or by us to stop siblings in "fail" mode
+        group = (self.cancel_token or CancelToken()).child()
+
+        def run_item(item: Any) -> Any:
+            results = executor.spawn().execute(
+                compiled, token=group, inputs={target: {target_port: item}}
+            )
+            for node_id, out in results.items():
+                if is_failed(out):
+                    reason = (
+                        out.get("_error") or out.get("_errors") or out.get("_skipped")
+                    )
+                    raise RuntimeError(f"node {node_id}: {reason}")
+            if collect is None:
+                return {node_id: results[node_id] for node_id in compiled.sinks}
+            node_id, port = collect
+            if port not in results[node_id]:
+                raise RuntimeError(f"node {node_id} produced no {port!r} output")
+            return results[node_id][port]
+
+        collected: list[Any] = [None] * len(items)
+        errors: list[dict[str, Any]] = []
+        workers = max(1, min(int(concurrency), self.MAX_CONCURRENCY, len(items)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="map") as pool:
+            futures = {pool.submit(run_item, item): i for i, item in enumerate(items)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    collected[index] = future.result()
+                except Exception as exc:
+                    errors.append({"index": index, "error": str(exc)})
+                    if on_error == "fail":
+                        group.cancel("sibling item failed")
+        group.detach()
+
+        # A cancelled run stops the node rather than returning partial results
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
+        errors.sort(key=lambda e: e["index"])
+        if errors and on_error == "fail":
+            first = errors[0]
+            raise RuntimeError(
+                f"{len(errors)} of {len(items)} items failed; item {first['index']}: {first['error']}"
+            )
+        if on_error == "skip":
+            failed = {e["index"] for e in errors}
+            collected = [value for i, value in enumerate(collected) if i not in failed]
+        return {
+            "results": collected,
+            "errors": errors,
+            "succeeded": len(items) - len(errors),
+            "failed": len(errors),
+        }
@@ -0,0 +1,48 @@
+"""Shared fixtures.
+
+Every store the app opens at import time is pointed at a throwaway
+directory first, so tests never touch `data/`.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterator
+
+_DATA = Path(tempfile.mkdtemp(prefix="openflow-tests-"))
+os.environ.setdefault("RUN_DB", str(_DATA / "runs.sqlite3"))
+os.environ.setdefault("WORKFLOW_DB", str(_DATA / "workflows.sqlite3"))
+os.environ.setdefault("DATA_DIR", str(_DATA / "generations"))
+os.environ.setdefault("RUN_RETENTION_DAYS", "0")
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.api import workflows  # noqa: E402
+from app.data.workflow_store import (  # noqa: E402
+    CachedWorkflowStore,
+    SQLiteWorkflowStore,
+)
+
+
+@pytest.fixture
+def store(tmp_path: Path) -> CachedWorkflowStore:
+    """A cached SQLite workflow store in a fresh file."""
+    return CachedWorkflowStore(
+        SQLiteWorkflowStore(tmp_path / "workflows.sqlite3"), maxsize=16
+    )
+
+
+@pytest.fixture
+def client(store: CachedWorkflowStore) -> Iterator[TestClient]:
+    """A test client for the app, with the workflow routes on `store`."""
+    from app.main import app
+
+    app.dependency_overrides[workflows.get_store] = lambda: store
+    try:
+        with TestClient(app) as client:
+            yield client
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,198 @@
+"""Tests for admission control: rate limits, fair queueing and rejections."""
+
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app.engine.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    AdmissionStore,
+    MemoryAdmissionStore,
+    SQLiteAdmissionStore,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def admission_store(request: pytest.FixtureRequest, tmp_path: Path) -> AdmissionStore:
+    if request.param == "memory":
+        return MemoryAdmissionStore()
+    return SQLiteAdmissionStore(tmp_path / "admission.sqlite3")
+
+
+def _controller(store: AdmissionStore, **kwargs: Any) -> AdmissionController:
+    options: dict[str, Any] = {
+        "max_in_flight": 1,
+        "per_user_in_flight": 1,
+        "burst": 100,
+        "max_wait": 5.0,
+        "poll_interval": 0.01,
+    }
+    return AdmissionController(store, **{**options, **kwargs})
+
+
+async def _serve_order(admission: AdmissionController, users: list[str]) -> list[str]:
+    """Queue `users`' requests behind a held slot; return the order they run in."""
+    order: list[str] = []
+
+    async def run(user_id: str) -> None:
+        async with admission.admit(user_id):
+            order.append(user_id)
+
+    async with admission.admit("holder"):
+        tasks = [asyncio.create_task(run(user_id)) for user_id in users]
+        while admission.queue_depth < len(users):
+            await asyncio.sleep(0.005)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_light_user_is_not_stuck_behind_a_backlog(
+    admission_store: AdmissionStore,
+) -> None:
+    admission = _controller(admission_store, per_user_in_flight=10)
+    order = asyncio.run(_serve_order(admission, ["heavy"] * 6 + ["light"] * 2))
+
+    assert sorted(order) == ["heavy"] * 6 + ["light"] * 2
+    # Both of light's requests are tagged alongside heavy's first two
+    assert max(i for i, user in enumerate(order) if user == "light") <= 3
+
+
+def test_weights_scale_a_users_share(admission_store: AdmissionStore) -> None:
+    admission = _controller(
+        admission_store, per_user_in_flight=10, weights={"double": 2.0}
+    )
+    order = asyncio.run(_serve_order(admission, ["double"] * 4 + ["single"] * 4))
+
+    assert order[:4].count("double") == 3
+    assert order[-2:] == ["single", "single"]
+
+
+def test_empty_bucket_is_rate_limited(admission_store: AdmissionStore) -> None:
+    admission = _controller(admission_store, burst=2, rate=0.5)
+
+    async def scenario() -> AdmissionRejected:
+        await admission.check_rate("u")
+        await admission.check_rate("u")
+        await admission.check_rate("other")
+        with pytest.raises(AdmissionRejected) as exc:
+            await admission.check_rate("u")
+        return exc.value
+
+    rejected = asyncio.run(scenario())
+    assert rejected.reason == "rate_limited"
+    assert 0 < rejected.retry_after <= 2
+    assert admission._rejected["rate_limited"] == 1
+
+
+def test_too_many_queued_is_rejected(admission_store: AdmissionStore) -> None:
+    admission = _controller(admission_store, max_queued_per_user=1)
+
+    async def wait_for_slot() -> None:
+        async with admission.admit("u"):
+            pass
+
+    async def scenario() -> str:
+        async with admission.admit("holder"):
+            queued = asyncio.create_task(wait_for_slot())
+            while admission.queue_depth < 1:
+                await asyncio.sleep(0.005)
+            with pytest.raises(AdmissionRejected) as exc:
+                async with admission.admit("u"):
+                    pass
+            queued.cancel()
+            return exc.value.reason
+
+    assert asyncio.run(scenario()) == "queue_full"
+
+
+def test_waiting_too_long_is_rejected_and_frees_the_queue(
+    admission_store: AdmissionStore,
+) -> None:
+    admission = _controller(admission_store, max_wait=0.05)
+
+    async def scenario() -> dict[str, Any]:
+        async with admission.admit("holder"):
+            with pytest.raises(AdmissionRejected) as exc:
+                async with admission.admit("u"):
+                    pass
+            assert exc.value.reason == "queue_timeout"
+        async with admission.admit("u"):
+            pass
+        await asyncio.sleep(0.05)  # SQLite releases finish on a worker thread
+        return await admission.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["queue_depth"] == 0
+    assert metrics["in_flight"] == 0
+    assert metrics["admitted"] == 2
+    assert metrics["rejected"]["queue_timeout"] == 1
+
+
+def test_per_user_cap_and_lease_expiry_span_workers(tmp_path: Path) -> None:
+    path = tmp_path / "admission.sqlite3"
+    worker_a = SQLiteAdmissionStore(path)
+    worker_b = SQLiteAdmissionStore(path)
+
+    lease, _ = worker_a.acquire("u", per_user=1, total=4, ttl=0.05)
+    assert lease is not None
+    assert worker_b.acquire("u", per_user=1, total=4, ttl=60) == (None, "user")
+    assert worker_b.in_flight() == {"u": 1}
+
+    admission = _controller(worker_b, max_in_flight=4, lease_ttl=60)
+
+    async def scenario() -> None:
+        async with admission.admit("u"):  # waits for the first lease to expire
+            assert worker_a.in_flight() == {"u": 1}
+
+    asyncio.run(scenario())
+    assert worker_a.take("u", 1, capacity=1, rate=1) == 0
+    assert worker_b.take("u", 1, capacity=1, rate=1) > 0
+
+
+def _request(host: str, headers: dict[str, str]) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "client": (host, 1234),
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+    )
+
+
+def test_user_key_trusts_identity_headers_only_from_proxies(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from app import main
+
+    monkeypatch.setattr(main, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+    spoofed = {"X-User-Id": "admin", "X-Forwarded-For": "198.51.100.1"}
+
+    assert main.user_key(_request("203.0.113.7", spoofed)) == "203.0.113.7"
+    assert main.user_key(_request("10.0.0.2", spoofed)) == "admin"
+    forwarded = {"X-Forwarded-For": "198.51.100.1, 203.0.113.7, 10.0.0.3"}
+    assert main.user_key(_request("10.0.0.2", forwarded)) == "203.0.113.7"
+
+
+def test_rejected_run_is_a_429_with_retry_after(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    from app import main
+
+    monkeypatch.setattr(
+        main, "admission", _controller(MemoryAdmissionStore(), burst=1, rate=0.25)
+    )
+    empty = {"nodes": [], "edges": []}
+
+    assert client.post("/api/workflows/execute", json=empty).status_code == 200
+    rejected = client.post("/api/workflows/execute", json=empty)
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "4"
+    assert rejected.json()["reason"] == "rate_limited"
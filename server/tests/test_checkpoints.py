@@ -0,0 +1,100 @@
+"""Tests for run checkpoints: blob storage, restorable outputs and pruning."""
+
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+import pytest
+
+from app.engine.checkpoints import CheckpointStore
+
+
+@pytest.fixture
+def checkpoints(tmp_path: Path) -> CheckpointStore:
+    return CheckpointStore(tmp_path / "runs.sqlite3")
+
+
+def _count(store: CheckpointStore, table: str) -> int:
+    return store._conn().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_bytes_round_trip_through_shared_blobs(checkpoints: CheckpointStore) -> None:
+    image = b"\x89PNG" + bytes(range(256))
+    run_a = checkpoints.create_run({"nodes": [], "edges": []})
+    run_b = checkpoints.create_run({"nodes": [], "edges": []})
+    checkpoints.save_node(run_a, "gen", {"image": image, "meta": [b"x", 1]}, ok=True)
+    checkpoints.save_node(run_b, "gen", {"image": image}, ok=True)
+
+    assert checkpoints.completed_outputs(run_a) == {
+        "gen": {"image": image, "meta": [b"x", 1]}
+    }
+    assert _count(checkpoints, "blobs") == 2
+    assert _count(checkpoints, "blob_refs") == 3
+
+
+def test_resaving_a_node_replaces_its_blob_refs(checkpoints: CheckpointStore) -> None:
+    run_id = checkpoints.create_run({"nodes": [], "edges": []})
+    checkpoints.save_node(run_id, "gen", {"_error": "boom"}, ok=False)
+    checkpoints.save_node(run_id, "gen", {"image": b"one"}, ok=True)
+    checkpoints.save_node(run_id, "gen", {"image": b"two"}, ok=True)
+
+    refs = checkpoints._conn().execute("SELECT digest FROM blob_refs").fetchall()
+    assert len(refs) == 1
+    assert checkpoints.completed_outputs(run_id) == {"gen": {"image": b"two"}}
+
+
+def test_unserialisable_output_is_not_restorable_and_stores_no_blobs(
+    checkpoints: CheckpointStore,
+) -> None:
+    run_id = checkpoints.create_run({"nodes": [], "edges": []})
+    checkpoints.save_node(
+        run_id, "gen", {"image": b"data", "handle": threading.Lock()}, ok=True
+    )
+
+    assert checkpoints.completed_outputs(run_id) == {}
+    assert checkpoints.get_run(run_id)["nodes"]["gen"]["status"] == "ok"
+    assert _count(checkpoints, "blobs") == 0
+    assert _count(checkpoints, "blob_refs") == 0
+
+
+def test_output_with_a_missing_blob_is_not_restorable(
+    checkpoints: CheckpointStore,
+) -> None:
+    run_id = checkpoints.create_run({"nodes": [], "edges": []})
+    checkpoints.save_node(run_id, "gen", {"image": b"data"}, ok=True)
+    checkpoints.save_node(run_id, "text", {"text": "A cat"}, ok=True)
+    with checkpoints._conn() as conn:
+        conn.execute("DELETE FROM blobs")
+
+    assert checkpoints.completed_outputs(run_id) == {"text": {"text": "A cat"}}
+
+
+def test_prune_keeps_running_runs_and_shared_blobs(
+    checkpoints: CheckpointStore,
+) -> None:
+    finished = checkpoints.create_run({"nodes": [], "edges": []})
+    checkpoints.save_node(finished, "gen", {"image": b"shared", "own": b"own"}, ok=True)
+    checkpoints.finish_run(finished)
+    running = checkpoints.create_run({"nodes": [], "edges": []})
+    checkpoints.save_node(running, "gen", {"image": b"shared"}, ok=True)
+
+    assert checkpoints.prune(older_than=3600) == {"runs": 0, "blobs": 0}
+    assert checkpoints.prune(older_than=-1) == {"runs": 1, "blobs": 1}
+
+    assert checkpoints.get_run(finished) is None
+    assert checkpoints.completed_outputs(running) == {"gen": {"image": b"shared"}}
+    assert _count(checkpoints, "node_results") == 1
+
+
+def test_finish_run_derives_status(checkpoints: CheckpointStore) -> None:
+    ok = checkpoints.create_run({"nodes": [], "edges": []})
+    checkpoints.save_node(ok, "a", {"text": "x"}, ok=True)
+    failed = checkpoints.create_run({"nodes": [], "edges": []})
+    checkpoints.save_node(failed, "a", {"_error": "boom"}, ok=False)
+
+    assert checkpoints.finish_run(ok) == "completed"
+    assert checkpoints.finish_run(failed) == "failed"
+    assert checkpoints.restart_run(ok, stale_after=60) is False
+    assert checkpoints.restart_run(failed, stale_after=60) is True
+    assert checkpoints.get_run(failed)["attempts"] == 2
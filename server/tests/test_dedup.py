@@ -0,0 +1,135 @@
+"""Tests for the deduplication index and the incremental exporter."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from app.data.collector import GenerationCollector, GenerationRecord
+from app.data.dedup import DedupIndex, jaccard_estimate, minhash, normalize_text
+from app.data.exporter import GenerationExporter
+
+PROMPT = "a watercolor painting of a red fox sleeping under a snowy pine tree at dusk"
+
+
+def _record(prompt: str, model: str = "flux", **params: Any) -> dict[str, Any]:
+    return {
+        "model": model,
+        "input": {"prompt": prompt, "width": 1024, "seed": 1, **params},
+    }
+
+
+@pytest.fixture
+def index(tmp_path: Path) -> DedupIndex:
+    return DedupIndex(tmp_path / "dedup.sqlite3")
+
+
+def test_normalisation_makes_an_exact_match(index: DedupIndex) -> None:
+    first = index.add(_record(PROMPT, guidance=7.5))
+    again = index.add(_record(f"  {PROMPT.upper()}!! ", seed=99, guidance=7.500001))
+
+    assert not first.duplicate
+    assert (again.cluster_id, again.duplicate, again.exact) == (
+        first.cluster_id,
+        True,
+        True,
+    )
+
+
+def test_a_reworded_prompt_is_a_near_duplicate(index: DedupIndex) -> None:
+    first = index.add(_record(PROMPT))
+    near = index.add(_record(PROMPT.replace("at dusk", "at night")))
+
+    assert (near.cluster_id, near.duplicate, near.exact) == (
+        first.cluster_id,
+        True,
+        False,
+    )
+    # The reworded prompt is now an exact key of the cluster too
+    assert index.add(_record(PROMPT.replace("at dusk", "at night"))).exact
+
+
+@pytest.mark.parametrize(
+    "record",
+    [
+        _record("a photo of a city skyline"),
+        _record(PROMPT, model="sdxl"),
+        _record(PROMPT, width=512),
+    ],
+)
+def test_different_prompt_model_or_params_start_a_new_cluster(
+    index: DedupIndex, record: dict[str, Any]
+) -> None:
+    first = index.add(_record(PROMPT))
+    other = index.add(record)
+    assert not other.duplicate
+    assert other.cluster_id != first.cluster_id
+
+
+def test_threshold_above_one_disables_near_matching(tmp_path: Path) -> None:
+    index = DedupIndex(tmp_path / "dedup.sqlite3", threshold=1.1)
+    index.add(_record(PROMPT))
+    assert not index.add(_record(PROMPT.replace("at dusk", "at night"))).duplicate
+    assert index.add(_record(PROMPT)).exact
+
+
+def test_minhash_estimates_similarity() -> None:
+    a = minhash(normalize_text(PROMPT))
+    assert jaccard_estimate(a, a) == 1.0
+    assert jaccard_estimate(a, minhash("a photo of a city skyline")) < 0.2
+    assert minhash("") == minhash("")
+
+
+def test_index_persists_and_reports_stats(tmp_path: Path) -> None:
+    index = DedupIndex(tmp_path / "dedup.sqlite3")
+    index.add({"id": "g1", **_record(PROMPT)})
+    index.add(_record(PROMPT))
+    index.commit()
+    index.close()
+
+    reopened = DedupIndex(tmp_path / "dedup.sqlite3")
+    assert reopened.add(_record(PROMPT.replace("at dusk", "at night"))).duplicate
+    stats = reopened.stats()
+    assert stats["records"] == 3
+    assert (stats["clusters"], stats["exact_duplicates"], stats["near_duplicates"]) == (
+        1,
+        1,
+        1,
+    )
+    assert stats["largest_clusters"][0]["canonical_id"] == "g1"
+
+
+def test_exporter_only_reads_new_lines(tmp_path: Path) -> None:
+    collector = GenerationCollector(tmp_path / "generations")
+
+    def log(prompt: str) -> Path:
+        return collector.log(
+            GenerationRecord(
+                "replicate",
+                "flux",
+                "image",
+                timestamp="2026-02-15T12:00:00+00:00",
+                input_params={"prompt": prompt},
+            )
+        )
+
+    partition = log(PROMPT)
+    log(PROMPT)
+    exporter = GenerationExporter(collector)
+    first = exporter.export_jsonl(tmp_path / "out" / "first.jsonl")
+    assert (first["read"], first["written"], first["exact_duplicates"]) == (2, 1, 1)
+
+    log("a photo of a city skyline")
+    with open(partition, "a", encoding="utf-8") as f:
+        f.write('{"model": "flux", "input": {"prompt": "half-wri')
+    second = exporter.export_jsonl(tmp_path / "out" / "second.jsonl")
+
+    assert (second["read"], second["written"]) == (1, 1)
+    lines = (tmp_path / "out" / "second.jsonl").read_text().splitlines()
+    assert [json.loads(line)["input"]["prompt"] for line in lines] == [
+        "a photo of a city skyline"
+    ]
+    assert (tmp_path / "out" / "second.stats.json").exists()
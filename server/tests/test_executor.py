@@ -0,0 +1,183 @@
+"""Tests for the DAG executor: timeouts, skipping, cancellation and resume."""
+
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from app.engine.cancellation import CancelToken
+from app.engine.checkpoints import CheckpointStore
+from app.engine.executor import WorkflowExecutor
+from app.nodes.base import BaseNode, NodeInput, NodeOutput
+
+executed: list[str] = []
+
+
+class Echo(BaseNode):
+    inputs = {"value": NodeInput(type="any")}
+    outputs = {"value": NodeOutput(type="any")}
+
+    def execute(self, value: Any, **kwargs: Any) -> dict[str, Any]:
+        executed.append(value)
+        return {"value": value}
+
+
+class Flaky(BaseNode):
+    """Fails until `healthy` is set."""
+
+    healthy = False
+    inputs = {"value": NodeInput(type="any")}
+    outputs = {"value": NodeOutput(type="any")}
+
+    def execute(self, value: Any, **kwargs: Any) -> dict[str, Any]:
+        if not Flaky.healthy:
+            raise RuntimeError("provider down")
+        return {"value": f"{value}!"}
+
+
+class Sleep(BaseNode):
+    timeout = 0.1
+    inputs = {"seconds": NodeInput(type="float")}
+    outputs = {"value": NodeOutput(type="float")}
+
+    def execute(self, seconds: float, **kwargs: Any) -> dict[str, Any]:
+        time.sleep(seconds)
+        return {"value": seconds}
+
+
+REGISTRY: dict[str, type[BaseNode]] = {"Echo": Echo, "Flaky": Flaky, "Sleep": Sleep}
+
+
+def _node(node_id: str, node_type: str, **data: Any) -> dict[str, Any]:
+    return {"id": node_id, "type": node_type, "data": data}
+
+
+def _edge(source: str, target: str) -> dict[str, str]:
+    return {
+        "source": source,
+        "sourceHandle": "value",
+        "target": target,
+        "targetHandle": "value",
+    }
+
+
+def _cancelled() -> CancelToken:
+    token = CancelToken()
+    token.cancel()
+    return token
+
+
+@pytest.fixture(autouse=True)
+def _reset() -> None:
+    executed.clear()
+    Flaky.healthy = False
+
+
+def test_outputs_flow_along_edges() -> None:
+    workflow = {
+        "nodes": [_node("a", "Echo", value="x"), _node("b", "Echo")],
+        "edges": [_edge("a", "b")],
+    }
+    results = WorkflowExecutor(registry=REGISTRY).execute(workflow)
+    assert results == {"a": {"value": "x"}, "b": {"value": "x"}}
+
+
+def test_timed_out_node_skips_only_its_descendants() -> None:
+    workflow = {
+        "nodes": [
+            _node("slow", "Sleep", seconds=0.5),
+            _node("after", "Echo"),
+            _node("other", "Echo", value="z"),
+        ],
+        "edges": [_edge("slow", "after")],
+    }
+    start = time.monotonic()
+    results = WorkflowExecutor(registry=REGISTRY).execute(workflow)
+
+    assert time.monotonic() - start < 0.4
+    assert results["slow"]["_cancelled"] == "timeout"
+    assert results["after"] == {"_skipped": "upstream node slow was stopped"}
+    assert results["other"] == {"value": "z"}
+
+
+def test_timed_node_that_finishes_in_time_returns_its_output() -> None:
+    workflow = {"nodes": [_node("quick", "Sleep", seconds=0.0)], "edges": []}
+    results = WorkflowExecutor(registry=REGISTRY).execute(workflow)
+    assert results == {"quick": {"value": 0.0}}
+
+
+@pytest.mark.parametrize(
+    "token, reason",
+    [
+        (CancelToken(deadline=time.monotonic() - 1), "deadline"),
+        (_cancelled(), "cancelled"),
+    ],
+)
+def test_stopped_run_skips_every_node(token: CancelToken, reason: str) -> None:
+    workflow = {
+        "nodes": [_node("a", "Echo", value="x"), _node("b", "Echo")],
+        "edges": [_edge("a", "b")],
+    }
+    results = WorkflowExecutor(registry=REGISTRY).execute(workflow, token=token)
+
+    assert results == {
+        "a": {"_skipped": f"run {reason}"},
+        "b": {"_skipped": f"run {reason}"},
+    }
+    assert executed == []
+
+
+def test_unknown_type_and_missing_input_fail_the_node() -> None:
+    workflow = {
+        "nodes": [_node("a", "Nope"), _node("b", "Echo")],
+        "edges": [_edge("a", "b")],
+    }
+    results = WorkflowExecutor(registry=REGISTRY).execute(workflow)
+    assert results["a"] == {"_error": "Unknown node type: Nope"}
+    assert results["b"] == {"_errors": ["Missing required input: 'value'"]}
+
+
+def test_resume_restores_succeeded_nodes_and_reruns_the_rest(tmp_path: Path) -> None:
+    checkpoints = CheckpointStore(tmp_path / "runs.sqlite3")
+    workflow = {
+        "nodes": [
+            _node("a", "Echo", value="x"),
+            _node("b", "Flaky"),
+            _node("c", "Echo"),
+            _node("d", "Echo", value="y"),
+        ],
+        "edges": [_edge("a", "b"), _edge("b", "c")],
+    }
+    run_id = checkpoints.create_run(workflow)
+    executor = WorkflowExecutor(checkpoints=checkpoints, registry=REGISTRY)
+
+    first = executor.execute(workflow, run_id)
+    assert first["b"] == {"_error": "provider down"}
+    assert "_errors" in first["c"]
+    assert checkpoints.finish_run(run_id) == "failed"
+
+    Flaky.healthy = True
+    executed.clear()
+    assert checkpoints.restart_run(run_id, stale_after=60)
+    resumed = executor.resume(run_id)
+
+    assert sorted(executor.restored) == ["a", "d"]
+    assert executed == ["x!"]
+    assert resumed == {
+        "a": {"value": "x"},
+        "b": {"value": "x!"},
+        "c": {"value": "x!"},
+        "d": {"value": "y"},
+    }
+    assert checkpoints.finish_run(run_id) == "completed"
+
+
+def test_resume_needs_a_known_run(tmp_path: Path) -> None:
+    executor = WorkflowExecutor(
+        checkpoints=CheckpointStore(tmp_path / "runs.sqlite3"), registry=REGISTRY
+    )
+    with pytest.raises(KeyError):
+        executor.resume("run_missing")
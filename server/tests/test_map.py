@@ -0,0 +1,119 @@
+"""Tests for the Map node's fan-out, collection and on_error modes."""
+
+from __future__ import annotations
+
+import re
+from typing import Any
+
+import pytest
+
+from app.engine.executor import WorkflowExecutor
+from app.nodes.base import BaseNode, NodeInput, NodeOutput
+from app.nodes.flow import Map
+
+
+class Square(BaseNode):
+    """Squares a number; fails on negative ones."""
+
+    inputs = {"value": NodeInput(type="int")}
+    outputs = {"value": NodeOutput(type="int")}
+
+    def execute(self, value: int, **kwargs: Any) -> dict[str, Any]:
+        if value < 0:
+            raise ValueError(f"negative: {value}")
+        return {"value": value * value}
+
+
+REGISTRY: dict[str, type[BaseNode]] = {"Map": Map, "Square": Square}
+SQUARE = {"nodes": [{"id": "sq", "type": "Square", "data": {}}], "edges": []}
+
+
+class Workflows:
+    """A WorkflowSource over a dict."""
+
+    def __init__(self, graphs: dict[str, dict[str, Any]]) -> None:
+        self.graphs = graphs
+
+    def get(self, workflow_id: str) -> dict[str, Any] | None:
+        return self.graphs.get(workflow_id)
+
+
+def _run_map(items: list[Any], **data: Any) -> dict[str, Any]:
+    data = {"workflow": SQUARE, "item_input": "sq.value", "output": "sq.value", **data}
+    workflow = {
+        "nodes": [{"id": "map", "type": "Map", "data": {"items": items, **data}}],
+        "edges": [],
+    }
+    executor = WorkflowExecutor(
+        registry=REGISTRY, workflows=Workflows({"square": SQUARE})
+    )
+    return executor.execute(workflow)["map"]
+
+
+def test_results_come_back_in_item_order() -> None:
+    items = list(range(20))
+    result = _run_map(items, concurrency=8)
+    assert result == {
+        "results": [i * i for i in items],
+        "errors": [],
+        "succeeded": 20,
+        "failed": 0,
+    }
+
+
+def test_collect_keeps_a_null_for_each_failed_item() -> None:
+    result = _run_map([1, -2, 3, -4], on_error="collect")
+    assert result["results"] == [1, None, 9, None]
+    assert result["errors"] == [
+        {"index": 1, "error": "node sq: negative: -2"},
+        {"index": 3, "error": "node sq: negative: -4"},
+    ]
+    assert (result["succeeded"], result["failed"]) == (2, 2)
+
+
+def test_skip_drops_failed_items() -> None:
+    result = _run_map([1, -2, 3], on_error="skip")
+    assert result["results"] == [1, 9]
+    assert [e["index"] for e in result["errors"]] == [1]
+
+
+def test_fail_fails_the_node() -> None:
+    result = _run_map([1, -2, 3], on_error="fail", concurrency=1)
+    # item 2 may have been stopped by the failure, or finished before it
+    assert re.fullmatch(
+        r"[12] of 3 items failed; item 1: node sq: negative: -2", result["_error"]
+    )
+
+
+def test_saved_sub_workflow_and_sink_outputs() -> None:
+    result = _run_map([2, 3], workflow="square", output=None)
+    assert result["results"] == [{"sq": {"value": 4}}, {"sq": {"value": 9}}]
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [
+        ({"on_error": "ignore"}, "Unknown on_error mode: 'ignore'"),
+        ({"workflow": "missing"}, "Unknown sub-workflow: missing"),
+        ({"item_input": "sq"}, "item_input must look like 'node_id.port'"),
+        ({"output": "other.value"}, "output names unknown sub-workflow node"),
+    ],
+)
+def test_bad_node_data_fails_the_node(data: dict[str, Any], error: str) -> None:
+    assert _run_map([1], **data)["_error"].startswith(error)
+
+
+def test_nesting_is_capped() -> None:
+    workflow = {
+        "nodes": [
+            {
+                "id": "map",
+                "type": "Map",
+                "data": {"items": [1], "workflow": SQUARE, "item_input": "sq.value"},
+            }
+        ],
+        "edges": [],
+    }
+    executor = WorkflowExecutor(registry=REGISTRY, depth=Map.MAX_DEPTH)
+    result = executor.execute(workflow)["map"]
+    assert result == {"_error": f"Map nesting deeper than {Map.MAX_DEPTH} levels"}
@@ -0,0 +1,62 @@
+"""Tests for the metrics registry and the HTTP timing middleware."""
+
+from __future__ import annotations
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.metrics import REGISTRY, MetricsMiddleware, Registry
+
+
+def _routes(histogram) -> set[tuple[str, str, str]]:
+    return set(histogram._children)
+
+
+def test_included_router_routes_are_labelled_with_the_full_template(
+    client: TestClient,
+) -> None:
+    from app.metrics import HTTP_SECONDS
+
+    created = client.post(
+        "/api/workflows/", json={"name": "w", "nodes": [], "edges": []}
+    )
+    client.get(f"/api/workflows/{created.json()['id']}")
+    client.get("/api/runs/nope")
+
+    labels = _routes(HTTP_SECONDS)
+    assert ("GET", "/api/workflows/{workflow_id}", "200") in labels
+    assert ("POST", "/api/workflows/", "200") in labels
+    assert ("GET", "/api/runs/{run_id}", "404") in labels
+    assert not any(route == "/{workflow_id}" for _, route, _ in labels)
+
+
+def test_unmatched_and_mounted_paths() -> None:
+    registry = Registry()
+    histogram = registry.histogram("t_seconds", "test", ("method", "route", "status"))
+    inner = APIRouter()
+
+    @inner.get("/items/{item_id}")
+    def item(item_id: int) -> dict:
+        return {"id": item_id}
+
+    sub = FastAPI()
+    sub.include_router(inner, prefix="/v1")
+    app = FastAPI()
+    app.mount("/sub", sub)
+    app.add_middleware(MetricsMiddleware, histogram=histogram)
+
+    client = TestClient(app)
+    assert client.get("/sub/v1/items/7").status_code == 200
+    client.get("/missing")
+
+    assert _routes(histogram) == {
+        ("GET", "/sub/v1/items/{item_id}", "200"),
+        ("GET", "<unmatched>", "404"),
+    }
+
+
+def test_render_escapes_label_values() -> None:
+    registry = Registry()
+    registry.counter("t_total", "test", ("route",)).labels('a"b\\c').inc()
+    assert 't_total{route="a\\"b\\\\c"} 1' in registry.render()
+    assert "openflow_http_request_duration_seconds" in REGISTRY.render()
@@ -0,0 +1,130 @@
+"""Tests for the workflow store, its cache and the ETag-aware routes."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.data.workflow_store import (
+    CachedWorkflowStore,
+    SQLiteWorkflowStore,
+    WorkflowConflict,
+)
+
+NODES = [{"id": "a", "type": "TextInput", "data": {"text": "A cat"}}]
+
+
+def test_cache_revalidates_against_another_workers_writes(tmp_path: Path) -> None:
+    path = tmp_path / "workflows.sqlite3"
+    mine = CachedWorkflowStore(SQLiteWorkflowStore(path))
+    theirs = CachedWorkflowStore(SQLiteWorkflowStore(path))
+    created = mine.create("flow", NODES, [])
+
+    assert mine.get(created["id"]) is created
+    assert (mine.hits, mine.misses) == (1, 0)
+
+    theirs.update(created["id"], {"name": "renamed"}, expected_version=1)
+    fresh = mine.get(created["id"])
+    assert fresh is not None
+    assert (fresh["name"], fresh["version"]) == ("renamed", 2)
+    assert mine.misses == 1
+    assert mine.get(created["id"]) is fresh
+
+    theirs.delete(created["id"])
+    assert mine.get(created["id"]) is None
+
+
+def test_stale_expected_version_conflicts(store: CachedWorkflowStore) -> None:
+    created = store.create("flow", NODES, [])
+    store.update(created["id"], {"nodes": []}, expected_version=1)
+
+    with pytest.raises(WorkflowConflict) as exc:
+        store.update(created["id"], {"name": "late"}, expected_version=1)
+    assert exc.value.current_version == 2
+    assert store.get(created["id"])["name"] == "flow"
+    assert store.update("missing", {"name": "x"}) is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    store = CachedWorkflowStore(
+        SQLiteWorkflowStore(tmp_path / "workflows.sqlite3"), maxsize=2
+    )
+    first, second, third = (store.create(n, [], []) for n in "abc")
+
+    assert list(store._cache) == [second["id"], third["id"]]
+    store.get(second["id"])
+    store.get(first["id"])
+    assert list(store._cache) == [second["id"], first["id"]]
+
+
+def test_list_pages_with_a_cursor(client: TestClient) -> None:
+    ids = {
+        client.post(
+            "/api/workflows/", json={"name": n, "nodes": NODES, "edges": []}
+        ).json()["id"]
+        for n in "abcde"
+    }
+    seen: list[str] = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/workflows/", params=params)
+        page = response.json()
+        assert all(s["node_count"] == 1 and "nodes" not in s for s in page)
+        seen += [s["id"] for s in page]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert len(seen) == 5 and set(seen) == ids
+    assert client.get("/api/workflows/", params={"cursor": "!"}).status_code == 400
+
+
+def test_etag_and_if_none_match(client: TestClient) -> None:
+    created = client.post(
+        "/api/workflows/", json={"name": "flow", "nodes": NODES, "edges": []}
+    )
+    wf_id = created.json()["id"]
+    etag = created.headers["ETag"]
+    assert etag == f'"{wf_id}.1"'
+
+    cached = client.get(f"/api/workflows/{wf_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    other = client.get(
+        f"/api/workflows/{wf_id}", headers={"If-None-Match": f'"x", W/"{wf_id}.0"'}
+    )
+    assert other.status_code == 200
+    assert other.headers["ETag"] == etag
+
+
+def test_if_match_rejects_stale_and_foreign_versions(client: TestClient) -> None:
+    wf_id = client.post(
+        "/api/workflows/", json={"name": "flow", "nodes": NODES, "edges": []}
+    ).json()["id"]
+    url = f"/api/workflows/{wf_id}"
+
+    updated = client.patch(
+        url, json={"name": "v2"}, headers={"If-Match": f'"{wf_id}.1"'}
+    )
+    assert updated.status_code == 200
+    assert updated.headers["ETag"] == f'"{wf_id}.2"'
+
+    stale = client.patch(url, json={"name": "v3"}, headers={"If-Match": f'"{wf_id}.1"'})
+    assert stale.status_code == 412
+    assert stale.headers["ETag"] == f'"{wf_id}.2"'
+
+    foreign = client.patch(url, json={"name": "v3"}, headers={"If-Match": '"other.2"'})
+    assert foreign.status_code == 412
+
+    forced = client.patch(url, json={"name": "v3"}, headers={"If-Match": "*"})
+    assert forced.json()["version"] == 3
+    assert client.get(url).json()["name"] == "v3"
+
+
+def test_missing_workflow(client: TestClient) -> None:
+    assert client.get("/api/workflows/nope").status_code == 404
+    assert client.patch("/api/workflows/nope", json={"name": "x"}).status_code == 404
+    assert client.delete("/api/workflows/nope").status_code == 404
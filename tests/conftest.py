@@ -0,0 +1,88 @@
+"""Fixtures for the single-file apps (backend/main.py and api/index.py).
+
+Neither app is a package, so each is imported from its file under a
+private module name, with its database in a throwaway directory. Small
+snapshot intervals make revision history exercise snapshot + delta replay.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import os
+import sys
+import tempfile
+from pathlib import Path
+from types import ModuleType
+from typing import Iterator
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+_DATA = Path(tempfile.mkdtemp(prefix="openflow-apps-"))
+
+ENV = {
+    "WORKFLOW_SNAPSHOT_EVERY": "3",
+    "KDF_EXECUTOR": "thread",
+    "PBKDF2_ITERATIONS": "1000",
+    "JOB_POLLER": "0",
+}
+
+
+def _load(name: str, path: Path, database: str) -> ModuleType:
+    saved = dict(os.environ)
+    os.environ.update(ENV, DATABASE_URL=f"sqlite:///{_DATA / database}")
+    cwd = os.getcwd()
+    os.chdir(_DATA)
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        assert spec is not None and spec.loader is not None
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(saved)
+    return module
+
+
+@pytest.fixture(scope="session")
+def backend() -> ModuleType:
+    """backend/main.py."""
+    return _load("openflow_backend_main", ROOT / "backend" / "main.py", "backend.db")
+
+
+@pytest.fixture(scope="session")
+def api() -> ModuleType:
+    """api/index.py."""
+    return _load("openflow_api_index", ROOT / "api" / "index.py", "api.db")
+
+
+@pytest.fixture
+def backend_client(backend: ModuleType) -> Iterator[TestClient]:
+    """A client signed in to backend/main.py as a fresh user."""
+    with TestClient(backend.app) as client:
+        email = f"user{os.urandom(4).hex()}@example.com"
+        token = client.post(
+            "/auth/signup", json={"email": email, "password": "test-pass"}
+        ).json()["token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+        yield client
+
+
+@pytest.fixture
+def api_client(api: ModuleType) -> Iterator[TestClient]:
+    """A client signed in to api/index.py as a fresh user."""
+    with TestClient(api.app) as client:
+        name = f"user{os.urandom(4).hex()}"
+        token = client.post(
+            "/api/auth/signup",
+            json={
+                "email": f"{name}@example.com",
+                "username": name,
+                "password": "test-pass",
+            },
+        ).json()["token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+        yield client
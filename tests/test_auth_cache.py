@@ -0,0 +1,189 @@
+"""The verified-token and user-row cache in both single-file apps.
+
+Authenticated requests skip signature checks and the users lookup while
+both are cached, but a changed user row must be re-read, and a token
+must stop working at its `exp` even if it is still cached.
+"""
+
+from __future__ import annotations
+
+import time
+from types import ModuleType
+from typing import Any, Iterator, NamedTuple
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+
+class App(NamedTuple):
+    module: ModuleType
+    client: TestClient
+    authed_url: str
+    user_model: Any
+    project_model: Any
+    session_factory: Any
+    set_password_hash: Any
+
+
+@pytest.fixture(params=["backend", "api"])
+def app(request: pytest.FixtureRequest) -> App:
+    module: ModuleType = request.getfixturevalue(request.param)
+    if request.param == "backend":
+        return App(
+            module,
+            request.getfixturevalue("backend_client"),
+            "/projects",
+            module.User,
+            module.Project,
+            module.SessionLocal,
+            module._set_password_hash,
+        )
+    return App(
+        module,
+        request.getfixturevalue("api_client"),
+        "/api/projects",
+        module.UserModel,
+        module.ProjectModel,
+        module._Session,
+        module.set_password_hash,
+    )
+
+
+@pytest.fixture(params=["backend", "api"])
+def cache_class(request: pytest.FixtureRequest) -> Any:
+    module: ModuleType = request.getfixturevalue(request.param)
+    return module._TTLCache if request.param == "backend" else module.TTLCache
+
+
+def _token(app: App) -> str:
+    return str(app.client.headers["Authorization"])[len("Bearer ") :]
+
+
+def _user_id(app: App) -> Any:
+    return app.module._token_cache.get(_token(app))["sub"]
+
+
+@pytest.fixture
+def user_selects(app: App) -> Iterator[list[str]]:
+    """SELECTs against the users table issued while the test runs."""
+    statements: list[str] = []
+
+    def record(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        if statement.lstrip().upper().startswith("SELECT") and "users" in statement:
+            statements.append(statement)
+
+    event.listen(app.module.engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(app.module.engine, "before_cursor_execute", record)
+
+
+def test_ttl_cache_evicts_least_recently_used(cache_class: Any) -> None:
+    cache = cache_class(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.set("c", 3)
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    cache.pop("a")
+    cache.pop("missing")
+    assert cache.get("a") is None
+    cache.clear()
+    assert cache.get("c") is None
+
+
+def test_ttl_cache_expires_entries(cache_class: Any) -> None:
+    cache = cache_class(maxsize=8, ttl=0.05)
+    cache.set("capped", 1, ttl=3600)  # never outlives the cache's own ttl
+    cache.set("short", 2, ttl=0.01)
+    cache.set("expired", 3, ttl=-1)
+    assert cache.get("expired") is None
+    time.sleep(0.02)
+    assert (cache.get("capped"), cache.get("short")) == (1, None)
+    time.sleep(0.05)
+    assert cache.get("capped") is None
+
+    disabled = cache_class(maxsize=8, ttl=0)
+    disabled.set("a", 1)
+    assert disabled.get("a") is None
+
+
+def test_repeat_requests_are_served_from_the_cache(
+    app: App, user_selects: list[str]
+) -> None:
+    assert app.client.get(app.authed_url).status_code == 200
+    assert app.module._user_cache.get(_user_id(app)) is not None
+    user_selects.clear()
+
+    for _ in range(3):
+        assert app.client.get(app.authed_url).status_code == 200
+    assert user_selects == []
+
+
+def test_orm_update_and_delete_invalidate_the_cached_user(
+    app: App, user_selects: list[str]
+) -> None:
+    assert app.client.get(app.authed_url).status_code == 200
+    user_id = _user_id(app)
+
+    with app.session_factory() as db:
+        user = db.get(app.user_model, user_id)
+        user.email = f"renamed-{user_id}@example.com"
+        db.commit()
+    assert app.module._user_cache.get(user_id) is None
+    user_selects.clear()
+    assert app.client.get(app.authed_url).status_code == 200
+    assert len(user_selects) == 1
+    assert app.module._user_cache.get(user_id).email.startswith("renamed-")
+
+    with app.session_factory() as db:
+        projects = db.query(app.project_model)
+        projects.filter(app.project_model.user_id == user_id).delete()
+        db.delete(db.get(app.user_model, user_id))
+        db.commit()
+    assert app.client.get(app.authed_url).status_code == 401
+
+
+def test_bulk_password_update_invalidates_the_cached_user(app: App) -> None:
+    assert app.client.get(app.authed_url).status_code == 200
+    user_id = _user_id(app)
+
+    with app.session_factory() as db:
+        app.set_password_hash(db, user_id, "rehashed")
+    assert app.module._user_cache.get(user_id) is None
+    assert app.client.get(app.authed_url).status_code == 200
+    assert app.module._user_cache.get(user_id).password_hash == "rehashed"
+
+
+def test_cached_token_still_expires(app: App, monkeypatch: pytest.MonkeyPatch) -> None:
+    assert app.client.get(app.authed_url).status_code == 200
+    token = _token(app)
+    exp = app.module._token_cache.get(token)["exp"]
+    real_time = time.time
+
+    monkeypatch.setattr(time, "time", lambda: real_time() + 73 * 3600)
+    assert exp < time.time()
+    response = app.client.get(app.authed_url)
+    assert response.status_code == 401
+    assert "xpired" in response.json()["detail"]
+    assert app.module._token_cache.get(token) is None
+
+
+@pytest.mark.parametrize("mangle", ["signature", "payload", "garbage"])
+def test_tampered_tokens_are_rejected_and_not_cached(app: App, mangle: str) -> None:
+    header, payload, signature = _token(app).split(".")
+    bad = {
+        "signature": f"{header}.{payload}.{signature[::-1]}",
+        "payload": f"{header}.{payload[:-2]}AA.{signature}",
+        "garbage": "not-a-token",
+    }[mangle]
+
+    response = app.client.get(
+        app.authed_url, headers={"Authorization": f"Bearer {bad}"}
+    )
+    assert response.status_code == 401
+    assert app.module._token_cache.get(bad) is None
+    assert (
+        app.client.get(app.authed_url, headers={"Authorization": ""}).status_code == 401
+    )
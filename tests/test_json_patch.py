@@ -0,0 +1,268 @@
+"""JSON Patch (RFC 6902) and revision replay in both single-file apps.
+
+Autosaves store patches as deltas between snapshots, and every revision
+read replays them, so a patch both apps accept must apply the same way
+in both, and an invalid one must be rejected before it is stored.
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+from types import ModuleType
+from typing import Any, Callable
+
+import pytest
+from fastapi.testclient import TestClient
+
+Patch = Callable[[Any, list], Any]
+
+
+@pytest.fixture(params=["backend", "api"])
+def apply_patch(request: pytest.FixtureRequest) -> Patch:
+    module: ModuleType = request.getfixturevalue(request.param)
+    fn = (
+        module._apply_json_patch
+        if request.param == "backend"
+        else module.apply_json_patch
+    )
+    return lambda doc, ops: fn(copy.deepcopy(doc), ops)
+
+
+# RFC 6902 appendix A, plus pointer escaping
+VALID = [
+    (
+        {"foo": "bar"},
+        [{"op": "add", "path": "/baz", "value": "qux"}],
+        {"foo": "bar", "baz": "qux"},
+    ),
+    (
+        {"foo": ["bar", "baz"]},
+        [{"op": "add", "path": "/foo/1", "value": "qux"}],
+        {"foo": ["bar", "qux", "baz"]},
+    ),
+    (
+        {"foo": ["bar"]},
+        [{"op": "add", "path": "/foo/1", "value": "qux"}],
+        {"foo": ["bar", "qux"]},
+    ),
+    (
+        {"foo": ["bar"]},
+        [{"op": "add", "path": "/foo/-", "value": ["abc"]}],
+        {"foo": ["bar", ["abc"]]},
+    ),
+    ({"baz": "qux", "foo": "bar"}, [{"op": "remove", "path": "/baz"}], {"foo": "bar"}),
+    (
+        {"foo": ["bar", "qux", "baz"]},
+        [{"op": "remove", "path": "/foo/1"}],
+        {"foo": ["bar", "baz"]},
+    ),
+    (
+        {"baz": "qux"},
+        [{"op": "replace", "path": "/baz", "value": "boo"}],
+        {"baz": "boo"},
+    ),
+    ({"a": [1, 2]}, [{"op": "replace", "path": "/a/0", "value": 9}], {"a": [9, 2]}),
+    (
+        {"foo": {"bar": "baz", "waldo": "fred"}, "qux": {"corge": "grault"}},
+        [{"op": "move", "from": "/foo/waldo", "path": "/qux/thud"}],
+        {"foo": {"bar": "baz"}, "qux": {"corge": "grault", "thud": "fred"}},
+    ),
+    (
+        {"foo": ["all", "grass", "cows", "eat"]},
+        [{"op": "move", "from": "/foo/1", "path": "/foo/3"}],
+        {"foo": ["all", "cows", "eat", "grass"]},
+    ),
+    (
+        {"a": {"b": 1}},
+        [{"op": "copy", "from": "/a", "path": "/c"}],
+        {"a": {"b": 1}, "c": {"b": 1}},
+    ),
+    (
+        {"baz": "qux", "foo": ["a", 2, "c"]},
+        [
+            {"op": "test", "path": "/baz", "value": "qux"},
+            {"op": "test", "path": "/foo/1", "value": 2},
+        ],
+        {"baz": "qux", "foo": ["a", 2, "c"]},
+    ),
+    (
+        {"/": 1, "~": 2},
+        [{"op": "replace", "path": "/~1", "value": 3}, {"op": "remove", "path": "/~0"}],
+        {"/": 3},
+    ),
+    ({"a": 1}, [{"op": "replace", "path": "", "value": [1]}], [1]),
+    ({"n": 1}, [{"op": "test", "path": "/n", "value": 1.0}], {"n": 1}),
+    (
+        {"o": {"x": 1, "y": [True]}},
+        [{"op": "test", "path": "/o", "value": {"y": [True], "x": 1}}],
+        {"o": {"x": 1, "y": [True]}},
+    ),
+]
+
+INVALID = [
+    ({"foo": "bar"}, [{"op": "test", "path": "/baz", "value": "qux"}]),
+    ({"foo": "bar"}, [{"op": "remove", "path": "/baz"}]),
+    ({"foo": "bar"}, [{"op": "replace", "path": "/baz", "value": 1}]),
+    ({"foo": "bar"}, [{"op": "add", "path": "/baz/bat", "value": "qux"}]),
+    ({"foo": "bar"}, [{"op": "add", "path": "baz", "value": "qux"}]),
+    ({"foo": "bar"}, [{"op": "frobnicate", "path": "/foo"}]),
+    ({"foo": "bar"}, [{"op": "remove", "path": ""}]),
+    ({"a": [1, 2]}, [{"op": "add", "path": "/a/3", "value": 0}]),
+    ({"a": [1, 2]}, [{"op": "add", "path": "/a/-1", "value": 0}]),
+    ({"a": [1, 2]}, [{"op": "add", "path": "/a/01", "value": 0}]),
+    ({"a": [1, 2]}, [{"op": "add", "path": "/a/+1", "value": 0}]),
+    ({"a": [1, 2]}, [{"op": "add", "path": "/a/ 1", "value": 0}]),
+    ({"a": [1, 2]}, [{"op": "remove", "path": "/a/2"}]),
+    ({"a": [1, 2]}, [{"op": "remove", "path": "/a/-"}]),
+    ({"a": [1, 2]}, [{"op": "remove", "path": "/a/-1"}]),
+    ({"a": [1, 2]}, [{"op": "replace", "path": "/a/-", "value": 0}]),
+    ({"a": [1, 2]}, [{"op": "replace", "path": "/a/00", "value": 0}]),
+    ({"a": [1, 2]}, [{"op": "test", "path": "/a/-", "value": 2}]),
+    ({"a": [1, 2]}, [{"op": "move", "from": "/a/-1", "path": "/b"}]),
+    ({"flag": True}, [{"op": "test", "path": "/flag", "value": 1}]),
+    ({"n": 0}, [{"op": "test", "path": "/n", "value": False}]),
+    ({"s": "1"}, [{"op": "test", "path": "/s", "value": 1}]),
+    ({"l": [1, True]}, [{"op": "test", "path": "/l", "value": [1, 1]}]),
+    ({"o": {"x": 1}}, [{"op": "test", "path": "/o", "value": {"x": 1, "y": None}}]),
+]
+
+
+@pytest.mark.parametrize("doc, ops, expected", VALID)
+def test_valid_patches_apply(
+    apply_patch: Patch, doc: Any, ops: list, expected: Any
+) -> None:
+    assert apply_patch(doc, ops) == expected
+
+
+@pytest.mark.parametrize("doc, ops", INVALID)
+def test_invalid_patches_raise_value_error(
+    apply_patch: Patch, doc: Any, ops: list
+) -> None:
+    with pytest.raises(ValueError):
+        apply_patch(doc, ops)
+
+
+def test_patch_values_are_copied(apply_patch: Patch) -> None:
+    value = {"nested": [1]}
+    doc = apply_patch(
+        {},
+        [
+            {"op": "add", "path": "/a", "value": value},
+            {"op": "copy", "from": "/a", "path": "/b"},
+        ],
+    )
+    doc["a"]["nested"].append(2)
+    assert value == {"nested": [1]}
+    assert doc["b"] == {"nested": [1]}
+
+
+def _edits() -> list[list[dict[str, Any]]]:
+    """Autosave patches that grow and rearrange a canvas."""
+    edits: list[list[dict[str, Any]]] = []
+    for i in range(8):
+        edits.append(
+            [
+                {
+                    "op": "add",
+                    "path": "/nodes/-",
+                    "value": {"id": f"n{i}", "position": {"x": i * 10, "y": 0}},
+                }
+            ]
+        )
+        if i % 3 == 2:
+            edits.append(
+                [
+                    {"op": "test", "path": f"/nodes/{i}/id", "value": f"n{i}"},
+                    {
+                        "op": "replace",
+                        "path": f"/nodes/{i}/position/x",
+                        "value": i * 10.5,
+                    },
+                    {"op": "move", "from": "/nodes/0", "path": "/nodes/-"},
+                ]
+            )
+    return edits
+
+
+def _replay(
+    client: TestClient,
+    patch_url: str,
+    revision_url: Callable[[int], str],
+    read: Callable[[dict[str, Any]], Any],
+    start: dict[str, Any],
+) -> None:
+    """Autosave every edit, then read every revision back and check it."""
+    history = [copy.deepcopy(start)]
+    for revision, ops in enumerate(_edits()):
+        response = client.patch(
+            patch_url, json={"base_revision": revision, "patch": ops}
+        )
+        assert response.status_code == 200, response.text
+        assert response.json()["revision"] == revision + 1
+        history.append(json.loads(json.dumps(history[-1])))
+        for op in ops:  # tracked independently of the apps' patch code
+            if op["op"] == "add":
+                history[-1]["nodes"].append(op["value"])
+            elif op["op"] == "replace":
+                index = int(op["path"].split("/")[2])
+                history[-1]["nodes"][index]["position"]["x"] = op["value"]
+            elif op["op"] == "move":
+                history[-1]["nodes"].append(history[-1]["nodes"].pop(0))
+
+    for revision, expected in enumerate(history):
+        response = client.get(revision_url(revision))
+        assert response.status_code == 200, response.text
+        assert read(response.json()) == expected, f"revision {revision}"
+    assert client.get(revision_url(len(history))).status_code == 404
+
+    stale = client.patch(patch_url, json={"base_revision": 0, "patch": []})
+    assert stale.status_code == 409
+    bad = client.patch(
+        patch_url,
+        json={
+            "base_revision": len(history) - 1,
+            "patch": [{"op": "remove", "path": "/nodes/-"}],
+        },
+    )
+    assert bad.status_code == 422
+    assert client.get(revision_url(len(history))).status_code == 404
+
+
+def test_backend_replays_every_revision(
+    backend: ModuleType, backend_client: TestClient
+) -> None:
+    start = {"nodes": [], "edges": []}
+    project = backend_client.post(
+        "/projects", json={"name": "p", "workflow_json": json.dumps(start)}
+    ).json()
+
+    _replay(
+        backend_client,
+        f"/projects/{project['id']}/workflow",
+        lambda rev: f"/projects/{project['id']}/revisions/{rev}",
+        lambda body: json.loads(body["workflow_json"]),
+        start,
+    )
+    revisions = backend_client.get(f"/projects/{project['id']}/revisions").json()
+    assert backend.SNAPSHOT_EVERY == 3
+    assert {r["kind"] for r in revisions} == {"snapshot", "delta"}
+
+
+def test_api_replays_every_revision(api: ModuleType, api_client: TestClient) -> None:
+    start = {"nodes": [], "edges": []}
+    project = api_client.post("/api/projects", json={"name": "p"}).json()
+    workflow = api_client.post(
+        f"/api/projects/{project['id']}/workflows", json={"name": "w", "data": start}
+    ).json()
+
+    _replay(
+        api_client,
+        f"/api/workflows/{workflow['id']}",
+        lambda rev: f"/api/workflows/{workflow['id']}/revisions/{rev}",
+        lambda body: body["data"],
+        start,
+    )
+    revisions = api_client.get(f"/api/workflows/{workflow['id']}/revisions").json()
+    assert api.SNAPSHOT_EVERY == 3
+    assert {r["kind"] for r in revisions} == {"snapshot", "delta"}
@@ -0,0 +1,165 @@
+"""Round trips of the compact workflow encoding shared by both apps.
+
+backend/main.py and api/index.py each carry a copy of the codec, and
+either may read what the other wrote, so the two must produce the same
+bytes for every document.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import random
+from types import ModuleType
+from typing import Any, Callable
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+def canvas(n: int, seed: int = 0) -> dict[str, Any]:
+    """An n-node React Flow canvas, some nodes dragged to fractional positions."""
+    rng = random.Random(seed)
+    nodes, edges = [], []
+    for i in range(n):
+        x, y = 100 + 400 * (i % 5), 150 + 300 * (i // 5)
+        if rng.random() < 0.2:
+            x = round(x + rng.uniform(-50, 50), 2)
+            y = round(y + rng.uniform(-50, 50), 2)
+        nodes.append(
+            {
+                "id": f"node_{i}",
+                "type": "flowNode",
+                "position": {"x": x, "y": y},
+                "defId": rng.choice(["text.input", "image.text_to_image"]),
+                "values": {"prompt": f"shot {rng.randint(0, 9)}", "steps": 28},
+            }
+        )
+        if i:
+            edges.append(
+                {
+                    "id": f"edge_{i}",
+                    "source": f"node_{i - 1}",
+                    "sourceHandle": "out",
+                    "target": f"node_{i}",
+                    "targetHandle": "in",
+                    "animated": False,
+                    "style": {"stroke": "#d1d5db", "strokeWidth": 1.5},
+                }
+            )
+    return {"nodes": nodes, "edges": edges}
+
+
+DOCUMENTS: list[Any] = [
+    {},
+    [],
+    None,
+    {"nodes": [], "edges": []},
+    canvas(1),
+    canvas(60, seed=3),
+    {
+        "ints": [0, 1, 127, 128, -1, -32, -33, 2**31, -(2**53), 2**63 - 1],
+        "floats": [0.5, -2.25, 1e-300, 1.7976931348623157e308, 0.1, 3.0],
+        "bools": [True, False, None],
+        "text": ["", "é", "日本語", "emoji 🦊", "\ud800", "x" * 64, "y" * 65],
+        "nested": {"a": [{"b": [[]]}, {}], "a2": {"c": {"d": "a"}}},
+        "position": {"x": 1, "y": 2.5, "z": 3},
+        "not_position": {"y": 2, "x": 1},
+    },
+    {str(i): i for i in range(40)},
+    ["same string"] * 40,
+]
+
+
+@pytest.fixture
+def codecs(
+    backend: ModuleType, api: ModuleType
+) -> list[tuple[Callable[[Any], bytes], Callable[[bytes], Any]]]:
+    return [
+        (backend._encode_workflow, backend._decode_workflow),
+        (api.encode_workflow, api.decode_workflow),
+    ]
+
+
+def _same_json(a: Any, b: Any) -> bool:
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+
+@pytest.mark.parametrize("doc", DOCUMENTS)
+def test_both_copies_encode_byte_identically_and_round_trip(
+    backend: ModuleType, api: ModuleType, doc: Any
+) -> None:
+    blob = backend._encode_workflow(doc)
+    assert api.encode_workflow(doc) == blob
+    for decode in (backend._decode_workflow, api.decode_workflow):
+        decoded = decode(blob)
+        assert decoded == doc
+        assert _same_json(decoded, doc)  # types too: 3.0 stays a float, 1 an int
+
+
+def test_large_canvas_is_compact(backend: ModuleType) -> None:
+    doc = canvas(500)
+    blob = backend._encode_workflow(doc)
+    assert len(json.dumps(doc, separators=(",", ":"))) / len(blob) > 10
+
+
+@pytest.mark.parametrize(
+    "mangle",
+    [
+        lambda blob: b"",
+        lambda blob: b"{" + blob[1:],
+        lambda blob: blob[:1] + b"\x09" + blob[2:],
+        lambda blob: blob[:2] + b"\x07" + blob[3:],
+        lambda blob: blob[:-4],
+        lambda blob: blob[:2] + b"\x00" + b"\xc8\x05\x01",
+        lambda blob: blob[:2] + b"\x00" + b"\x80\x00",
+        lambda blob: blob[:2] + b"\x00" + b"\x81\x01\x01",
+        lambda blob: blob[:2] + b"\x00" + b"\xc1",
+    ],
+    ids=[
+        "empty",
+        "magic",
+        "version",
+        "compression",
+        "truncated",
+        "short-array",
+        "trailing",
+        "non-string-key",
+        "unknown-tag",
+    ],
+)
+def test_malformed_input_raises_value_error_in_both(
+    codecs: list[tuple[Callable[[Any], bytes], Callable[[bytes], Any]]],
+    mangle: Callable[[bytes], bytes],
+) -> None:
+    for encode, decode in codecs:
+        with pytest.raises(ValueError):
+            decode(mangle(encode(canvas(20))))
+
+
+def test_decompression_is_capped(backend: ModuleType, api: ModuleType) -> None:
+    bomb = backend._encode_workflow(["a" * 1000] * (backend.WF_MAX_BYTES // 1000 + 1))
+    with pytest.raises(ValueError, match="too large"):
+        backend._decode_workflow(bomb)
+    with pytest.raises(ValueError, match="too large"):
+        api.decode_workflow(bomb)
+
+
+def test_share_links_round_trip_across_apps(
+    backend_client: TestClient, api_client: TestClient
+) -> None:
+    doc = canvas(10)
+    encoded = backend_client.post("/workflows/encode", json={"data": doc}).json()
+    assert (
+        api_client.post("/api/workflows/encode", json={"data": doc}).json() == encoded
+    )
+    decoded = api_client.post(
+        "/api/workflows/decode", json={"encoded": encoded["encoded"]}
+    )
+    assert decoded.json() == {"data": doc}
+
+    garbage = base64.urlsafe_b64encode(b"\xcf\x01\x00\xc1").decode()
+    assert (
+        backend_client.post("/workflows/decode", json={"encoded": garbage}).status_code
+        == 422
+    )
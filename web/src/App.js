@@ -1576,15 +1576,16 @@ export default function App() {
     }, []);
     // Workflow sharing: check URL hash on load
     useEffect(() => {
-        const wf = decodeWorkflowFromHash();
-        if (wf && wf.nodes) {
-            if (confirm("A shared workflow was found in the URL. Import it?")) {
-                loadProject(JSON.stringify(wf));
-                setShowLanding(false);
-                setCurrentView("canvas");
-                addToast("Workflow imported from shared link!", "success");
+        decodeWorkflowFromHash(BACKEND_URL).then(wf => {
+            if (wf && wf.nodes) {
+                if (confirm("A shared workflow was found in the URL. Import it?")) {
+                    loadProject(JSON.stringify(wf));
+                    setShowLanding(false);
+                    setCurrentView("canvas");
+                    addToast("Workflow imported from shared link!", "success");
+                }
             }
-        }
+        });
     }, []);
     const onDragStart = (e, def) => {
         e.dataTransfer.setData("application/openflow-node", JSON.stringify(def));
@@ -1673,6 +1674,16 @@ export default function App() {
         }
         catch { }
     }, [authToken]);
+    const openProject = async (id) => {
+        try {
+            const res = await fetch(`${BACKEND_URL}/projects/${id}`, { headers: apiHeaders() });
+            if (res.ok) {
+                loadProject((await res.json()).workflow_json);
+                setCurrentView("canvas");
+            }
+        }
+        catch { }
+    };
     const handleAuth = async (mode) => {
         try {
             const res = await fetch(`${BACKEND_URL}/auth/${mode}`, {
@@ -1866,7 +1877,7 @@ export default function App() {
                             setActivePanel(null);
                             setCurrentView("canvas");
                         }
-                    } })) : activePanel === "workflows" ? (_jsx(WorkflowTemplatesPanel, { onLoadPipeline: (pipeline) => { loadTemplate(pipeline); setActivePanel(null); } })) : activePanel === "assets" ? (_jsx(AssetManagerPanel, { assets: assets })) : activePanel === "chat" ? (_jsx(ChatPanel, {})) : activePanel === "scenes" ? (_jsxs("div", { style: { padding: 20 }, children: [_jsx("div", { style: { fontSize: 13, fontWeight: 600, color: "#1a1a1a", marginBottom: 16 }, children: "\uD83C\uDFAC Scene Builder" }), _jsx("div", { style: { fontSize: 10, fontWeight: 600, color: "#9ca3af", textTransform: "uppercase", letterSpacing: "0.8px", marginBottom: 6 }, children: "Describe your story" }), _jsx("textarea", { value: sceneStory, onChange: (e) => setSceneStory(e.target.value), placeholder: "A knight rides through a misty forest, discovers a glowing crystal cave, and meets an ancient dragon...", rows: 6, style: { width: "100%", background: "#f5f5f7", border: "none", borderRadius: 10, color: "#1a1a1a", fontSize: 12, padding: "10px 12px", resize: "vertical", outline: "none", fontFamily: "inherit", lineHeight: 1.5, boxSizing: "border-box" } }), _jsx("button", { onClick: generateScenes, disabled: sceneLoading || !sceneStory.trim(), style: { width: "100%", marginTop: 10, padding: "10px", background: sceneLoading ? "#e5e7eb" : "#c026d3", color: sceneLoading ? "#9ca3af" : "#fff", border: "none", borderRadius: 10, fontSize: 12, fontWeight: 600, cursor: sceneLoading ? "not-allowed" : "pointer" }, children: sceneLoading ? "Generating..." : "Generate Scenes ✦" }), _jsx("div", { style: { fontSize: 10, color: "#9ca3af", marginTop: 8 }, children: "Splits your story into 3-5 scenes as connected image nodes." })] })) : activePanel === "projects" ? (_jsxs("div", { style: { padding: 20 }, children: [_jsx("div", { style: { fontSize: 13, fontWeight: 600, color: "#1a1a1a", marginBottom: 16 }, children: "\uD83D\uDCC1 Projects" }), !authToken ? (_jsxs("div", { children: [_jsx("div", { style: { fontSize: 10, fontWeight: 600, color: "#9ca3af", marginBottom: 6 }, children: "LOGIN / SIGNUP" }), _jsx("input", { placeholder: "Email", value: authEmail, onChange: e => setAuthEmail(e.target.value), style: { width: "100%", background: "#f5f5f7", border: "none", borderRadius: 8, fontSize: 12, padding: "8px 12px", outline: "none", marginBottom: 6, boxSizing: "border-box" } }), _jsx("input", { placeholder: "Password", type: "password", value: authPass, onChange: e => setAuthPass(e.target.value), style: { width: "100%", background: "#f5f5f7", border: "none", borderRadius: 8, fontSize: 12, padding: "8px 12px", outline: "none", marginBottom: 8, boxSizing: "border-box" } }), _jsxs("div", { style: { display: "flex", gap: 6 }, children: [_jsx("button", { onClick: () => handleAuth("login"), style: { flex: 1, padding: "8px", background: "#c026d3", color: "#fff", border: "none", borderRadius: 8, fontSize: 11, fontWeight: 600, cursor: "pointer" }, children: "Login" }), _jsx("button", { onClick: () => handleAuth("signup"), style: { flex: 1, padding: "8px", background: "#f5f5f7", color: "#1a1a1a", border: "1px solid #ebebee", borderRadius: 8, fontSize: 11, fontWeight: 600, cursor: "pointer" }, children: "Sign Up" })] })] })) : (_jsxs("div", { children: [_jsxs("div", { style: { display: "flex", gap: 6, marginBottom: 12 }, children: [_jsx("input", { placeholder: "Project name", value: projectName, onChange: e => setProjectName(e.target.value), style: { flex: 1, background: "#f5f5f7", border: "none", borderRadius: 8, fontSize: 12, padding: "8px 12px", outline: "none" } }), _jsx("button", { onClick: saveProject, style: { padding: "8px 12px", background: "#c026d3", color: "#fff", border: "none", borderRadius: 8, fontSize: 11, fontWeight: 600, cursor: "pointer" }, children: "Save" })] }), _jsx("div", { style: { fontSize: 10, fontWeight: 600, color: "#9ca3af", marginBottom: 8 }, children: "SAVED PROJECTS" }), projectsList.length === 0 && _jsx("div", { style: { fontSize: 11, color: "#9ca3af" }, children: "No projects yet" }), projectsList.map(p => (_jsxs("div", { onClick: () => { loadProject(p.workflow_json); setCurrentView("canvas"); }, style: { padding: "8px 10px", background: "#f5f5f7", borderRadius: 8, marginBottom: 4, cursor: "pointer", fontSize: 12, fontWeight: 500, color: "#1a1a1a" }, onMouseOver: e => { e.currentTarget.style.background = "#e8e8eb"; }, onMouseOut: e => { e.currentTarget.style.background = "#f5f5f7"; }, children: [p.name, _jsx("div", { style: { fontSize: 9, color: "#9ca3af", marginTop: 2 }, children: p.updated_at?.slice(0, 16) }), _jsx(WorkflowStatsInline, { name: p.name })] }, p.id))), _jsx("button", { onClick: () => { setAuthToken(""); localStorage.removeItem("openflow_token"); }, style: { marginTop: 12, padding: "6px", background: "transparent", border: "none", fontSize: 10, color: "#9ca3af", cursor: "pointer" }, children: "Logout" })] }))] })) : activePanel === "history" ? (_jsx(HistoryPanel, { onRerun: (record) => {
+                    } })) : activePanel === "workflows" ? (_jsx(WorkflowTemplatesPanel, { onLoadPipeline: (pipeline) => { loadTemplate(pipeline); setActivePanel(null); } })) : activePanel === "assets" ? (_jsx(AssetManagerPanel, { assets: assets })) : activePanel === "chat" ? (_jsx(ChatPanel, {})) : activePanel === "scenes" ? (_jsxs("div", { style: { padding: 20 }, children: [_jsx("div", { style: { fontSize: 13, fontWeight: 600, color: "#1a1a1a", marginBottom: 16 }, children: "\uD83C\uDFAC Scene Builder" }), _jsx("div", { style: { fontSize: 10, fontWeight: 600, color: "#9ca3af", textTransform: "uppercase", letterSpacing: "0.8px", marginBottom: 6 }, children: "Describe your story" }), _jsx("textarea", { value: sceneStory, onChange: (e) => setSceneStory(e.target.value), placeholder: "A knight rides through a misty forest, discovers a glowing crystal cave, and meets an ancient dragon...", rows: 6, style: { width: "100%", background: "#f5f5f7", border: "none", borderRadius: 10, color: "#1a1a1a", fontSize: 12, padding: "10px 12px", resize: "vertical", outline: "none", fontFamily: "inherit", lineHeight: 1.5, boxSizing: "border-box" } }), _jsx("button", { onClick: generateScenes, disabled: sceneLoading || !sceneStory.trim(), style: { width: "100%", marginTop: 10, padding: "10px", background: sceneLoading ? "#e5e7eb" : "#c026d3", color: sceneLoading ? "#9ca3af" : "#fff", border: "none", borderRadius: 10, fontSize: 12, fontWeight: 600, cursor: sceneLoading ? "not-allowed" : "pointer" }, children: sceneLoading ? "Generating..." : "Generate Scenes ✦" }), _jsx("div", { style: { fontSize: 10, color: "#9ca3af", marginTop: 8 }, children: "Splits your story into 3-5 scenes as connected image nodes." })] })) : activePanel === "projects" ? (_jsxs("div", { style: { padding: 20 }, children: [_jsx("div", { style: { fontSize: 13, fontWeight: 600, color: "#1a1a1a", marginBottom: 16 }, children: "\uD83D\uDCC1 Projects" }), !authToken ? (_jsxs("div", { children: [_jsx("div", { style: { fontSize: 10, fontWeight: 600, color: "#9ca3af", marginBottom: 6 }, children: "LOGIN / SIGNUP" }), _jsx("input", { placeholder: "Email", value: authEmail, onChange: e => setAuthEmail(e.target.value), style: { width: "100%", background: "#f5f5f7", border: "none", borderRadius: 8, fontSize: 12, padding: "8px 12px", outline: "none", marginBottom: 6, boxSizing: "border-box" } }), _jsx("input", { placeholder: "Password", type: "password", value: authPass, onChange: e => setAuthPass(e.target.value), style: { width: "100%", background: "#f5f5f7", border: "none", borderRadius: 8, fontSize: 12, padding: "8px 12px", outline: "none", marginBottom: 8, boxSizing: "border-box" } }), _jsxs("div", { style: { display: "flex", gap: 6 }, children: [_jsx("button", { onClick: () => handleAuth("login"), style: { flex: 1, padding: "8px", background: "#c026d3", color: "#fff", border: "none", borderRadius: 8, fontSize: 11, fontWeight: 600, cursor: "pointer" }, children: "Login" }), _jsx("button", { onClick: () => handleAuth("signup"), style: { flex: 1, padding: "8px", background: "#f5f5f7", color: "#1a1a1a", border: "1px solid #ebebee", borderRadius: 8, fontSize: 11, fontWeight: 600, cursor: "pointer" }, children: "Sign Up" })] })] })) : (_jsxs("div", { children: [_jsxs("div", { style: { display: "flex", gap: 6, marginBottom: 12 }, children: [_jsx("input", { placeholder: "Project name", value: projectName, onChange: e => setProjectName(e.target.value), style: { flex: 1, background: "#f5f5f7", border: "none", borderRadius: 8, fontSize: 12, padding: "8px 12px", outline: "none" } }), _jsx("button", { onClick: saveProject, style: { padding: "8px 12px", background: "#c026d3", color: "#fff", border: "none", borderRadius: 8, fontSize: 11, fontWeight: 600, cursor: "pointer" }, children: "Save" })] }), _jsx("div", { style: { fontSize: 10, fontWeight: 600, color: "#9ca3af", marginBottom: 8 }, children: "SAVED PROJECTS" }), projectsList.length === 0 && _jsx("div", { style: { fontSize: 11, color: "#9ca3af" }, children: "No projects yet" }), projectsList.map(p => (_jsxs("div", { onClick: () => openProject(p.id), style: { padding: "8px 10px", background: "#f5f5f7", borderRadius: 8, marginBottom: 4, cursor: "pointer", fontSize: 12, fontWeight: 500, color: "#1a1a1a" }, onMouseOver: e => { e.currentTarget.style.background = "#e8e8eb"; }, onMouseOut: e => { e.currentTarget.style.background = "#f5f5f7"; }, children: [p.name, _jsx("div", { style: { fontSize: 9, color: "#9ca3af", marginTop: 2 }, children: p.updated_at?.slice(0, 16) }), _jsx(WorkflowStatsInline, { name: p.name })] }, p.id))), _jsx("button", { onClick: () => { setAuthToken(""); localStorage.removeItem("openflow_token"); }, style: { marginTop: 12, padding: "6px", background: "transparent", border: "none", fontSize: 10, color: "#9ca3af", cursor: "pointer" }, children: "Logout" })] }))] })) : activePanel === "history" ? (_jsx(HistoryPanel, { onRerun: (record) => {
                         const def = NODE_DEFS.find(d => d.id === "image.text_to_image");
                         if (def) {
                             addNodeWithHandler(def, { model: record.model, prompt: record.prompt, ...record.params });
@@ -1904,8 +1915,9 @@ export default function App() {
                                             })();
                                         }, style: { padding: "8px 14px", borderRadius: 8, border: "1px solid #2a2a30", background: "#141416", color: "#22c55e", fontSize: 12, fontWeight: 600, cursor: "pointer" }, children: "\u25B6 Run Selected" }), _jsx("button", { onClick: () => { setNodes(nds => nds.filter(n => !n.selected)); addToast("Deleted selected", "success"); }, style: { padding: "8px 14px", borderRadius: 8, border: "1px solid #2a2a30", background: "#141416", color: "#ef4444", fontSize: 12, fontWeight: 600, cursor: "pointer" }, children: "\uD83D\uDDD1 Delete" })] })), _jsx("button", { onClick: autoLayout, title: "Auto-layout", style: { padding: "8px 10px", borderRadius: 8, border: "1px solid #2a2a30", background: "#141416", color: "#9ca3af", fontSize: 12, cursor: "pointer" }, children: "\u229E" }), _jsx("button", { onClick: () => setSnapToGrid(s => !s), title: "Snap to grid", style: { padding: "8px 10px", borderRadius: 8, border: "1px solid #2a2a30", background: snapToGrid ? "#2a2a30" : "#141416", color: snapToGrid ? "#c026d3" : "#9ca3af", fontSize: 12, cursor: "pointer" }, children: "\u22A1" }), _jsx("button", { onClick: () => undo(), disabled: undoStack.length === 0, title: "Undo (Ctrl+Z)", style: { padding: "8px 10px", borderRadius: 8, border: "1px solid #2a2a30", background: "#141416", color: undoStack.length > 0 ? "#9ca3af" : "#4a4a50", fontSize: 12, cursor: undoStack.length > 0 ? "pointer" : "not-allowed" }, children: "\u21A9" }), _jsx("button", { onClick: () => redo(), disabled: redoStack.length === 0, title: "Redo (Ctrl+Shift+Z)", style: { padding: "8px 10px", borderRadius: 8, border: "1px solid #2a2a30", background: "#141416", color: redoStack.length > 0 ? "#9ca3af" : "#4a4a50", fontSize: 12, cursor: redoStack.length > 0 ? "pointer" : "not-allowed" }, children: "\u21AA" }), _jsx("button", { onClick: () => setShowGallery(true), title: "Gallery view", style: { display: "flex", alignItems: "center", gap: 6, padding: "8px 14px", borderRadius: 8, border: "1px solid #2a2a30", background: "#141416", color: "#9ca3af", fontSize: 12, fontWeight: 600, cursor: "pointer" }, children: "\uD83D\uDDBC\uFE0F Gallery" }), _jsxs("button", { onClick: () => {
                                     const workflow = { nodes: nodes.map(n => ({ id: n.id, type: n.type, position: n.position, defId: n.data.def.id, values: n.data.values, comment: nodeComments[n.id] })), edges };
-                                    const url = encodeWorkflowToUrl(workflow);
-                                    navigator.clipboard.writeText(url).then(() => addToast("Share link copied to clipboard!", "success")).catch(() => { prompt("Copy this link:", url); });
+                                    encodeWorkflowToUrl(workflow, BACKEND_URL).then(url => {
+                                        navigator.clipboard.writeText(url).then(() => addToast("Share link copied to clipboard!", "success")).catch(() => { prompt("Copy this link:", url); });
+                                    });
                                 }, title: "Share workflow", style: { display: "flex", alignItems: "center", gap: 6, padding: "8px 14px", borderRadius: 8, border: "1px solid #2a2a30", background: "#141416", color: "#9ca3af", fontSize: 12, fontWeight: 600, cursor: "pointer" }, children: [_jsxs("svg", { width: "14", height: "14", viewBox: "0 0 24 24", fill: "none", stroke: "currentColor", strokeWidth: "2", strokeLinecap: "round", strokeLinejoin: "round", style: { flexShrink: 0 }, children: [_jsx("path", { d: "M10 13a5 5 0 0 0 7.54.54l3-3a5 5 0 0 0-7.07-7.07l-1.72 1.71" }), _jsx("path", { d: "M14 11a5 5 0 0 0-7.54-.54l-3 3a5 5 0 0 0 7.07 7.07l1.71-1.71" })] }), " Share"] }), _jsx("button", { onClick: () => {
                                     const collabUrl = `${window.location.origin}${window.location.pathname}?collab=${Date.now().toString(36)}`;
                                     navigator.clipboard.writeText(collabUrl).then(() => addToast("Collaboration link copied!", "success")).catch(() => prompt("Copy this link:", collabUrl));
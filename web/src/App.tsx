@@ -2023,15 +2023,16 @@ export default function App() {
 
   // Workflow sharing: check URL hash on load
   useEffect(() => {
-    const wf = decodeWorkflowFromHash();
-    if (wf && (wf as { nodes?: unknown }).nodes) {
-      if (confirm("A shared workflow was found in the URL. Import it?")) {
-        loadProject(JSON.stringify(wf));
-        setShowLanding(false);
-        setCurrentView("canvas");
-        addToast("Workflow imported from shared link!", "success");
+    decodeWorkflowFromHash(BACKEND_URL).then(wf => {
+      if (wf && (wf as { nodes?: unknown }).nodes) {
+        if (confirm("A shared workflow was found in the URL. Import it?")) {
+          loadProject(JSON.stringify(wf));
+          setShowLanding(false);
+          setCurrentView("canvas");
+          addToast("Workflow imported from shared link!", "success");
+        }
       }
-    }
+    });
   }, []);
 
   const onDragStart = (e: DragEvent, def: NodeDef) => {
@@ -2110,7 +2111,7 @@ export default function App() {
   const [sceneStory, setSceneStory] = useState("");
   const [sceneLoading, setSceneLoading] = useState(false);
   const [projectName, setProjectName] = useState("Untitled");
-  const [projectsList, setProjectsList] = useState<Array<{id: number; name: string; workflow_json: string; updated_at: string}>>([]);
+  const [projectsList, setProjectsList] = useState<Array<{id: number; name: string; updated_at: string}>>([]);
   const [authToken, setAuthToken] = useState(() => localStorage.getItem("openflow_token") || "");
   const [authEmail, setAuthEmail] = useState("");
   const [authPass, setAuthPass] = useState("");
@@ -2125,6 +2126,13 @@ export default function App() {
     } catch {}
   }, [authToken]);
 
+  const openProject = async (id: number) => {
+    try {
+      const res = await fetch(`${BACKEND_URL}/projects/${id}`, { headers: apiHeaders() });
+      if (res.ok) { loadProject((await res.json()).workflow_json); setCurrentView("canvas"); }
+    } catch {}
+  };
+
   const handleAuth = async (mode: "login" | "signup") => {
     try {
       const res = await fetch(`${BACKEND_URL}/auth/${mode}`, {
@@ -2473,7 +2481,7 @@ export default function App() {
                   <div style={{ fontSize: 10, fontWeight: 600, color: "#9ca3af", marginBottom: 8 }}>SAVED PROJECTS</div>
                   {projectsList.length === 0 && <div style={{ fontSize: 11, color: "#9ca3af" }}>No projects yet</div>}
                   {projectsList.map(p => (
-                    <div key={p.id} onClick={() => { loadProject(p.workflow_json); setCurrentView("canvas"); }}
+                    <div key={p.id} onClick={() => openProject(p.id)}
                       style={{ padding: "8px 10px", background: "#f5f5f7", borderRadius: 8, marginBottom: 4, cursor: "pointer", fontSize: 12, fontWeight: 500, color: "#1a1a1a" }}
                       onMouseOver={e => { e.currentTarget.style.background = "#e8e8eb"; }}
                       onMouseOut={e => { e.currentTarget.style.background = "#f5f5f7"; }}>
@@ -2695,8 +2703,9 @@ export default function App() {
             </button>
             <button onClick={() => {
               const workflow = { nodes: nodes.map(n => ({ id: n.id, type: n.type, position: n.position, defId: (n.data.def as NodeDef).id, values: n.data.values, comment: nodeComments[n.id] })), edges };
-              const url = encodeWorkflowToUrl(workflow);
-              navigator.clipboard.writeText(url).then(() => addToast("Share link copied to clipboard!", "success")).catch(() => { prompt("Copy this link:", url); });
+              encodeWorkflowToUrl(workflow, BACKEND_URL).then(url => {
+                navigator.clipboard.writeText(url).then(() => addToast("Share link copied to clipboard!", "success")).catch(() => { prompt("Copy this link:", url); });
+              });
             }} title="Share workflow"
               style={{ display: "flex", alignItems: "center", gap: 6, padding: "8px 14px", borderRadius: 8, border: "1px solid #2a2a30", background: "#141416", color: "#9ca3af", fontSize: 12, fontWeight: 600, cursor: "pointer" }}>
               <svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" strokeWidth="2" strokeLinecap="round" strokeLinejoin="round" style={{flexShrink:0}}><path d="M10 13a5 5 0 0 0 7.54.54l3-3a5 5 0 0 0-7.07-7.07l-1.72 1.71"/><path d="M14 11a5 5 0 0 0-7.54-.54l-3 3a5 5 0 0 0 7.07 7.07l1.71-1.71"/></svg> Share
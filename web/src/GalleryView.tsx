@@ -10,6 +10,7 @@ interface Asset {
   prompt: string;
   model: string;
   timestamp: number;
+  thumbnail?: string | null;  // /api/assets: smallest thumbnail or video poster, null until rendered
 }
 
 interface GalleryViewProps {
@@ -106,9 +107,9 @@ export function GalleryView({ assets, onClose, onUseAsInput }: GalleryViewProps)
               onMouseOver={e => { e.currentTarget.style.transform = "scale(1.02)"; e.currentTarget.style.boxShadow = "0 8px 24px rgba(0,0,0,0.1)"; }}
               onMouseOut={e => { e.currentTarget.style.transform = "scale(1)"; e.currentTarget.style.boxShadow = "none"; }}>
               {asset.type === "video" ? (
-                <video src={asset.url} style={{ width: "100%", height: 180, objectFit: "cover" }} muted />
+                <video src={asset.url} poster={asset.thumbnail || undefined} preload={asset.thumbnail ? "none" : "metadata"} style={{ width: "100%", height: 180, objectFit: "cover" }} muted />
               ) : (
-                <img src={asset.url} alt="" loading="lazy" style={{ width: "100%", height: 180, objectFit: "cover" }} />
+                <img src={asset.thumbnail || asset.url} alt="" loading="lazy" style={{ width: "100%", height: 180, objectFit: "cover" }} />
               )}
               <div style={{ padding: "10px 12px" }}>
                 <div style={{ fontSize: 11, fontWeight: 600, color: "#1a1a1a" }}>{asset.model}</div>
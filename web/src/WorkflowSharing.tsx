@@ -1,21 +1,45 @@
 /**
  * WorkflowSharing — Export/import workflows via URL hash
  * Sprint 6
+ *
+ * Links carry the backend's compact workflow encoding (`#wf=`, base64url),
+ * which keeps large canvases under URL length limits. `#workflow=` links
+ * (base64 JSON) still import, and are what we produce if the backend is
+ * unreachable.
  */
 
-export function encodeWorkflowToUrl(workflow: object): string {
+export async function encodeWorkflowToUrl(workflow: object, backendUrl: string): Promise<string> {
+  const base = `${window.location.origin}${window.location.pathname}`;
+  try {
+    const res = await fetch(`${backendUrl}/workflows/encode`, {
+      method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ data: workflow }),
+    });
+    if (res.ok) return `${base}#wf=${(await res.json()).encoded}`;
+  } catch {
+    // Offline: fall back to the uncompressed form
+  }
   const json = JSON.stringify(workflow);
   const base64 = btoa(unescape(encodeURIComponent(json)));
-  return `${window.location.origin}${window.location.pathname}#workflow=${base64}`;
+  return `${base}#workflow=${base64}`;
 }
 
-export function decodeWorkflowFromHash(): object | null {
+export async function decodeWorkflowFromHash(backendUrl: string): Promise<object | null> {
   const hash = window.location.hash;
-  if (!hash.startsWith("#workflow=")) return null;
   try {
-    const base64 = hash.slice("#workflow=".length);
-    const json = decodeURIComponent(escape(atob(base64)));
-    const wf = JSON.parse(json);
+    let wf: object;
+    if (hash.startsWith("#wf=")) {
+      const res = await fetch(`${backendUrl}/workflows/decode`, {
+        method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ encoded: hash.slice("#wf=".length) }),
+      });
+      if (!res.ok) return null;
+      wf = (await res.json()).data;
+    } else if (hash.startsWith("#workflow=")) {
+      const base64 = hash.slice("#workflow=".length);
+      const json = decodeURIComponent(escape(atob(base64)));
+      wf = JSON.parse(json);
+    } else {
+      return null;
+    }
     // Clear hash after reading
     window.history.replaceState(null, "", window.location.pathname);
     return wf;